@@ -32,7 +32,7 @@ class ProductoAdmin(admin.ModelAdmin):
 class ItemVentaInline(admin.TabularInline):
     model = ItemVenta
     extra = 0
-    readonly_fields = ['subtotal']
+    readonly_fields = ['subtotal', 'codigo', 'nombre', 'atributo', 'codigo_barras']
 
 
 @admin.register(Venta)
@@ -64,6 +64,7 @@ class MovimientoStockAdmin(admin.ModelAdmin):
     list_filter = ['tipo', 'fecha']
     search_fields = ['producto__nombre', 'producto__codigo']
     readonly_fields = ['fecha']
+    raw_id_fields = ['venta', 'ingreso', 'salida', 'conteo']
 
 
 @admin.register(PerfilUsuario)
@@ -0,0 +1,257 @@
+"""
+Análisis ABC y puntos de reorden (reportes?tipo=abc).
+
+Clasifica los productos activos en A/B/C según su aporte al valor vendido en
+el período (A hasta el 80 % acumulado, B hasta el 95 %, C el resto) y calcula
+por producto la demanda diaria promedio y su desviación estándar, el stock de
+seguridad, el punto de reorden y la cantidad sugerida a pedir:
+
+    stock_seguridad = z(nivel de servicio) * desviación * sqrt(días de reposición)
+    punto_reorden   = demanda_promedio * días de reposición + stock_seguridad
+    cantidad        = punto_reorden + demanda_promedio * días de cobertura - stock
+                      (solo si el stock ya está en o bajo el punto de reorden)
+
+Las ventas salen de VentaProductoDiaria en una sola consulta agrupada por
+producto (unidades, suma de cuadrados de las unidades diarias y valor): con
+eso se obtienen promedio y varianza diaria contando como cero los días sin
+ventas, sin traer una fila por producto y día. El resto del cálculo se hace
+con arreglos NumPy, sin recorrer productos en Python.
+"""
+import math
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Producto
+from .ventas_diarias import ventas_producto_rango
+
+# Aporte acumulado al valor vendido que cierra las clases A y B
+UMBRAL_CLASE_A = 0.80
+UMBRAL_CLASE_B = 0.95
+
+DIAS_PERIODO_DEFECTO = 90
+DIAS_REPOSICION_DEFECTO = 7
+DIAS_COBERTURA_DEFECTO = 30
+NIVEL_SERVICIO_DEFECTO = 95
+
+CLASES = ('A', 'B', 'C')
+
+# Filas por tabla en pantalla (la exportación CSV incluye todos los productos)
+LIMITE_PANTALLA_ABC = 200
+
+COLUMNAS_ANALISIS_ABC = [
+    'Código', 'Producto', 'Atributo', 'Clase', 'Valor Vendido', '% del Total', '% Acumulado',
+    'Unidades Vendidas', 'Demanda Diaria', 'Desviación Diaria', 'Stock Actual',
+    'Stock de Seguridad', 'Punto de Reorden', 'Cantidad Sugerida',
+]
+
+
+def _fecha(valor):
+    """Convierte 'YYYY-MM-DD' a date; None si está vacío o no es válido"""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+    except ValueError:
+        return None
+
+
+def _entero(valor, defecto, minimo, maximo):
+    try:
+        return min(max(int(valor), minimo), maximo)
+    except (TypeError, ValueError):
+        return defecto
+
+
+def parametros_analisis_abc(datos):
+    """
+    Parámetros del análisis desde un dict de request (GET): período (por
+    defecto los últimos 90 días), días de reposición, días de cobertura y
+    nivel de servicio en porcentaje. Valores inválidos usan el valor por defecto.
+    """
+    fecha_hasta = _fecha(datos.get('fecha_hasta')) or timezone.localdate()
+    fecha_desde = _fecha(datos.get('fecha_desde')) or fecha_hasta - timedelta(days=DIAS_PERIODO_DEFECTO - 1)
+    if fecha_hasta < fecha_desde:
+        fecha_desde, fecha_hasta = fecha_hasta, fecha_desde
+    return {
+        'fecha_desde': fecha_desde,
+        'fecha_hasta': fecha_hasta,
+        'dias_reposicion': _entero(datos.get('dias_reposicion'), DIAS_REPOSICION_DEFECTO, 1, 365),
+        'dias_cobertura': _entero(datos.get('dias_cobertura'), DIAS_COBERTURA_DEFECTO, 0, 365),
+        'nivel_servicio': _entero(datos.get('nivel_servicio'), NIVEL_SERVICIO_DEFECTO, 50, 99),
+    }
+
+
+def _ventas_por_producto(ids, fecha_desde, fecha_hasta):
+    """
+    Unidades, suma de cuadrados de las unidades diarias y valor vendido por
+    producto, alineados con `ids` (ordenados), en una consulta agrupada.
+    """
+    unidades = np.zeros(len(ids), dtype=np.float64)
+    cuadrados = np.zeros(len(ids), dtype=np.float64)
+    valor = np.zeros(len(ids), dtype=np.float64)
+
+    filas = np.array(list(
+        ventas_producto_rango(fecha_desde, fecha_hasta).values('producto_id').annotate(
+            suma_cantidad=Sum('cantidad'),
+            suma_cuadrados=Sum(F('cantidad') * F('cantidad')),
+            suma_valor=Sum('valor'),
+        ).order_by().values_list('producto_id', 'suma_cantidad', 'suma_cuadrados', 'suma_valor')
+    ), dtype=np.float64).reshape(-1, 4)
+    if not len(filas) or not len(ids):
+        return unidades, cuadrados, valor
+
+    # Ventas de productos inactivos o eliminados no tienen posición en `ids`
+    producto_ids = filas[:, 0].astype(np.int64)
+    posiciones = np.minimum(np.searchsorted(ids, producto_ids), len(ids) - 1)
+    validas = ids[posiciones] == producto_ids
+    posiciones = posiciones[validas]
+    unidades[posiciones] = filas[validas, 1]
+    cuadrados[posiciones] = filas[validas, 2]
+    valor[posiciones] = filas[validas, 3]
+    return unidades, cuadrados, valor
+
+
+def _clases_abc(valor):
+    """
+    Clase A/B/C por producto según el aporte acumulado al valor vendido (de
+    mayor a menor). Devuelve (clases, orden, porcentaje, porcentaje_acumulado).
+    """
+    orden = np.argsort(-valor, kind='stable')
+    total = valor.sum()
+    porcentaje = np.zeros_like(valor)
+    acumulado = np.zeros_like(valor)
+    clases = np.full(len(valor), 'C', dtype='<U1')
+    if total > 0:
+        porcentaje = valor / total
+        acumulado_ordenado = np.cumsum(valor[orden]) / total
+        acumulado[orden] = acumulado_ordenado
+        # Un producto entra en la clase según el acumulado previo a su aporte
+        previo = acumulado - porcentaje
+        clases = np.where(
+            previo < UMBRAL_CLASE_A, 'A', np.where(previo < UMBRAL_CLASE_B, 'B', 'C')
+        ).astype('<U1')
+        clases[valor <= 0] = 'C'
+    return clases, orden, porcentaje * 100, acumulado * 100
+
+
+def construir_analisis_abc(fecha_desde, fecha_hasta, dias_reposicion=DIAS_REPOSICION_DEFECTO,
+                           dias_cobertura=DIAS_COBERTURA_DEFECTO, nivel_servicio=NIVEL_SERVICIO_DEFECTO):
+    """
+    Clasificación ABC, demanda y reposición de todos los productos activos.
+
+    Args:
+        fecha_desde, fecha_hasta: date del período (inclusive)
+        dias_reposicion: días que tarda en llegar un pedido
+        dias_cobertura: días de demanda que debe cubrir el pedido sugerido
+        nivel_servicio: porcentaje (50-99) de probabilidad de no quedar sin stock
+
+    Returns:
+        dict con los parámetros, las columnas por producto (arreglos NumPy y
+        listas alineadas), el orden por valor vendido y el resumen por clase
+    """
+    dias = (fecha_hasta - fecha_desde).days + 1
+    productos = list(
+        Producto.objects.filter(activo=True).order_by('id').values_list('id', 'codigo', 'nombre', 'atributo', 'stock')
+    )
+    if productos:
+        ids, codigos, nombres, atributos, stocks = zip(*productos)
+    else:
+        ids, codigos, nombres, atributos, stocks = (), (), (), (), ()
+    ids = np.array(ids, dtype=np.int64)
+    stock = np.array(stocks, dtype=np.float64)
+
+    unidades, cuadrados, valor = _ventas_por_producto(ids, fecha_desde, fecha_hasta)
+
+    # Demanda diaria: los días sin ventas cuentan como cero
+    demanda = unidades / dias
+    desviacion = np.sqrt(np.maximum(cuadrados / dias - demanda ** 2, 0))
+
+    z = NormalDist().inv_cdf(nivel_servicio / 100)
+    stock_seguridad = np.ceil(z * desviacion * math.sqrt(dias_reposicion))
+    punto_reorden = np.ceil(demanda * dias_reposicion) + stock_seguridad
+    reponer = (demanda > 0) & (stock <= punto_reorden)
+    cantidad_sugerida = np.where(
+        reponer, np.maximum(np.ceil(punto_reorden + demanda * dias_cobertura - stock), 0), 0
+    )
+
+    clases, orden, porcentaje, acumulado = _clases_abc(valor)
+    total_valor = float(valor.sum())
+
+    resumen_clases = []
+    for clase in CLASES:
+        de_clase = clases == clase
+        valor_clase = float(valor[de_clase].sum())
+        resumen_clases.append({
+            'clase': clase,
+            'productos': int(de_clase.sum()),
+            'valor': int(valor_clase),
+            'porcentaje_valor': round(valor_clase / total_valor * 100, 2) if total_valor else 0,
+            'productos_reponer': int((de_clase & reponer).sum()),
+        })
+
+    return {
+        'fecha_desde': fecha_desde,
+        'fecha_hasta': fecha_hasta,
+        'dias': dias,
+        'dias_reposicion': dias_reposicion,
+        'dias_cobertura': dias_cobertura,
+        'nivel_servicio': nivel_servicio,
+        'columnas': {
+            'codigo': codigos,
+            'nombre': nombres,
+            'atributo': atributos,
+            'clase': clases,
+            'valor': valor,
+            'porcentaje': porcentaje,
+            'acumulado': acumulado,
+            'unidades': unidades,
+            'demanda': demanda,
+            'desviacion': desviacion,
+            'stock': stock,
+            'stock_seguridad': stock_seguridad,
+            'punto_reorden': punto_reorden,
+            'cantidad_sugerida': cantidad_sugerida,
+            'reponer': reponer,
+        },
+        'orden': orden,
+        'resumen_clases': resumen_clases,
+        'total_valor': int(total_valor),
+        'total_productos': len(ids),
+        'total_reponer': int(reponer.sum()),
+    }
+
+
+def items_analisis_abc(analisis, solo_reponer=False):
+    """Dicts por producto (de mayor a menor valor vendido); solo los que hay que reponer si se indica"""
+    columnas = analisis['columnas']
+    orden = analisis['orden']
+    if solo_reponer:
+        orden = orden[columnas['reponer'][orden]]
+    for i in orden.tolist():
+        yield {
+            'codigo': columnas['codigo'][i],
+            'nombre': columnas['nombre'][i],
+            'atributo': columnas['atributo'][i] or '-',
+            'clase': str(columnas['clase'][i]),
+            'valor': int(columnas['valor'][i]),
+            'porcentaje': round(float(columnas['porcentaje'][i]), 2),
+            'acumulado': round(float(columnas['acumulado'][i]), 2),
+            'unidades': int(columnas['unidades'][i]),
+            'demanda': round(float(columnas['demanda'][i]), 2),
+            'desviacion': round(float(columnas['desviacion'][i]), 2),
+            'stock': int(columnas['stock'][i]),
+            'stock_seguridad': int(columnas['stock_seguridad'][i]),
+            'punto_reorden': int(columnas['punto_reorden'][i]),
+            'cantidad_sugerida': int(columnas['cantidad_sugerida'][i]),
+        }
+
+
+def fila_analisis_abc(item):
+    """Fila de exportación CSV de un item de items_analisis_abc"""
+    return [
+        item['codigo'], item['nombre'], item['atributo'], item['clase'], item['valor'],
+        item['porcentaje'], item['acumulado'], item['unidades'], item['demanda'], item['desviacion'],
+        item['stock'], item['stock_seguridad'], item['punto_reorden'], item['cantidad_sugerida'],
+    ]
@@ -0,0 +1,336 @@
+"""
+Cierre de período: archiva el detalle histórico de ventas, items de venta,
+movimientos de stock y gastos de caja hasta una fecha y, opcionalmente, lo
+saca de las tablas para que reportes, diagnósticos y paginadores no crezcan
+con todo el historial.
+
+Cada cierre cubre los días locales desde el día siguiente al cierre anterior
+hasta `fecha` (inclusive) y deja, en ARCHIVO_HISTORICO_DIR/<fecha>/:
+
+    ventas.jsonl.gz              filas de Venta (values(), una por línea)
+    items_venta.jsonl.gz         filas de ItemVenta de esas ventas
+    movimientos_stock.jsonl.gz   filas de MovimientoStock
+    gastos_caja.jsonl.gz         filas de GastoCaja
+
+Los totales se conservan en tablas resumen: VentaDiaria y VentaProductoDiaria
+(se reconstruyen para el período antes de archivar), ResumenStockCierre (stock
+inicial y unidades por tipo de cada producto), ResumenGastoCierre (gastos,
+ingresos y retiros de caja por día y tipo) y una foto de StockDiario al cierre
+de `fecha`. Los reportes de caja e inventario leen los resúmenes de los
+cierres movidos (cierres_movidos) en lugar del detalle.
+
+Al mover, las filas se borran sin señales: las de Venta e ItemVenta
+descontarían las tablas diarias que justamente conservan esos totales. Por lo
+mismo, las reconstrucciones de VentaDiaria, VentaProductoDiaria y StockDiario
+no tocan los días hasta el último cierre movido (primer_dia_abierto), y no se
+mueve un período mientras haya una caja abierta desde antes del corte. El
+detalle movido se lee bajo demanda con movimientos_archivados() e
+items_venta_archivados().
+
+Configuración opcional en settings:
+
+    ARCHIVO_HISTORICO_DIR = BASE_DIR / 'archivo_historico'
+"""
+import gzip
+import json
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import BooleanField, Case, Count, F, IntegerField, Q, Sum, Value, When, Window
+from django.db.models.functions import RowNumber, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .fechas import rango_fechas_local
+from .models import (
+    CajaUsuario, CierrePeriodo, GastoCaja, ItemVenta, MovimientoStock, Producto, ResumenGastoCierre, ResumenStockCierre, Venta,
+)
+from .reporte_caja import DESCRIPCION_RETIRO
+from .verificacion_stock import ORDEN_HISTORIAL
+
+# Archivos del cierre, en el orden en que se escriben
+TABLAS_ARCHIVO = ('ventas', 'items_venta', 'movimientos_stock', 'gastos_caja')
+
+TAMANO_LOTE = 2000
+
+
+def directorio_archivo():
+    return Path(getattr(settings, 'ARCHIVO_HISTORICO_DIR', Path(settings.BASE_DIR) / 'archivo_historico'))
+
+
+def ruta_archivo(cierre, tabla):
+    return Path(cierre.directorio) / f'{tabla}.jsonl.gz'
+
+
+def periodo_cierre(fecha):
+    """
+    (desde, inicio, fin) del período que cerraría `fecha`: primer día local
+    (None si no hay cierres previos) y rango aware [inicio, fin).
+
+    Raises:
+        ValueError: la fecha no es anterior a hoy o no es posterior al último cierre
+    """
+    if fecha >= timezone.localdate():
+        raise ValueError('Solo se pueden cerrar días ya terminados (fecha anterior a hoy)')
+    ultimo = CierrePeriodo.objects.order_by('-fecha').first()
+    if ultimo and fecha <= ultimo.fecha:
+        raise ValueError(f'La fecha debe ser posterior al último cierre ({ultimo.fecha})')
+    desde = ultimo.fecha + timedelta(days=1) if ultimo else None
+    inicio, fin = rango_fechas_local(desde, fecha)
+    return desde, inicio, fin
+
+
+def primer_dia_abierto(fecha_desde=None):
+    """
+    Primer día que las tablas diarias pueden recalcular desde el detalle: el
+    siguiente al último cierre movido (el detalle anterior ya no está en las
+    tablas y reconstruirlo borraría sus totales). Devuelve `fecha_desde` si es
+    posterior o si no hay cierres movidos.
+    """
+    ultimo = CierrePeriodo.objects.filter(movido=True).order_by('-fecha').values_list('fecha', flat=True).first()
+    if ultimo is None:
+        return fecha_desde
+    primero = ultimo + timedelta(days=1)
+    return max(fecha_desde, primero) if fecha_desde else primero
+
+
+def cierres_movidos(fecha_desde=None, fecha_hasta=None):
+    """
+    Cierres movidos cuyo período se cruza con los días fecha_desde..fecha_hasta
+    (None: sin límite). Sus resúmenes reemplazan en los reportes al detalle que
+    ya no está en las tablas.
+    """
+    cierres = CierrePeriodo.objects.filter(movido=True)
+    if fecha_desde:
+        cierres = cierres.filter(fecha__gte=fecha_desde)
+    if fecha_hasta:
+        cierres = cierres.filter(Q(desde__isnull=True) | Q(desde__lte=fecha_hasta))
+    return cierres
+
+
+def _filas_periodo(inicio, fin):
+    """QuerySets del período por tabla de TABLAS_ARCHIVO"""
+    def en_rango(campo):
+        filtro = Q(**{f'{campo}__lt': fin})
+        if inicio is not None:
+            filtro &= Q(**{f'{campo}__gte': inicio})
+        return filtro
+
+    return {
+        'ventas': Venta.objects.filter(en_rango('fecha')),
+        'items_venta': ItemVenta.objects.filter(en_rango('venta__fecha')),
+        'movimientos_stock': MovimientoStock.objects.filter(en_rango('fecha')),
+        'gastos_caja': GastoCaja.objects.filter(en_rango('fecha')),
+    }
+
+
+def exportar_jsonl(queryset, ruta):
+    """Escribe las filas (values(), por id) como JSON Lines comprimido; devuelve cuántas escribió"""
+    total = 0
+    with gzip.open(ruta, 'wt', encoding='utf-8') as archivo:
+        for fila in queryset.order_by('id').values().iterator(chunk_size=TAMANO_LOTE):
+            archivo.write(json.dumps(fila, cls=DjangoJSONEncoder) + '\n')
+            total += 1
+    return total
+
+
+def resumen_stock(cierre, movimientos):
+    """
+    ResumenStockCierre por producto de los movimientos del período: una
+    consulta con el primer movimiento (ROW_NUMBER) y sumas de ventana por tipo.
+    """
+    por_producto = [F('producto_id')]
+
+    def suma(filtro):
+        return Window(Sum('cantidad', filter=filtro), partition_by=por_producto)
+
+    filas = movimientos.annotate(
+        posicion=Window(RowNumber(), partition_by=por_producto, order_by=ORDEN_HISTORIAL),
+        suma_ingresos=suma(Q(tipo='ingreso')),
+        suma_salidas_venta=suma(Q(tipo='salida', venta__isnull=False)),
+        suma_salidas_inventario=suma(Q(tipo='salida', venta__isnull=True)),
+        suma_ajustes=suma(Q(tipo='ajuste')),
+        numero_movimientos=Window(Count('id'), partition_by=por_producto, output_field=IntegerField()),
+    ).filter(posicion=1).values_list(
+        'producto_id', 'stock_anterior', 'suma_ingresos', 'suma_salidas_venta',
+        'suma_salidas_inventario', 'suma_ajustes', 'numero_movimientos',
+    )
+    return ResumenStockCierre.objects.bulk_create([
+        ResumenStockCierre(
+            cierre=cierre,
+            producto_id=producto_id,
+            stock_inicial=stock_inicial,
+            ingresos=ingresos or 0,
+            salidas_venta=salidas_venta or 0,
+            salidas_inventario=salidas_inventario or 0,
+            ajustes=ajustes or 0,
+            cantidad_movimientos=cantidad,
+        )
+        for producto_id, stock_inicial, ingresos, salidas_venta, salidas_inventario, ajustes, cantidad
+        in filas.iterator(chunk_size=TAMANO_LOTE)
+    ], batch_size=TAMANO_LOTE)
+
+
+def resumen_gastos(cierre, gastos):
+    """ResumenGastoCierre por día local, tipo y retiro (una consulta agrupada)"""
+    filas = gastos.annotate(
+        dia=TruncDate('fecha', tzinfo=timezone.get_current_timezone()),
+        es_retiro=Case(
+            When(tipo='gasto', descripcion__icontains=DESCRIPCION_RETIRO, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    ).values('dia', 'tipo', 'es_retiro').annotate(suma=Sum('monto'), cantidad=Count('id')).order_by('dia', 'tipo', 'es_retiro')
+    return ResumenGastoCierre.objects.bulk_create([
+        ResumenGastoCierre(
+            cierre=cierre, fecha=fila['dia'], tipo=fila['tipo'], retiro=fila['es_retiro'],
+            total=fila['suma'] or 0, cantidad=fila['cantidad'],
+        )
+        for fila in filas
+    ])
+
+
+def _borrar_sin_senales(queryset):
+    """Borra por lotes de ids con DELETE directo (sin señales ni recolección de objetos en memoria)"""
+    ids = list(queryset.values_list('id', flat=True))
+    for inicio in range(0, len(ids), TAMANO_LOTE):
+        lote = queryset.model.objects.filter(id__in=ids[inicio:inicio + TAMANO_LOTE])
+        lote._raw_delete(lote.db)
+
+
+def mover_filas(filas, fin):
+    """
+    Elimina de las tablas las filas archivadas. Los movimientos posteriores al
+    corte que apuntan a una venta archivada (anulaciones, ediciones) quedan
+    sin la venta, como haría on_delete=SET_NULL.
+    """
+    MovimientoStock.objects.filter(fecha__gte=fin, venta__in=filas['ventas']).update(venta=None)
+    for tabla in ('movimientos_stock', 'items_venta', 'ventas', 'gastos_caja'):
+        _borrar_sin_senales(filas[tabla])
+
+
+def cerrar_periodo(fecha, usuario=None, mover=False):
+    """
+    Cierra el período que termina en `fecha`: reconstruye las tablas diarias
+    de ventas del período, escribe los resúmenes y la foto de stock, exporta
+    el detalle a JSON Lines comprimido y, con mover=True, lo elimina de las
+    tablas. Todo en una transacción; si falla se borran los archivos escritos.
+
+    Raises:
+        ValueError: fecha no válida para un nuevo cierre (ver periodo_cierre) o,
+            al mover, hay cajas abiertas desde antes del corte
+    """
+    from .reporte_inventario import invalidar_cache_inventario
+    from .stock_diario import generar_stock_diario
+    from .ventas_diarias import reconstruir_ventas_diarias, reconstruir_ventas_producto_diarias
+
+    desde, inicio, fin = periodo_cierre(fecha)
+    if mover and CajaUsuario.objects.filter(fecha_apertura__lt=fin, fecha_cierre__isnull=True).exists():
+        # El balance de esa caja se calcula con las ventas y gastos que se moverían
+        raise ValueError('Hay cajas abiertas antes del corte: ciérrelas antes de mover el período')
+    directorio = directorio_archivo() / fecha.isoformat()
+    directorio.mkdir(parents=True, exist_ok=True)
+    try:
+        with transaction.atomic():
+            reconstruir_ventas_diarias(desde, fecha)
+            reconstruir_ventas_producto_diarias(desde, fecha)
+            generar_stock_diario(fecha, fecha)
+
+            cierre = CierrePeriodo.objects.create(fecha=fecha, desde=desde, directorio=str(directorio), usuario=usuario)
+            filas = _filas_periodo(inicio, fin)
+            resumen_stock(cierre, filas['movimientos_stock'])
+            resumen_gastos(cierre, filas['gastos_caja'])
+            cierre.conteos = {tabla: exportar_jsonl(filas[tabla], ruta_archivo(cierre, tabla)) for tabla in TABLAS_ARCHIVO}
+
+            if mover:
+                mover_filas(filas, fin)
+                cierre.movido = True
+            cierre.save(update_fields=['conteos', 'movido'])
+    except BaseException:
+        shutil.rmtree(directorio, ignore_errors=True)
+        raise
+
+    if mover:
+        invalidar_cache_inventario()
+    return cierre
+
+
+def _marcas_campo(campo, valor):
+    """Textos de los que toda línea con ese valor del campo contiene alguno (formato de json.dumps por defecto)"""
+    marca = f'"{campo}": {json.dumps(valor)}'
+    return (marca + ',', marca + '}')
+
+
+def filas_archivadas(tabla, condicion=None, contiene=None):
+    """
+    Filas (dicts) de `tabla` en los archivos de los cierres movidos, del más
+    antiguo al más reciente; con `condicion` solo las que la cumplen. Se leen
+    línea a línea sin cargar los archivos completos; con `contiene` las líneas
+    que no incluyen ninguno de esos textos se descartan sin decodificar el JSON.
+    """
+    for cierre in CierrePeriodo.objects.filter(movido=True).order_by('fecha'):
+        with gzip.open(ruta_archivo(cierre, tabla), 'rt', encoding='utf-8') as archivo:
+            for linea in archivo:
+                if contiene is not None and not any(marca in linea for marca in contiene):
+                    continue
+                fila = json.loads(linea)
+                if condicion is None or condicion(fila):
+                    yield fila
+
+
+def movimientos_archivados(producto_id=None, tipo=None, inicio=None, fin=None):
+    """
+    Movimientos archivados como instancias de MovimientoStock sin guardar
+    (con producto y usuario cargados), del más reciente al más antiguo.
+    La venta no se enlaza: también está archivada.
+    """
+    producto_id = int(producto_id) if producto_id is not None else None
+
+    def condicion(fila):
+        return (
+            (producto_id is None or fila['producto_id'] == producto_id)
+            and (tipo is None or fila['tipo'] == tipo)
+        )
+
+    contiene = _marcas_campo('producto_id', producto_id) if producto_id is not None else None
+    movimientos = []
+    for fila in filas_archivadas('movimientos_stock', condicion, contiene):
+        fila['fecha'] = parse_datetime(fila['fecha'])
+        if (inicio is None or fila['fecha'] >= inicio) and (fin is None or fila['fecha'] < fin):
+            fila['venta_id'] = None
+            movimientos.append(MovimientoStock(**fila))
+    movimientos.sort(key=lambda movimiento: (movimiento.fecha, movimiento.id), reverse=True)
+
+    productos = Producto.objects.in_bulk({movimiento.producto_id for movimiento in movimientos})
+    usuarios = User.objects.in_bulk({movimiento.usuario_id for movimiento in movimientos if movimiento.usuario_id})
+    for movimiento in movimientos:
+        movimiento.producto = productos.get(movimiento.producto_id)
+        movimiento.usuario = usuarios.get(movimiento.usuario_id)
+    return movimientos
+
+
+def items_venta_archivados(producto_id):
+    """
+    Items archivados del producto en ventas completadas y no anuladas, con
+    'fecha' de su venta, del más reciente al más antiguo.
+    """
+    producto_id = int(producto_id)
+    items = list(filas_archivadas(
+        'items_venta', lambda fila: fila['producto_id'] == producto_id, _marcas_campo('producto_id', producto_id)
+    ))
+    venta_ids = {item['venta_id'] for item in items}
+    ventas = {
+        fila['id']: fila for fila in filas_archivadas(
+            'ventas', lambda fila: fila['id'] in venta_ids and fila['completada'] and not fila['anulada']
+        )
+    }
+    items = [item for item in items if item['venta_id'] in ventas]
+    for item in items:
+        item['fecha'] = parse_datetime(ventas[item['venta_id']]['fecha'])
+    items.sort(key=lambda item: (item['fecha'], item['id']), reverse=True)
+    return items
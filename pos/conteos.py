@@ -0,0 +1,432 @@
+"""
+Acceso al último conteo físico por (codigo, atributo) y aplicación de los
+conteos al stock.
+
+Los conteos se guardan con atributo None cuando el producto no tiene atributo;
+aquí las claves usan el atributo normalizado de pos.sku ('' sin atributo, sin
+espacios en los extremos), igual que el reporte de inventario, y los cruces
+en SQL con productos usan la columna indexada sku_key.
+
+Aplicar un conteo registra un MovimientoStock de tipo 'ajuste' enlazado al
+conteo. El ajuste parte del stock que había al momento de contar (stock actual
+menos lo movido desde entonces), así las ventas posteriores al conteo no se
+deshacen. Al aplicar se marca aplicado_en en el conteo y en su fila vigente:
+un conteo ya aplicado no se vuelve a aplicar hasta que se cuente de nuevo
+(fecha_conteo posterior), aunque sus movimientos salgan de la tabla. Los
+conteos anteriores al último cierre movido no se aplican: el stock movido
+desde ellos ya no está en MovimientoStock.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+
+from .fechas import filtro_rango_fechas
+from .models import ConteoFisico, ConteoFisicoActual, LoteConteoFisico, MovimientoStock, Producto
+from .sku import clave_sku, normalizar_atributo, sku_key
+
+# Modos de una entrada de captura por escaneo: fijar la cantidad o sumarla
+MODOS_CAPTURA = ('set', 'increment')
+TAMANO_LOTE_CAPTURA = 500
+# Días que se recuerdan los lotes aplicados (reenvíos de la página de escaneo)
+DIAS_LOTES_CAPTURA = 7
+
+COLUMNAS_APLICAR_CONTEO = [
+    'Código', 'Atributo', 'Nombre', 'Cantidad Contada', 'Fecha Conteo',
+    'Stock al Contar', 'Stock Actual', 'Ajuste',
+]
+
+
+def usar_tabla_actual():
+    """Indica si las lecturas usan la tabla ConteoFisicoActual (por defecto sí)"""
+    return getattr(settings, 'CONTEO_FISICO_TABLA_ACTUAL', True)
+
+
+def _ultimos_desde_historial(codigos=None):
+    """Último conteo por (codigo, atributo) con una sola consulta (ROW_NUMBER)"""
+    conteos = ConteoFisico.objects.all()
+    if codigos is not None:
+        conteos = conteos.filter(codigo__in=list(codigos))
+    filas = conteos.annotate(
+        orden=Window(
+            expression=RowNumber(),
+            # Atributos guardados con espacios o '-' comparten sku_key: gana el más reciente
+            partition_by=[F('sku_key')],
+            order_by=[F('fecha_conteo').desc(), F('id').desc()],
+        )
+    ).filter(orden=1).values('id', 'codigo', 'atributo', 'cantidad_contada', 'fecha_conteo', 'aplicado_en')
+    return {clave_sku(fila['codigo'], fila['atributo']): fila for fila in filas}
+
+
+def _ultimos_desde_tabla(codigos=None):
+    conteos = ConteoFisicoActual.objects.all()
+    if codigos is not None:
+        conteos = conteos.filter(codigo__in=list(codigos))
+    return {
+        clave_sku(fila['codigo'], fila['atributo']): {
+            'id': fila['conteo_id'],
+            'codigo': fila['codigo'],
+            'atributo': fila['atributo'] or None,
+            'cantidad_contada': fila['cantidad_contada'],
+            'fecha_conteo': fila['fecha_conteo'],
+        }
+        for fila in conteos.values('codigo', 'atributo', 'cantidad_contada', 'fecha_conteo', 'conteo_id')
+    }
+
+
+def ultimos_conteos_por_clave(codigos=None):
+    """
+    Último conteo físico por (codigo, atributo normalizado) en una sola consulta.
+
+    Args:
+        codigos: limita la búsqueda a estos códigos (None = todos)
+
+    Returns:
+        dict {(codigo, atributo): {'id', 'codigo', 'atributo', 'cantidad_contada', 'fecha_conteo'}}
+    """
+    if usar_tabla_actual():
+        return _ultimos_desde_tabla(codigos)
+    return _ultimos_desde_historial(codigos)
+
+
+def ultimo_conteo(codigo, atributo=None):
+    """Último conteo de un código+atributo (dict) o None"""
+    clave = clave_sku(codigo, atributo)
+    return ultimos_conteos_por_clave([clave[0]]).get(clave)
+
+
+def actualizar_conteo_actual(conteo):
+    """Registra `conteo` como el conteo vigente de su código+atributo"""
+    codigo, atributo = clave_sku(conteo.codigo, conteo.atributo)
+    ConteoFisicoActual.objects.update_or_create(
+        sku_key=sku_key(codigo, atributo),
+        defaults={
+            'codigo': codigo,
+            'atributo': atributo,
+            'cantidad_contada': conteo.cantidad_contada,
+            'fecha_conteo': conteo.fecha_conteo,
+            'conteo': conteo,
+        }
+    )
+
+
+class EntradaCapturaInvalida(ValueError):
+    """Una entrada de captura no es válida; `numero` es su posición (desde 1) en el lote"""
+
+    def __init__(self, numero, mensaje):
+        self.numero = numero
+        super().__init__(f'Entrada {numero}: {mensaje}')
+
+
+def _cantidad_captura(valor, modo):
+    """Cantidad de una entrada de captura: vacía = 0 al fijar y 1 al sumar"""
+    if valor is None or str(valor).strip() == '':
+        return 0 if modo == 'set' else 1
+    if isinstance(valor, bool) or isinstance(valor, float) and not valor.is_integer():
+        raise ValueError
+    return int(valor)
+
+
+def entradas_captura(entradas):
+    """
+    Valida las entradas de una sesión de escaneo (dicts con codigo, atributo,
+    cantidad y mode 'set' o 'increment', por defecto 'set').
+
+    Returns:
+        dict {(codigo, atributo normalizado): [(modo, cantidad), ...]} en el orden recibido
+
+    Raises:
+        EntradaCapturaInvalida: alguna entrada es inválida (no se aplica ninguna)
+    """
+    operaciones = {}
+    for numero, entrada in enumerate(entradas, start=1):
+        if not isinstance(entrada, dict):
+            raise EntradaCapturaInvalida(numero, 'datos inválidos')
+        codigo = str(entrada.get('codigo') or '').strip()
+        if not codigo:
+            raise EntradaCapturaInvalida(numero, 'código requerido')
+        modo = entrada.get('mode') or 'set'
+        if modo not in MODOS_CAPTURA:
+            raise EntradaCapturaInvalida(numero, f'modo inválido "{modo}" (set o increment)')
+        try:
+            cantidad = _cantidad_captura(entrada.get('cantidad'), modo)
+        except (TypeError, ValueError):
+            raise EntradaCapturaInvalida(numero, 'la cantidad debe ser un número entero')
+        clave = clave_sku(codigo, str(entrada.get('atributo') or ''))
+        operaciones.setdefault(clave, []).append((modo, cantidad))
+    return operaciones
+
+
+def _bloquear_conteos_actuales(claves, ahora):
+    """
+    Bloquea hasta el fin de la transacción las filas de ConteoFisicoActual de
+    las claves (select_for_update, en orden de sku_key). Las claves sin fila
+    se reservan antes con una fila vacía (sin conteo), así también quedan
+    bloqueadas; registrar_conteos la sobrescribe en la misma transacción.
+    """
+    claves = sorted(claves, key=lambda clave: sku_key(*clave))
+    ConteoFisicoActual.objects.bulk_create(
+        [
+            ConteoFisicoActual(
+                codigo=codigo, atributo=atributo, sku_key=sku_key(codigo, atributo),
+                cantidad_contada=0, fecha_conteo=ahora,
+            )
+            for codigo, atributo in claves
+        ],
+        batch_size=TAMANO_LOTE_CAPTURA,
+        ignore_conflicts=True,
+    )
+    for inicio in range(0, len(claves), TAMANO_LOTE_CAPTURA):
+        list(ConteoFisicoActual.objects.select_for_update().filter(
+            sku_key__in=[sku_key(*clave) for clave in claves[inicio:inicio + TAMANO_LOTE_CAPTURA]]
+        ).order_by('sku_key').values_list('id', flat=True))
+
+
+def _resultado_lote(lote):
+    """Totales guardados de un lote ya aplicado (None si no se aplicó)"""
+    if not lote:
+        return None
+    return LoteConteoFisico.objects.filter(lote=lote).values_list('resultado', flat=True).first()
+
+
+def registrar_conteos(entradas, usuario=None, lote=None):
+    """
+    Aplica en bloque las entradas de una sesión de escaneo: por cada
+    código+atributo, 'set' fija la cantidad e 'increment' suma al conteo
+    vigente, en el orden recibido. Igual que el guardado individual, se
+    actualiza el último conteo de la clave o se crea uno nuevo, y la tabla
+    ConteoFisicoActual se escribe con un solo upsert.
+
+    Las filas vigentes de las claves se bloquean antes de leer los totales:
+    dos escáneres que suman al mismo código a la vez no pierden incrementos.
+    Con `lote` (identificador del envío) un lote repetido no se vuelve a
+    aplicar y devuelve el resultado del primero.
+
+    Returns:
+        lista de dicts con codigo, atributo, cantidad (total resultante) y
+        created, uno por código+atributo en el orden recibido
+
+    Raises:
+        EntradaCapturaInvalida: alguna entrada es inválida (no se aplica ninguna)
+    """
+    from .reporte_inventario import invalidar_cache_inventario
+
+    aplicado = _resultado_lote(lote)
+    if aplicado is not None:
+        return aplicado
+    operaciones = entradas_captura(entradas)
+    if not operaciones:
+        return []
+
+    ahora = timezone.now()
+    try:
+        with transaction.atomic():
+            _bloquear_conteos_actuales(operaciones, ahora)
+            vigentes = ultimos_conteos_por_clave({codigo for codigo, _ in operaciones})
+            actualizar, crear, totales = [], [], []
+            for (codigo, atributo), lista in operaciones.items():
+                # La fila reservada para una clave nueva tiene cantidad 0 y ningún conteo que actualizar
+                vigente = vigentes.get((codigo, atributo))
+                cantidad = vigente['cantidad_contada'] if vigente else 0
+                for modo, valor in lista:
+                    cantidad = valor if modo == 'set' else cantidad + valor
+                conteo = ConteoFisico(
+                    id=vigente['id'] if vigente else None,
+                    codigo=codigo,
+                    atributo=atributo or None,
+                    sku_key=sku_key(codigo, atributo),
+                    cantidad_contada=cantidad,
+                    fecha_conteo=ahora,
+                    usuario=usuario,
+                )
+                (actualizar if conteo.id else crear).append(conteo)
+                totales.append({'codigo': codigo, 'atributo': atributo, 'cantidad': cantidad, 'created': not conteo.id})
+
+            ConteoFisico.objects.bulk_update(
+                actualizar, ['cantidad_contada', 'fecha_conteo', 'usuario'], batch_size=TAMANO_LOTE_CAPTURA
+            )
+            ConteoFisico.objects.bulk_create(crear, batch_size=TAMANO_LOTE_CAPTURA)
+            ConteoFisicoActual.objects.bulk_create(
+                [
+                    ConteoFisicoActual(
+                        codigo=conteo.codigo,
+                        atributo=conteo.atributo or '',
+                        sku_key=conteo.sku_key,
+                        cantidad_contada=conteo.cantidad_contada,
+                        fecha_conteo=conteo.fecha_conteo,
+                        conteo=conteo,
+                    )
+                    for conteo in actualizar + crear
+                ],
+                batch_size=TAMANO_LOTE_CAPTURA,
+                update_conflicts=True,
+                unique_fields=['sku_key'],
+                update_fields=['codigo', 'atributo', 'cantidad_contada', 'fecha_conteo', 'conteo'],
+            )
+            if lote:
+                LoteConteoFisico.objects.filter(fecha__lt=ahora - timedelta(days=DIAS_LOTES_CAPTURA)).delete()
+                LoteConteoFisico.objects.create(lote=lote, usuario=usuario, resultado=totales)
+    except IntegrityError:
+        # El mismo lote llegó dos veces a la vez: el otro envío ya lo aplicó
+        aplicado = _resultado_lote(lote)
+        if aplicado is None:
+            raise
+        return aplicado
+    # bulk_update/bulk_create no disparan las señales de ConteoFisico
+    invalidar_cache_inventario()
+    return totales
+
+
+def reconstruir_conteos_actuales():
+    """Reconstruye la tabla ConteoFisicoActual desde el historial; devuelve filas creadas"""
+    ultimos = _ultimos_desde_historial()
+    ConteoFisicoActual.objects.all().delete()
+    ConteoFisicoActual.objects.bulk_create([
+        ConteoFisicoActual(
+            codigo=codigo,
+            atributo=atributo,
+            sku_key=sku_key(codigo, atributo),
+            cantidad_contada=fila['cantidad_contada'],
+            fecha_conteo=fila['fecha_conteo'],
+            aplicado_en=fila['aplicado_en'],
+            conteo_id=fila['id'],
+        )
+        for (codigo, atributo), fila in ultimos.items()
+    ], batch_size=1000)
+    return len(ultimos)
+
+
+def diferencias_conteo():
+    """
+    Ajustes pendientes de los conteos vigentes (ConteoFisicoActual) para los
+    productos activos, en una consulta: cruce por código y atributo normalizado,
+    stock movido desde el conteo y descarte de conteos ya aplicados.
+
+    Solo se consideran conteos pendientes (sin aplicar desde su fecha de
+    conteo) posteriores al último cierre movido. Las claves con más de un
+    producto activo no se ajustan (no se sabe a cuál corresponde la
+    diferencia); se cuentan en 'ambiguos'.
+
+    Returns:
+        dict con 'filas' (una por producto con ajuste distinto de cero, por
+        código y atributo), 'ambiguos' (cantidad de productos omitidos) y
+        'conteo_ids' (conteos revisados, con o sin ajuste, que quedan
+        aplicados al aplicar)
+    """
+    from .cierre_periodo import primer_dia_abierto
+    from .verificacion_stock import variacion_stock
+
+    conteo = ConteoFisicoActual.objects.filter(
+        Q(aplicado_en__isnull=True) | Q(aplicado_en__lt=F('fecha_conteo')),
+        filtro_rango_fechas('fecha_conteo', primer_dia_abierto()),
+        sku_key=OuterRef('sku_key'),
+        conteo__isnull=False,
+    )
+    movido = MovimientoStock.objects.filter(
+        producto=OuterRef('pk'), fecha__gt=OuterRef('fecha_conteo')
+    ).values('producto').annotate(neto=Sum(variacion_stock())).values('neto')
+
+    filas = Producto.objects.filter(activo=True).annotate(
+        productos_clave=Window(Count('id'), partition_by=[F('sku_key')]),
+        conteo_id=Subquery(conteo.values('conteo_id')[:1]),
+        cantidad_contada=Subquery(conteo.values('cantidad_contada')[:1]),
+        fecha_conteo=Subquery(conteo.values('fecha_conteo')[:1]),
+    ).annotate(
+        movido=Coalesce(Subquery(movido, output_field=IntegerField()), Value(0)),
+    ).filter(cantidad_contada__isnull=False).order_by('sku_key', 'id').values(
+        'id', 'codigo', 'atributo', 'nombre', 'stock', 'productos_clave',
+        'conteo_id', 'cantidad_contada', 'fecha_conteo', 'movido',
+    )
+
+    resultado = {'filas': [], 'ambiguos': 0, 'conteo_ids': []}
+    for fila in filas:
+        if fila['productos_clave'] > 1:
+            resultado['ambiguos'] += 1
+            continue
+        resultado['conteo_ids'].append(fila['conteo_id'])
+        stock_conteo = fila['stock'] - fila['movido']
+        ajuste = fila['cantidad_contada'] - stock_conteo
+        if ajuste:
+            resultado['filas'].append({
+                'producto_id': fila['id'],
+                'codigo': fila['codigo'],
+                'atributo': normalizar_atributo(fila['atributo']),
+                'nombre': fila['nombre'],
+                'conteo_id': fila['conteo_id'],
+                'cantidad_contada': fila['cantidad_contada'],
+                'fecha_conteo': fila['fecha_conteo'],
+                'stock_conteo': stock_conteo,
+                'stock': fila['stock'],
+                'ajuste': ajuste,
+            })
+    return resultado
+
+
+def _fecha_conteo(fila):
+    return timezone.localtime(fila['fecha_conteo']).strftime('%Y-%m-%d %H:%M')
+
+
+def resumen_diferencias(diferencias):
+    """Totales de una vista previa: productos, unidades que suben y que bajan"""
+    ajustes = [fila['ajuste'] for fila in diferencias['filas']]
+    return {
+        'productos': len(ajustes),
+        'unidades_suben': sum(ajuste for ajuste in ajustes if ajuste > 0),
+        'unidades_bajan': -sum(ajuste for ajuste in ajustes if ajuste < 0),
+        'ambiguos': diferencias['ambiguos'],
+    }
+
+
+def _marcar_aplicados(conteo_ids, momento):
+    """Marca aplicado_en de los conteos y de sus filas vigentes, por lotes de ids"""
+    conteo_ids = list(conteo_ids)
+    for inicio in range(0, len(conteo_ids), TAMANO_LOTE_CAPTURA):
+        lote = conteo_ids[inicio:inicio + TAMANO_LOTE_CAPTURA]
+        ConteoFisico.objects.filter(id__in=lote).update(aplicado_en=momento)
+        ConteoFisicoActual.objects.filter(conteo_id__in=lote).update(aplicado_en=momento)
+
+
+def aplicar_conteos(usuario=None, simular=False):
+    """
+    Aplica al stock las diferencias de diferencias_conteo(): un UPDATE por
+    lote de productos y los movimientos de ajuste con bulk_create, en una
+    transacción (se recalculan dentro de ella), y marca como aplicados todos
+    los conteos revisados. Con simular=True solo devuelve las diferencias,
+    sin escribir.
+
+    Returns:
+        el resultado de diferencias_conteo() (lo aplicado o lo que se aplicaría)
+    """
+    from .movimientos_stock import incrementar_stock, movimientos_encadenados, registrar_movimientos
+
+    if simular:
+        return diferencias_conteo()
+
+    with transaction.atomic():
+        diferencias = diferencias_conteo()
+        filas = diferencias['filas']
+        if filas:
+            stock_anterior = incrementar_stock({fila['producto_id']: fila['ajuste'] for fila in filas})
+            movimientos = movimientos_encadenados(
+                (
+                    (fila['producto_id'], fila['ajuste'], f"Conteo físico del {_fecha_conteo(fila)}")
+                    for fila in filas
+                ),
+                stock_anterior, 'ajuste', usuario=usuario,
+            )
+            for movimiento, fila in zip(movimientos, filas):
+                movimiento.conteo_id = fila['conteo_id']
+            registrar_movimientos(movimientos)
+        _marcar_aplicados(diferencias['conteo_ids'], timezone.now())
+    return diferencias
+
+
+def fila_aplicar_conteo(fila):
+    """Fila CSV de la vista previa (columnas de COLUMNAS_APLICAR_CONTEO)"""
+    return [
+        fila['codigo'], fila['atributo'] or '-', fila['nombre'], fila['cantidad_contada'],
+        _fecha_conteo(fila), fila['stock_conteo'], fila['stock'], fila['ajuste'],
+    ]
@@ -0,0 +1,415 @@
+"""
+Exportaciones de reportes (CSV y XLSX) sin materializar el rango completo.
+
+Cada exportación es un par (encabezados, generador de filas). Los generadores
+recorren los querysets con ``.iterator(chunk_size=...)``:
+
+- CSV: se envía con StreamingHttpResponse a medida que se producen las filas.
+- XLSX: se escribe con el libro write-only de openpyxl en un archivo temporal
+  (en memoria hasta XLSX_MAX_EN_MEMORIA, luego en disco) y se envía por bloques.
+"""
+import csv
+import tempfile
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import CajaUsuario, GastoCaja, Venta
+
+# Filas por consulta al recorrer los querysets
+TAMANO_LOTE_EXPORTACION = 2000
+
+# Bytes aproximados por bloque enviado al cliente
+TAMANO_BLOQUE_CSV = 64 * 1024
+
+FORMATO_FECHA_EXPORTACION = '%Y-%m-%d %H:%M:%S'
+
+ENCABEZADOS_VENTAS_CSV = [
+    'ID', 'Fecha', 'Total', 'Metodo Pago', 'Completada', 'Anulada',
+    'Usuario', 'Vendedor', 'Registradora',
+    'Items Cantidad', 'Items Detalle'
+]
+ENCABEZADOS_VENTAS_XLSX = [
+    'ID', 'Fecha', 'Total', 'Metodo Pago', 'Anulada',
+    'Usuario', 'Vendedor', 'Registradora',
+    'Items Cantidad', 'Items Detalle'
+]
+ENCABEZADOS_ITEMS_XLSX = [
+    'VentaID', 'Fecha', 'Producto', 'Cantidad', 'Precio Unitario', 'Subtotal'
+]
+ENCABEZADOS_MOVIMIENTOS = [
+    'Fecha', 'Tipo', 'Descripcion', 'Monto', 'Metodo', 'Usuario', 'CajaUsuarioID'
+]
+ENCABEZADOS_CAJAS_CSV = [
+    'CajaUsuarioID', 'Apertura', 'Cierre', 'Monto Inicial', 'Monto Final', 'Usuario'
+]
+ENCABEZADOS_CAJAS_XLSX = [
+    'CajaUsuarioID', 'Caja', 'Apertura', 'Cierre', 'Monto Inicial', 'Monto Final', 'Usuario'
+]
+ENCABEZADOS_MOVIMIENTOS_CAJA = [
+    'Fecha/Hora', 'Tipo', 'Descripcion', 'Monto', 'Saldo Antes', 'Saldo Despues', 'Metodo de Pago', 'Usuario'
+]
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea escrita en vez de guardarla"""
+
+    def write(self, valor):
+        return valor
+
+
+def lineas_csv(encabezados, filas, tamano_bloque=TAMANO_BLOQUE_CSV):
+    """
+    Genera el CSV en bloques de texto de ~tamano_bloque caracteres.
+
+    Agrupar líneas evita enviar un fragmento por fila sin acumular el archivo.
+    """
+    writer = csv.writer(_Eco())
+    bloque = [writer.writerow(encabezados)]
+    tamano = len(bloque[0])
+    for fila in filas:
+        linea = writer.writerow(fila)
+        bloque.append(linea)
+        tamano += len(linea)
+        if tamano >= tamano_bloque:
+            yield ''.join(bloque)
+            bloque = []
+            tamano = 0
+    if bloque:
+        yield ''.join(bloque)
+
+
+def respuesta_csv(filename, encabezados, filas):
+    """StreamingHttpResponse con el CSV de `filas` como adjunto"""
+    response = StreamingHttpResponse(
+        lineas_csv(encabezados, filas),
+        content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def escribir_csv(destino, encabezados, filas):
+    """Escribe el CSV de `filas` en la ruta `destino` (UTF-8) por bloques"""
+    with open(destino, 'w', encoding='utf-8', newline='') as archivo:
+        for bloque in lineas_csv(encabezados, filas):
+            archivo.write(bloque)
+
+
+def _fecha_local(fecha, tz):
+    return timezone.localtime(fecha, tz).strftime(FORMATO_FECHA_EXPORTACION)
+
+
+def _username(usuario):
+    return usuario.username if usuario else ''
+
+
+def _ventas_rango(inicio_dt, fin_dt):
+    return Venta.objects.filter(
+        fecha__gte=inicio_dt, fecha__lt=fin_dt, completada=True
+    ).order_by('fecha', 'id')
+
+
+def filas_ventas_csv(inicio_dt, fin_dt, tz, chunk_size=TAMANO_LOTE_EXPORTACION):
+    """Una fila por venta completada del rango con el detalle de sus items"""
+    ventas = _ventas_rango(inicio_dt, fin_dt).select_related(
+        'usuario', 'vendedor'
+    ).prefetch_related('items')
+    for v in ventas.iterator(chunk_size=chunk_size):
+        items = list(v.items.all())
+        items_cant = sum((it.cantidad or 0) for it in items)
+        items_detalle = ' | '.join([
+            f"{it.nombre} x{it.cantidad} (${it.subtotal})" for it in items
+        ])
+        yield [
+            v.id,
+            _fecha_local(v.fecha, tz),
+            v.total,
+            v.metodo_pago,
+            int(v.completada),
+            int(v.anulada),
+            _username(v.usuario),
+            _username(v.vendedor),
+            (v.registradora_id or ''),
+            items_cant,
+            items_detalle,
+        ]
+
+
+def filas_movimientos(inicio_dt, fin_dt, tz, chunk_size=TAMANO_LOTE_EXPORTACION):
+    """Ventas del rango seguidas de los gastos/ingresos del rango"""
+    ventas = _ventas_rango(inicio_dt, fin_dt).select_related('usuario')
+    filas_ventas = (
+        [
+            _fecha_local(v.fecha, tz),
+            'venta_anulada' if v.anulada else 'venta',
+            f'Venta #{v.id}',
+            v.total,
+            v.metodo_pago,
+            _username(v.usuario),
+            '',
+        ]
+        for v in ventas.iterator(chunk_size=chunk_size)
+    )
+    gastos = GastoCaja.objects.filter(
+        fecha__gte=inicio_dt, fecha__lt=fin_dt
+    ).select_related('usuario').order_by('fecha', 'id')
+    filas_gastos = (
+        [
+            _fecha_local(g.fecha, tz),
+            g.tipo,
+            g.descripcion,
+            g.monto,
+            '',
+            _username(g.usuario),
+            (g.caja_usuario_id or ''),
+        ]
+        for g in gastos.iterator(chunk_size=chunk_size)
+    )
+    return chain(filas_ventas, filas_gastos)
+
+
+def filas_cajas_csv(inicio_dt, fin_dt, tz, chunk_size=TAMANO_LOTE_EXPORTACION):
+    """Sesiones de caja que se cruzan con el rango, más recientes primero"""
+    cajas = CajaUsuario.objects.filter(
+        fecha_apertura__lt=fin_dt
+    ).filter(
+        Q(fecha_cierre__gte=inicio_dt) | Q(fecha_cierre__isnull=True)
+    ).select_related('usuario').order_by('-fecha_apertura')
+    for cu in cajas.iterator(chunk_size=chunk_size):
+        yield [
+            cu.id,
+            _fecha_local(cu.fecha_apertura, tz),
+            _fecha_local(cu.fecha_cierre, tz) if cu.fecha_cierre else '',
+            cu.monto_inicial,
+            (cu.monto_final if cu.monto_final is not None else ''),
+            _username(cu.usuario),
+        ]
+
+
+def filas_movimientos_caja(movimientos):
+    """Filas de exportación para los movimientos con saldo del reporte de caja"""
+    for m in movimientos:
+        yield [
+            m['fecha_local'].strftime(FORMATO_FECHA_EXPORTACION),
+            m['tipo'],
+            m['descripcion'],
+            m['delta'],
+            m['saldo_antes'],
+            m['saldo_despues'],
+            m['metodo_pago'] or '-',
+            m['usuario'] or '',
+        ]
+
+
+# Exportaciones del reporte de caja (parámetro export=)
+EXPORTACIONES_CAJA = ('ventas', 'movimientos', 'cajas', 'movimientos_caja')
+
+
+def exportacion_caja_csv(export_tipo, inicio_dt, fin_dt, tz):
+    """(encabezados, filas) del CSV de una exportación del reporte de caja"""
+    if export_tipo == 'ventas':
+        return ENCABEZADOS_VENTAS_CSV, filas_ventas_csv(inicio_dt, fin_dt, tz)
+    if export_tipo == 'movimientos':
+        return ENCABEZADOS_MOVIMIENTOS, filas_movimientos(inicio_dt, fin_dt, tz)
+    if export_tipo == 'cajas':
+        return ENCABEZADOS_CAJAS_CSV, filas_cajas_csv(inicio_dt, fin_dt, tz)
+    from .reporte_caja import movimientos_caja
+    return ENCABEZADOS_MOVIMIENTOS_CAJA, filas_movimientos_caja(movimientos_caja(inicio_dt, fin_dt))
+
+
+def exportacion_caja_xlsx(export_tipo, inicio_dt, fin_dt, tz):
+    """(hojas, filas) del XLSX de una exportación del reporte de caja"""
+    if export_tipo == 'ventas':
+        return [
+            ('Ventas', ENCABEZADOS_VENTAS_XLSX, None),
+            ('Items', ENCABEZADOS_ITEMS_XLSX, None),
+        ], filas_ventas_xlsx(inicio_dt, fin_dt, tz)
+    if export_tipo == 'movimientos':
+        return [('Movimientos', ENCABEZADOS_MOVIMIENTOS, None)], una_hoja(filas_movimientos(inicio_dt, fin_dt, tz))
+    if export_tipo == 'cajas':
+        return [('Cajas', ENCABEZADOS_CAJAS_XLSX, None)], una_hoja(filas_cajas_xlsx(inicio_dt, fin_dt, tz))
+    from .reporte_caja import movimientos_caja
+    return [('MovimientosCaja', ENCABEZADOS_MOVIMIENTOS_CAJA, None)], una_hoja(
+        filas_movimientos_caja(movimientos_caja(inicio_dt, fin_dt))
+    )
+
+
+# ----------------------------------------------------------------------
+# XLSX
+# ----------------------------------------------------------------------
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Bytes del XLSX que se mantienen en memoria antes de pasar a un archivo en disco
+XLSX_MAX_EN_MEMORIA = 8 * 1024 * 1024
+
+# Relleno de filas resaltadas (verde claro)
+COLOR_RESALTADO_XLSX = 'C6EFCE'
+
+
+def xlsx_write_only():
+    """Indica si el XLSX se genera con el libro write-only (por defecto sí)"""
+    return getattr(settings, 'REPORTES_XLSX_WRITE_ONLY', True)
+
+
+def filas_ventas_xlsx(inicio_dt, fin_dt, tz, chunk_size=TAMANO_LOTE_EXPORTACION):
+    """Filas (hoja, valores): hoja 0 = ventas, hoja 1 = items de cada venta"""
+    ventas = _ventas_rango(inicio_dt, fin_dt).select_related(
+        'usuario', 'vendedor'
+    ).prefetch_related('items')
+    for v in ventas.iterator(chunk_size=chunk_size):
+        items = list(v.items.all())
+        items_cant = sum((it.cantidad or 0) for it in items)
+        items_detalle = ' | '.join([
+            f"{it.nombre} x{it.cantidad} (${it.subtotal})" for it in items
+        ])
+        fecha_local = _fecha_local(v.fecha, tz)
+        yield 0, [
+            v.id,
+            fecha_local,
+            v.total,
+            v.metodo_pago,
+            int(v.anulada),
+            _username(v.usuario),
+            _username(v.vendedor),
+            (v.registradora_id or ''),
+            items_cant,
+            items_detalle,
+        ]
+        for it in items:
+            yield 1, [
+                v.id,
+                fecha_local,
+                it.nombre,
+                it.cantidad,
+                it.precio_unitario,
+                it.subtotal,
+            ]
+
+
+def filas_cajas_xlsx(inicio_dt, fin_dt, tz, chunk_size=TAMANO_LOTE_EXPORTACION):
+    """Sesiones de caja que se cruzan con el rango, por fecha de apertura"""
+    cajas = CajaUsuario.objects.filter(
+        fecha_apertura__lt=fin_dt
+    ).filter(
+        Q(fecha_cierre__gte=inicio_dt) | Q(fecha_cierre__isnull=True)
+    ).select_related('usuario', 'caja').order_by('fecha_apertura')
+    for cu in cajas.iterator(chunk_size=chunk_size):
+        yield [
+            cu.id,
+            (cu.caja.nombre if cu.caja else ''),
+            _fecha_local(cu.fecha_apertura, tz),
+            _fecha_local(cu.fecha_cierre, tz) if cu.fecha_cierre else '',
+            cu.monto_inicial,
+            (cu.monto_final if cu.monto_final is not None else ''),
+            _username(cu.usuario),
+        ]
+
+
+def filas_resumen_inventario_xlsx(resumen_productos):
+    """Filas del resumen de inventario; resalta las que coinciden con el conteo físico"""
+    from .reporte_inventario import fila_resumen_inventario
+
+    for item in resumen_productos:
+        cantidad_contada = item.get('cantidad_contada')
+        coincide = cantidad_contada is not None and item.get('stock_actual', 0) == cantidad_contada
+        yield 0, fila_resumen_inventario(item), coincide
+
+
+def una_hoja(filas):
+    """Adapta filas de una sola hoja al formato (hoja, valores)"""
+    return ((0, fila) for fila in filas)
+
+
+def escribir_xlsx(destino, hojas, filas, write_only=None):
+    """
+    Escribe un libro XLSX en `destino` (archivo binario o ruta).
+
+    Args:
+        hojas: lista de (titulo, encabezados, anchos) donde anchos es
+            {letra_columna: ancho} o None
+        filas: iterable de (indice_hoja, valores) o (indice_hoja, valores, resaltar)
+        write_only: usar el libro write-only de openpyxl (None = setting
+            REPORTES_XLSX_WRITE_ONLY)
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, PatternFill
+
+    if write_only is None:
+        write_only = xlsx_write_only()
+
+    fuente_encabezado = Font(bold=True)
+    alineacion_encabezado = Alignment(horizontal='center', vertical='center')
+    relleno = PatternFill(start_color=COLOR_RESALTADO_XLSX, end_color=COLOR_RESALTADO_XLSX, fill_type='solid')
+
+    wb = Workbook(write_only=write_only)
+    if not write_only:
+        wb.remove(wb.active)
+
+    hojas_ws = []
+    for titulo, encabezados, anchos in hojas:
+        ws = wb.create_sheet(titulo)
+        # En write-only los anchos deben fijarse antes de escribir filas
+        for columna, ancho in (anchos or {}).items():
+            ws.column_dimensions[columna].width = ancho
+        if write_only:
+            celdas = []
+            for valor in encabezados:
+                celda = WriteOnlyCell(ws, value=valor)
+                celda.font = fuente_encabezado
+                celda.alignment = alineacion_encabezado
+                celdas.append(celda)
+            ws.append(celdas)
+        else:
+            ws.append(list(encabezados))
+            for celda in ws[1]:
+                celda.font = fuente_encabezado
+                celda.alignment = alineacion_encabezado
+        hojas_ws.append(ws)
+
+    for fila in filas:
+        indice, valores = fila[0], fila[1]
+        resaltar = len(fila) > 2 and fila[2]
+        ws = hojas_ws[indice]
+        if not resaltar:
+            ws.append(valores)
+        elif write_only:
+            celdas = []
+            for valor in valores:
+                celda = WriteOnlyCell(ws, value=valor)
+                celda.fill = relleno
+                celdas.append(celda)
+            ws.append(celdas)
+        else:
+            ws.append(valores)
+            for celda in ws[ws.max_row]:
+                celda.fill = relleno
+
+    wb.save(destino)
+
+
+def respuesta_xlsx(filename, hojas, filas, write_only=None):
+    """
+    FileResponse con el XLSX generado en un SpooledTemporaryFile.
+
+    El archivo se envía por bloques y se cierra (liberando el temporal) al
+    terminar la respuesta.
+    """
+    archivo = tempfile.SpooledTemporaryFile(max_size=XLSX_MAX_EN_MEMORIA)
+    try:
+        escribir_xlsx(archivo, hojas, filas, write_only=write_only)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=filename,
+        content_type=CONTENT_TYPE_XLSX,
+    )
@@ -0,0 +1,50 @@
+"""
+Rangos de fechas locales para filtrar columnas DateTimeField.
+
+Con USE_TZ=True, un filtro como fecha__date__gte envuelve la columna en una
+conversión de zona horaria (django_datetime_cast_date en SQLite, AT TIME ZONE
+en PostgreSQL) y el índice sobre `fecha` deja de usarse. Aquí los días locales
+(America/Bogota) se convierten a un rango aware semiabierto [inicio, fin) que
+se compara directamente con la columna:
+
+    MovimientoStock.objects.filter(filtro_rango_fechas('fecha', desde, hasta))
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def rango_fechas_local(fecha_desde=None, fecha_hasta=None):
+    """
+    (inicio, fin) aware del rango de fechas locales, semiabierto: inicio
+    inclusive y fin exclusivo (medianoche del día siguiente a fecha_hasta).
+    Cualquiera de los dos es None si no se indicó la fecha.
+    """
+    tz = timezone.get_current_timezone()
+    inicio = fin = None
+    if fecha_desde:
+        inicio = timezone.make_aware(datetime.combine(fecha_desde, time.min), tz)
+    if fecha_hasta:
+        fin = timezone.make_aware(datetime.combine(fecha_hasta + timedelta(days=1), time.min), tz)
+    return inicio, fin
+
+
+def filtro_rango_fechas(campo, fecha_desde=None, fecha_hasta=None):
+    """
+    Q equivalente a `campo__date__gte=fecha_desde, campo__date__lte=fecha_hasta`
+    pero sobre la columna sin convertir (usa el índice). Sin fechas no filtra.
+    """
+    inicio, fin = rango_fechas_local(fecha_desde, fecha_hasta)
+    filtro = Q()
+    if inicio is not None:
+        filtro &= Q(**{f'{campo}__gte': inicio})
+    if fin is not None:
+        filtro &= Q(**{f'{campo}__lt': fin})
+    return filtro
+
+
+def filtro_dia_local(campo, fecha=None):
+    """Q de un solo día local (hoy si no se indica), equivalente a `campo__date=fecha`"""
+    fecha = fecha or timezone.localdate()
+    return filtro_rango_fechas(campo, fecha, fecha)
@@ -0,0 +1,45 @@
+"""
+Datos del producto guardados en ItemVenta.
+
+Cada item conserva código, nombre, atributo y código de barras del producto
+tal como estaban al vender. save() los copia al crear el item; las cargas que
+no pasan por save() (bulk_create, SQL directo) y los items anteriores a estos
+campos se completan con rellenar_datos_producto().
+"""
+from django.db.models import OuterRef, Subquery
+
+CAMPOS_PRODUCTO_ITEM = ('codigo', 'nombre', 'atributo', 'codigo_barras')
+TAMANO_LOTE_ITEMS = 5000
+
+
+def rellenar_datos_producto(item_model, producto_model, todos=False, tamano_lote=TAMANO_LOTE_ITEMS):
+    """
+    Copia los datos del producto a los items de venta con un UPDATE por rango
+    de ids (subconsultas al producto, sin traer filas a Python).
+
+    Args:
+        item_model / producto_model: modelos (los de apps.get_model en migraciones)
+        todos: recopiar también los items que ya tienen datos; por defecto solo
+            se completan los que tienen el nombre vacío
+        tamano_lote: ids por UPDATE
+
+    Returns:
+        cantidad de items actualizados
+    """
+    items = item_model.objects.all()
+    if not todos:
+        items = items.filter(nombre='')
+    rango = items.order_by('id').values_list('id', flat=True)
+    primero = rango.first()
+    if primero is None:
+        return 0
+    ultimo = rango.last()
+
+    valores = {
+        campo: Subquery(producto_model.objects.filter(pk=OuterRef('producto_id')).values(campo)[:1])
+        for campo in CAMPOS_PRODUCTO_ITEM
+    }
+    actualizados = 0
+    for desde in range(primero, ultimo + 1, tamano_lote):
+        actualizados += items.filter(id__gte=desde, id__lt=desde + tamano_lote).update(**valores)
+    return actualizados
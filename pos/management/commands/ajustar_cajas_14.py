@@ -7,6 +7,7 @@ Uso: python manage.py ajustar_cajas_14
 from datetime import datetime
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from pos.fechas import filtro_dia_local
 from pos.models import CajaUsuario, GastoCaja
 
 
@@ -20,7 +21,7 @@ class Command(BaseCommand):
         cierre = datetime(2025, 12, 14, 23, 59, 59, 999999, tzinfo=tz)
 
         cu_ids = list(
-            CajaUsuario.objects.filter(fecha_apertura__date=target_date).values_list(
+            CajaUsuario.objects.filter(filtro_dia_local('fecha_apertura', target_date)).values_list(
                 "id", flat=True
             )
         )
@@ -35,7 +36,7 @@ class Command(BaseCommand):
         # Reasignar gastos de ese día a cada caja (si hay varias, todos a la primera)
         if cu_ids:
             destino_id = cu_ids[0]
-            gastos = GastoCaja.objects.filter(fecha__date=target_date)
+            gastos = GastoCaja.objects.filter(filtro_dia_local('fecha', target_date))
             for g in gastos:
                 if g.caja_usuario_id != destino_id:
                     g.caja_usuario_id = destino_id
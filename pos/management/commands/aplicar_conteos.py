@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from pos.conteos import aplicar_conteos, resumen_diferencias
+
+
+class Command(BaseCommand):
+    help = (
+        'Muestra los ajustes de stock pendientes de los conteos físicos vigentes (vista previa). '
+        'Con --aplicar los registra en una transacción: stock en bloque y movimientos de ajuste'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--aplicar',
+            action='store_true',
+            help='Aplicar los ajustes (sin esta opción no se escribe nada)',
+        )
+        parser.add_argument(
+            '--detalle',
+            action='store_true',
+            help='Listar cada ajuste',
+        )
+
+    def handle(self, *args, **options):
+        diferencias = aplicar_conteos(simular=not options['aplicar'])
+        if options['detalle']:
+            for fila in diferencias['filas']:
+                self.stdout.write(
+                    f"{fila['codigo']} {fila['atributo'] or '-'}: contado {fila['cantidad_contada']}, "
+                    f"stock al contar {fila['stock_conteo']}, ajuste {fila['ajuste']:+d}"
+                )
+
+        resumen = resumen_diferencias(diferencias)
+        self.stdout.write(
+            f"Productos: {resumen['productos']} (+{resumen['unidades_suben']} / -{resumen['unidades_bajan']} unidades), "
+            f"omitidos por código y atributo repetido: {resumen['ambiguos']}"
+        )
+        if options['aplicar']:
+            self.stdout.write(self.style.SUCCESS('Ajustes aplicados'))
+        else:
+            self.stdout.write(self.style.WARNING('Vista previa: use --aplicar para registrar los ajustes'))
@@ -0,0 +1,409 @@
+"""
+Benchmark de reportes con datos sintéticos.
+
+Los datos se crean dentro de una transacción que se revierte al final, así que
+el comando se puede ejecutar sobre la base de datos real sin dejar rastro.
+
+Uso:
+    python manage.py benchmark_reportes --escenario inventario --productos 5000,50000
+    python manage.py benchmark_reportes --escenario xlsx --ventas 5000,50000
+    python manage.py benchmark_reportes --escenario marketing --ventas 200000 --vendedores 50
+    python manage.py benchmark_reportes --escenario abc --productos 50000 --dias 365 --densidad 0.2
+"""
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from pos.models import GastoCaja, ItemVenta, MovimientoStock, Producto, Venta, VentaProductoDiaria
+from pos.sku import sku_key
+
+
+class Command(BaseCommand):
+    help = 'Mide tiempo y cantidad de consultas de los reportes con datos sintéticos (se revierten al terminar)'
+
+    ESCENARIOS = ['inventario', 'xlsx', 'marketing', 'abc']
+
+    # Exportaciones medidas en el escenario xlsx
+    EXPORTACIONES_XLSX = ['ventas', 'movimientos']
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--escenario',
+            choices=self.ESCENARIOS,
+            default='inventario',
+            help='Reporte a medir',
+        )
+        parser.add_argument(
+            '--productos',
+            type=str,
+            default='5000,50000',
+            help='Cantidades de productos separadas por coma (default: 5000,50000)',
+        )
+        parser.add_argument(
+            '--movimientos-por-producto',
+            type=int,
+            default=3,
+            help='Movimientos de stock por producto (default: 3)',
+        )
+        parser.add_argument(
+            '--ventas',
+            type=str,
+            default='5000,50000',
+            help='Cantidades de ventas separadas por coma para los escenarios xlsx y marketing (default: 5000,50000)',
+        )
+        parser.add_argument(
+            '--vendedores',
+            type=int,
+            default=50,
+            help='Vendedores entre los que se reparten las ventas en el escenario marketing (default: 50)',
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=365,
+            help='Días de ventas por producto en el escenario abc (default: 365)',
+        )
+        parser.add_argument(
+            '--densidad',
+            type=float,
+            default=0.2,
+            help='Fracción de días con ventas de cada producto en el escenario abc (default: 0.2)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("=" * 80)
+        self.stdout.write(self.style.SUCCESS(f"BENCHMARK DE REPORTES - ESCENARIO: {options['escenario']}"))
+        self.stdout.write("=" * 80)
+
+        escenario = getattr(self, f"_escenario_{options['escenario']}")
+        escenario(options)
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
+
+    def _cantidades(self, valor):
+        return [int(v) for v in str(valor).split(',') if v.strip()]
+
+    def _usuario_benchmark(self):
+        usuario, _ = User.objects.get_or_create(
+            username='benchmark_reportes',
+            defaults={'is_staff': True, 'is_superuser': True},
+        )
+        return usuario
+
+    def _request(self, usuario, params):
+        request = RequestFactory().get('/reportes/', params)
+        request.user = usuario
+        request.session = {}
+        from django.contrib.messages.storage.fallback import FallbackStorage
+        request._messages = FallbackStorage(request)
+        return request
+
+    def _medir_vista(self, vista, usuario, params):
+        """Ejecuta la vista y devuelve (segundos, consultas, status)"""
+        request = self._request(usuario, params)
+
+        # Contador propio: CaptureQueriesContext solo guarda las últimas 9000 consultas
+        consultas = [0]
+
+        def _contar(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(_contar):
+            inicio = time.perf_counter()
+            response = vista(request)
+            if hasattr(response, 'streaming_content'):
+                for _ in response.streaming_content:
+                    pass
+            duracion = time.perf_counter() - inicio
+        return duracion, consultas[0], response.status_code
+
+    def _medir_exportacion(self, vista, usuario, params):
+        """Ejecuta la exportación completa y devuelve (segundos, pico_bytes, tamano_bytes, status)"""
+        request = self._request(usuario, params)
+        tracemalloc.start()
+        try:
+            inicio = time.perf_counter()
+            response = vista(request)
+            tamano = 0
+            if response.streaming:
+                # Sin response.close(): dispararía request_finished y cerraría la conexión
+                for bloque in response.streaming_content:
+                    tamano += len(bloque)
+            else:
+                tamano = len(response.content)
+            duracion = time.perf_counter() - inicio
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return duracion, pico, tamano, response.status_code
+
+    def _crear_productos(self, cantidad, prefijo):
+        productos = [
+            Producto(
+                codigo=f'{prefijo}{i // 3:06d}',
+                nombre=f'Producto benchmark {i // 3}',
+                atributo=['S', 'M', 'L'][i % 3],
+                sku_key=sku_key(f'{prefijo}{i // 3:06d}', ['S', 'M', 'L'][i % 3]),
+                precio=1000 + (i % 500) * 10,
+                stock=i % 40,
+                activo=True,
+            )
+            for i in range(cantidad)
+        ]
+        Producto.objects.bulk_create(productos, batch_size=2000)
+        return list(Producto.objects.filter(codigo__startswith=prefijo).values_list('id', flat=True))
+
+    def _crear_movimientos(self, producto_ids, por_producto, usuario):
+        tipos = ['ingreso', 'salida', 'ajuste']
+        ahora = timezone.now()
+        lote = []
+        for producto_id in producto_ids:
+            for j in range(por_producto):
+                lote.append(MovimientoStock(
+                    producto_id=producto_id,
+                    tipo=tipos[j % 3],
+                    cantidad=5 + j,
+                    stock_anterior=0,
+                    stock_nuevo=5 + j,
+                    motivo='Benchmark',
+                    fecha=ahora,
+                    usuario=usuario,
+                ))
+            if len(lote) >= 5000:
+                MovimientoStock.objects.bulk_create(lote, batch_size=5000)
+                lote = []
+        if lote:
+            MovimientoStock.objects.bulk_create(lote, batch_size=5000)
+
+    def _crear_ventas(self, cantidad, usuario, inicio):
+        """Ventas con dos items cada una y un gasto por cada diez ventas"""
+        productos = [
+            Producto.objects.create(
+                codigo=f'BENCHX{i}', nombre=f'Producto exportación {i}', precio=1000 + i, stock=0
+            )
+            for i in range(10)
+        ]
+        for desde in range(0, cantidad, 5000):
+            hasta = min(desde + 5000, cantidad)
+            ventas = Venta.objects.bulk_create([
+                Venta(
+                    fecha=inicio + timedelta(seconds=i * 10),
+                    total=3000,
+                    metodo_pago=['efectivo', 'tarjeta', 'transferencia'][i % 3],
+                    completada=True,
+                    usuario=usuario,
+                    vendedor=usuario,
+                )
+                for i in range(desde, hasta)
+            ])
+            items = []
+            for i, venta in enumerate(ventas):
+                for j in range(2):
+                    producto = productos[(i + j) % len(productos)]
+                    item = ItemVenta(
+                        venta=venta, producto=producto, cantidad=1 + j,
+                        precio_unitario=1000, subtotal=1000 * (1 + j),
+                    )
+                    # bulk_create no pasa por save(): los datos del producto se copian aquí
+                    item.copiar_datos_producto(producto)
+                    items.append(item)
+            ItemVenta.objects.bulk_create(items, batch_size=5000)
+            GastoCaja.objects.bulk_create([
+                GastoCaja(
+                    tipo='gasto', monto=500, descripcion=f'Gasto benchmark {i}',
+                    fecha=inicio + timedelta(seconds=i * 10 + 5), usuario=usuario,
+                )
+                for i in range(desde, hasta, 10)
+            ])
+
+    def _crear_ventas_vendedores(self, cantidad, vendedores, usuario, inicio):
+        """Ventas sin items repartidas entre vendedores (una de cada veinte anulada)"""
+        for desde in range(0, cantidad, 5000):
+            hasta = min(desde + 5000, cantidad)
+            Venta.objects.bulk_create([
+                Venta(
+                    fecha=inicio + timedelta(seconds=i * 10),
+                    total=1000 + (i % 50) * 100,
+                    metodo_pago=['efectivo', 'tarjeta', 'transferencia'][i % 3],
+                    completada=True,
+                    anulada=(i % 20 == 0),
+                    usuario=usuario,
+                    vendedor=vendedores[i % len(vendedores)],
+                    registradora_id=1 + i % 3,
+                )
+                for i in range(desde, hasta)
+            ])
+
+    # ------------------------------------------------------------------
+    # Escenarios
+    # ------------------------------------------------------------------
+
+    def _escenario_inventario(self, options):
+        from pos.views import reportes_view
+
+        for cantidad in self._cantidades(options['productos']):
+            with transaction.atomic():
+                usuario = self._usuario_benchmark()
+                self.stdout.write(f"\nCreando {cantidad:,} productos sintéticos...")
+                producto_ids = self._crear_productos(cantidad, 'BENCH')
+                self._crear_movimientos(producto_ids, options['movimientos_por_producto'], usuario)
+
+                duracion, consultas, status = self._medir_vista(
+                    reportes_view, usuario, {'tipo': 'inventario'}
+                )
+                self.stdout.write(
+                    f"  Productos: {cantidad:>8,} | Tiempo: {duracion:8.2f}s | "
+                    f"Consultas: {consultas:>5} | HTTP {status}"
+                )
+                transaction.set_rollback(True)
+
+        self._fin()
+
+    def _escenario_xlsx(self, options):
+        """Compara el XLSX write-only con el libro en memoria (REPORTES_XLSX_WRITE_ONLY)"""
+        from pos.views import reportes_view
+
+        inicio = timezone.make_aware(timezone.datetime(2020, 1, 1, 8, 0, 0))
+        for cantidad in self._cantidades(options['ventas']):
+            with transaction.atomic():
+                usuario = self._usuario_benchmark()
+                self.stdout.write(f"\nCreando {cantidad:,} ventas sintéticas...")
+                self._crear_ventas(cantidad, usuario, inicio)
+                fin = timezone.localtime(inicio + timedelta(seconds=cantidad * 10))
+                params = {
+                    'tipo': 'caja',
+                    'fecha_desde': timezone.localtime(inicio).date().isoformat(),
+                    'fecha_hasta': fin.date().isoformat(),
+                    'format': 'xlsx',
+                }
+
+                for export in self.EXPORTACIONES_XLSX:
+                    for modo, write_only in (('en memoria', False), ('write-only', True)):
+                        with override_settings(REPORTES_XLSX_WRITE_ONLY=write_only):
+                            duracion, pico, tamano, status = self._medir_exportacion(
+                                reportes_view, usuario, {**params, 'export': export}
+                            )
+                        self.stdout.write(
+                            f"  {export:<12} {modo:<11} | Ventas: {cantidad:>8,} | "
+                            f"Tiempo: {duracion:8.2f}s | Pico memoria: {pico / 1048576:8.1f} MB | "
+                            f"Archivo: {tamano / 1048576:6.1f} MB | HTTP {status}"
+                        )
+                transaction.set_rollback(True)
+
+        self._fin()
+
+    def _escenario_marketing(self, options):
+        """Ranking de vendedores: primera consulta, consulta cacheada y consulta tras una venta nueva"""
+        from pos.views import marketing_view
+        from pos.ventas_diarias import reconstruir_ventas_diarias
+
+        inicio = timezone.make_aware(timezone.datetime(2020, 1, 1, 8, 0, 0))
+        for cantidad in self._cantidades(options['ventas']):
+            with transaction.atomic():
+                usuario = self._usuario_benchmark()
+                self.stdout.write(
+                    f"\nCreando {cantidad:,} ventas sintéticas de {options['vendedores']} vendedores..."
+                )
+                User.objects.bulk_create([
+                    User(username=f'benchmark_vendedor_{i}', first_name='Vendedor', last_name=str(i))
+                    for i in range(options['vendedores'])
+                ])
+                vendedores = list(User.objects.filter(username__startswith='benchmark_vendedor_'))
+                self._crear_ventas_vendedores(cantidad, vendedores, usuario, inicio)
+                # bulk_create no dispara señales: cargar la tabla de totales diarios
+                reconstruir_ventas_diarias()
+
+                fin = timezone.localtime(inicio + timedelta(seconds=cantidad * 10))
+                params = {
+                    'fecha_desde': timezone.localtime(inicio).date().isoformat(),
+                    'fecha_hasta': fin.date().isoformat(),
+                }
+                mediciones = [('primera', None), ('cacheada', None), ('tras venta', vendedores[0])]
+                for etiqueta, vendedor in mediciones:
+                    if vendedor:
+                        Venta.objects.create(
+                            fecha=inicio, total=1000, metodo_pago='efectivo', completada=True,
+                            usuario=usuario, vendedor=vendedor,
+                        )
+                    duracion, consultas, status = self._medir_vista(marketing_view, usuario, params)
+                    self.stdout.write(
+                        f"  Ventas: {cantidad:>8,} | {etiqueta:<10} | Tiempo: {duracion:8.3f}s | "
+                        f"Consultas: {consultas:>3} | HTTP {status}"
+                    )
+                transaction.set_rollback(True)
+
+        self._fin()
+
+    def _crear_ventas_producto_diarias(self, producto_ids, inicio, dias, densidad):
+        """Filas de VentaProductoDiaria: cada producto vende en una fracción `densidad` de los días"""
+        import numpy as np
+
+        aleatorio = np.random.default_rng(2025)
+        total = 0
+        lote = []
+        for producto_id in producto_ids:
+            dias_venta = np.flatnonzero(aleatorio.random(dias) < densidad)
+            cantidades = aleatorio.poisson(3, len(dias_venta)) + 1
+            for dia, cantidad in zip(dias_venta.tolist(), cantidades.tolist()):
+                lote.append(VentaProductoDiaria(
+                    fecha=inicio + timedelta(days=dia),
+                    producto_id=producto_id,
+                    cantidad=cantidad,
+                    valor=cantidad * (1000 + producto_id % 500 * 10),
+                    cantidad_ventas=1,
+                ))
+            if len(lote) >= 20000:
+                VentaProductoDiaria.objects.bulk_create(lote, batch_size=5000)
+                total += len(lote)
+                lote = []
+        if lote:
+            VentaProductoDiaria.objects.bulk_create(lote, batch_size=5000)
+            total += len(lote)
+        return total
+
+    def _escenario_abc(self, options):
+        """Análisis ABC y puntos de reorden: pantalla y CSV completo"""
+        from pos.views import reportes_view
+
+        inicio = timezone.localdate() - timedelta(days=options['dias'])
+        fin = inicio + timedelta(days=options['dias'] - 1)
+        params = {'tipo': 'abc', 'fecha_desde': inicio.isoformat(), 'fecha_hasta': fin.isoformat()}
+        for cantidad in self._cantidades(options['productos']):
+            with transaction.atomic():
+                usuario = self._usuario_benchmark()
+                self.stdout.write(
+                    f"\nCreando {cantidad:,} productos con {options['dias']} días de ventas "
+                    f"(densidad {options['densidad']})..."
+                )
+                producto_ids = self._crear_productos(cantidad, 'BENCH')
+                filas = self._crear_ventas_producto_diarias(producto_ids, inicio, options['dias'], options['densidad'])
+                self.stdout.write(f"  Filas de ventas diarias por producto: {filas:,}")
+
+                duracion, consultas, status = self._medir_vista(reportes_view, usuario, params)
+                self.stdout.write(
+                    f"  Pantalla | Productos: {cantidad:>8,} | Tiempo: {duracion:8.2f}s | "
+                    f"Consultas: {consultas:>3} | HTTP {status}"
+                )
+                duracion, pico, tamano, status = self._medir_exportacion(
+                    reportes_view, usuario, {**params, 'export': 'analisis_abc'}
+                )
+                self.stdout.write(
+                    f"  CSV      | Productos: {cantidad:>8,} | Tiempo: {duracion:8.2f}s | "
+                    f"Pico memoria: {pico / 1048576:8.1f} MB | Archivo: {tamano / 1048576:6.1f} MB | HTTP {status}"
+                )
+                transaction.set_rollback(True)
+
+        self._fin()
+
+    def _fin(self):
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS("Benchmark finalizado (datos sintéticos revertidos)"))
@@ -53,21 +53,21 @@ class Command(BaseCommand):
                 )
             )
 
-            # 2. Ventas
-            deleted_ventas = Venta.objects.all().delete()
+            # 2. Movimientos de stock de las ventas (antes de borrarlas: la FK quedaría en NULL)
+            deleted_movimientos_ventas = MovimientoStock.objects.filter(
+                venta__isnull=False
+            ).delete()
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'[OK] Eliminados {deleted_ventas[0]} registros de Venta'
+                    f'[OK] Eliminados {deleted_movimientos_ventas[0]} movimientos de stock relacionados con ventas'
                 )
             )
 
-            # 3. Movimientos de stock relacionados con ventas
-            deleted_movimientos_ventas = MovimientoStock.objects.filter(
-                motivo__icontains='Venta'
-            ).delete()
+            # 3. Ventas
+            deleted_ventas = Venta.objects.all().delete()
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'[OK] Eliminados {deleted_movimientos_ventas[0]} movimientos de stock relacionados con ventas'
+                    f'[OK] Eliminados {deleted_ventas[0]} registros de Venta'
                 )
             )
 
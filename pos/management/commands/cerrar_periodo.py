@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.cierre_periodo import TABLAS_ARCHIVO, cerrar_periodo
+
+
+class Command(BaseCommand):
+    help = (
+        'Cierra el período hasta la fecha indicada (inclusive): conserva sus totales en tablas resumen '
+        'y exporta ventas, items, movimientos de stock y gastos de caja a archivos JSON Lines comprimidos. '
+        'Con --mover además los elimina de las tablas (el detalle queda disponible desde el archivo)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fecha', type=str, help='Último día local del período, YYYY-MM-DD')
+        parser.add_argument(
+            '--mover',
+            action='store_true',
+            help='Eliminar de las tablas las filas archivadas',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fecha = datetime.strptime(options['fecha'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {options["fecha"]} (formato YYYY-MM-DD)')
+
+        try:
+            cierre = cerrar_periodo(fecha, mover=options['mover'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for tabla in TABLAS_ARCHIVO:
+            self.stdout.write(f'{tabla}: {cierre.conteos[tabla]}')
+        accion = 'archivado y movido' if cierre.movido else 'archivado'
+        self.stdout.write(self.style.SUCCESS(f'Período hasta {cierre.fecha} {accion} en {cierre.directorio}'))
@@ -4,6 +4,7 @@ Ejecutar con: python manage.py corregir_movimientos_caja
 """
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from pos.fechas import filtro_dia_local
 from pos.models import CajaUsuario, GastoCaja, Venta, Caja
 
 
@@ -136,8 +137,8 @@ class Command(BaseCommand):
             for fecha_dia, ventas_dia in sorted(ventas_por_dia.items()):
                 # Buscar si ya existe una caja para este dia
                 caja_existente = CajaUsuario.objects.filter(
-                    caja=caja_principal,
-                    fecha_apertura__date=fecha_dia
+                    filtro_dia_local('fecha_apertura', fecha_dia),
+                    caja=caja_principal
                 ).first()
                 
                 if caja_existente:
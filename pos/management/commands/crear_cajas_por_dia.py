@@ -5,6 +5,7 @@ Uso: python manage.py crear_cajas_por_dia
 from datetime import datetime
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from pos.fechas import filtro_dia_local
 from pos.models import Caja, CajaUsuario, Venta, GastoCaja
 
 
@@ -24,7 +25,7 @@ class Command(BaseCommand):
         ]
 
         for fecha in fechas:
-            ventas = Venta.objects.filter(completada=True, fecha__date=fecha)
+            ventas = Venta.objects.filter(filtro_dia_local('fecha', fecha), completada=True)
             if not ventas.exists():
                 self.stdout.write(f"Sin ventas en {fecha}")
                 continue
@@ -49,7 +50,7 @@ class Command(BaseCommand):
             )
 
             # Asignar gastos de ese día a la nueva caja
-            gastos = GastoCaja.objects.filter(fecha__date=fecha)
+            gastos = GastoCaja.objects.filter(filtro_dia_local('fecha', fecha))
             for g in gastos:
                 g.caja_usuario = caja
                 g.save(update_fields=["caja_usuario"])
@@ -8,6 +8,7 @@ from django.utils import timezone
 from datetime import date, timedelta, datetime
 import random
 
+from pos.fechas import filtro_dia_local
 from pos.models import (
     Producto, Caja, CajaUsuario, Venta, ItemVenta,
     MovimientoStock, GastoCaja
@@ -221,9 +222,9 @@ class Command(BaseCommand):
         
         # Verificar si ya existe una caja abierta
         caja_abierta = CajaUsuario.objects.filter(
+            filtro_dia_local('fecha_apertura', hoy),
             usuario=usuario,
-            fecha_cierre__isnull=True,
-            fecha_apertura__date=hoy
+            fecha_cierre__isnull=True
         ).first()
         
         if not caja_abierta:
@@ -4,12 +4,12 @@ Comando para crear un ingreso de mercancía desde un archivo Excel
 """
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from django.db.models import Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 from pos.models import (
     Producto, IngresoMercancia, ItemIngresoMercancia, MovimientoStock
 )
+from pos.sku import sku_key
 import openpyxl
 import os
 
@@ -177,14 +177,8 @@ class Command(BaseCommand):
                             precio_compra = 0
                     
                     # Buscar producto por código Y atributo
-                    producto = None
-                    if atributo:
-                        producto = Producto.objects.filter(codigo=codigo, atributo=atributo).first()
-                    else:
-                        # Si no hay atributo, buscar por código sin atributo (atributo=None o atributo='')
-                        producto = Producto.objects.filter(codigo=codigo).filter(
-                            Q(atributo__isnull=True) | Q(atributo='')
-                        ).first()
+                    # (sku_key: sin atributo equivale a atributo None, '' o '-')
+                    producto = Producto.objects.filter(sku_key=sku_key(codigo, atributo)).first()
                     
                     # Si no existe, crear el producto
                     if not producto:
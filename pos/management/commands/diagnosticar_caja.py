@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.db.models import Sum
 from datetime import date
 
+from pos.fechas import filtro_dia_local
 from pos.models import (
     CajaUsuario, Caja, Venta, GastoCaja
 )
@@ -25,13 +26,13 @@ class Command(BaseCommand):
         
         # Buscar caja abierta o cerrada del día
         caja_abierta = CajaUsuario.objects.filter(
-            fecha_cierre__isnull=True,
-            fecha_apertura__date=hoy
+            filtro_dia_local('fecha_apertura', hoy),
+            fecha_cierre__isnull=True
         ).first()
         
         caja_cerrada = CajaUsuario.objects.filter(
-            fecha_cierre__isnull=False,
-            fecha_apertura__date=hoy
+            filtro_dia_local('fecha_apertura', hoy),
+            fecha_cierre__isnull=False
         ).order_by('-fecha_cierre').first()
         
         caja_mostrar = caja_abierta or caja_cerrada
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from pos.models import MovimientoStock
+from pos.stock_diario import generar_stock_diario
+
+
+class Command(BaseCommand):
+    help = (
+        'Registra las fotos diarias de stock por producto (StockDiario). '
+        'Sin argumentos registra la de ayer (para ejecutar cada noche); '
+        'con --desde/--hasta o --historial construye las de fechas pasadas en bloque'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            type=str,
+            help='Fecha local inicial YYYY-MM-DD (por defecto: igual a --hasta)',
+        )
+        parser.add_argument(
+            '--hasta',
+            type=str,
+            help='Fecha local final YYYY-MM-DD, inclusive (por defecto: ayer)',
+        )
+        parser.add_argument(
+            '--historial',
+            action='store_true',
+            help='Desde el día anterior al primer movimiento de stock registrado',
+        )
+
+    def _fecha(self, valor):
+        if not valor:
+            return None
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {valor} (formato YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        fecha_desde = self._fecha(options.get('desde'))
+        fecha_hasta = self._fecha(options.get('hasta'))
+        if options.get('historial'):
+            primera = MovimientoStock.objects.aggregate(primera=Min('fecha'))['primera']
+            if primera:
+                fecha_desde = timezone.localdate(primera) - timedelta(days=1)
+        if fecha_desde and fecha_hasta and fecha_desde > fecha_hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+
+        self.stdout.write("=" * 80)
+        self.stdout.write(self.style.SUCCESS("GENERAR STOCK DIARIO"))
+        self.stdout.write("=" * 80)
+
+        total = generar_stock_diario(fecha_desde, fecha_hasta)
+
+        self.stdout.write(self.style.SUCCESS(f"[OK] {total} fotos de stock registradas"))
@@ -5,8 +5,8 @@ Comando para importar productos desde un archivo Excel con imágenes desde API
 from django.core.management.base import BaseCommand
 from django.core.files.base import ContentFile
 from django.db import transaction, models
-from django.db.models import Q
 from pos.models import Producto
+from pos.sku import sku_key
 import openpyxl
 import os
 import requests
@@ -246,18 +246,10 @@ class Command(BaseCommand):
             for prod_data in productos_a_importar:
                 try:
                     with transaction.atomic():
-                        # Buscar producto por código Y atributo
-                        if prod_data['atributo']:
-                            producto = Producto.objects.filter(
-                                codigo=prod_data['codigo'],
-                                atributo=prod_data['atributo']
-                            ).first()
-                        else:
-                            producto = Producto.objects.filter(
-                                codigo=prod_data['codigo']
-                            ).filter(
-                                Q(atributo__isnull=True) | Q(atributo='')
-                            ).first()
+                        # Buscar producto por código Y atributo normalizados (sku_key)
+                        producto = Producto.objects.filter(
+                            sku_key=sku_key(prod_data['codigo'], prod_data['atributo'])
+                        ).first()
                         
                         # Buscar imagen en el API
                         imagen_url = None
@@ -6,6 +6,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import date
 
+from pos.fechas import filtro_dia_local
 from pos.models import (
     Venta, ItemVenta, GastoCaja, CajaUsuario
 )
@@ -93,7 +94,7 @@ class Command(BaseCommand):
             
             # Eliminar aperturas de caja del día
             cajas_eliminadas = CajaUsuario.objects.filter(
-                fecha_apertura__date=hoy
+                filtro_dia_local('fecha_apertura', hoy)
             ).delete()[0]
             
             self.stdout.write(f'\n[OK] Eliminadas {ventas_eliminadas} ventas del día')
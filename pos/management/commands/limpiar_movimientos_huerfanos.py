@@ -2,7 +2,8 @@
 Comando para identificar y limpiar movimientos de stock huérfanos
 """
 from django.core.management.base import BaseCommand
-from pos.models import MovimientoStock, IngresoMercancia, SalidaMercancia
+from django.db.models import Q
+from pos.models import MovimientoStock
 
 
 class Command(BaseCommand):
@@ -21,45 +22,15 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('=' * 70))
         self.stdout.write('')
         
-        # Obtener todos los IDs de ingresos y salidas existentes
-        ingresos_ids = set(IngresoMercancia.objects.values_list('id', flat=True))
-        salidas_ids = set(SalidaMercancia.objects.values_list('id', flat=True))
-        
-        self.stdout.write(f'Ingresos existentes: {len(ingresos_ids)}')
-        self.stdout.write(f'Salidas existentes: {len(salidas_ids)}')
-        self.stdout.write('')
-        
-        # Analizar movimientos de ingresos
-        movimientos_ingresos = MovimientoStock.objects.filter(
-            motivo__startswith='Ingreso #'
-        )
-        
-        movimientos_huerfanos = []
-        
-        for mov in movimientos_ingresos:
-            # Extraer ID del ingreso del motivo
-            try:
-                # Formato: "Ingreso #5 - Bazar Cristian"
-                ingreso_id = int(mov.motivo.split('#')[1].split()[0])
-                if ingreso_id not in ingresos_ids:
-                    movimientos_huerfanos.append(mov)
-            except (ValueError, IndexError):
-                # Si no se puede extraer el ID, considerar como huérfano potencial
-                pass
-        
-        # Analizar movimientos de salidas
-        movimientos_salidas = MovimientoStock.objects.filter(
-            motivo__startswith='Salida #'
+        # Los movimientos nuevos quedan enlazados por FK (y se borran con su ingreso o salida);
+        # los huérfanos son movimientos antiguos cuyo documento ya no existía al enlazarlos
+        movimientos_huerfanos = list(
+            MovimientoStock.objects.filter(
+                Q(motivo__startswith='Ingreso #', ingreso__isnull=True) |
+                Q(motivo__startswith='Salida #', salida__isnull=True)
+            ).order_by('id')
         )
         
-        for mov in movimientos_salidas:
-            try:
-                salida_id = int(mov.motivo.split('#')[1].split()[0])
-                if salida_id not in salidas_ids:
-                    movimientos_huerfanos.append(mov)
-            except (ValueError, IndexError):
-                pass
-        
         self.stdout.write(f'Movimientos huérfanos encontrados: {len(movimientos_huerfanos)}')
         self.stdout.write('')
         
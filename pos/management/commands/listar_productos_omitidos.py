@@ -3,8 +3,8 @@
 Comando para listar productos del Excel que no se encontraron en la base de datos
 """
 from django.core.management.base import BaseCommand
-from django.db.models import Q
 from pos.models import Producto
+from pos.sku import sku_key
 import openpyxl
 import os
 
@@ -71,13 +71,8 @@ class Command(BaseCommand):
                 else:
                     atributo = None
                 
-                # Buscar producto
-                if atributo:
-                    producto = Producto.objects.filter(codigo=codigo, atributo=atributo).first()
-                else:
-                    producto = Producto.objects.filter(codigo=codigo).filter(
-                        Q(atributo__isnull=True) | Q(atributo='')
-                    ).first()
+                # Buscar producto por código y atributo normalizados (sku_key)
+                producto = Producto.objects.filter(sku_key=sku_key(codigo, atributo)).first()
                 
                 if not producto:
                     no_encontrados.append({
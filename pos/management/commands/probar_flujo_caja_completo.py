@@ -8,6 +8,7 @@ from django.utils import timezone
 from django.db.models import Sum
 from datetime import date, timedelta, datetime
 
+from pos.fechas import filtro_dia_local
 from pos.models import (
     Caja, CajaUsuario, Venta, ItemVenta,
     GastoCaja, Producto
@@ -48,9 +49,9 @@ class Command(BaseCommand):
         # Limpiar caja abierta si se solicita
         if options['limpiar']:
             CajaUsuario.objects.filter(
+                filtro_dia_local('fecha_apertura', hoy),
                 usuario=usuario,
-                fecha_cierre__isnull=True,
-                fecha_apertura__date=hoy
+                fecha_cierre__isnull=True
             ).delete()
             self.stdout.write('Caja abierta del dia actual eliminada')
         
@@ -60,9 +61,9 @@ class Command(BaseCommand):
         self.stdout.write('=' * 70)
         
         caja_abierta = CajaUsuario.objects.filter(
+            filtro_dia_local('fecha_apertura', hoy),
             usuario=usuario,
-            fecha_cierre__isnull=True,
-            fecha_apertura__date=hoy
+            fecha_cierre__isnull=True
         ).first()
         
         monto_inicial = 500000
@@ -8,6 +8,7 @@ from django.utils import timezone
 from django.db.models import Sum
 from datetime import date, timedelta, datetime
 
+from pos.fechas import filtro_dia_local
 from pos.models import (
     Caja, CajaUsuario, Venta, ItemVenta,
     GastoCaja
@@ -36,9 +37,9 @@ class Command(BaseCommand):
         # Obtener caja abierta del día actual
         hoy = date.today()
         caja_abierta = CajaUsuario.objects.filter(
+            filtro_dia_local('fecha_apertura', hoy),
             usuario=usuario,
-            fecha_cierre__isnull=True,
-            fecha_apertura__date=hoy
+            fecha_cierre__isnull=True
         ).first()
         
         if not caja_abierta:
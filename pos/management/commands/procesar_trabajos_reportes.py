@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pos.models import TrabajoReporte
+from pos.trabajos_reportes import eliminar_trabajos_antiguos, procesar_trabajo, reiniciar_trabajos_en_proceso
+
+
+class Command(BaseCommand):
+    help = 'Procesa los trabajos de reportes pendientes (sin servidor web) y limpia los antiguos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reiniciar',
+            action='store_true',
+            help='Volver a encolar los trabajos que quedaron en proceso (el servidor se detuvo)',
+        )
+        parser.add_argument(
+            '--limpiar-dias',
+            type=int,
+            default=None,
+            help='Eliminar trabajos (y sus archivos) con más de N días',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("=" * 80)
+        self.stdout.write(self.style.SUCCESS("PROCESAR TRABAJOS DE REPORTES"))
+        self.stdout.write("=" * 80)
+
+        if options['reiniciar']:
+            reiniciados = reiniciar_trabajos_en_proceso()
+            self.stdout.write(f"Trabajos reiniciados: {reiniciados}")
+
+        pendientes = list(
+            TrabajoReporte.objects.filter(estado='pendiente').order_by('id').values_list('id', flat=True)
+        )
+        for trabajo_id in pendientes:
+            if procesar_trabajo(trabajo_id):
+                trabajo = TrabajoReporte.objects.get(pk=trabajo_id)
+                estilo = self.style.SUCCESS if trabajo.estado == 'completado' else self.style.ERROR
+                self.stdout.write(estilo(f"  Trabajo #{trabajo.id} ({trabajo.tipo}): {trabajo.get_estado_display()}"))
+
+        if options['limpiar_dias'] is not None:
+            eliminados = eliminar_trabajos_antiguos(timezone.now() - timedelta(days=options['limpiar_dias']))
+            self.stdout.write(f"Trabajos antiguos eliminados: {eliminados}")
+
+        self.stdout.write(self.style.SUCCESS(f"[OK] {len(pendientes)} trabajos pendientes procesados"))
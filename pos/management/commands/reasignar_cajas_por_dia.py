@@ -10,6 +10,7 @@ from datetime import datetime, time
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from pos.fechas import filtro_dia_local
 from pos.models import Caja, CajaUsuario, GastoCaja
 
 
@@ -45,7 +46,8 @@ class Command(BaseCommand):
             # Buscar si ya existe una caja para ese día
             cu = (
                 CajaUsuario.objects.filter(
-                    caja=caja_principal, fecha_apertura__date=d
+                    filtro_dia_local('fecha_apertura', d),
+                    caja=caja_principal
                 ).order_by("fecha_apertura")
             ).first()
 
@@ -69,7 +71,7 @@ class Command(BaseCommand):
             created_or_updated.append((cu.id, d, action))
 
             # Asignar gastos de ese día a esta caja
-            gastos = GastoCaja.objects.filter(fecha__date=d)
+            gastos = GastoCaja.objects.filter(filtro_dia_local('fecha', d))
             for g in gastos:
                 if g.caja_usuario_id != cu.id:
                     g.caja_usuario = cu
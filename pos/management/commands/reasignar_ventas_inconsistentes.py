@@ -7,6 +7,7 @@ from datetime import datetime, time, timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from pos.fechas import filtro_dia_local
 from pos.models import Caja, CajaUsuario, Venta
 
 
@@ -57,7 +58,8 @@ class Command(BaseCommand):
 
             cu = (
                 CajaUsuario.objects.filter(
-                    caja=caja_principal, fecha_apertura__date=fecha
+                    filtro_dia_local('fecha_apertura', fecha),
+                    caja=caja_principal
                 ).order_by("fecha_apertura")
             ).first()
             if cu:
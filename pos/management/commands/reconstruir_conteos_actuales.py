@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pos.conteos import reconstruir_conteos_actuales
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla de conteos físicos vigentes (último conteo por código+atributo) desde el historial'
+
+    def handle(self, *args, **options):
+        self.stdout.write("=" * 80)
+        self.stdout.write(self.style.SUCCESS("RECONSTRUIR CONTEOS FÍSICOS ACTUALES"))
+        self.stdout.write("=" * 80)
+
+        with transaction.atomic():
+            total = reconstruir_conteos_actuales()
+
+        self.stdout.write(self.style.SUCCESS(f"[OK] {total} conteos vigentes registrados"))
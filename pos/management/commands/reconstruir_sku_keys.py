@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pos.models import ConteoFisico, ConteoFisicoActual, Producto
+from pos.reporte_inventario import invalidar_cache_inventario
+from pos.sku import reconstruir_sku_keys
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la clave normalizada sku_key (código|atributo) de productos y conteos físicos. '
+        'Necesario tras cargas masivas que no pasan por save() (bulk_create, update(), SQL directo)'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write("=" * 80)
+        self.stdout.write(self.style.SUCCESS("RECONSTRUIR CLAVES SKU"))
+        self.stdout.write("=" * 80)
+
+        with transaction.atomic():
+            for modelo in (Producto, ConteoFisico, ConteoFisicoActual):
+                total = reconstruir_sku_keys(modelo)
+                self.stdout.write(f"{modelo._meta.verbose_name_plural}: {total} claves actualizadas")
+        invalidar_cache_inventario()
+
+        self.stdout.write(self.style.SUCCESS("[OK] Claves SKU al día"))
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.ventas_diarias import reconstruir_ventas_producto_diarias
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla de ventas diarias por producto (VentaProductoDiaria) desde los items de venta'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            type=str,
+            help='Fecha local inicial YYYY-MM-DD (por defecto: todas)',
+        )
+        parser.add_argument(
+            '--hasta',
+            type=str,
+            help='Fecha local final YYYY-MM-DD, inclusive (por defecto: todas)',
+        )
+
+    def _fecha(self, valor):
+        if not valor:
+            return None
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {valor} (formato YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        fecha_desde = self._fecha(options.get('desde'))
+        fecha_hasta = self._fecha(options.get('hasta'))
+
+        self.stdout.write("=" * 80)
+        self.stdout.write(self.style.SUCCESS("RECONSTRUIR VENTAS DIARIAS POR PRODUCTO"))
+        self.stdout.write("=" * 80)
+
+        total = reconstruir_ventas_producto_diarias(fecha_desde, fecha_hasta)
+
+        self.stdout.write(self.style.SUCCESS(f"[OK] {total} filas de ventas diarias por producto registradas"))
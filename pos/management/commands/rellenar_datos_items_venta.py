@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pos.items_venta import TAMANO_LOTE_ITEMS, rellenar_datos_producto
+from pos.models import ItemVenta, Producto
+
+
+class Command(BaseCommand):
+    help = (
+        'Completa código, nombre, atributo y código de barras del producto en los items de venta '
+        'que no los tienen (items anteriores o cargados con bulk_create / SQL directo)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos',
+            action='store_true',
+            help='Recopiar los datos actuales del producto en todos los items (sobrescribe lo guardado al vender)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANO_LOTE_ITEMS,
+            help=f'Ids de items por UPDATE (por defecto {TAMANO_LOTE_ITEMS})',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rellenar_datos_producto(ItemVenta, Producto, todos=options['todos'], tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"[OK] {total} items de venta actualizados"))
@@ -3,9 +3,12 @@ from pos.models import (
     Producto, MovimientoStock, ItemVenta, Venta,
     ItemIngresoMercancia, IngresoMercancia,
     ItemSalidaMercancia, SalidaMercancia,
-    ConteoFisico
+    ConteoFisico, VentaProductoDiaria, ResumenStockCierre
 )
-from django.db.models import Sum
+from pos.cierre_periodo import items_venta_archivados, movimientos_archivados
+from pos.stock_diario import stock_en
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
 
 
 class Command(BaseCommand):
@@ -13,6 +16,11 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('codigo', type=str, help='Código del producto a reportar')
+        parser.add_argument(
+            '--archivo',
+            action='store_true',
+            help='Incluir el detalle de movimientos y ventas de períodos cerrados (leído del archivo)',
+        )
 
     def handle(self, *args, **options):
         codigo_producto = options['codigo'].upper()
@@ -29,19 +37,37 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"[ERROR] No se encontro ningun producto con codigo: {codigo_producto}"))
             return
         
+        # Stock inicial: stock antes del primer movimiento (foto diaria más cercana + movimientos)
+        primer_movimiento = MovimientoStock.objects.filter(
+            producto__in=productos
+        ).aggregate(primera=Min('fecha'))['primera']
+        stocks_iniciales = stock_en(primer_movimiento, [p.id for p in productos]) if primer_movimiento else {}
+
+        # Períodos cerrados y movidos: sus movimientos ya no están en la tabla, los totales vienen del resumen
+        archivados = {
+            fila['producto_id']: fila
+            for fila in ResumenStockCierre.objects.filter(producto__in=productos, cierre__movido=True).values('producto_id').annotate(
+                ingresos=Sum('ingresos'),
+                salidas_venta=Sum('salidas_venta'),
+                salidas_inventario=Sum('salidas_inventario'),
+                ajustes=Sum('ajustes'),
+                movimientos=Sum('cantidad_movimientos'),
+                cierres=Count('id'),
+            ).order_by()
+        }
+        resumenes = ResumenStockCierre.objects.filter(
+            producto__in=productos, cierre__movido=True
+        ).select_related('cierre').order_by('-cierre__fecha')
+        for resumen in resumenes:
+            # El cierre más antiguo queda al final: su stock inicial es el del historial completo
+            if primer_movimiento is None or resumen.cierre.fecha < timezone.localdate(primer_movimiento):
+                stocks_iniciales[resumen.producto_id] = resumen.stock_inicial
+
         self.stdout.write(f"PRODUCTOS ENCONTRADOS: {productos.count()}")
         self.stdout.write("-" * 80)
         for prod in productos:
             atributo = prod.atributo if prod.atributo else "(sin atributo)"
-            # Calcular stock inicial: Stock Actual + Salidas - Ingresos
-            movimientos_prod = MovimientoStock.objects.filter(producto=prod)
-            total_ingresos_prod = movimientos_prod.filter(tipo='ingreso').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            total_salidas_prod = movimientos_prod.filter(tipo='salida').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            total_ajustes_prod = movimientos_prod.filter(tipo='ajuste').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            # Stock inicial = Stock actual - (Ingresos - Salidas + Ajustes)
-            # O mejor: Stock inicial = Stock actual - Neto
-            neto = total_ingresos_prod - total_salidas_prod + total_ajustes_prod
-            stock_inicial = prod.stock - neto
+            stock_inicial = stocks_iniciales.get(prod.id, prod.stock)
             self.stdout.write(f"  • ID: {prod.id} | Nombre: {prod.nombre} | Atributo: {atributo}")
             self.stdout.write(f"    Stock Inicial: {stock_inicial} | Stock Actual: {prod.stock}")
         self.stdout.write("")
@@ -58,13 +84,7 @@ class Command(BaseCommand):
         for producto in productos:
             self.stdout.write("=" * 80)
             atributo = producto.atributo if producto.atributo else "(sin atributo)"
-            # Calcular stock inicial para este producto
-            movimientos_prod = MovimientoStock.objects.filter(producto=producto)
-            total_ingresos_prod = movimientos_prod.filter(tipo='ingreso').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            total_salidas_prod = movimientos_prod.filter(tipo='salida').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            total_ajustes_prod = movimientos_prod.filter(tipo='ajuste').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            neto = total_ingresos_prod - total_salidas_prod + total_ajustes_prod
-            stock_inicial = producto.stock - neto
+            stock_inicial = stocks_iniciales.get(producto.id, producto.stock)
             
             self.stdout.write(f"PRODUCTO: {producto.nombre} | Atributo: {atributo}")
             self.stdout.write(f"Stock Inicial: {stock_inicial} | Stock Actual: {producto.stock}")
@@ -75,21 +95,28 @@ class Command(BaseCommand):
             self.stdout.write("[MOVIMIENTOS] MOVIMIENTOS DE STOCK (MovimientoStock)")
             self.stdout.write("-" * 80)
             movimientos = MovimientoStock.objects.filter(producto=producto).order_by('-fecha')
+            archivado = archivados.get(producto.id)
             
-            if movimientos.exists():
+            if archivado or movimientos.exists():
                 ingresos = movimientos.filter(tipo='ingreso')
                 salidas = movimientos.filter(tipo='salida')
                 ajustes = movimientos.filter(tipo='ajuste')
                 
                 # Separar salidas por tipo
-                salidas_por_venta = salidas.filter(motivo__icontains='Venta')
-                salidas_inventario = salidas.exclude(motivo__icontains='Venta')
+                salidas_por_venta = salidas.filter(venta__isnull=False)
+                salidas_inventario = salidas.filter(venta__isnull=True)
                 
                 sum_ingresos = ingresos.aggregate(Sum('cantidad'))['cantidad__sum'] or 0
                 sum_salidas = salidas.aggregate(Sum('cantidad'))['cantidad__sum'] or 0
                 sum_ajustes = ajustes.aggregate(Sum('cantidad'))['cantidad__sum'] or 0
                 sum_salidas_ventas = salidas_por_venta.aggregate(Sum('cantidad'))['cantidad__sum'] or 0
                 sum_salidas_inv = salidas_inventario.aggregate(Sum('cantidad'))['cantidad__sum'] or 0
+                if archivado:
+                    sum_ingresos += archivado['ingresos']
+                    sum_salidas_ventas += archivado['salidas_venta']
+                    sum_salidas_inv += archivado['salidas_inventario']
+                    sum_salidas = sum_salidas_ventas + sum_salidas_inv
+                    sum_ajustes += archivado['ajustes']
                 
                 total_ingresos += sum_ingresos
                 total_salidas += sum_salidas
@@ -100,6 +127,10 @@ class Command(BaseCommand):
                 self.stdout.write(f"    - Salidas por Ventas: {sum_salidas_ventas}")
                 self.stdout.write(f"    - Salidas de Inventario: {sum_salidas_inv}")
                 self.stdout.write(f"  Total Ajustes: {sum_ajustes}")
+                if archivado:
+                    self.stdout.write(
+                        f"  (incluye {archivado['movimientos']} movimientos de {archivado['cierres']} períodos cerrados)"
+                    )
                 self.stdout.write("")
                 self.stdout.write("  Detalle de movimientos (ultimos 20):")
                 for mov in movimientos[:20]:
@@ -107,7 +138,7 @@ class Command(BaseCommand):
                     usuario_str = mov.usuario.username if mov.usuario else 'N/A'
                     tipo_mov = mov.tipo.upper()
                     if mov.tipo == 'salida':
-                        if mov.motivo and 'Venta' in mov.motivo:
+                        if mov.venta_id:
                             tipo_mov = 'SALIDA-VENTA'
                         else:
                             tipo_mov = 'SALIDA-INV'
@@ -120,6 +151,17 @@ class Command(BaseCommand):
                     if mov.motivo:
                         motivo_short = mov.motivo[:100] + "..." if len(mov.motivo) > 100 else mov.motivo
                         self.stdout.write(f"      Motivo: {motivo_short}")
+                if archivado and options['archivo']:
+                    self.stdout.write("")
+                    self.stdout.write("  Movimientos archivados (ultimos 20):")
+                    for mov in movimientos_archivados(producto.id)[:20]:
+                        fecha_str = mov.fecha.strftime('%Y-%m-%d %H:%M:%S')
+                        self.stdout.write(
+                            f"    [{fecha_str}] {mov.tipo.upper():15} | "
+                            f"Cantidad: {mov.cantidad:6} | "
+                            f"Stock: {mov.stock_anterior} -> {mov.stock_nuevo} | "
+                            f"Motivo: {(mov.motivo or '')[:60]}"
+                        )
             else:
                 self.stdout.write("  No hay movimientos de stock registrados")
             self.stdout.write("")
@@ -131,12 +173,21 @@ class Command(BaseCommand):
                 producto=producto,
                 venta__completada=True,
                 venta__anulada=False
-            ).order_by('-venta__fecha')
+            ).select_related('venta').order_by('-venta__fecha')
+            
+            # Totales desde la tabla diaria por producto (no recorre los items)
+            totales_ventas = VentaProductoDiaria.objects.filter(producto=producto).aggregate(
+                suma_cantidad=Sum('cantidad'),
+                suma_valor=Sum('valor'),
+                suma_ventas=Sum('cantidad_ventas'),
+            )
+            total_ventas_producto = totales_ventas['suma_cantidad'] or 0
             
-            if ventas.exists():
-                total_ventas_producto = ventas.aggregate(Sum('cantidad'))['cantidad__sum'] or 0
+            if total_ventas_producto:
                 total_ventas += total_ventas_producto
                 self.stdout.write(f"  Total Ventas: {total_ventas_producto} unidades")
+                self.stdout.write(f"  Valor Vendido: ${totales_ventas['suma_valor'] or 0:,}")
+                self.stdout.write(f"  Ventas con el producto: {totales_ventas['suma_ventas'] or 0}")
                 self.stdout.write("")
                 self.stdout.write("  Detalle de ventas (últimos 20):")
                 for item in ventas[:20]:
@@ -148,6 +199,18 @@ class Command(BaseCommand):
                         f"Total: ${item.subtotal:,} | "
                         f"Venta ID: {venta.id}"
                     )
+                if options['archivo']:
+                    items_archivados = items_venta_archivados(producto.id)
+                    if items_archivados:
+                        self.stdout.write("")
+                        self.stdout.write("  Ventas archivadas (últimas 20):")
+                    for item in items_archivados[:20]:
+                        self.stdout.write(
+                            f"    [{item['fecha'].strftime('%Y-%m-%d %H:%M:%S')}] Cantidad: {item['cantidad']:6} | "
+                            f"Precio Unit: ${item['precio_unitario']:,} | "
+                            f"Total: ${item['subtotal']:,} | "
+                            f"Venta ID: {item['venta_id']}"
+                        )
             else:
                 self.stdout.write("  No hay ventas registradas")
             self.stdout.write("")
@@ -202,35 +265,8 @@ class Command(BaseCommand):
             # 5. CONTEO FÍSICO
             self.stdout.write("[CONTEO] CONTEO FISICO (ConteoFisico)")
             self.stdout.write("-" * 80)
-            # Normalizar atributo: quitar espacios y convertir valores vacíos a None
-            atributo_buscar = producto.atributo
-            if atributo_buscar:
-                atributo_buscar = atributo_buscar.strip()  # Quitar espacios al inicio y final
-                if atributo_buscar in ('', '-', 'None', 'null'):
-                    atributo_buscar = None
-            else:
-                atributo_buscar = None
-            
-            # Buscar conteos con el código (case insensitive) y atributo normalizado
-            # Primero buscar por código, luego filtrar por atributo normalizado
-            conteos_codigo = ConteoFisico.objects.filter(codigo__iexact=producto.codigo)
-            conteos = []
-            for conteo in conteos_codigo:
-                # Normalizar atributo del conteo para comparar
-                atributo_conteo = conteo.atributo
-                if atributo_conteo:
-                    atributo_conteo = atributo_conteo.strip()
-                    if atributo_conteo in ('', '-', 'None', 'null'):
-                        atributo_conteo = None
-                else:
-                    atributo_conteo = None
-                
-                # Comparar atributos normalizados
-                if atributo_buscar == atributo_conteo:
-                    conteos.append(conteo)
-            
-            # Ordenar por fecha
-            conteos = sorted(conteos, key=lambda x: x.fecha_conteo, reverse=True)
+            # Conteos del mismo código+atributo normalizado (columna sku_key indexada)
+            conteos = list(ConteoFisico.objects.filter(sku_key=producto.sku_key).order_by('-fecha_conteo'))
             
             if conteos:
                 total_conteos_fisicos += len(conteos)
@@ -267,21 +303,19 @@ class Command(BaseCommand):
                 producto=producto, 
                 tipo='salida'
             )
-            salidas_venta = salidas_ms.filter(motivo__icontains='Venta')
-            salidas_inv = salidas_ms.exclude(motivo__icontains='Venta')
+            salidas_venta = salidas_ms.filter(venta__isnull=False)
+            salidas_inv = salidas_ms.filter(venta__isnull=True)
             total_salidas_por_venta_ms += salidas_venta.aggregate(Sum('cantidad'))['cantidad__sum'] or 0
             total_salidas_inventario_ms += salidas_inv.aggregate(Sum('cantidad'))['cantidad__sum'] or 0
+            if producto.id in archivados:
+                total_salidas_por_venta_ms += archivados[producto.id]['salidas_venta']
+                total_salidas_inventario_ms += archivados[producto.id]['salidas_inventario']
         
         # Calcular stock inicial total
         stock_inicial_total = 0
         stock_actual_total = 0
         for producto in productos:
-            movimientos_prod = MovimientoStock.objects.filter(producto=producto)
-            total_ingresos_prod = movimientos_prod.filter(tipo='ingreso').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            total_salidas_prod = movimientos_prod.filter(tipo='salida').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            total_ajustes_prod = movimientos_prod.filter(tipo='ajuste').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            neto = total_ingresos_prod - total_salidas_prod + total_ajustes_prod
-            stock_inicial_total += (producto.stock - neto)
+            stock_inicial_total += stocks_iniciales.get(producto.id, producto.stock)
             stock_actual_total += producto.stock
         
         # RESUMEN GENERAL
@@ -6,6 +6,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import date
+from pos.fechas import filtro_dia_local
 from pos.models import Caja, CajaUsuario
 
 
@@ -53,8 +54,8 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('-' * 70))
         
         cajas_abiertas_hoy = CajaUsuario.objects.filter(
-            fecha_cierre__isnull=True,
-            fecha_apertura__date=hoy
+            filtro_dia_local('fecha_apertura', hoy),
+            fecha_cierre__isnull=True
         )
         
         self.stdout.write(f'Cajas abiertas hoy: {cajas_abiertas_hoy.count()}')
@@ -120,8 +121,8 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('-' * 70))
         
         caja_obtenida = CajaUsuario.objects.filter(
+            filtro_dia_local('fecha_apertura', hoy),
             fecha_cierre__isnull=True,
-            fecha_apertura__date=hoy,
             caja=caja_principal
         ).first()
         
@@ -166,7 +167,7 @@ class Command(BaseCommand):
         self.stdout.write(f'Estado: {"Abierta" if nueva_caja.fecha_cierre is None else "Cerrada"}')
         
         # Verificar todas las cajas del día
-        todas_cajas_hoy = CajaUsuario.objects.filter(fecha_apertura__date=hoy)
+        todas_cajas_hoy = CajaUsuario.objects.filter(filtro_dia_local('fecha_apertura', hoy))
         self.stdout.write('')
         self.stdout.write(f'Total de cajas del día: {todas_cajas_hoy.count()}')
         for caja in todas_cajas_hoy:
@@ -8,6 +8,7 @@ from django.utils import timezone
 from django.db.models import Sum
 from datetime import date, timedelta, datetime
 
+from pos.fechas import filtro_dia_local
 from pos.models import (
     Caja, CajaUsuario, Venta, ItemVenta,
     GastoCaja, Producto
@@ -69,9 +70,9 @@ class Command(BaseCommand):
         # Limpiar caja abierta si se solicita
         if options['limpiar']:
             CajaUsuario.objects.filter(
+                filtro_dia_local('fecha_apertura', hoy),
                 usuario=usuario,
-                fecha_cierre__isnull=True,
-                fecha_apertura__date=hoy
+                fecha_cierre__isnull=True
             ).delete()
             self.print_info('Caja abierta del dia actual eliminada')
         
@@ -81,9 +82,9 @@ class Command(BaseCommand):
         self.print_section('TEST 1: APERTURA DE CAJA')
         
         caja_abierta = CajaUsuario.objects.filter(
+            filtro_dia_local('fecha_apertura', hoy),
             usuario=usuario,
-            fecha_cierre__isnull=True,
-            fecha_apertura__date=hoy
+            fecha_cierre__isnull=True
         ).first()
         
         monto_inicial = 1000000
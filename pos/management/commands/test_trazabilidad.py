@@ -7,6 +7,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from django.db.models import Sum
 from datetime import date, timedelta
+from pos.fechas import filtro_dia_local
 from pos.models import (
     Caja, CajaUsuario, Venta, ItemVenta, Producto, GastoCaja
 )
@@ -57,8 +58,8 @@ class Command(BaseCommand):
         # Limpiar datos de prueba anteriores del día actual
         hoy = date.today()
         CajaUsuario.objects.filter(
-            usuario=usuario,
-            fecha_apertura__date=hoy
+            filtro_dia_local('fecha_apertura', hoy),
+            usuario=usuario
         ).delete()
         self.stdout.write(self.style.WARNING('[INFO] Datos de prueba anteriores eliminados'))
 
@@ -4,7 +4,7 @@ Comando para verificar que todos los productos del Excel estén creados con sus
 """
 from django.core.management.base import BaseCommand
 from pos.models import Producto
-from django.db.models import Q
+from pos.sku import sku_key
 import openpyxl
 import os
 
@@ -102,18 +102,8 @@ class Command(BaseCommand):
                         'fila': row_num
                     })
                     
-                    # Buscar producto en la base de datos
-                    if atributo:
-                        producto = Producto.objects.filter(
-                            codigo=codigo,
-                            atributo=atributo
-                        ).first()
-                    else:
-                        producto = Producto.objects.filter(
-                            codigo=codigo
-                        ).filter(
-                            Q(atributo__isnull=True) | Q(atributo='')
-                        ).first()
+                    # Buscar producto en la base de datos por código y atributo normalizados (sku_key)
+                    producto = Producto.objects.filter(sku_key=sku_key(codigo, atributo)).first()
                     
                     if producto:
                         # Verificar que el atributo coincida exactamente
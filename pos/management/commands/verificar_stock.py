@@ -0,0 +1,60 @@
+import csv
+import json
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from pos.verificacion_stock import COLUMNAS_DISCREPANCIA, TIPOS_DISCREPANCIA, discrepancias_stock, fila_discrepancia
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica el stock de todo el catálogo contra el historial de movimientos y las ventas. '
+        'Escribe las discrepancias en formato legible por máquina (JSON por línea o CSV) '
+        'y un resumen por tipo en stderr'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tipo',
+            action='append',
+            choices=TIPOS_DISCREPANCIA,
+            help='Comprobación a ejecutar (se puede repetir; por defecto: todas)',
+        )
+        parser.add_argument(
+            '--formato',
+            choices=['jsonl', 'csv'],
+            default='jsonl',
+            help='Formato de salida (por defecto: jsonl, un objeto JSON por línea)',
+        )
+        parser.add_argument(
+            '--salida',
+            type=str,
+            help='Archivo de salida (por defecto: stdout)',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        archivo = open(options['salida'], 'w', encoding='utf-8', newline='') if options.get('salida') else self.stdout
+        conteo = Counter()
+        try:
+            escritor = None
+            if options['formato'] == 'csv':
+                escritor = csv.writer(archivo)
+                escritor.writerow(COLUMNAS_DISCREPANCIA)
+            for discrepancia in discrepancias_stock(options.get('tipo')):
+                conteo[discrepancia['tipo']] += 1
+                if escritor:
+                    escritor.writerow(fila_discrepancia(discrepancia))
+                else:
+                    archivo.write(json.dumps(discrepancia) + '\n')
+        finally:
+            if archivo is not self.stdout:
+                archivo.close()
+
+        for tipo in TIPOS_DISCREPANCIA:
+            if not options.get('tipo') or tipo in options['tipo']:
+                self.stderr.write(f'{tipo}: {conteo[tipo]}')
+        resumen = f'{sum(conteo.values())} discrepancias en {time.perf_counter() - inicio:.2f}s'
+        self.stderr.write(self.style.WARNING(resumen) if conteo else self.style.SUCCESS(resumen))
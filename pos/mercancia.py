@@ -0,0 +1,224 @@
+"""
+Ingresos y salidas de mercancía en bloque, con un número de consultas que no
+depende de la cantidad de líneas del documento.
+
+- Creación: los productos de todas las líneas se leen con un solo in_bulk, se
+  valida todo antes de escribir y el encabezado y sus items (bulk_create) se
+  guardan en una transacción.
+- Completado: una transacción con incrementos de stock agrupados por
+  producto, movimientos con bulk_create y actualización masiva de los items.
+  En salidas el descuento es condicional (stock suficiente en el mismo
+  UPDATE): o se aplica la salida completa o no se aplica nada.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import IngresoMercancia, ItemIngresoMercancia, ItemSalidaMercancia, Producto, SalidaMercancia
+from .movimientos_stock import (
+    TAMANO_LOTE, StockNegativo, incrementar_stock, movimientos_encadenados, registrar_movimientos,
+)
+
+
+# Intentos de completar una salida cuando el stock cambia durante el descuento
+INTENTOS_COMPLETAR_SALIDA = 3
+
+
+class StockInsuficiente(ValueError):
+    """Una salida pide más unidades de un producto que su stock actual"""
+
+    def __init__(self, producto, mensaje=None):
+        self.producto = producto
+        super().__init__(mensaje or f'Stock insuficiente para {producto.nombre}')
+
+
+def lineas_documento(items_data, con_precio=False):
+    """
+    Valida las líneas enviadas por el formulario (lista de dicts con
+    producto_id, cantidad y, en ingresos, precio_compra) y lee sus productos
+    con una sola consulta.
+
+    Returns:
+        lista de (producto, cantidad, precio_compra) en el orden recibido
+
+    Raises:
+        ValueError: línea con datos inválidos, cantidad no positiva o producto inexistente
+    """
+    lineas = []
+    for numero, item_data in enumerate(items_data, start=1):
+        try:
+            producto_id = int(item_data['producto_id'])
+            cantidad = int(item_data['cantidad'])
+            precio_compra = int(float(item_data.get('precio_compra', 0))) if con_precio else 0
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError(f'Línea {numero}: datos inválidos')
+        if cantidad <= 0:
+            raise ValueError(f'Línea {numero}: la cantidad debe ser mayor que cero')
+        lineas.append((producto_id, cantidad, precio_compra))
+
+    productos = Producto.objects.in_bulk({producto_id for producto_id, _, _ in lineas})
+    faltantes = sorted({producto_id for producto_id, _, _ in lineas} - productos.keys())
+    if faltantes:
+        raise ValueError(f'Productos inexistentes: {", ".join(map(str, faltantes))}')
+    return [(productos[producto_id], cantidad, precio_compra) for producto_id, cantidad, precio_compra in lineas]
+
+
+def crear_ingreso(usuario, proveedor, items_data, numero_factura=None, observaciones=None):
+    """
+    Crea el ingreso (pendiente de completar) con sus items y el total ya
+    calculado: encabezado e items en una transacción.
+
+    Raises:
+        ValueError: alguna línea es inválida (no se crea nada)
+    """
+    lineas = lineas_documento(items_data, con_precio=True)
+    with transaction.atomic():
+        ingreso = IngresoMercancia.objects.create(
+            proveedor=proveedor,
+            numero_factura=numero_factura,
+            observaciones=observaciones,
+            usuario=usuario,
+            completado=False,
+            total=sum(cantidad * precio_compra for _, cantidad, precio_compra in lineas),
+        )
+        ItemIngresoMercancia.objects.bulk_create([
+            ItemIngresoMercancia(
+                ingreso=ingreso,
+                producto=producto,
+                cantidad=cantidad,
+                precio_compra=precio_compra,
+                subtotal=cantidad * precio_compra,
+            )
+            for producto, cantidad, precio_compra in lineas
+        ], batch_size=TAMANO_LOTE)
+    return ingreso
+
+
+def crear_salida(usuario, tipo, items_data, destino=None, motivo=None):
+    """
+    Crea la salida (pendiente de completar) con sus items si el stock actual
+    alcanza para el total pedido de cada producto (sumando sus líneas).
+
+    Raises:
+        StockInsuficiente: algún producto no tiene stock suficiente (no se crea nada)
+        ValueError: alguna línea es inválida
+    """
+    lineas = lineas_documento(items_data)
+    pedidas = defaultdict(int)
+    for producto, cantidad, _ in lineas:
+        pedidas[producto.id] += cantidad
+    for producto, _, _ in lineas:
+        if producto.stock < pedidas[producto.id]:
+            raise StockInsuficiente(producto)
+
+    with transaction.atomic():
+        salida = SalidaMercancia.objects.create(
+            tipo=tipo,
+            destino=destino,
+            motivo=motivo,
+            usuario=usuario,
+            completado=False,
+        )
+        ItemSalidaMercancia.objects.bulk_create([
+            ItemSalidaMercancia(salida=salida, producto=producto, cantidad=cantidad)
+            for producto, cantidad, _ in lineas
+        ], batch_size=TAMANO_LOTE)
+    return salida
+
+
+def estado_ingreso(ingreso):
+    """Cantidad de items del ingreso por estado, en una sola consulta"""
+    return ingreso.items.aggregate(
+        total=Count('id'),
+        procesados=Count('id', filter=Q(procesado=True)),
+        verificados_pendientes=Count('id', filter=Q(verificado=True, procesado=False)),
+        no_verificados=Count('id', filter=Q(verificado=False)),
+    )
+
+
+def completar_ingreso(ingreso, usuario):
+    """
+    Procesa los items verificados y aún no procesados del ingreso: suma su
+    cantidad al stock, registra un movimiento por item y los marca como
+    procesados. Si ya no quedan items sin procesar, marca el ingreso como completado.
+
+    Returns:
+        (cantidad de items procesados en esta operación, estado_ingreso después de procesar)
+    """
+    with transaction.atomic():
+        # Serializa completados simultáneos del mismo ingreso (sin efecto en SQLite, que bloquea al escribir)
+        IngresoMercancia.objects.select_for_update().filter(pk=ingreso.pk).exists()
+        items = list(
+            ingreso.items.filter(verificado=True, procesado=False).order_by('id').values_list(
+                'id', 'producto_id', 'cantidad'
+            )
+        )
+        if items:
+            variaciones = defaultdict(int)
+            for _, producto_id, cantidad in items:
+                variaciones[producto_id] += cantidad
+            stock_anterior = incrementar_stock(variaciones)
+
+            motivo = f'Ingreso #{ingreso.id} - {ingreso.proveedor}'
+            registrar_movimientos(movimientos_encadenados(
+                ((producto_id, cantidad, motivo) for _, producto_id, cantidad in items),
+                stock_anterior, 'ingreso', usuario=usuario, ingreso=ingreso,
+            ))
+
+            item_ids = [item_id for item_id, _, _ in items]
+            for inicio in range(0, len(item_ids), TAMANO_LOTE):
+                ItemIngresoMercancia.objects.filter(id__in=item_ids[inicio:inicio + TAMANO_LOTE]).update(procesado=True)
+
+        estado = estado_ingreso(ingreso)
+        if items and estado['procesados'] == estado['total']:
+            ingreso.completado = True
+            ingreso.save(update_fields=['completado'])
+    return len(items), estado
+
+
+def completar_salida(salida, usuario):
+    """
+    Descuenta del stock todos los items de la salida, registra un movimiento
+    por item y la marca como completada, todo en una transacción.
+
+    Returns:
+        True si esta llamada completó la salida, False si ya estaba completada
+
+    Raises:
+        StockInsuficiente: algún producto no cubre el total de sus líneas (o el
+            stock siguió cambiando en cada intento); no se aplica ningún item
+    """
+    for _ in range(INTENTOS_COMPLETAR_SALIDA):
+        pedidas = defaultdict(int)
+        try:
+            with transaction.atomic():
+                # Marcar primero: dos completados simultáneos no pueden descontar dos veces
+                if not SalidaMercancia.objects.filter(pk=salida.pk, completado=False).update(completado=True):
+                    return False
+                items = list(salida.items.order_by('id').values_list('producto_id', 'cantidad'))
+                for producto_id, cantidad in items:
+                    pedidas[producto_id] += cantidad
+                stock_anterior = incrementar_stock(
+                    {producto_id: -cantidad for producto_id, cantidad in pedidas.items()}, sin_negativos=True
+                )
+                motivo = f'Salida #{salida.id} - {salida.get_tipo_display()}'
+                registrar_movimientos(movimientos_encadenados(
+                    ((producto_id, cantidad, motivo) for producto_id, cantidad in items),
+                    stock_anterior, 'salida', usuario=usuario, salida=salida,
+                ))
+        except StockNegativo:
+            # Transacción revertida: el stock leído ahora es el previo al intento
+            productos = Producto.objects.in_bulk(pedidas)
+            for producto_id, cantidad in pedidas.items():
+                if productos[producto_id].stock < cantidad:
+                    raise StockInsuficiente(productos[producto_id])
+            # Otra transacción cambió el stock entre el descuento y esta lectura: se reintenta
+            continue
+
+        salida.completado = True
+        return True
+
+    raise StockInsuficiente(
+        None, 'El stock de los productos cambió mientras se completaba la salida. Intente de nuevo'
+    )
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def poblar_conteos_actuales(apps, schema_editor):
+    """Carga el último conteo de cada código+atributo desde el historial existente"""
+    ConteoFisico = apps.get_model('pos', 'ConteoFisico')
+    ConteoFisicoActual = apps.get_model('pos', 'ConteoFisicoActual')
+
+    ultimos = {}
+    for conteo in ConteoFisico.objects.order_by('fecha_conteo', 'id').iterator():
+        atributo = (conteo.atributo or '').strip()
+        if atributo in ('-', 'None', 'null'):
+            atributo = ''
+        ultimos[(conteo.codigo, atributo)] = conteo
+
+    ConteoFisicoActual.objects.bulk_create([
+        ConteoFisicoActual(
+            codigo=codigo,
+            atributo=atributo,
+            cantidad_contada=conteo.cantidad_contada,
+            fecha_conteo=conteo.fecha_conteo,
+            conteo_id=conteo.id,
+        )
+        for (codigo, atributo), conteo in ultimos.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0024_conteofisico_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoFisicoActual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=50, verbose_name='Código')),
+                ('atributo', models.CharField(blank=True, default='', help_text='Atributo normalizado (vacío si el producto no tiene atributo)', max_length=200, verbose_name='Atributo')),
+                ('cantidad_contada', models.IntegerField(verbose_name='Cantidad Contada')),
+                ('fecha_conteo', models.DateTimeField(verbose_name='Fecha de Conteo')),
+                ('conteo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pos.conteofisico', verbose_name='Conteo')),
+            ],
+            options={
+                'verbose_name': 'Conteo Físico Actual',
+                'verbose_name_plural': 'Conteos Físicos Actuales',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conteofisicoactual',
+            constraint=models.UniqueConstraint(fields=('codigo', 'atributo'), name='unique_conteo_actual_codigo_atributo'),
+        ),
+        migrations.RunPython(poblar_conteos_actuales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def poblar_ventas_diarias(apps, schema_editor):
+    """Carga los totales diarios desde las ventas completadas existentes"""
+    Venta = apps.get_model('pos', 'Venta')
+    VentaDiaria = apps.get_model('pos', 'VentaDiaria')
+
+    filas = Venta.objects.filter(completada=True).annotate(
+        dia=TruncDate('fecha', tzinfo=timezone.get_current_timezone())
+    ).values('dia', 'registradora_id', 'vendedor_id', 'usuario_id', 'metodo_pago').annotate(
+        total_ventas=Sum('total', filter=Q(anulada=False)),
+        cantidad_ventas=Count('id', filter=Q(anulada=False)),
+        total_anuladas=Sum('total', filter=Q(anulada=True)),
+        cantidad_anuladas=Count('id', filter=Q(anulada=True)),
+    ).order_by()
+
+    VentaDiaria.objects.bulk_create([
+        VentaDiaria(
+            fecha=fila['dia'],
+            registradora_id=fila['registradora_id'],
+            vendedor_id=fila['vendedor_id'],
+            usuario_id=fila['usuario_id'],
+            metodo_pago=fila['metodo_pago'] or '',
+            total_ventas=fila['total_ventas'] or 0,
+            cantidad_ventas=fila['cantidad_ventas'] or 0,
+            total_anuladas=fila['total_anuladas'] or 0,
+            cantidad_anuladas=fila['cantidad_anuladas'] or 0,
+        )
+        for fila in filas
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pos', '0025_conteofisicoactual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Fecha local (TIME_ZONE) de la venta', verbose_name='Fecha')),
+                ('registradora_id', models.IntegerField(blank=True, null=True, verbose_name='Registradora')),
+                ('metodo_pago', models.CharField(max_length=20, verbose_name='Método de Pago')),
+                ('total_ventas', models.BigIntegerField(default=0, help_text='Total de ventas válidas (no anuladas)', verbose_name='Total Ventas')),
+                ('cantidad_ventas', models.IntegerField(default=0, verbose_name='Cantidad Ventas')),
+                ('total_anuladas', models.BigIntegerField(default=0, verbose_name='Total Anuladas')),
+                ('cantidad_anuladas', models.IntegerField(default=0, verbose_name='Cantidad Anuladas')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+                ('vendedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Vendedor')),
+            ],
+            options={
+                'verbose_name': 'Venta Diaria',
+                'verbose_name_plural': 'Ventas Diarias',
+                'indexes': [models.Index(fields=['vendedor', 'fecha'], name='pos_ventadi_vendedo_b05392_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiaria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'registradora_id', 'vendedor', 'usuario', 'metodo_pago'), name='unique_venta_diaria_clave'),
+        ),
+        migrations.RunPython(poblar_ventas_diarias, migrations.RunPython.noop),
+    ]
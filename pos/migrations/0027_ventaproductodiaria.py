@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def poblar_ventas_producto_diarias(apps, schema_editor):
+    """Carga las ventas diarias por producto desde los items de ventas válidas existentes"""
+    ItemVenta = apps.get_model('pos', 'ItemVenta')
+    VentaProductoDiaria = apps.get_model('pos', 'VentaProductoDiaria')
+
+    filas = ItemVenta.objects.filter(venta__completada=True, venta__anulada=False).annotate(
+        dia=TruncDate('venta__fecha', tzinfo=timezone.get_current_timezone())
+    ).values('dia', 'producto_id').annotate(
+        suma_cantidad=Sum('cantidad'),
+        suma_valor=Sum('subtotal'),
+        ventas_distintas=Count('venta_id', distinct=True),
+    ).order_by()
+
+    VentaProductoDiaria.objects.bulk_create([
+        VentaProductoDiaria(
+            fecha=fila['dia'],
+            producto_id=fila['producto_id'],
+            cantidad=fila['suma_cantidad'] or 0,
+            valor=fila['suma_valor'] or 0,
+            cantidad_ventas=fila['ventas_distintas'],
+        )
+        for fila in filas
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0026_ventadiaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaProductoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Fecha local (TIME_ZONE) de la venta', verbose_name='Fecha')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad Vendida')),
+                ('valor', models.BigIntegerField(default=0, help_text='Suma de subtotales de los items', verbose_name='Valor Vendido')),
+                ('cantidad_ventas', models.IntegerField(default=0, help_text='Ventas distintas que incluyen el producto', verbose_name='Cantidad Ventas')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pos.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Venta Diaria por Producto',
+                'verbose_name_plural': 'Ventas Diarias por Producto',
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='pos_ventapr_product_d123c9_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ventaproductodiaria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'producto'), name='unique_venta_producto_diaria'),
+        ),
+        migrations.RunPython(poblar_ventas_producto_diarias, migrations.RunPython.noop),
+    ]
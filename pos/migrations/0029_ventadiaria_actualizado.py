@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0028_trabajoreporte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ventadiaria',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, help_text='Último cambio de la fila (versión de los datos cacheados por rango)', verbose_name='Actualizado'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0029_ventadiaria_actualizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Fecha local (TIME_ZONE); el stock es el del cierre del día', verbose_name='Fecha')),
+                ('stock', models.IntegerField(default=0, verbose_name='Stock')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pos.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Stock Diario',
+                'verbose_name_plural': 'Stock Diario',
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='pos_stockdi_product_1f7a9f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockdiario',
+            constraint=models.UniqueConstraint(fields=('fecha', 'producto'), name='unique_stock_diario'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0030_stockdiario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ventaproductodiaria',
+            index=models.Index(fields=['fecha', 'producto', 'cantidad', 'valor'], name='pos_ventapr_fecha_84328b_idx'),
+        ),
+    ]
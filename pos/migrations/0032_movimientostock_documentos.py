@@ -0,0 +1,87 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:19
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Motivos escritos antes de las FK: 'Venta #12', 'Anulación venta #12', 'Ingreso #5 - Proveedor', 'Salida #3 - Merma'
+PATRONES_MOTIVO = (
+    ('venta', re.compile(r'^(?:Anulación venta|Venta) #(\d+)\b')),
+    ('ingreso', re.compile(r'^Ingreso #(\d+)\b')),
+    ('salida', re.compile(r'^Salida #(\d+)\b')),
+)
+
+TAMANO_LOTE = 2000
+
+
+def poblar_documentos_movimientos(apps, schema_editor):
+    """
+    Enlaza los movimientos existentes con su venta, ingreso o salida leyendo
+    el motivo, por lotes de ids. Los documentos que ya no existen quedan sin enlace.
+    """
+    MovimientoStock = apps.get_model('pos', 'MovimientoStock')
+    modelos = {
+        'venta': apps.get_model('pos', 'Venta'),
+        'ingreso': apps.get_model('pos', 'IngresoMercancia'),
+        'salida': apps.get_model('pos', 'SalidaMercancia'),
+    }
+
+    ultimo_id = 0
+    while True:
+        lote = list(
+            MovimientoStock.objects.filter(id__gt=ultimo_id, motivo__isnull=False)
+            .order_by('id').values_list('id', 'motivo')[:TAMANO_LOTE]
+        )
+        if not lote:
+            break
+        ultimo_id = lote[-1][0]
+
+        referencias = {campo: {} for campo in modelos}
+        for movimiento_id, motivo in lote:
+            for campo, patron in PATRONES_MOTIVO:
+                coincidencia = patron.match(motivo)
+                if coincidencia:
+                    referencias[campo][movimiento_id] = int(coincidencia.group(1))
+                    break
+
+        for campo, por_movimiento in referencias.items():
+            existentes = set(
+                modelos[campo].objects.filter(id__in=set(por_movimiento.values())).values_list('id', flat=True)
+            )
+            MovimientoStock.objects.bulk_update([
+                MovimientoStock(id=movimiento_id, **{f'{campo}_id': documento_id})
+                for movimiento_id, documento_id in por_movimiento.items()
+                if documento_id in existentes
+            ], [campo], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0031_ventaproductodiaria_indice_cubriente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientostock',
+            name='conteo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='pos.conteofisico', verbose_name='Conteo Físico'),
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='ingreso',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='pos.ingresomercancia', verbose_name='Ingreso de Mercancía'),
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='salida',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='pos.salidamercancia', verbose_name='Salida de Mercancía'),
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='venta',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='pos.venta', verbose_name='Venta'),
+        ),
+        migrations.RunPython(poblar_documentos_movimientos, migrations.RunPython.noop),
+    ]
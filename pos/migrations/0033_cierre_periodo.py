@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pos', '0032_movimientostock_documentos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierrePeriodo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Último día local incluido en el cierre', unique=True, verbose_name='Fecha de Corte')),
+                ('desde', models.DateField(blank=True, help_text='Primer día local del período (vacío: desde el inicio del historial)', null=True, verbose_name='Desde')),
+                ('directorio', models.CharField(help_text='Directorio con los archivos .jsonl.gz del cierre', max_length=500, verbose_name='Directorio')),
+                ('conteos', models.JSONField(default=dict, help_text='Filas archivadas por tabla', verbose_name='Conteos')),
+                ('movido', models.BooleanField(default=False, help_text='Las filas archivadas se eliminaron de las tablas', verbose_name='Movido')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Cierre de Período',
+                'verbose_name_plural': 'Cierres de Período',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenGastoCierre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('tipo', models.CharField(choices=[('gasto', 'Gasto'), ('ingreso', 'Ingreso')], max_length=10, verbose_name='Tipo')),
+                ('total', models.BigIntegerField(default=0, verbose_name='Total')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad')),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumen_gastos', to='pos.cierreperiodo', verbose_name='Cierre')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Gastos del Cierre',
+                'verbose_name_plural': 'Resúmenes de Gastos de Cierres',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenStockCierre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_inicial', models.IntegerField(default=0, verbose_name='Stock Inicial')),
+                ('ingresos', models.IntegerField(default=0, verbose_name='Ingresos')),
+                ('salidas_venta', models.IntegerField(default=0, verbose_name='Salidas por Ventas')),
+                ('salidas_inventario', models.IntegerField(default=0, verbose_name='Salidas de Inventario')),
+                ('ajustes', models.IntegerField(default=0, verbose_name='Ajustes')),
+                ('cantidad_movimientos', models.IntegerField(default=0, verbose_name='Cantidad de Movimientos')),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumen_stock', to='pos.cierreperiodo', verbose_name='Cierre')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pos.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Stock del Cierre',
+                'verbose_name_plural': 'Resúmenes de Stock de Cierres',
+                'indexes': [models.Index(fields=['producto', 'cierre'], name='pos_resumen_product_22fcce_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumenstockcierre',
+            constraint=models.UniqueConstraint(fields=('cierre', 'producto'), name='unique_resumen_stock_cierre'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumengastocierre',
+            constraint=models.UniqueConstraint(fields=('cierre', 'fecha', 'tipo'), name='unique_resumen_gasto_cierre'),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:53
+
+from django.db import migrations, models
+
+ATRIBUTOS_VACIOS = ('-', 'None', 'null')
+TAMANO_LOTE = 1000
+
+
+def clave_sku(codigo, atributo):
+    """Copia de pos.sku.clave_sku al momento de esta migración"""
+    atributo = (atributo or '').strip()
+    if atributo in ATRIBUTOS_VACIOS:
+        atributo = ''
+    return (codigo or '').strip(), atributo
+
+
+def calcular_sku_key(codigo, atributo):
+    """Copia de pos.sku.sku_key al momento de esta migración"""
+    return '%s|%s' % clave_sku(codigo, atributo)
+
+
+def poblar_sku_keys(apps, schema_editor):
+    """Calcula sku_key de productos y conteos existentes"""
+    for nombre in ('Producto', 'ConteoFisico', 'ConteoFisicoActual'):
+        modelo = apps.get_model('pos', nombre)
+        cambiadas = []
+        for fila in modelo.objects.only('id', 'codigo', 'atributo', 'sku_key').order_by('id').iterator(chunk_size=TAMANO_LOTE):
+            fila.sku_key = calcular_sku_key(fila.codigo, fila.atributo)
+            cambiadas.append(fila)
+            if len(cambiadas) >= TAMANO_LOTE:
+                modelo.objects.bulk_update(cambiadas, ['sku_key'])
+                cambiadas = []
+        if cambiadas:
+            modelo.objects.bulk_update(cambiadas, ['sku_key'])
+
+
+def fusionar_conteos_actuales(apps, schema_editor):
+    """
+    Deja una fila de ConteoFisicoActual por sku_key (la del conteo más
+    reciente) con código y atributo normalizados: las filas copiadas del
+    historial sin normalizar (0025) pueden repetir la clave.
+    """
+    ConteoFisicoActual = apps.get_model('pos', 'ConteoFisicoActual')
+    repetidas = []
+    normalizadas = []
+    anterior = None
+    for fila in ConteoFisicoActual.objects.order_by('sku_key', '-fecha_conteo', '-id').iterator(chunk_size=TAMANO_LOTE):
+        if fila.sku_key == anterior:
+            repetidas.append(fila.id)
+            continue
+        anterior = fila.sku_key
+        clave = clave_sku(fila.codigo, fila.atributo)
+        if (fila.codigo, fila.atributo) != clave:
+            fila.codigo, fila.atributo = clave
+            normalizadas.append(fila)
+
+    for inicio in range(0, len(repetidas), TAMANO_LOTE):
+        ConteoFisicoActual.objects.filter(id__in=repetidas[inicio:inicio + TAMANO_LOTE]).delete()
+    ConteoFisicoActual.objects.bulk_update(normalizadas, ['codigo', 'atributo'], batch_size=TAMANO_LOTE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0033_cierre_periodo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conteofisico',
+            name='sku_key',
+            field=models.CharField(default='', editable=False, help_text='Código|atributo normalizado', max_length=251, verbose_name='Clave SKU'),
+        ),
+        migrations.AddField(
+            model_name='conteofisicoactual',
+            name='sku_key',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='Código|atributo normalizado', max_length=251, verbose_name='Clave SKU'),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='sku_key',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='Código|atributo normalizado, para cruzar con conteos y reportes', max_length=251, verbose_name='Clave SKU'),
+        ),
+        migrations.AddIndex(
+            model_name='conteofisico',
+            index=models.Index(fields=['sku_key', '-fecha_conteo'], name='pos_conteof_sku_key_877f2a_idx'),
+        ),
+        migrations.RunPython(poblar_sku_keys, migrations.RunPython.noop),
+        migrations.RunPython(fusionar_conteos_actuales, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='conteofisicoactual',
+            name='unique_conteo_actual_codigo_atributo',
+        ),
+        migrations.AlterField(
+            model_name='conteofisicoactual',
+            name='sku_key',
+            field=models.CharField(editable=False, help_text='Código|atributo normalizado', max_length=251, unique=True, verbose_name='Clave SKU'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+CAMPOS_PRODUCTO_ITEM = ('codigo', 'nombre', 'atributo', 'codigo_barras')
+TAMANO_LOTE = 5000
+
+
+def poblar_datos_producto(apps, schema_editor):
+    """Copia a los items existentes los datos actuales de su producto, por rangos de ids"""
+    ItemVenta = apps.get_model('pos', 'ItemVenta')
+    Producto = apps.get_model('pos', 'Producto')
+    items = ItemVenta.objects.filter(nombre='')
+    rango = items.order_by('id').values_list('id', flat=True)
+    primero = rango.first()
+    if primero is None:
+        return
+    ultimo = rango.last()
+
+    valores = {
+        campo: Subquery(Producto.objects.filter(pk=OuterRef('producto_id')).values(campo)[:1])
+        for campo in CAMPOS_PRODUCTO_ITEM
+    }
+    for desde in range(primero, ultimo + 1, TAMANO_LOTE):
+        items.filter(id__gte=desde, id__lt=desde + TAMANO_LOTE).update(**valores)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0034_sku_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemventa',
+            name='atributo',
+            field=models.CharField(blank=True, max_length=200, null=True, verbose_name='Atributo'),
+        ),
+        migrations.AddField(
+            model_name='itemventa',
+            name='codigo',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Código'),
+        ),
+        migrations.AddField(
+            model_name='itemventa',
+            name='codigo_barras',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Código de Barras'),
+        ),
+        migrations.AddField(
+            model_name='itemventa',
+            name='nombre',
+            field=models.CharField(blank=True, default='', max_length=200, verbose_name='Nombre'),
+        ),
+        migrations.RunPython(poblar_datos_producto, migrations.RunPython.noop),
+    ]
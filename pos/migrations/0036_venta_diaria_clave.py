@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+CAMPOS_TOTALES = ('total_ventas', 'cantidad_ventas', 'total_anuladas', 'cantidad_anuladas')
+
+
+def calcular_claves(apps, schema_editor):
+    """
+    Calcula la clave de las filas existentes. Las filas repetidas (misma clave
+    con registradora, vendedor o usuario vacíos) se suman en la primera y se borran.
+    """
+    VentaDiaria = apps.get_model('pos', 'VentaDiaria')
+    por_clave = {}
+    repetidas = []
+    for fila in VentaDiaria.objects.order_by('id').iterator(chunk_size=2000):
+        fila.clave = '|'.join((
+            fila.fecha.isoformat(),
+            str(fila.registradora_id or 0),
+            str(fila.vendedor_id or 0),
+            str(fila.usuario_id or 0),
+            fila.metodo_pago or '',
+        ))
+        principal = por_clave.get(fila.clave)
+        if principal is None:
+            por_clave[fila.clave] = fila
+            continue
+        for campo in CAMPOS_TOTALES:
+            setattr(principal, campo, getattr(principal, campo) + getattr(fila, campo))
+        repetidas.append(fila.id)
+
+    VentaDiaria.objects.filter(id__in=repetidas).delete()
+    VentaDiaria.objects.bulk_update(list(por_clave.values()), ['clave', *CAMPOS_TOTALES], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0035_item_venta_datos_producto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ventadiaria',
+            name='clave',
+            field=models.CharField(default='', editable=False, max_length=100, verbose_name='Clave'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(calcular_claves, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='ventadiaria',
+            name='unique_venta_diaria_clave',
+        ),
+        migrations.AlterField(
+            model_name='ventadiaria',
+            name='clave',
+            field=models.CharField(editable=False, help_text='fecha|registradora|vendedor|usuario|método de pago, con 0 en los ids vacíos', max_length=100, unique=True, verbose_name='Clave'),
+        ),
+    ]
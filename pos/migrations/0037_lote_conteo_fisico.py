@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pos', '0036_venta_diaria_clave'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteConteoFisico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.CharField(help_text='Identificador generado por el navegador', max_length=64, unique=True, verbose_name='Lote')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha')),
+                ('resultado', models.JSONField(default=list, help_text='Totales devueltos al aplicar el lote', verbose_name='Resultado')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Lote de Conteo Físico',
+                'verbose_name_plural': 'Lotes de Conteo Físico',
+            },
+        ),
+    ]
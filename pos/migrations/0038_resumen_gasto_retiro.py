@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:42
+
+import gzip
+import json
+from collections import defaultdict
+from pathlib import Path
+
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+DESCRIPCION_RETIRO = 'Retiro de dinero al cerrar caja'
+
+
+def separar_retiros(apps, schema_editor):
+    """
+    Rehace los resúmenes de gastos de los cierres movidos desde su archivo
+    gastos_caja.jsonl.gz, con los retiros en filas aparte (antes iban sumados
+    a los gastos). Los cierres sin archivo conservan sus filas.
+    """
+    CierrePeriodo = apps.get_model('pos', 'CierrePeriodo')
+    ResumenGastoCierre = apps.get_model('pos', 'ResumenGastoCierre')
+    for cierre in CierrePeriodo.objects.filter(movido=True):
+        ruta = Path(cierre.directorio) / 'gastos_caja.jsonl.gz'
+        if not ruta.exists():
+            continue
+        totales = defaultdict(lambda: [0, 0])
+        with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+            for linea in archivo:
+                fila = json.loads(linea)
+                dia = timezone.localdate(parse_datetime(fila['fecha']))
+                retiro = fila['tipo'] == 'gasto' and DESCRIPCION_RETIRO.lower() in (fila['descripcion'] or '').lower()
+                total = totales[(dia, fila['tipo'], retiro)]
+                total[0] += int(fila['monto'] or 0)
+                total[1] += 1
+        ResumenGastoCierre.objects.filter(cierre=cierre).delete()
+        ResumenGastoCierre.objects.bulk_create([
+            ResumenGastoCierre(cierre=cierre, fecha=dia, tipo=tipo, retiro=retiro, total=total, cantidad=cantidad)
+            for (dia, tipo, retiro), (total, cantidad) in totales.items()
+        ])
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0037_lote_conteo_fisico'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='resumengastocierre',
+            name='unique_resumen_gasto_cierre',
+        ),
+        migrations.AddField(
+            model_name='resumengastocierre',
+            name='retiro',
+            field=models.BooleanField(default=False, help_text='Gastos que son retiros de dinero al cerrar caja', verbose_name='Retiro'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumengastocierre',
+            constraint=models.UniqueConstraint(fields=('cierre', 'fecha', 'tipo', 'retiro'), name='unique_resumen_gasto_cierre_retiro'),
+        ),
+        migrations.RunPython(separar_retiros, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:45
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def marcar_aplicados(apps, schema_editor):
+    """
+    Marca como aplicados los conteos que ya tienen su ajuste (movimiento de
+    tipo 'ajuste' enlazado, posterior al conteo) y borra los conteos vigentes
+    cuyo conteo ya no existe.
+    """
+    ConteoFisico = apps.get_model('pos', 'ConteoFisico')
+    ConteoFisicoActual = apps.get_model('pos', 'ConteoFisicoActual')
+    MovimientoStock = apps.get_model('pos', 'MovimientoStock')
+
+    def ultimo_ajuste(campo_conteo):
+        return Subquery(
+            MovimientoStock.objects.filter(
+                conteo_id=OuterRef(campo_conteo), tipo='ajuste', fecha__gte=OuterRef('fecha_conteo')
+            ).values('conteo_id').annotate(ultimo=Max('fecha')).values('ultimo')[:1]
+        )
+
+    ConteoFisicoActual.objects.filter(conteo__isnull=True).delete()
+    ConteoFisico.objects.update(aplicado_en=ultimo_ajuste('id'))
+    ConteoFisicoActual.objects.update(aplicado_en=ultimo_ajuste('conteo_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0038_resumen_gasto_retiro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conteofisico',
+            name='aplicado_en',
+            field=models.DateTimeField(blank=True, help_text='Última aplicación al stock; el conteo está pendiente si es anterior a la fecha de conteo', null=True, verbose_name='Aplicado en'),
+        ),
+        migrations.AddField(
+            model_name='conteofisicoactual',
+            name='aplicado_en',
+            field=models.DateTimeField(blank=True, help_text='Última aplicación al stock; el conteo está pendiente si es anterior a la fecha de conteo', null=True, verbose_name='Aplicado en'),
+        ),
+        migrations.AlterField(
+            model_name='conteofisicoactual',
+            name='conteo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pos.conteofisico', verbose_name='Conteo'),
+        ),
+        migrations.RunPython(marcar_aplicados, migrations.RunPython.noop),
+    ]
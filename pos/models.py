@@ -1,11 +1,27 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from .sku import sku_key as calcular_sku_key
 
-class Producto(models.Model):
+
+class ClaveSkuMixin:
+    """
+    Mantiene sku_key (código + atributo normalizados, ver pos.sku) al guardar.
+    bulk_create y update() no pasan por save(): quien los use debe asignarlo.
+    """
+
+    def save(self, *args, **kwargs):
+        self.sku_key = calcular_sku_key(self.codigo, self.atributo)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'codigo', 'atributo'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'sku_key'}
+        super().save(*args, **kwargs)
+
+
+class Producto(ClaveSkuMixin, models.Model):
     """Modelo para productos del sistema POS"""
     codigo = models.CharField(
         max_length=50, 
@@ -32,6 +48,14 @@ class Producto(models.Model):
         verbose_name='Atributo',
         help_text='Atributo adicional del producto (ej: color, tamaño, modelo, etc.)'
     )
+    sku_key = models.CharField(
+        max_length=251,
+        default='',
+        editable=False,
+        db_index=True,
+        verbose_name='Clave SKU',
+        help_text='Código|atributo normalizado, para cruzar con conteos y reportes'
+    )
     precio = models.IntegerField(
         default=0,
         verbose_name='Precio'
@@ -301,13 +325,223 @@ class ItemVenta(models.Model):
         default=0,
         verbose_name='Subtotal'
     )
+    # Datos del producto al momento de la venta: tickets, detalle y exportaciones
+    # los leen de aquí (sin join a Producto) y no cambian si el producto se edita
+    codigo = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        verbose_name='Código'
+    )
+    nombre = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        verbose_name='Nombre'
+    )
+    atributo = models.CharField(
+        max_length=200,
+        null=True,
+        blank=True,
+        verbose_name='Atributo'
+    )
+    codigo_barras = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        verbose_name='Código de Barras'
+    )
 
     class Meta:
         verbose_name = 'Item de Venta'
         verbose_name_plural = 'Items de Venta'
 
     def __str__(self):
-        return f"{self.producto.nombre} x{self.cantidad}"
+        return f"{self.nombre or self.producto.nombre} x{self.cantidad}"
+
+    def copiar_datos_producto(self, producto=None):
+        """Copia código, nombre, atributo y código de barras del producto al item"""
+        producto = producto or self.producto
+        self.codigo = producto.codigo
+        self.nombre = producto.nombre
+        self.atributo = producto.atributo
+        self.codigo_barras = producto.codigo_barras
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.nombre and self.producto_id:
+            self.copiar_datos_producto()
+        super().save(*args, **kwargs)
+
+
+class VentaDiaria(models.Model):
+    """
+    Totales diarios de ventas completadas por fecha local, registradora,
+    vendedor, usuario y método de pago.
+    Tabla de hechos para dashboard y reportes; se actualiza al guardar,
+    anular, editar o eliminar una venta y se puede reconstruir con el
+    comando reconstruir_ventas_diarias.
+    """
+    fecha = models.DateField(
+        verbose_name='Fecha',
+        help_text='Fecha local (TIME_ZONE) de la venta'
+    )
+    registradora_id = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Registradora'
+    )
+    vendedor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Vendedor'
+    )
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Usuario'
+    )
+    metodo_pago = models.CharField(
+        max_length=20,
+        verbose_name='Método de Pago'
+    )
+    total_ventas = models.BigIntegerField(
+        default=0,
+        verbose_name='Total Ventas',
+        help_text='Total de ventas válidas (no anuladas)'
+    )
+    cantidad_ventas = models.IntegerField(
+        default=0,
+        verbose_name='Cantidad Ventas'
+    )
+    total_anuladas = models.BigIntegerField(
+        default=0,
+        verbose_name='Total Anuladas'
+    )
+    cantidad_anuladas = models.IntegerField(
+        default=0,
+        verbose_name='Cantidad Anuladas'
+    )
+    actualizado = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Actualizado',
+        help_text='Último cambio de la fila (versión de los datos cacheados por rango)'
+    )
+    # Registradora, vendedor y usuario admiten NULL y en una restricción única
+    # los NULL no chocan entre sí: la unicidad se apoya en esta clave sin vacíos
+    clave = models.CharField(
+        max_length=100,
+        unique=True,
+        editable=False,
+        verbose_name='Clave',
+        help_text='fecha|registradora|vendedor|usuario|método de pago, con 0 en los ids vacíos'
+    )
+
+    class Meta:
+        verbose_name = 'Venta Diaria'
+        verbose_name_plural = 'Ventas Diarias'
+        indexes = [
+            models.Index(fields=['vendedor', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"Ventas {self.fecha} ({self.metodo_pago}): {self.total_ventas}"
+
+
+class VentaProductoDiaria(models.Model):
+    """
+    Unidades, valor y cantidad de ventas distintas por producto y fecha local,
+    solo de ventas válidas (completadas y no anuladas).
+    Alimenta rotación, top de productos y precio promedio; se recalcula al
+    guardar o eliminar items y al anular o editar la venta, y se puede
+    reconstruir con el comando reconstruir_ventas_producto_diarias.
+    """
+    fecha = models.DateField(
+        verbose_name='Fecha',
+        help_text='Fecha local (TIME_ZONE) de la venta'
+    )
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Producto'
+    )
+    cantidad = models.IntegerField(
+        default=0,
+        verbose_name='Cantidad Vendida'
+    )
+    valor = models.BigIntegerField(
+        default=0,
+        verbose_name='Valor Vendido',
+        help_text='Suma de subtotales de los items'
+    )
+    cantidad_ventas = models.IntegerField(
+        default=0,
+        verbose_name='Cantidad Ventas',
+        help_text='Ventas distintas que incluyen el producto'
+    )
+
+    class Meta:
+        verbose_name = 'Venta Diaria por Producto'
+        verbose_name_plural = 'Ventas Diarias por Producto'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'producto'],
+                name='unique_venta_producto_diaria'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['producto', 'fecha']),
+            # Cubre las sumas por producto de un rango de fechas sin leer la tabla (análisis ABC)
+            models.Index(fields=['fecha', 'producto', 'cantidad', 'valor']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} {self.fecha}: {self.cantidad}"
+
+
+class StockDiario(models.Model):
+    """
+    Foto del stock de cada producto al cierre de un día local.
+    Permite calcular el stock en una fecha como la foto más reciente más los
+    movimientos posteriores, sin recorrer todo el historial de MovimientoStock.
+    Se genera cada noche (y para fechas pasadas) con el comando generar_stock_diario.
+    """
+    fecha = models.DateField(
+        verbose_name='Fecha',
+        help_text='Fecha local (TIME_ZONE); el stock es el del cierre del día'
+    )
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Producto'
+    )
+    stock = models.IntegerField(
+        default=0,
+        verbose_name='Stock'
+    )
+
+    class Meta:
+        verbose_name = 'Stock Diario'
+        verbose_name_plural = 'Stock Diario'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'producto'],
+                name='unique_stock_diario'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['producto', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} {self.fecha}: {self.stock}"
 
 
 class MovimientoStock(models.Model):
@@ -346,6 +580,39 @@ class MovimientoStock(models.Model):
         blank=True,
         verbose_name='Usuario'
     )
+    # Documento que originó el movimiento (el motivo queda solo como texto descriptivo)
+    venta = models.ForeignKey(
+        'Venta',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name='Venta'
+    )
+    ingreso = models.ForeignKey(
+        'IngresoMercancia',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name='Ingreso de Mercancía'
+    )
+    salida = models.ForeignKey(
+        'SalidaMercancia',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name='Salida de Mercancía'
+    )
+    conteo = models.ForeignKey(
+        'ConteoFisico',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_stock',
+        verbose_name='Conteo Físico'
+    )
 
     class Meta:
         verbose_name = 'Movimiento de Stock'
@@ -360,7 +627,7 @@ class MovimientoStock(models.Model):
         return f"{self.tipo} - {self.producto.nombre} ({self.cantidad})"
 
 
-class ConteoFisico(models.Model):
+class ConteoFisico(ClaveSkuMixin, models.Model):
     """Modelo para almacenar conteos físicos de inventario"""
     codigo = models.CharField(
         max_length=50,
@@ -375,6 +642,13 @@ class ConteoFisico(models.Model):
         verbose_name='Atributo',
         help_text='Atributo del producto'
     )
+    sku_key = models.CharField(
+        max_length=251,
+        default='',
+        editable=False,
+        verbose_name='Clave SKU',
+        help_text='Código|atributo normalizado'
+    )
     cantidad_contada = models.IntegerField(
         verbose_name='Cantidad Contada',
         help_text='Cantidad física contada'
@@ -396,6 +670,12 @@ class ConteoFisico(models.Model):
         blank=True,
         verbose_name='Observaciones'
     )
+    aplicado_en = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Aplicado en',
+        help_text='Última aplicación al stock; el conteo está pendiente si es anterior a la fecha de conteo'
+    )
 
     class Meta:
         verbose_name = 'Conteo Físico'
@@ -403,6 +683,7 @@ class ConteoFisico(models.Model):
         ordering = ['-fecha_conteo']
         indexes = [
             models.Index(fields=['codigo', 'atributo', '-fecha_conteo']),
+            models.Index(fields=['sku_key', '-fecha_conteo']),
             models.Index(fields=['-fecha_conteo']),
         ]
 
@@ -410,6 +691,98 @@ class ConteoFisico(models.Model):
         return f"Conteo {self.codigo} - {self.cantidad_contada} ({self.fecha_conteo.strftime('%Y-%m-%d')})"
 
 
+class ConteoFisicoActual(ClaveSkuMixin, models.Model):
+    """
+    Último conteo físico por código+atributo (una fila por sku_key).
+    Tabla de lectura rápida para reportes; se actualiza al guardar un conteo
+    y se puede reconstruir con el comando reconstruir_conteos_actuales.
+    """
+    codigo = models.CharField(
+        max_length=50,
+        verbose_name='Código'
+    )
+    atributo = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        verbose_name='Atributo',
+        help_text='Atributo normalizado (vacío si el producto no tiene atributo)'
+    )
+    sku_key = models.CharField(
+        max_length=251,
+        unique=True,
+        editable=False,
+        verbose_name='Clave SKU',
+        help_text='Código|atributo normalizado'
+    )
+    cantidad_contada = models.IntegerField(
+        verbose_name='Cantidad Contada'
+    )
+    fecha_conteo = models.DateTimeField(
+        verbose_name='Fecha de Conteo'
+    )
+    aplicado_en = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Aplicado en',
+        help_text='Última aplicación al stock; el conteo está pendiente si es anterior a la fecha de conteo'
+    )
+    conteo = models.ForeignKey(
+        ConteoFisico,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Conteo'
+    )
+
+    class Meta:
+        verbose_name = 'Conteo Físico Actual'
+        verbose_name_plural = 'Conteos Físicos Actuales'
+
+    def __str__(self):
+        return f"Conteo actual {self.codigo} {self.atributo or '-'}: {self.cantidad_contada}"
+
+
+class LoteConteoFisico(models.Model):
+    """
+    Lote de escaneos ya aplicado. La página de escaneo reenvía el mismo lote
+    (mismo identificador) si no recibió respuesta; el lote repetido devuelve
+    el resultado guardado en lugar de sumar dos veces.
+    """
+    lote = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Lote',
+        help_text='Identificador generado por el navegador'
+    )
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Usuario'
+    )
+    fecha = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Fecha'
+    )
+    resultado = models.JSONField(
+        default=list,
+        verbose_name='Resultado',
+        help_text='Totales devueltos al aplicar el lote'
+    )
+
+    class Meta:
+        verbose_name = 'Lote de Conteo Físico'
+        verbose_name_plural = 'Lotes de Conteo Físico'
+
+    def __str__(self):
+        return f"Lote de conteo {self.lote}"
+
+
 class PerfilUsuario(models.Model):
     """Modelo para perfil de usuario con PIN"""
     usuario = models.OneToOneField(
@@ -920,22 +1293,312 @@ class CampanaMarketing(models.Model):
         return f"{self.nombre} - {self.get_estado_display()}"
 
 
+class TrabajoReporte(models.Model):
+    """
+    Reporte calculado en segundo plano (inventario o caja).
+    El resultado (contexto JSON, CSV y XLSX) se guarda en disco junto con los
+    parámetros y la versión de datos; solicitudes idénticas reutilizan el
+    trabajo mientras la versión de datos no cambie.
+    """
+    TIPOS = [
+        ('inventario', 'Inventario'),
+        ('caja', 'Caja'),
+    ]
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En Proceso'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+
+    tipo = models.CharField(
+        max_length=20,
+        choices=TIPOS,
+        verbose_name='Tipo de Reporte'
+    )
+    parametros = models.JSONField(
+        default=dict,
+        verbose_name='Parámetros',
+        help_text='Filtros normalizados del reporte'
+    )
+    version_datos = models.CharField(
+        max_length=64,
+        verbose_name='Versión de Datos'
+    )
+    clave = models.CharField(
+        max_length=64,
+        db_index=True,
+        verbose_name='Clave',
+        help_text='Hash de tipo, parámetros y versión de datos'
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADOS,
+        default='pendiente',
+        db_index=True,
+        verbose_name='Estado'
+    )
+    progreso = models.IntegerField(
+        default=0,
+        verbose_name='Progreso (%)'
+    )
+    mensaje = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name='Mensaje'
+    )
+    error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name='Error'
+    )
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='trabajos_reporte',
+        verbose_name='Usuario'
+    )
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Fecha de Creación'
+    )
+    fecha_inicio = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Fecha de Inicio'
+    )
+    fecha_fin = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Fecha de Fin'
+    )
+
+    class Meta:
+        verbose_name = 'Trabajo de Reporte'
+        verbose_name_plural = 'Trabajos de Reporte'
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"Reporte {self.get_tipo_display()} #{self.id} ({self.get_estado_display()})"
+
+
+class CierrePeriodo(models.Model):
+    """
+    Cierre de período: ventas, items, movimientos de stock y gastos de caja
+    hasta `fecha` (inclusive, fecha local) exportados a archivos JSON Lines
+    comprimidos, con filas resumen que conservan los totales de los reportes.
+    Si `movido` es True las filas ya no están en las tablas y su detalle se
+    lee desde el archivo (ver cierre_periodo.py).
+    """
+    fecha = models.DateField(
+        unique=True,
+        verbose_name='Fecha de Corte',
+        help_text='Último día local incluido en el cierre'
+    )
+    desde = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name='Desde',
+        help_text='Primer día local del período (vacío: desde el inicio del historial)'
+    )
+    directorio = models.CharField(
+        max_length=500,
+        verbose_name='Directorio',
+        help_text='Directorio con los archivos .jsonl.gz del cierre'
+    )
+    conteos = models.JSONField(
+        default=dict,
+        verbose_name='Conteos',
+        help_text='Filas archivadas por tabla'
+    )
+    movido = models.BooleanField(
+        default=False,
+        verbose_name='Movido',
+        help_text='Las filas archivadas se eliminaron de las tablas'
+    )
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Usuario'
+    )
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Fecha de Creación'
+    )
+
+    class Meta:
+        verbose_name = 'Cierre de Período'
+        verbose_name_plural = 'Cierres de Período'
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"Cierre {self.fecha}"
+
+
+class ResumenStockCierre(models.Model):
+    """
+    Totales de MovimientoStock de un producto dentro de un cierre de período:
+    stock antes del primer movimiento del período y unidades por tipo.
+    Reemplaza a los movimientos archivados en los totales de reporte_producto.
+    """
+    cierre = models.ForeignKey(
+        CierrePeriodo,
+        on_delete=models.CASCADE,
+        related_name='resumen_stock',
+        verbose_name='Cierre'
+    )
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Producto'
+    )
+    stock_inicial = models.IntegerField(
+        default=0,
+        verbose_name='Stock Inicial'
+    )
+    ingresos = models.IntegerField(default=0, verbose_name='Ingresos')
+    salidas_venta = models.IntegerField(default=0, verbose_name='Salidas por Ventas')
+    salidas_inventario = models.IntegerField(default=0, verbose_name='Salidas de Inventario')
+    ajustes = models.IntegerField(default=0, verbose_name='Ajustes')
+    cantidad_movimientos = models.IntegerField(default=0, verbose_name='Cantidad de Movimientos')
+
+    class Meta:
+        verbose_name = 'Resumen de Stock del Cierre'
+        verbose_name_plural = 'Resúmenes de Stock de Cierres'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cierre', 'producto'],
+                name='unique_resumen_stock_cierre'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['producto', 'cierre']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} {self.cierre_id}"
+
+
+class ResumenGastoCierre(models.Model):
+    """
+    Total y cantidad de gastos/ingresos de caja por día local y tipo dentro de
+    un cierre de período; los retiros al cerrar caja van en filas aparte.
+    Reemplaza a los gastos archivados en los totales del reporte de caja.
+    """
+    cierre = models.ForeignKey(
+        CierrePeriodo,
+        on_delete=models.CASCADE,
+        related_name='resumen_gastos',
+        verbose_name='Cierre'
+    )
+    fecha = models.DateField(verbose_name='Fecha')
+    tipo = models.CharField(
+        max_length=10,
+        choices=GastoCaja.TIPOS,
+        verbose_name='Tipo'
+    )
+    retiro = models.BooleanField(
+        default=False,
+        verbose_name='Retiro',
+        help_text='Gastos que son retiros de dinero al cerrar caja'
+    )
+    total = models.BigIntegerField(default=0, verbose_name='Total')
+    cantidad = models.IntegerField(default=0, verbose_name='Cantidad')
+
+    class Meta:
+        verbose_name = 'Resumen de Gastos del Cierre'
+        verbose_name_plural = 'Resúmenes de Gastos de Cierres'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cierre', 'fecha', 'tipo', 'retiro'],
+                name='unique_resumen_gasto_cierre_retiro'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.tipo}: {self.total}"
+
+
 # ============================================
 # SEÑALES PARA MANTENER INTEGRIDAD DE DATOS
 # ============================================
 
-@receiver(pre_delete, sender=IngresoMercancia)
-def eliminar_movimientos_ingreso(sender, instance, **kwargs):
-    """Eliminar movimientos de stock asociados cuando se elimina un ingreso"""
-    MovimientoStock.objects.filter(
-        motivo__startswith=f'Ingreso #{instance.id}'
+# Los movimientos de stock de un ingreso o una salida eliminados se borran por
+# la FK (on_delete=CASCADE en MovimientoStock.ingreso / MovimientoStock.salida)
+
+@receiver([post_save, post_delete], sender=MovimientoStock)
+@receiver([post_save, post_delete], sender=ItemVenta)
+@receiver([post_save, post_delete], sender=ConteoFisico)
+@receiver([post_save, post_delete], sender=Producto)
+def invalidar_reporte_inventario(sender, **kwargs):
+    """Invalidar el dataset en caché del reporte de inventario cuando cambian sus datos"""
+    from .reporte_inventario import invalidar_cache_inventario
+    invalidar_cache_inventario()
+
+
+@receiver([post_save, post_delete], sender=MovimientoStock)
+def invalidar_stock_diario(sender, instance, raw=False, **kwargs):
+    """Borrar las fotos de stock del producto desde el día del movimiento (quedan desactualizadas)"""
+    if raw:
+        return
+    StockDiario.objects.filter(
+        producto_id=instance.producto_id,
+        fecha__gte=timezone.localdate(instance.fecha),
     ).delete()
 
 
-@receiver(pre_delete, sender=SalidaMercancia)
-def eliminar_movimientos_salida(sender, instance, **kwargs):
-    """Eliminar movimientos de stock asociados cuando se elimina una salida"""
-    MovimientoStock.objects.filter(
-        motivo__startswith=f'Salida #{instance.id}'
-    ).delete()
-
+@receiver(pre_save, sender=Venta)
+def guardar_estado_anterior_venta(sender, instance, raw=False, **kwargs):
+    """Guardar el estado previo de la venta para actualizar VentaDiaria por diferencia"""
+    if raw:
+        return
+    from .ventas_diarias import estado_venta_guardada
+    instance._venta_diaria_anterior = estado_venta_guardada(instance.pk)
+
+
+@receiver(post_save, sender=Venta)
+def actualizar_venta_diaria(sender, instance, raw=False, **kwargs):
+    """Aplicar a VentaDiaria el cambio de la venta (alta, anulación o edición)"""
+    if raw:
+        return
+    from .ventas_diarias import estado_venta, registrar_cambio_venta, registrar_cambio_venta_productos
+    anterior = getattr(instance, '_venta_diaria_anterior', None)
+    actual = estado_venta(instance)
+    registrar_cambio_venta(anterior, actual)
+    registrar_cambio_venta_productos(instance.pk, anterior, actual)
+    instance._venta_diaria_anterior = None
+
+
+@receiver(post_delete, sender=Venta)
+def descontar_venta_diaria(sender, instance, **kwargs):
+    """Quitar de VentaDiaria una venta eliminada"""
+    from .ventas_diarias import estado_venta, registrar_cambio_venta
+    registrar_cambio_venta(estado_venta(instance), None)
+
+
+@receiver(pre_save, sender=ItemVenta)
+def guardar_clave_anterior_item_venta(sender, instance, raw=False, **kwargs):
+    """Guardar venta y producto previos del item para recalcular VentaProductoDiaria"""
+    if raw:
+        return
+    from .ventas_diarias import clave_item_guardado
+    instance._venta_producto_anterior = clave_item_guardado(instance.pk)
+
+
+@receiver(post_save, sender=ItemVenta)
+@receiver(post_delete, sender=ItemVenta)
+def actualizar_venta_producto_diaria(sender, instance, raw=False, **kwargs):
+    """Recalcular VentaProductoDiaria del producto y día del item (y de los previos si cambiaron)"""
+    if raw:
+        return
+    from .ventas_diarias import clave_item, programar_recalculo_ventas_producto
+    claves = {clave_item(instance), getattr(instance, '_venta_producto_anterior', None)}
+    instance._venta_producto_anterior = None
+    programar_recalculo_ventas_producto(claves)
@@ -0,0 +1,290 @@
+"""
+Línea de tiempo de movimientos de la caja única (apertura, ventas,
+anulaciones, gastos, ingresos y retiros) con saldo antes/después.
+
+Las ventas, las anulaciones y los gastos se leen ya ordenados desde la base de
+datos y se mezclan con heapq.merge; cada página trae solo N filas por fuente
+(paginación por cursor), así que el costo de la página no depende de cuánto
+tiempo lleve abierta la caja.
+"""
+import base64
+import heapq
+import json
+import re
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import GastoCaja, Venta
+
+
+# Orden de desempate entre movimientos con la misma fecha
+ORDEN_APERTURA = 0
+ORDEN_VENTA = 1
+ORDEN_DEVOLUCION = 2
+ORDEN_GASTO = 3
+
+DESCRIPCION_RETIRO = 'Retiro de dinero al cerrar caja'
+DESCRIPCION_DEVOLUCION = 'Devolución por anulación de venta #'
+
+REGISTRADORAS = {
+    1: 'Registradora 1',
+    2: 'Registradora 2',
+    3: 'Registradora 3',
+}
+
+
+def ventas_periodo_caja(caja_usuario, caja_principal):
+    """Ventas completadas (válidas y anuladas) del período de la caja"""
+    if caja_usuario.fecha_cierre:
+        return Venta.objects.filter(
+            fecha__gte=caja_usuario.fecha_apertura,
+            fecha__lte=caja_usuario.fecha_cierre,
+            completada=True
+        )
+    return Venta.objects.filter(
+        caja=caja_principal,
+        fecha__gte=caja_usuario.fecha_apertura,
+        completada=True
+    )
+
+
+def gastos_periodo_caja(caja_usuario):
+    """Gastos/ingresos/retiros registrados en la caja dentro de su período"""
+    gastos = GastoCaja.objects.filter(
+        caja_usuario=caja_usuario,
+        fecha__gte=caja_usuario.fecha_apertura
+    )
+    if caja_usuario.fecha_cierre:
+        gastos = gastos.filter(fecha__lte=caja_usuario.fecha_cierre)
+    return gastos
+
+
+def ventas_con_gasto_devolucion(gastos_qs):
+    """IDs de ventas anuladas cuya devolución ya está registrada como GastoCaja"""
+    ids = set()
+    descripciones = gastos_qs.filter(
+        descripcion__icontains=DESCRIPCION_DEVOLUCION
+    ).values_list('descripcion', flat=True)
+    for descripcion in descripciones:
+        match = re.search(r'venta #(\d+)', descripcion, re.IGNORECASE)
+        if match:
+            ids.add(int(match.group(1)))
+    return ids
+
+
+def codificar_token(clave, saldo):
+    """Token opaco para continuar la línea de tiempo después de `clave`"""
+    fecha, orden, obj_id = clave
+    data = {'f': fecha.isoformat(), 'o': orden, 'i': obj_id, 's': saldo}
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+
+def decodificar_token(token):
+    """Devuelve ((fecha, orden, id), saldo) o None si el token no es válido"""
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        clave = (datetime.fromisoformat(data['f']), int(data['o']), int(data['i']))
+        return clave, int(data['s'])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def _filtro_cursor(campo_fecha, orden, cursor):
+    """Filtro keyset: filas cuya clave (fecha, orden, id) es menor que el cursor"""
+    if cursor is None:
+        return Q()
+    fecha_c, orden_c, id_c = cursor
+    if orden < orden_c:
+        return Q(**{f'{campo_fecha}__lte': fecha_c})
+    if orden > orden_c:
+        return Q(**{f'{campo_fecha}__lt': fecha_c})
+    return Q(**{f'{campo_fecha}__lt': fecha_c}) | Q(**{campo_fecha: fecha_c, 'id__lt': id_c})
+
+
+def _movimiento_venta(venta):
+    registradora_nombre = None
+    if venta.registradora_id:
+        registradora_nombre = REGISTRADORAS.get(venta.registradora_id, f'Registradora {venta.registradora_id}')
+    return {
+        'clave': (venta.fecha, ORDEN_VENTA, venta.id),
+        'tipo': 'venta',
+        'fecha': venta.fecha,
+        'monto': int(venta.total or 0),
+        'descripcion': f'Venta #{venta.id}' + (' (Anulada)' if venta.anulada else ''),
+        'usuario': venta.usuario,
+        'metodo_pago': venta.get_metodo_pago_display(),
+        'vendedor': venta.vendedor,
+        'venta_id': venta.id,
+        'registradora_id': venta.registradora_id,
+        'registradora_nombre': registradora_nombre,
+        'anulada': venta.anulada,
+    }
+
+
+def _movimiento_devolucion(venta):
+    movimiento = _movimiento_venta(venta)
+    movimiento.update({
+        'clave': (venta.fecha_movimiento, ORDEN_DEVOLUCION, venta.id),
+        'tipo': 'devolucion',
+        'fecha': venta.fecha_movimiento,
+        'monto': -int(venta.total or 0),
+        'descripcion': f'Anulación - Venta #{venta.id}',
+        'usuario': venta.usuario_anulacion if venta.usuario_anulacion else venta.usuario,
+        'anulada': True,
+    })
+    return movimiento
+
+
+def _movimiento_gasto(gasto):
+    es_retiro = DESCRIPCION_RETIRO in (gasto.descripcion or '')
+    return {
+        'clave': (gasto.fecha, ORDEN_GASTO, gasto.id),
+        'tipo': 'retiro' if es_retiro else gasto.tipo,
+        'fecha': gasto.fecha,
+        'monto': int(gasto.monto or 0),
+        'descripcion': gasto.descripcion,
+        'usuario': gasto.usuario,
+        'metodo_pago': None,
+        'vendedor': None,
+        'venta_id': None,
+        'gasto_id': gasto.id,
+    }
+
+
+def delta_movimiento(movimiento):
+    """Efecto del movimiento sobre el saldo de la caja"""
+    if movimiento['tipo'] in ('gasto', 'retiro'):
+        return -int(movimiento['monto'])
+    # apertura, venta, ingreso y devolución (esta última ya trae monto negativo)
+    return int(movimiento['monto'])
+
+
+def resumen_linea_tiempo(caja_usuario, caja_principal):
+    """
+    Saldo final y cantidad de movimientos de la caja usando solo agregados.
+    Devuelve también los IDs de ventas con devolución registrada como gasto.
+    """
+    ventas = ventas_periodo_caja(caja_usuario, caja_principal)
+    gastos = gastos_periodo_caja(caja_usuario)
+    ids_con_gasto = ventas_con_gasto_devolucion(gastos)
+
+    filtro_devolucion = Q(anulada=True) & ~Q(id__in=ids_con_gasto)
+    tot_ventas = ventas.aggregate(
+        total_ventas=Sum('total'),
+        cantidad=Count('id'),
+        total_devoluciones=Sum('total', filter=filtro_devolucion),
+        cantidad_devoluciones=Count('id', filter=filtro_devolucion),
+    )
+    tot_gastos = gastos.aggregate(
+        total_gastos=Sum('monto', filter=Q(tipo='gasto')),
+        total_ingresos=Sum('monto', filter=Q(tipo='ingreso')),
+        cantidad=Count('id'),
+    )
+
+    monto_inicial = int(caja_usuario.monto_inicial or 0)
+    saldo_final = (
+        monto_inicial
+        + int(tot_ventas['total_ventas'] or 0)
+        - int(tot_ventas['total_devoluciones'] or 0)
+        + int(tot_gastos['total_ingresos'] or 0)
+        - int(tot_gastos['total_gastos'] or 0)
+    )
+    total_movimientos = (
+        1
+        + tot_ventas['cantidad']
+        + tot_ventas['cantidad_devoluciones']
+        + tot_gastos['cantidad']
+    )
+    return {
+        'saldo_final': saldo_final,
+        'total_movimientos': total_movimientos,
+        'ids_con_gasto_devolucion': ids_con_gasto,
+    }
+
+
+def pagina_movimientos_caja(caja_usuario, caja_principal, limite=50, token=None):
+    """
+    Página de la línea de tiempo de la caja, de más reciente a más antiguo.
+
+    Args:
+        caja_usuario: CajaUsuario cuya línea de tiempo se muestra
+        caja_principal: Caja principal (filtra ventas si la caja está abierta)
+        limite: cantidad máxima de movimientos por página
+        token: token devuelto por la página anterior (None para la primera)
+
+    Returns:
+        dict con 'movimientos', 'siguiente_token' y 'total_movimientos'
+    """
+    resumen = resumen_linea_tiempo(caja_usuario, caja_principal)
+    cursor_saldo = decodificar_token(token)
+    if cursor_saldo:
+        cursor, saldo = cursor_saldo
+    else:
+        cursor, saldo = None, resumen['saldo_final']
+
+    ventas = ventas_periodo_caja(caja_usuario, caja_principal).select_related(
+        'usuario', 'vendedor', 'usuario_anulacion'
+    )
+    gastos = gastos_periodo_caja(caja_usuario).select_related('usuario')
+
+    ventas_page = ventas.filter(
+        _filtro_cursor('fecha', ORDEN_VENTA, cursor)
+    ).order_by('-fecha', '-id')[:limite + 1]
+
+    devoluciones_page = ventas.filter(anulada=True).exclude(
+        id__in=resumen['ids_con_gasto_devolucion']
+    ).annotate(
+        fecha_movimiento=Coalesce('fecha_anulacion', 'fecha')
+    ).filter(
+        _filtro_cursor('fecha_movimiento', ORDEN_DEVOLUCION, cursor)
+    ).order_by('-fecha_movimiento', '-id')[:limite + 1]
+
+    gastos_page = gastos.filter(
+        _filtro_cursor('fecha', ORDEN_GASTO, cursor)
+    ).order_by('-fecha', '-id')[:limite + 1]
+
+    apertura = []
+    clave_apertura = (caja_usuario.fecha_apertura, ORDEN_APERTURA, caja_usuario.id)
+    if cursor is None or clave_apertura < cursor:
+        apertura.append({
+            'clave': clave_apertura,
+            'tipo': 'apertura',
+            'fecha': caja_usuario.fecha_apertura,
+            'monto': int(caja_usuario.monto_inicial or 0),
+            'descripcion': 'Apertura de Caja',
+            'usuario': caja_usuario.usuario,
+            'metodo_pago': None,
+            'vendedor': None,
+            'venta_id': None,
+        })
+
+    fuentes = [
+        (_movimiento_venta(v) for v in ventas_page),
+        (_movimiento_devolucion(v) for v in devoluciones_page),
+        (_movimiento_gasto(g) for g in gastos_page),
+        iter(apertura),
+    ]
+    mezclados = heapq.merge(*fuentes, key=lambda m: m['clave'], reverse=True)
+    filas = list(islice(mezclados, limite + 1))
+
+    movimientos = []
+    for movimiento in filas[:limite]:
+        movimiento['saldo_despues'] = saldo
+        saldo -= delta_movimiento(movimiento)
+        movimiento['saldo_antes'] = saldo
+        movimientos.append(movimiento)
+
+    siguiente_token = None
+    if len(filas) > limite and movimientos:
+        siguiente_token = codificar_token(movimientos[-1]['clave'], saldo)
+
+    return {
+        'movimientos': movimientos,
+        'siguiente_token': siguiente_token,
+        'total_movimientos': resumen['total_movimientos'],
+    }
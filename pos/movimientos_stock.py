@@ -0,0 +1,123 @@
+"""
+Escritura en bloque de stock y de MovimientoStock para documentos con muchas
+líneas (ingresos, salidas, conteos).
+
+El stock se actualiza con incrementos F() agrupados por producto en un solo
+UPDATE (CASE por id), se lee de vuelta dentro de la misma transacción y los
+movimientos se encadenan desde ese valor, así stock_anterior/stock_nuevo
+quedan continuos aunque un producto aparezca en varias líneas. bulk_create y
+update() no disparan señales: registrar_movimientos() aplica lo que harían
+las señales de MovimientoStock y Producto (cachés y fotos de stock diario).
+"""
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import MovimientoStock, Producto, StockDiario
+
+# Productos por UPDATE (límite de parámetros de SQLite) y movimientos por INSERT
+TAMANO_LOTE = 500
+
+
+class StockNegativo(Exception):
+    """Un descuento condicional no se aplicó: algún producto no tenía stock suficiente"""
+
+
+def _por_producto(producto_ids, valores):
+    """Expresión CASE con el valor de cada producto ({producto_id: valor})"""
+    return Case(
+        *(When(id=producto_id, then=Value(valores[producto_id])) for producto_id in producto_ids),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def incrementar_stock(variaciones, sin_negativos=False):
+    """
+    Suma a cada producto su variación ({producto_id: variación}, con signo)
+    con un UPDATE por lote de productos. Debe llamarse dentro de una transacción.
+
+    Con sin_negativos=True el UPDATE solo alcanza a los productos cuyo stock
+    cubre la variación (condición evaluada en la misma sentencia, sin lecturas
+    previas que puedan quedar viejas); si alguno queda fuera lanza
+    StockNegativo y la transacción que lo rodea debe revertirse.
+
+    Returns:
+        dict {producto_id: stock antes de la variación}
+    """
+    producto_ids = [producto_id for producto_id, variacion in variaciones.items() if variacion]
+    for inicio in range(0, len(producto_ids), TAMANO_LOTE):
+        lote = producto_ids[inicio:inicio + TAMANO_LOTE]
+        productos = Producto.objects.filter(id__in=lote)
+        if sin_negativos:
+            productos = productos.filter(stock__gte=_por_producto(lote, {
+                producto_id: -variaciones[producto_id] for producto_id in lote
+            }))
+        actualizados = productos.update(stock=F('stock') + _por_producto(lote, variaciones))
+        if sin_negativos and actualizados < len(lote):
+            raise StockNegativo()
+
+    # Leído después de escribir: ya se tiene el bloqueo de escritura, así que es el valor propio
+    stock_anterior = {}
+    producto_ids = list(variaciones)
+    for inicio in range(0, len(producto_ids), TAMANO_LOTE):
+        for producto_id, stock in Producto.objects.filter(
+            id__in=producto_ids[inicio:inicio + TAMANO_LOTE]
+        ).values_list('id', 'stock'):
+            stock_anterior[producto_id] = stock - variaciones[producto_id]
+    return stock_anterior
+
+
+def movimientos_encadenados(lineas, stock_anterior, tipo, fecha=None, **campos):
+    """
+    MovimientoStock sin guardar, uno por línea y en orden, con
+    stock_anterior/stock_nuevo encadenados por producto.
+
+    Args:
+        lineas: iterable de (producto_id, cantidad, motivo); la cantidad es
+            positiva y el tipo define el signo (ajuste: cantidad con signo)
+        stock_anterior: dict {producto_id: stock antes de la primera línea}
+        tipo: 'ingreso', 'salida' o 'ajuste'
+        campos: campos comunes (usuario, ingreso, salida, conteo, ...)
+    """
+    fecha = fecha or timezone.now()
+    stock = dict(stock_anterior)
+    movimientos = []
+    for producto_id, cantidad, motivo in lineas:
+        anterior = stock[producto_id]
+        stock[producto_id] = anterior + (-cantidad if tipo == 'salida' else cantidad)
+        movimientos.append(MovimientoStock(
+            producto_id=producto_id,
+            tipo=tipo,
+            cantidad=cantidad,
+            stock_anterior=anterior,
+            stock_nuevo=stock[producto_id],
+            motivo=motivo,
+            fecha=fecha,
+            **campos
+        ))
+    return movimientos
+
+
+def registrar_movimientos(movimientos):
+    """
+    Guarda los movimientos con bulk_create y aplica los efectos de las señales
+    omitidas: invalida las cachés que leen stock o movimientos y borra las
+    fotos de stock diario de los productos desde el día de cada movimiento.
+    """
+    from .reporte_inventario import invalidar_cache_inventario
+
+    MovimientoStock.objects.bulk_create(movimientos, batch_size=TAMANO_LOTE)
+
+    desde = {}
+    for movimiento in movimientos:
+        dia = timezone.localdate(movimiento.fecha)
+        if movimiento.producto_id not in desde or dia < desde[movimiento.producto_id]:
+            desde[movimiento.producto_id] = dia
+    for dia in set(desde.values()):
+        producto_ids = [producto_id for producto_id, fecha in desde.items() if fecha == dia]
+        for inicio in range(0, len(producto_ids), TAMANO_LOTE):
+            StockDiario.objects.filter(
+                producto_id__in=producto_ids[inicio:inicio + TAMANO_LOTE], fecha__gte=dia
+            ).delete()
+    invalidar_cache_inventario()
+    return movimientos
@@ -0,0 +1,300 @@
+"""
+Pronóstico de agotamiento de stock ("días de cobertura") por producto.
+
+La velocidad de venta de cada producto activo sale de sus ventas diarias
+(VentaProductoDiaria) en los últimos días completos: promedio simple o, si se
+indica `alfa`, suavizado exponencial (los días recientes pesan más). Los días
+de cobertura son stock / velocidad; un producto está en riesgo si se agota
+antes de la próxima entrega del proveedor.
+
+Las ventas de la ventana se cargan en una matriz NumPy (productos x días) con
+una sola consulta y el cálculo es vectorizado para todos los productos. Las
+velocidades quedan en caché en memoria hasta la siguiente actualización de
+VentaProductoDiaria (señales de venta, reconstrucción o escrituras de otros
+procesos) o el cambio de día; el stock se lee en cada consulta.
+
+Configuración opcional en settings:
+
+    PRONOSTICO_STOCK_VENTANA_DIAS = 28   # días completos de historia
+    PRONOSTICO_STOCK_ALFA = None         # 0 < alfa <= 1 activa el suavizado exponencial
+    PRONOSTICO_STOCK_DIAS_ENTREGA = 7    # días hasta la próxima entrega del proveedor
+    PRONOSTICO_STOCK_CACHE_TTL = 300     # segundos
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Producto
+from .ventas_diarias import ventas_producto_rango
+
+# Columnas por las que se puede ordenar el reporte
+ORDENES_PRONOSTICO = ('dias_cobertura', 'velocidad', 'stock')
+
+COLUMNAS_PRONOSTICO = [
+    'Código', 'Producto', 'Atributo', 'Stock Actual', 'Venta Diaria', 'Días de Cobertura',
+    'Fecha de Agotamiento', 'En Riesgo',
+]
+
+
+def parametros_pronostico(ventana_dias=None, alfa=None, dias_entrega=None):
+    """Completa los parámetros con los valores de settings; alfa fuera de (0, 1] desactiva el suavizado"""
+    ventana_dias = int(ventana_dias or getattr(settings, 'PRONOSTICO_STOCK_VENTANA_DIAS', 28))
+    if alfa is None:
+        alfa = getattr(settings, 'PRONOSTICO_STOCK_ALFA', None)
+    if alfa is not None and not 0 < alfa <= 1:
+        alfa = None
+    if dias_entrega is None:
+        dias_entrega = getattr(settings, 'PRONOSTICO_STOCK_DIAS_ENTREGA', 7)
+    return max(ventana_dias, 1), alfa, max(int(dias_entrega), 0)
+
+
+def parametros_reporte_pronostico(datos):
+    """
+    Parámetros del reporte desde un dict de request (GET): ventana, alfa y
+    días de entrega (valores vacíos o inválidos usan settings), columna y
+    sentido de orden y filtro de productos en riesgo.
+    """
+    def _numero(clave, tipo):
+        try:
+            return tipo(datos.get(clave))
+        except (TypeError, ValueError):
+            return None
+
+    ventana_dias, alfa, dias_entrega = parametros_pronostico(
+        min(max(_numero('ventana', int) or 0, 0), 365), _numero('alfa', float), _numero('dias_entrega', int)
+    )
+    orden = datos.get('orden')
+    return {
+        'ventana_dias': ventana_dias,
+        'alfa': alfa,
+        'dias_entrega': dias_entrega,
+        'orden': orden if orden in ORDENES_PRONOSTICO else 'dias_cobertura',
+        'descendente': datos.get('dir') == 'desc',
+        'solo_riesgo': datos.get('solo_riesgo') == '1',
+    }
+
+
+def pesos_suavizado(ventana_dias, alfa):
+    """
+    Pesos por día (del más antiguo al más reciente) que suman 1: promedio
+    simple sin alfa; con alfa, el suavizado exponencial
+    s_t = alfa * x_t + (1 - alfa) * s_(t-1) iniciado en el primer día.
+    """
+    if alfa is None:
+        return np.full(ventana_dias, 1 / ventana_dias)
+    pesos = alfa * (1 - alfa) ** np.arange(ventana_dias - 1, -1, -1, dtype=np.float64)
+    pesos[0] = (1 - alfa) ** (ventana_dias - 1)
+    return pesos
+
+
+def calcular_velocidades(ventana_dias, alfa, hoy=None):
+    """
+    Velocidad de venta (unidades por día) de los productos con ventas en los
+    `ventana_dias` días completos anteriores a hoy.
+
+    Returns:
+        (ids, velocidades): arreglos NumPy alineados, ids ordenados
+    """
+    hoy = hoy or timezone.localdate()
+    desde = hoy - timedelta(days=ventana_dias)
+    filas = list(
+        ventas_producto_rango(desde, hoy - timedelta(days=1)).values_list('producto_id', 'fecha', 'cantidad')
+    )
+    if not filas:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+    producto_ids, fechas, cantidades = zip(*filas)
+    ids, posiciones = np.unique(np.array(producto_ids, dtype=np.int64), return_inverse=True)
+    dias = np.array([(fecha - desde).days for fecha in fechas], dtype=np.int64)
+    ventas = np.zeros((len(ids), ventana_dias), dtype=np.float64)
+    ventas[posiciones, dias] = cantidades
+    return ids, ventas @ pesos_suavizado(ventana_dias, alfa)
+
+
+# ============================================
+# CACHÉ DE VELOCIDADES
+# ============================================
+
+# Combinaciones (ventana, alfa) en memoria: dashboard y reporte pueden usar parámetros distintos
+MAX_ENTRADAS_CACHE = 4
+
+_cache_lock = threading.Lock()
+_cache_velocidades = OrderedDict()
+_version_local = 0
+
+
+def invalidar_cache_pronostico(**kwargs):
+    """Descarta las velocidades en memoria (cambió VentaProductoDiaria)"""
+    global _version_local
+    with _cache_lock:
+        _version_local += 1
+        _cache_velocidades.clear()
+
+
+def velocidades_venta(ventana_dias, alfa):
+    """Velocidades desde la caché (por día, ventana, alfa y versión de datos) o recién calculadas"""
+    ttl = getattr(settings, 'PRONOSTICO_STOCK_CACHE_TTL', 300)
+    hoy = timezone.localdate()
+    # El último id de los días completos detecta filas nuevas creadas por otros procesos
+    # (las ventas de hoy no entran en las velocidades)
+    ultimo_id = ventas_producto_rango(fecha_hasta=hoy - timedelta(days=1)).aggregate(v=Max('id'))['v']
+    clave = (hoy, ventana_dias, alfa, _version_local, ultimo_id)
+    ahora = time.monotonic()
+    with _cache_lock:
+        entrada = _cache_velocidades.get(clave)
+        if entrada and ahora - entrada[0] <= ttl:
+            _cache_velocidades.move_to_end(clave)
+            return entrada[1]
+
+    resultado = calcular_velocidades(ventana_dias, alfa, hoy)
+
+    with _cache_lock:
+        _cache_velocidades[clave] = (ahora, resultado)
+        _cache_velocidades.move_to_end(clave)
+        while len(_cache_velocidades) > MAX_ENTRADAS_CACHE:
+            _cache_velocidades.popitem(last=False)
+    return resultado
+
+
+# ============================================
+# PRONÓSTICO
+# ============================================
+
+def pronostico_stock(ventana_dias=None, alfa=None, dias_entrega=None):
+    """
+    Días de cobertura de todos los productos activos.
+
+    Returns:
+        dict con los parámetros usados y arreglos NumPy alineados por producto:
+        'ids', 'stock', 'velocidad', 'dias_cobertura' (inf sin ventas; 0 sin
+        stock) y 'en_riesgo' (se agota antes de la próxima entrega)
+    """
+    ventana_dias, alfa, dias_entrega = parametros_pronostico(ventana_dias, alfa, dias_entrega)
+    ids_venta, velocidades = velocidades_venta(ventana_dias, alfa)
+
+    productos = np.array(
+        list(Producto.objects.filter(activo=True).order_by('id').values_list('id', 'stock')), dtype=np.int64
+    ).reshape(-1, 2)
+    ids = productos[:, 0]
+    stock = productos[:, 1].astype(np.float64)
+
+    velocidad = np.zeros(len(ids), dtype=np.float64)
+    if len(ids_venta) and len(ids):
+        posiciones = np.minimum(np.searchsorted(ids_venta, ids), len(ids_venta) - 1)
+        con_ventas = ids_venta[posiciones] == ids
+        velocidad[con_ventas] = velocidades[posiciones[con_ventas]]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dias_cobertura = np.where(velocidad > 0, stock / velocidad, np.inf)
+    dias_cobertura[stock <= 0] = 0
+
+    return {
+        'ventana_dias': ventana_dias,
+        'alfa': alfa,
+        'dias_entrega': dias_entrega,
+        'hoy': timezone.localdate(),
+        'ids': ids,
+        'stock': stock,
+        'velocidad': velocidad,
+        'dias_cobertura': dias_cobertura,
+        'en_riesgo': dias_cobertura < dias_entrega,
+    }
+
+
+def orden_pronostico(pronostico, orden='dias_cobertura', descendente=False, solo_riesgo=False):
+    """
+    Posiciones de los productos ordenadas por una columna de
+    ORDENES_PRONOSTICO; a igualdad, por id.
+    """
+    if orden not in ORDENES_PRONOSTICO:
+        orden = 'dias_cobertura'
+    valores = pronostico[orden]
+    posiciones = np.lexsort((pronostico['ids'], -valores if descendente else valores))
+    if solo_riesgo:
+        posiciones = posiciones[pronostico['en_riesgo'][posiciones]]
+    return posiciones
+
+
+class FilasPronostico:
+    """
+    Secuencia perezosa de filas del pronóstico en un orden dado, para
+    Paginator y exportaciones: los datos del producto (código, nombre,
+    atributo) se leen solo para las posiciones pedidas.
+    """
+
+    def __init__(self, pronostico, posiciones):
+        self.pronostico = pronostico
+        self.posiciones = posiciones
+
+    def __len__(self):
+        return len(self.posiciones)
+
+    def count(self):
+        return len(self.posiciones)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return self._filas(self.posiciones[indice])
+        return self._filas(self.posiciones[indice:indice + 1])[0]
+
+    def __iter__(self):
+        for inicio in range(0, len(self.posiciones), 2000):
+            yield from self._filas(self.posiciones[inicio:inicio + 2000])
+
+    def _filas(self, posiciones):
+        pronostico = self.pronostico
+        ids = pronostico['ids'][posiciones].tolist()
+        productos = Producto.objects.in_bulk(ids)
+        limite_dias = (date.max - pronostico['hoy']).days
+        filas = []
+        for posicion, producto_id in zip(posiciones.tolist(), ids):
+            producto = productos.get(producto_id)
+            if producto is None:
+                continue
+            dias = float(pronostico['dias_cobertura'][posicion])
+            filas.append({
+                'producto': producto,
+                'id': producto_id,
+                'codigo': producto.codigo,
+                'nombre': producto.nombre,
+                'atributo': producto.atributo or '-',
+                'stock': int(pronostico['stock'][posicion]),
+                'velocidad': round(float(pronostico['velocidad'][posicion]), 2),
+                'dias_cobertura': None if dias == float('inf') else round(dias, 1),
+                # Sin fecha si no hay ventas o cae después del último día representable
+                'fecha_agotamiento': (
+                    pronostico['hoy'] + timedelta(days=int(dias)) if dias < limite_dias else None
+                ),
+                'en_riesgo': bool(pronostico['en_riesgo'][posicion]),
+            })
+        return filas
+
+
+def productos_en_riesgo(limite=10):
+    """
+    Para el dashboard: cantidad de productos que se agotan antes de la próxima
+    entrega y las primeras `limite` filas, de menor a mayor cobertura.
+    """
+    pronostico = pronostico_stock()
+    posiciones = orden_pronostico(pronostico, solo_riesgo=True)
+    return len(posiciones), FilasPronostico(pronostico, posiciones)[:limite], pronostico
+
+
+def fila_pronostico(fila):
+    """Fila de exportación CSV de una fila de FilasPronostico"""
+    return [
+        fila['codigo'],
+        fila['nombre'],
+        fila['atributo'],
+        fila['stock'],
+        fila['velocidad'],
+        '' if fila['dias_cobertura'] is None else fila['dias_cobertura'],
+        fila['fecha_agotamiento'].isoformat() if fila['fecha_agotamiento'] else '',
+        'Sí' if fila['en_riesgo'] else 'No',
+    ]
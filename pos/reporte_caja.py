@@ -0,0 +1,379 @@
+"""
+Dataset del reporte de caja (reportes?tipo=caja).
+
+construir_dataset_caja() calcula las secciones agregadas del reporte (totales,
+métodos de pago, resúmenes por usuario/vendedor, top de productos, gastos y
+resumen diario) desde las tablas diarias y consultas agrupadas. El resultado
+solo contiene listas, dicts y fechas, así que la pantalla lo usa directamente
+y los trabajos en segundo plano lo guardan como JSON. Los detalles paginados
+(ventas, movimientos, cajas) se consultan aparte en cada página.
+"""
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import BooleanField, Case, Count, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .fechas import rango_fechas_local
+from .models import CajaUsuario, GastoCaja, Producto, ResumenGastoCierre, Venta
+from .movimientos_caja import ORDEN_APERTURA, ORDEN_GASTO, ORDEN_VENTA
+from .ventas_diarias import totales_ventas, ventas_diarias_rango, ventas_producto_rango
+
+DESCRIPCION_RETIRO = 'Retiro de dinero al cerrar caja'
+
+# Filas leídas por lote de cada fuente de movimientos_caja()
+TAMANO_LOTE_MOVIMIENTOS = 2000
+
+
+def fechas_reporte_caja(fecha_desde, fecha_hasta):
+    """
+    Fechas del filtro ('YYYY-MM-DD') como date; por defecto el mes actual.
+    Si vienen invertidas se intercambian.
+    """
+    try:
+        if not fecha_desde:
+            fecha_desde = timezone.localdate().replace(day=1)
+        else:
+            fecha_desde = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
+    except Exception:
+        fecha_desde = timezone.localdate().replace(day=1)
+
+    try:
+        if not fecha_hasta:
+            fecha_hasta = timezone.localdate()
+        else:
+            fecha_hasta = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
+    except Exception:
+        fecha_hasta = timezone.localdate()
+
+    if fecha_hasta < fecha_desde:
+        fecha_desde, fecha_hasta = fecha_hasta, fecha_desde
+    return fecha_desde, fecha_hasta
+
+
+def rango_caja(fecha_desde, fecha_hasta):
+    """
+    (inicio_dt, fin_dt) aware que cubren los días locales fecha_desde..fecha_hasta.
+    Semiabierto: filtrar con __gte=inicio_dt y __lt=fin_dt.
+    """
+    return rango_fechas_local(fecha_desde, fecha_hasta)
+
+
+def _display_user(u):
+    if not u:
+        return ''
+    return (u.get_full_name() or u.username)
+
+
+def _movimiento_apertura(cu):
+    monto = int(cu.monto_inicial or 0)
+    return {
+        'clave': (cu.fecha_apertura, ORDEN_APERTURA, cu.id),
+        'fecha': cu.fecha_apertura,
+        'tipo': 'Apertura',
+        'descripcion': f'Apertura de Caja (CajaUsuario #{cu.id})',
+        'delta': monto,
+        'monto_abs': monto,
+        'metodo_pago': '-',
+        'usuario': _display_user(cu.usuario),
+        'venta_id': None,
+    }
+
+
+def _movimiento_venta(v):
+    vendedor = v.vendedor if v.vendedor else v.usuario
+    desc = f'Venta #{v.id}'
+    if v.registradora_id:
+        desc = f'{desc} - Registradora {v.registradora_id}'
+    monto = int(v.total or 0)
+    return {
+        'clave': (v.fecha, ORDEN_VENTA, v.id),
+        'fecha': v.fecha,
+        'tipo': 'Venta Anulada' if v.anulada else 'Venta',
+        'descripcion': desc,
+        'delta': -monto if v.anulada else monto,
+        'monto_abs': monto,
+        'metodo_pago': v.get_metodo_pago_display(),
+        'usuario': _display_user(vendedor),
+        'venta_id': v.id,
+    }
+
+
+def _movimiento_gasto(g):
+    es_retiro = bool(g.descripcion and DESCRIPCION_RETIRO in g.descripcion)
+    monto = int(g.monto or 0)
+    return {
+        'clave': (g.fecha, ORDEN_GASTO, g.id),
+        'fecha': g.fecha,
+        'tipo': 'Retiro' if es_retiro else ('Gasto' if g.tipo == 'gasto' else 'Ingreso'),
+        'descripcion': g.descripcion,
+        'delta': -monto if g.tipo == 'gasto' else monto,
+        'monto_abs': monto,
+        'metodo_pago': '-',
+        'usuario': _display_user(g.usuario),
+        'venta_id': None,
+    }
+
+
+def _fuentes_movimientos_caja(inicio_dt, fin_dt):
+    """Aperturas, ventas y gastos del rango, cada uno ya ordenado por (fecha, id) en la base de datos"""
+    aperturas = CajaUsuario.objects.filter(
+        fecha_apertura__gte=inicio_dt,
+        fecha_apertura__lt=fin_dt
+    )
+    ventas = Venta.objects.filter(
+        fecha__gte=inicio_dt,
+        fecha__lt=fin_dt,
+        completada=True
+    )
+    gastos = GastoCaja.objects.filter(fecha__gte=inicio_dt, fecha__lt=fin_dt)
+    return aperturas, ventas, gastos
+
+
+def movimientos_caja(inicio_dt, fin_dt):
+    """
+    Reporte estilo "Todos los Movimientos" (Caja):
+    Apertura + Ventas + Gastos/Ingresos/Retiros con saldo antes/después.
+
+    Generador: las tres fuentes se leen por lotes ya ordenadas por fecha y se
+    mezclan con heapq.merge (en la misma fecha: apertura, venta, gasto), así
+    que el rango completo nunca se carga en memoria.
+    """
+    tz = timezone.get_current_timezone()
+    aperturas, ventas, gastos = _fuentes_movimientos_caja(inicio_dt, fin_dt)
+    fuentes = [
+        (_movimiento_apertura(cu) for cu in aperturas.select_related('usuario').order_by(
+            'fecha_apertura', 'id'
+        ).iterator(chunk_size=TAMANO_LOTE_MOVIMIENTOS)),
+        (_movimiento_venta(v) for v in ventas.select_related('usuario', 'vendedor').order_by(
+            'fecha', 'id'
+        ).iterator(chunk_size=TAMANO_LOTE_MOVIMIENTOS)),
+        (_movimiento_gasto(g) for g in gastos.select_related('usuario').order_by(
+            'fecha', 'id'
+        ).iterator(chunk_size=TAMANO_LOTE_MOVIMIENTOS)),
+    ]
+
+    saldo = 0
+    for it in heapq.merge(*fuentes, key=lambda m: m['clave']):
+        it['saldo_antes'] = saldo
+        saldo += it['delta']
+        it['saldo_despues'] = saldo
+        it['fecha_local'] = timezone.localtime(it['fecha'], tz)
+        yield it
+
+
+class MovimientosCajaRango:
+    """
+    Movimientos de caja del rango para Paginator sin materializar el rango:
+    count() usa tres COUNT y cada página recorre el generador solo hasta su
+    última fila (el saldo acumulado necesita las filas anteriores).
+    """
+
+    def __init__(self, inicio_dt, fin_dt):
+        self.inicio_dt = inicio_dt
+        self.fin_dt = fin_dt
+
+    def count(self):
+        return sum(qs.count() for qs in _fuentes_movimientos_caja(self.inicio_dt, self.fin_dt))
+
+    def __iter__(self):
+        return movimientos_caja(self.inicio_dt, self.fin_dt)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return list(islice(iter(self), indice.start, indice.stop))
+        return next(islice(iter(self), indice, None))
+
+
+def gastos_por_dia(inicio_dt, fin_dt, fecha_desde, fecha_hasta):
+    """
+    Total y cantidad de gastos (sin retiros), ingresos y retiros por día local:
+    los de GastoCaja en el rango más los resúmenes de los cierres movidos
+    (ResumenGastoCierre), cuyos gastos ya no están en la tabla.
+
+    Returns:
+        dict {'gasto' | 'ingreso' | 'retiro': {dia: {'total': int, 'cantidad': int}}}
+    """
+    por_categoria = {'gasto': {}, 'ingreso': {}, 'retiro': {}}
+
+    def sumar(tipo, retiro, dia, total, cantidad):
+        fila = por_categoria['retiro' if retiro else tipo].setdefault(dia, {'total': 0, 'cantidad': 0})
+        fila['total'] += int(total or 0)
+        fila['cantidad'] += int(cantidad or 0)
+
+    gastos = GastoCaja.objects.filter(fecha__gte=inicio_dt, fecha__lt=fin_dt).annotate(
+        dia=TruncDate('fecha', tzinfo=timezone.get_current_timezone()),
+        es_retiro=Case(
+            When(tipo='gasto', descripcion__icontains=DESCRIPCION_RETIRO, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    ).values('dia', 'tipo', 'es_retiro').annotate(total=Sum('monto'), cantidad=Count('id')).order_by()
+    for fila in gastos:
+        sumar(fila['tipo'], fila['es_retiro'], fila['dia'], fila['total'], fila['cantidad'])
+
+    resumenes = ResumenGastoCierre.objects.filter(
+        cierre__movido=True, fecha__gte=fecha_desde, fecha__lte=fecha_hasta
+    ).values('fecha', 'tipo', 'retiro').annotate(suma=Sum('total'), numero=Sum('cantidad')).order_by()
+    for fila in resumenes:
+        sumar(fila['tipo'], fila['retiro'], fila['fecha'], fila['suma'], fila['numero'])
+    return por_categoria
+
+
+def construir_dataset_caja(fecha_desde, fecha_hasta):
+    """
+    Calcula las secciones agregadas del reporte de caja para el rango de fechas locales.
+
+    Args:
+        fecha_desde, fecha_hasta: date (inclusive)
+
+    Returns:
+        dict con totales, listas por método/usuario/vendedor/producto y resumen diario
+    """
+    tz = timezone.get_current_timezone()
+    inicio_dt, fin_dt = rango_caja(fecha_desde, fecha_hasta)
+
+    # Totales de ventas desde la tabla de totales diarios (costo por días, no por ventas)
+    diarias_qs = ventas_diarias_rango(fecha_desde, fecha_hasta)
+    diarias_validas = diarias_qs.filter(cantidad_ventas__gt=0)
+
+    totales = totales_ventas(diarias_qs)
+    total_ventas = totales['total_ventas']
+    cantidad_ventas = totales['cantidad_ventas']
+    promedio_venta = int(total_ventas / cantidad_ventas) if cantidad_ventas > 0 else 0
+
+    # Top productos (solo ventas válidas) desde la tabla diaria por producto
+    top_productos = list(ventas_producto_rango(fecha_desde, fecha_hasta).values('producto__nombre').annotate(
+        total_vendido=Sum('cantidad'),
+        total_valor=Sum('valor')
+    ).order_by('-total_vendido')[:15])
+
+    # Ventas por método de pago (válidas)
+    ventas_por_metodo = list(diarias_validas.values('metodo_pago').annotate(
+        cantidad=Sum('cantidad_ventas'),
+        total=Sum('total_ventas')
+    ).order_by('-total'))
+
+    # Resumen por usuario / vendedor (solo válidas)
+    resumen_por_usuario = list(diarias_validas.values('usuario__username').annotate(
+        cantidad=Sum('cantidad_ventas'),
+        total=Sum('total_ventas')
+    ).order_by('-total'))
+
+    resumen_por_vendedor = list(diarias_validas.values('vendedor__username').annotate(
+        cantidad=Sum('cantidad_ventas'),
+        total=Sum('total_ventas')
+    ).order_by('-total'))
+
+    # Totales por método (válidas)
+    totales_metodo = {r['metodo_pago']: int(r['total'] or 0) for r in ventas_por_metodo}
+    ventas_efectivo = totales_metodo.get('efectivo', 0)
+    ventas_tarjeta = totales_metodo.get('tarjeta', 0)
+    ventas_transferencia = totales_metodo.get('transferencia', 0)
+
+    # Movimientos (gastos/ingresos/retiros) por rango (no depende de una caja específica)
+    gastos_dia = gastos_por_dia(inicio_dt, fin_dt, fecha_desde, fecha_hasta)
+    total_gastos, total_ingresos, total_retiros = (
+        sum(fila['total'] for fila in gastos_dia[categoria].values())
+        for categoria in ('gasto', 'ingreso', 'retiro')
+    )
+
+    # Resumen diario (por fecha local)
+
+    # Saldo inicial por dia: suma de montos iniciales de cajas abiertas ese dia (segun corte)
+    dia_apertura_expr = TruncDate('fecha_apertura', tzinfo=tz)
+
+    saldo_inicial_map = {
+        r['dia']: int(r['saldo_inicial'] or 0)
+        for r in CajaUsuario.objects.filter(
+            fecha_apertura__gte=inicio_dt,
+            fecha_apertura__lt=fin_dt
+        ).annotate(
+            dia=dia_apertura_expr
+        ).values('dia').annotate(
+            saldo_inicial=Sum('monto_inicial')
+        )
+    }
+
+    ventas_dia_map = {
+        r['fecha']: r for r in diarias_qs.values('fecha').annotate(
+            ventas_total=Sum('total_ventas'),
+            ventas_cantidad=Sum('cantidad_ventas'),
+            ventas_efectivo=Sum('total_ventas', filter=Q(metodo_pago='efectivo')),
+            ventas_tarjeta=Sum('total_ventas', filter=Q(metodo_pago='tarjeta')),
+            ventas_transferencia=Sum('total_ventas', filter=Q(metodo_pago='transferencia')),
+            anuladas_total=Sum('total_anuladas'),
+            anuladas_cantidad=Sum('cantidad_anuladas'),
+        )
+    }
+
+    dias = sorted(set(ventas_dia_map).union(*gastos_dia.values()))
+
+    def _n(v):
+        return int(v or 0)
+
+    resumen_diario = []
+    for dia in dias:
+        vd = ventas_dia_map.get(dia, {})
+        mg = gastos_dia['gasto'].get(dia, {})
+        mi = gastos_dia['ingreso'].get(dia, {})
+        mr = gastos_dia['retiro'].get(dia, {})
+
+        saldo_inicial = int(saldo_inicial_map.get(dia, 0) or 0)
+        ventas_ef = _n(vd.get('ventas_efectivo'))
+        ventas_tj = _n(vd.get('ventas_tarjeta'))
+        ventas_tf = _n(vd.get('ventas_transferencia'))
+        gastos_sr = _n(mg.get('total'))
+        ingresos = _n(mi.get('total'))
+        retiros = _n(mr.get('total'))
+
+        # Neto operativo (sin retiros): efectivo + ingresos - gastos.
+        # Los retiros se muestran separados y no afectan este neto.
+        neto_operativo = ventas_ef + ingresos - gastos_sr
+
+        resumen_diario.append({
+            'dia': dia,
+            'saldo_inicial': saldo_inicial,
+            'ventas_total': _n(vd.get('ventas_total')),
+            'ventas_cantidad': _n(vd.get('ventas_cantidad')),
+            'anuladas_total': _n(vd.get('anuladas_total')),
+            'anuladas_cantidad': _n(vd.get('anuladas_cantidad')),
+            'ventas_efectivo': ventas_ef,
+            'ventas_tarjeta': ventas_tj,
+            'ventas_transferencia': ventas_tf,
+            'gastos_sin_retiro_total': gastos_sr,
+            'gastos_sin_retiro_cantidad': _n(mg.get('cantidad')),
+            'ingresos_total': ingresos,
+            'ingresos_cantidad': _n(mi.get('cantidad')),
+            'retiros_total': retiros,
+            'retiros_cantidad': _n(mr.get('cantidad')),
+            'neto_operativo': int(neto_operativo),
+        })
+
+    return {
+        # Ventas
+        'total_ventas': total_ventas,
+        'cantidad_ventas': cantidad_ventas,
+        'promedio_venta': promedio_venta,
+        'total_anuladas': totales['total_anuladas'],
+        'cantidad_anuladas': totales['cantidad_anuladas'],
+        'ventas_efectivo': ventas_efectivo,
+        'ventas_tarjeta': ventas_tarjeta,
+        'ventas_transferencia': ventas_transferencia,
+        'dinero_bancos': ventas_tarjeta + ventas_transferencia,
+        'ventas_por_metodo': ventas_por_metodo,
+        'resumen_por_usuario': resumen_por_usuario,
+        'resumen_por_vendedor': resumen_por_vendedor,
+        'top_productos': top_productos,
+
+        # Caja / movimientos
+        'total_gastos': total_gastos,
+        'total_ingresos': total_ingresos,
+        'total_retiros': total_retiros,
+        'resumen_diario': resumen_diario,
+
+        'total_productos': Producto.objects.filter(activo=True).count(),
+    }
+
@@ -0,0 +1,676 @@
+"""
+Dataset del reporte de inventario (reportes?tipo=inventario).
+
+Los mapas por producto (stock, ventas, ingresos/salidas de mercancía y stock
+inicial/final) se indexan por sku_key (codigo|atributo normalizado, ver
+pos.sku) y se calculan con una consulta agrupada por esa columna cada uno,
+para que el reporte no haga consultas por producto ni normalice claves en
+Python. El stock inicial y final del período salen de las fotos
+diarias de stock (stock_diario.stock_en) en lugar de recorrer todo el historial
+de movimientos.
+Las ventas (top de ventas, rotación y precio promedio) salen de la tabla
+VentaProductoDiaria en lugar de recorrer ItemVenta. Los movimientos de los
+cierres de período movidos se suman desde ResumenStockCierre.
+
+obtener_dataset_inventario() guarda el dataset en una caché en memoria (LRU)
+por (filtros, versión de datos); la pantalla y las exportaciones CSV/XLSX del
+mismo filtro comparten el mismo cálculo. La versión de datos combina un
+contador local (señales de MovimientoStock, ItemVenta, ConteoFisico y Producto)
+con el último id/fecha de esas tablas, para detectar escrituras de otros
+procesos. Configuración opcional en settings:
+
+    REPORTE_INVENTARIO_CACHE_MAX = 4    # datasets en memoria (0 desactiva la caché)
+    REPORTE_INVENTARIO_CACHE_TTL = 300  # segundos
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from .cierre_periodo import cierres_movidos
+from .fechas import filtro_rango_fechas, rango_fechas_local
+from .models import (
+    ConteoFisico, IngresoMercancia, ItemIngresoMercancia, ItemSalidaMercancia,
+    ItemVenta, MovimientoStock, Producto, ResumenStockCierre, SalidaMercancia, Venta
+)
+from .sku import clave_sku, sku_key
+from .stock_diario import stock_en
+from .ventas_diarias import ventas_producto_rango
+
+
+def stock_en_por_clave(momento, stock_base=None):
+    """
+    Stock de productos activos en `momento` (foto diaria más cercana más los
+    movimientos desde ella), agrupado por sku_key. `stock_base` ({producto_id:
+    stock}) reemplaza el valor calculado de esos productos.
+
+    Returns:
+        dict {sku_key: int}
+    """
+    stock = stock_en(momento)
+    stock.update(stock_base or {})
+    totales = {}
+    for producto_id, clave in Producto.objects.filter(activo=True).values_list('id', 'sku_key'):
+        totales[clave] = totales.get(clave, 0) + stock.get(producto_id, 0)
+    return totales
+
+
+def resumen_cierres_por_clave(producto_id=None, tipo_movimiento=None, fecha_desde=None, fecha_hasta=None):
+    """
+    Unidades por tipo de los cierres movidos que se cruzan con el rango, por
+    sku_key (ResumenStockCierre: sus movimientos ya no están en MovimientoStock).
+    Los totales de un cierre no se guardan por día, así que cuenta completo
+    aunque el rango lo corte.
+
+    Returns:
+        (dict {sku_key: fila como las de resumen_agrupado},
+         dict {producto_id: stock inicial en el cierre más antiguo del rango})
+    """
+    resumenes = ResumenStockCierre.objects.filter(cierre__in=cierres_movidos(fecha_desde, fecha_hasta))
+    if producto_id:
+        resumenes = resumenes.filter(producto_id=producto_id)
+    filas = resumenes.values(
+        'producto_id', 'producto__sku_key', 'producto__codigo', 'producto__atributo', 'producto__nombre',
+        'stock_inicial', 'ingresos', 'salidas_venta', 'salidas_inventario', 'ajustes',
+    ).order_by('cierre__fecha')
+
+    por_clave = {}
+    stock_inicial = {}
+    for fila in filas:
+        stock_inicial.setdefault(fila['producto_id'], fila['stock_inicial'])
+        entradas = fila['ingresos']
+        salidas = fila['salidas_venta'] + fila['salidas_inventario']
+        ajustes = fila['ajustes']
+        if tipo_movimiento:
+            entradas, salidas, ajustes = (
+                valor if tipo == tipo_movimiento else 0
+                for tipo, valor in (('ingreso', entradas), ('salida', salidas), ('ajuste', ajustes))
+            )
+            if not (entradas or salidas or ajustes):
+                continue
+        item = por_clave.setdefault(fila['producto__sku_key'], {
+            'producto__sku_key': fila['producto__sku_key'],
+            'codigo': fila['producto__codigo'],
+            'atributo': fila['producto__atributo'],
+            'producto__nombre': fila['producto__nombre'],
+            'total_entradas': 0,
+            'total_salidas': 0,
+            'total_ajustes': 0,
+        })
+        item['total_entradas'] += entradas
+        item['total_salidas'] += salidas
+        item['total_ajustes'] += ajustes
+    return por_clave, stock_inicial
+
+
+def comparativa_por_producto(movimientos_qs, items_venta_qs, productos):
+    """
+    Comparativa ingresos vs ventas vs salidas por producto con dos consultas
+    agrupadas (MovimientoStock e ItemVenta) en lugar de cuatro por producto.
+
+    Args:
+        movimientos_qs: MovimientoStock ya filtrado por fecha
+        items_venta_qs: ItemVenta de ventas válidas ya filtradas por fecha
+        productos: iterable de dicts con 'id', 'codigo', 'nombre' y 'atributo'
+
+    Returns:
+        list de dicts ordenada por código, solo productos con algún movimiento
+    """
+    movimientos_por_producto = {
+        fila['producto_id']: fila
+        for fila in movimientos_qs.values('producto_id').annotate(
+            ingresos=Sum('cantidad', filter=Q(tipo='ingreso')),
+            salidas=Sum('cantidad', filter=Q(tipo='salida')),
+        ).order_by()
+    }
+    ventas_por_producto = {
+        fila['producto_id']: fila
+        for fila in items_venta_qs.values('producto_id').annotate(
+            cantidad_total=Sum('cantidad'),
+            valor_total=Sum('subtotal'),
+        ).order_by()
+    }
+
+    comparativa = []
+    for prod in productos:
+        movimientos = movimientos_por_producto.get(prod['id'], {})
+        ventas = ventas_por_producto.get(prod['id'], {})
+        cant_ingresos = movimientos.get('ingresos') or 0
+        cant_salidas = movimientos.get('salidas') or 0
+        cant_ventas = ventas.get('cantidad_total') or 0
+        valor_ventas = ventas.get('valor_total') or 0
+
+        # Solo agregar si hay algún movimiento
+        if cant_ingresos > 0 or cant_ventas > 0 or cant_salidas > 0:
+            comparativa.append({
+                'codigo': prod['codigo'],
+                'nombre': prod['nombre'],
+                'atributo': prod['atributo'] or '-',
+                'ingresos_cantidad': cant_ingresos,
+                'ventas_cantidad': cant_ventas,
+                'ventas_valor': valor_ventas,
+                'salidas_cantidad': cant_salidas,
+                'balance_neto': cant_ingresos - cant_ventas - cant_salidas,
+            })
+
+    comparativa.sort(key=lambda x: x['codigo'])
+    return comparativa
+
+
+def _fecha_filtro(valor):
+    """Convierte 'YYYY-MM-DD' a date; None si está vacío o no es válido"""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _producto_id_filtro(valor):
+    try:
+        return int(valor) if valor else None
+    except (ValueError, TypeError):
+        return None
+
+
+def _filtrar_fechas(queryset, fecha_desde, fecha_hasta, campo='fecha'):
+    return queryset.filter(filtro_rango_fechas(campo, fecha_desde, fecha_hasta))
+
+
+def stock_por_clave():
+    """Stock, nombre y precio de productos activos por sku_key"""
+    stock_map = {}
+    productos = Producto.objects.filter(activo=True).values('sku_key', 'stock', 'nombre', 'precio')
+    for p in productos:
+        clave = p['sku_key']
+        if clave not in stock_map:
+            # Si hay varios productos con el mismo código+atributo se usa el nombre/precio del primero
+            stock_map[clave] = {'stock': 0, 'nombre': p['nombre'], 'precio': p['precio']}
+        stock_map[clave]['stock'] += p['stock']
+    return stock_map
+
+
+def ventas_por_clave(fecha_desde=None, fecha_hasta=None):
+    """
+    Cantidad vendida, valor y nombre por sku_key desde la tabla
+    VentaProductoDiaria (una fila por producto y día, no por item).
+    """
+    filas = ventas_producto_rango(fecha_desde, fecha_hasta).values('producto__sku_key').annotate(
+        codigo=Min('producto__codigo'),
+        atributo=Min('producto__atributo'),
+        nombre=Min('producto__nombre'),
+        cantidad_total=Sum('cantidad'),
+        valor_total=Sum('valor'),
+    ).order_by()
+
+    ventas = {}
+    for fila in filas:
+        codigo, atributo = clave_sku(fila['codigo'], fila['atributo'])
+        ventas[fila['producto__sku_key']] = {
+            'codigo': codigo,
+            'nombre': fila['nombre'],
+            'atributo': atributo or '-',
+            'cantidad_total': int(fila['cantidad_total'] or 0),
+            'valor_total': int(fila['valor_total'] or 0),
+        }
+    return ventas
+
+
+def _cantidades_por_clave(items_qs):
+    """Suma de `cantidad` de items de ingreso/salida de mercancía por sku_key"""
+    filas = items_qs.values('producto__sku_key').annotate(total=Sum('cantidad')).order_by()
+    return {fila['producto__sku_key']: int(fila['total'] or 0) for fila in filas}
+
+
+def construir_dataset_inventario(producto_id=None, tipo_movimiento=None, fecha_desde=None, fecha_hasta=None):
+    """
+    Calcula todos los datos del reporte de inventario para los filtros dados.
+
+    Args:
+        producto_id: id de producto (str o int) o None
+        tipo_movimiento: 'ingreso', 'salida', 'ajuste' o None
+        fecha_desde, fecha_hasta: 'YYYY-MM-DD' o None
+
+    Returns:
+        dict con el resumen por producto, análisis, tops, comparativa y los mapas base
+    """
+    from .conteos import ultimos_conteos_por_clave
+
+    producto_id_int = _producto_id_filtro(producto_id)
+    desde = _fecha_filtro(fecha_desde)
+    hasta = _fecha_filtro(fecha_hasta)
+
+    # Base query para movimientos
+    movimientos_qs = MovimientoStock.objects.all()
+    if producto_id_int:
+        movimientos_qs = movimientos_qs.filter(producto_id=producto_id_int)
+    if tipo_movimiento:
+        movimientos_qs = movimientos_qs.filter(tipo=tipo_movimiento)
+    movimientos_qs = _filtrar_fechas(movimientos_qs, desde, hasta)
+
+    # Agrupar movimientos por código + atributo normalizado (sku_key) en una sola consulta
+    resumen_agrupado = movimientos_qs.values('producto__sku_key').annotate(
+        codigo=Min('producto__codigo'),
+        atributo=Min('producto__atributo'),
+        producto__nombre=Min('producto__nombre'),
+        total_entradas=Sum('cantidad', filter=Q(tipo='ingreso')),
+        total_salidas=Sum('cantidad', filter=Q(tipo='salida')),
+        total_ajustes=Sum('cantidad', filter=Q(tipo='ajuste'))
+    ).order_by('producto__sku_key')
+
+    # Los movimientos de los cierres movidos se toman de sus resúmenes
+    resumen_cierres, stock_inicial_cierres = resumen_cierres_por_clave(producto_id_int, tipo_movimiento, desde, hasta)
+    if resumen_cierres:
+        resumen_agrupado = list(resumen_agrupado)
+        for item in resumen_agrupado:
+            cierre = resumen_cierres.pop(item['producto__sku_key'], None)
+            if cierre:
+                for campo in ('total_entradas', 'total_salidas', 'total_ajustes'):
+                    item[campo] = (item[campo] or 0) + cierre[campo]
+        resumen_agrupado.extend(resumen_cierres.values())
+
+    stock_map = stock_por_clave()
+
+    # Stock inicial: al comienzo de fecha_desde o, sin fecha, antes del primer movimiento;
+    # el de los productos con movimientos en cierres movidos sale del cierre más antiguo.
+    # Stock final: al cierre de fecha_hasta (el stock actual si el día no terminó).
+    inicio_periodo, fin_periodo = rango_fechas_local(desde, hasta)
+    if inicio_periodo is None:
+        inicio_periodo = MovimientoStock.objects.aggregate(primera=Min('fecha'))['primera']
+    if inicio_periodo is None and stock_inicial_cierres:
+        # Todos los movimientos están en cierres movidos: el resto parte del stock actual
+        inicio_periodo = timezone.now()
+    stock_inicial_map = stock_en_por_clave(inicio_periodo, stock_inicial_cierres) if inicio_periodo else None
+    stock_final_map = None
+    if fin_periodo is not None and fin_periodo <= timezone.now():
+        stock_final_map = stock_en_por_clave(fin_periodo)
+
+    # Construir la lista de resultados con análisis de negativos
+    resumen_productos = []
+    for item in resumen_agrupado:
+        clave = item['producto__sku_key']
+        codigo, atributo = clave_sku(item['codigo'], item['atributo'])
+
+        total_entradas = int(item['total_entradas'] or 0)
+        total_salidas = int(item['total_salidas'] or 0)
+        ajustes = int(item['total_ajustes'] or 0)
+        neto = total_entradas - total_salidas + ajustes
+
+        stock_info = stock_map.get(clave, {'stock': 0, 'nombre': item.get('producto__nombre', ''), 'precio': 0})
+        stock_actual = stock_info['stock']
+        nombre = stock_info['nombre'] or item.get('producto__nombre', '')
+        precio_venta = stock_info.get('precio', 0)
+
+        stock_inicial_calculado = stock_inicial_map.get(clave, 0) if stock_inicial_map is not None else stock_actual
+        stock_final = stock_final_map.get(clave, 0) if stock_final_map is not None else stock_actual
+
+        # Analizar causas de negativos
+        causas_negativos = []
+        alertas = []
+        diferencia_salidas_entradas = 0
+
+        if neto < 0:
+            if total_salidas > (total_entradas + ajustes):
+                diferencia = total_salidas - (total_entradas + ajustes)
+                causas_negativos.append(f"Salidas ({total_salidas}) superan entradas+ajustes ({total_entradas + ajustes}) por {diferencia} unidades")
+            if ajustes < 0:
+                causas_negativos.append(f"Ajustes negativos ({ajustes}) reducen el stock en {abs(ajustes)} unidades")
+
+        if total_salidas > total_entradas:
+            diferencia_salidas_entradas = total_salidas - total_entradas
+
+        if stock_actual < 0:
+            alertas.append(f"⚠️ Stock actual negativo: {stock_actual}. Posible inconsistencia en el inventario.")
+            stock_esperado = total_entradas - total_salidas + ajustes
+            if stock_esperado != stock_actual:
+                diferencia_stock = stock_actual - stock_esperado
+                causas_negativos.append(f"Inconsistencia: Stock actual ({stock_actual}) difiere del esperado ({stock_esperado}) por {diferencia_stock} unidades")
+
+        if stock_actual == 0 and (total_entradas > 0 or total_salidas > 0):
+            if total_salidas > total_entradas:
+                alertas.append("⚠️ Stock agotado: Se vendió más de lo que ingresó")
+
+        if abs(ajustes) > (total_entradas + total_salidas) * 0.5 and (total_entradas + total_salidas) > 0:
+            alertas.append(f"⚠️ Ajustes significativos ({ajustes}) comparado con movimientos normales")
+
+        resumen_productos.append({
+            'codigo': codigo,
+            'nombre': nombre,
+            'atributo': atributo if atributo else '-',
+            'total_entradas': total_entradas,
+            'total_salidas': total_salidas,
+            'ajustes': ajustes,
+            'ajustes_abs': abs(ajustes),
+            'neto': neto,
+            'stock_inicial': stock_inicial_calculado,
+            'stock_final': stock_final,
+            'stock_actual': stock_actual,
+            'precio_venta': precio_venta,
+            'causas_negativos': causas_negativos,
+            'alertas': alertas,
+            'tiene_problemas': len(causas_negativos) > 0 or len(alertas) > 0 or neto < 0 or stock_actual < 0,
+            'diferencia_salidas_entradas': diferencia_salidas_entradas,
+        })
+
+    resumen_productos.sort(key=lambda x: (x['codigo'], x['atributo']))
+
+    # Ventas por código+atributo (una sola vez para el resumen, el top de ventas y la rotación)
+    ventas_qs = _filtrar_fechas(Venta.objects.filter(completada=True, anulada=False), desde, hasta)
+    ventas_por_producto = ventas_por_clave(desde, hasta)
+
+    # Ingresos y salidas de mercancía completados por código+atributo
+    ingresos_mercancia_qs = _filtrar_fechas(IngresoMercancia.objects.filter(completado=True), desde, hasta)
+    salidas_mercancia_qs = _filtrar_fechas(SalidaMercancia.objects.filter(completado=True), desde, hasta)
+    ingresos_mercancia_por_producto = _cantidades_por_clave(
+        ItemIngresoMercancia.objects.filter(ingreso__in=ingresos_mercancia_qs)
+    )
+    salidas_mercancia_por_producto = _cantidades_por_clave(
+        ItemSalidaMercancia.objects.filter(salida__in=salidas_mercancia_qs)
+    )
+
+    conteos_fisicos = ultimos_conteos_por_clave()
+
+    productos_con_diferencias = []
+    for item in resumen_productos:
+        codigo = item['codigo']
+        # '-' (sin atributo en pantalla) se normaliza a ''
+        clave = sku_key(codigo, item['atributo'])
+
+        # Ventas y precio promedio
+        venta_info = ventas_por_producto.get(clave, {'cantidad_total': 0, 'valor_total': 0})
+        item['total_ventas'] = venta_info['cantidad_total']
+        if venta_info['cantidad_total'] > 0:
+            item['precio_promedio_venta'] = round(venta_info['valor_total'] / venta_info['cantidad_total'])
+        else:
+            item['precio_promedio_venta'] = None
+
+        # Ingresos netos de mercancía (Ingresos - Salidas)
+        item['total_ingresos_mercancia'] = (
+            ingresos_mercancia_por_producto.get(clave, 0) - salidas_mercancia_por_producto.get(clave, 0)
+        )
+
+        # Conteo físico y diferencia contra el stock actual
+        conteo = conteos_fisicos.get(clave_sku(codigo, item['atributo']))
+        cantidad_contada = conteo['cantidad_contada'] if conteo else None
+        item['cantidad_contada'] = cantidad_contada
+        stock_actual = item.get('stock_actual', 0)
+        if cantidad_contada is not None:
+            diferencia = cantidad_contada - stock_actual
+            item['diferencia'] = diferencia
+            item['coincide'] = (diferencia == 0)
+            if diferencia != 0:
+                productos_con_diferencias.append({
+                    'codigo': codigo,
+                    'nombre': item.get('nombre', ''),
+                    'atributo': item.get('atributo', '-'),
+                    'stock_actual': stock_actual,
+                    'cantidad_contada': cantidad_contada,
+                    'diferencia': diferencia,
+                })
+        else:
+            item['diferencia'] = None
+            item['coincide'] = False
+
+    # ===== ANÁLISIS DE DATOS DEL RESUMEN =====
+    # total_salidas son salidas de inventario (MovimientoStock tipo='salida'); las ventas van en la comparativa
+    analisis_datos = {
+        'total_productos': len(resumen_productos),
+        'total_entradas': sum(item.get('total_entradas', 0) for item in resumen_productos),
+        'total_salidas_inventario': sum(item.get('total_salidas', 0) for item in resumen_productos),
+        'total_ajustes': sum(item.get('ajustes', 0) for item in resumen_productos),
+        'total_neto': sum(item.get('neto', 0) for item in resumen_productos),
+        'total_stock_inicial': sum(item.get('stock_inicial', 0) for item in resumen_productos),
+        'total_stock_final': sum(item.get('stock_final', 0) for item in resumen_productos),
+        'total_stock_actual': sum(item.get('stock_actual', 0) for item in resumen_productos),
+        'productos_con_movimientos': len([item for item in resumen_productos if item.get('total_entradas', 0) > 0 or item.get('total_salidas', 0) > 0]),
+        'productos_sin_movimientos': len([item for item in resumen_productos if item.get('total_entradas', 0) == 0 and item.get('total_salidas', 0) == 0]),
+        'productos_stock_cero': len([item for item in resumen_productos if item.get('stock_actual', 0) == 0]),
+        'productos_stock_negativo': len([item for item in resumen_productos if item.get('stock_actual', 0) < 0]),
+        'productos_con_problemas': len([item for item in resumen_productos if item.get('tiene_problemas', False)]),
+        'productos_con_conteo': len([item for item in resumen_productos if item.get('cantidad_contada') is not None]),
+        'productos_coinciden': len([item for item in resumen_productos if item.get('coincide', False)]),
+    }
+
+    top_entradas = sorted(
+        [item for item in resumen_productos if item.get('total_entradas', 0) > 0],
+        key=lambda x: x.get('total_entradas', 0),
+        reverse=True
+    )[:10]
+
+    top_ventas = sorted(
+        [
+            {
+                'codigo': venta['codigo'],
+                'nombre': venta['nombre'],
+                'atributo': venta['atributo'],
+                'total_ventas': venta['cantidad_total'],
+            }
+            for venta in ventas_por_producto.values()
+        ],
+        key=lambda x: x.get('total_ventas', 0),
+        reverse=True
+    )[:10]
+
+    # Productos con mayor rotación (ventas / stock_inicial si stock_inicial > 0)
+    productos_rotacion = []
+    for item in resumen_productos:
+        stock_inicial = item.get('stock_inicial', 0)
+        ventas_producto = item.get('total_ventas', 0)
+        if stock_inicial > 0 and ventas_producto > 0:
+            productos_rotacion.append({
+                **item,
+                'rotacion_porcentaje': round((ventas_producto / stock_inicial) * 100, 2)
+            })
+    top_rotacion = sorted(productos_rotacion, key=lambda x: x.get('rotacion_porcentaje', 0), reverse=True)[:10]
+
+    productos_diferencias_abs = sorted(
+        [item for item in resumen_productos if item.get('diferencia') is not None],
+        key=lambda x: abs(x.get('diferencia', 0)),
+        reverse=True
+    )[:10]
+
+    # Análisis de variación de stock en el período
+    variaciones_stock = []
+    for item in resumen_productos:
+        stock_inicial = item.get('stock_inicial', 0)
+        stock_final = item.get('stock_final', 0)
+        if stock_inicial != 0:
+            variacion = ((stock_final - stock_inicial) / abs(stock_inicial)) * 100
+        else:
+            variacion = 100 if stock_final > 0 else 0
+        variaciones_stock.append({
+            **item,
+            'variacion_porcentaje': round(variacion, 2)
+        })
+    top_aumento_stock = sorted(
+        [v for v in variaciones_stock if v.get('variacion_porcentaje', 0) > 0],
+        key=lambda x: x.get('variacion_porcentaje', 0),
+        reverse=True
+    )[:10]
+    top_disminucion_stock = sorted(
+        [v for v in variaciones_stock if v.get('variacion_porcentaje', 0) < 0],
+        key=lambda x: x.get('variacion_porcentaje', 0)
+    )[:10]
+
+    # ===== COMPARATIVA: Ingresos vs Salidas (Ventas) vs Salidas de Mercancía =====
+    movimientos_periodo = _filtrar_fechas(MovimientoStock.objects.all(), desde, hasta)
+    items_venta_qs = ItemVenta.objects.filter(venta__in=ventas_qs)
+    if producto_id_int:
+        movimientos_producto = movimientos_periodo.filter(producto_id=producto_id_int)
+        items_venta_producto = items_venta_qs.filter(producto_id=producto_id_int)
+    else:
+        movimientos_producto = movimientos_periodo
+        items_venta_producto = items_venta_qs
+
+    tot_movimientos = movimientos_producto.aggregate(
+        ingresos_cantidad=Sum('cantidad', filter=Q(tipo='ingreso')),
+        ingresos_registros=Count('id', filter=Q(tipo='ingreso')),
+        salidas_cantidad=Sum('cantidad', filter=Q(tipo='salida')),
+        salidas_registros=Count('id', filter=Q(tipo='salida')),
+    )
+    tot_ventas = items_venta_producto.aggregate(
+        cantidad=Sum('cantidad'),
+        registros=Count('id'),
+        valor=Sum('subtotal'),
+    )
+    total_ingresos_cantidad = tot_movimientos['ingresos_cantidad'] or 0
+    total_ventas_cantidad = tot_ventas['cantidad'] or 0
+    total_salidas_cantidad = tot_movimientos['salidas_cantidad'] or 0
+
+    comparativa = []
+    if not producto_id_int:
+        comparativa = comparativa_por_producto(
+            movimientos_periodo,
+            items_venta_qs,
+            Producto.objects.filter(activo=True).values('id', 'codigo', 'nombre', 'atributo')
+        )
+
+    return {
+        'resumen_productos': resumen_productos,
+        'productos_con_diferencias': productos_con_diferencias,
+        'analisis_datos': analisis_datos,
+        'top_entradas': top_entradas,
+        'top_ventas': top_ventas,
+        'top_rotacion': top_rotacion,
+        'productos_diferencias_abs': productos_diferencias_abs,
+        'top_aumento_stock': top_aumento_stock,
+        'top_disminucion_stock': top_disminucion_stock,
+        'total_ingresos_cantidad': total_ingresos_cantidad,
+        'total_ingresos_registros': tot_movimientos['ingresos_registros'],
+        'total_ventas_cantidad': total_ventas_cantidad,
+        'total_ventas_registros': tot_ventas['registros'],
+        'total_ventas_valor': tot_ventas['valor'] or 0,
+        'total_salidas_cantidad': total_salidas_cantidad,
+        'total_salidas_registros': tot_movimientos['salidas_registros'],
+        'balance_neto_cantidad': total_ingresos_cantidad - total_ventas_cantidad - total_salidas_cantidad,
+        'comparativa_por_producto': comparativa,
+        # Mapas base (por código+atributo normalizado)
+        'stock_map': stock_map,
+        'ventas_por_producto': ventas_por_producto,
+        'ingresos_mercancia_por_producto': ingresos_mercancia_por_producto,
+        'salidas_mercancia_por_producto': salidas_mercancia_por_producto,
+        'conteos_fisicos': conteos_fisicos,
+    }
+
+
+# Claves del dataset que usa la pantalla (y que guardan los trabajos en segundo plano)
+CLAVES_CONTEXTO_INVENTARIO = (
+    'resumen_productos', 'productos_con_diferencias',
+    # Análisis de datos
+    'analisis_datos', 'top_entradas', 'top_ventas', 'top_rotacion',
+    'productos_diferencias_abs', 'top_aumento_stock', 'top_disminucion_stock',
+    # Comparativa
+    'total_ingresos_cantidad', 'total_ingresos_registros',
+    'total_ventas_cantidad', 'total_ventas_registros', 'total_ventas_valor',
+    'total_salidas_cantidad', 'total_salidas_registros',
+    'balance_neto_cantidad', 'comparativa_por_producto',
+)
+
+COLUMNAS_RESUMEN_INVENTARIO = [
+    'Código', 'Producto', 'Atributo', 'Total de Ingresos', 'Ventas', 'Stock Actual',
+    'Cantidad Física Contada', 'Diferencia', 'Precio Venta', 'Precio Promedio'
+]
+
+
+# Ancho de columnas del XLSX
+ANCHOS_RESUMEN_INVENTARIO = {
+    'A': 15,  # Código
+    'B': 35,  # Producto
+    'C': 20,  # Atributo
+    'D': 18,  # Total de Ingresos
+    'E': 12,  # Ventas
+    'F': 15,  # Stock Actual
+    'G': 20,  # Cantidad Física Contada
+    'H': 12,  # Diferencia
+    'I': 15,  # Precio Venta
+    'J': 15,  # Precio Promedio
+}
+
+
+def fila_resumen_inventario(item):
+    """Fila de exportación (CSV/XLSX) de un item de resumen_productos"""
+    # cantidad_contada puede ser None (sin conteo), 0 o un número
+    cantidad_contada = item.get('cantidad_contada')
+    stock_actual = item.get('stock_actual', 0)
+    precio_promedio = item.get('precio_promedio_venta')
+    return [
+        item['codigo'],
+        item['nombre'],
+        item.get('atributo', '-'),
+        item.get('total_ingresos_mercancia', 0),
+        item.get('total_ventas', 0),
+        stock_actual,
+        '' if cantidad_contada is None else cantidad_contada,
+        '' if cantidad_contada is None else cantidad_contada - stock_actual,
+        item.get('precio_venta', 0),
+        precio_promedio if precio_promedio else '',
+    ]
+
+
+# ============================================
+# CACHÉ DEL DATASET
+# ============================================
+
+_cache_lock = threading.Lock()
+_cache_datasets = OrderedDict()
+_version_local = 0
+
+
+def invalidar_cache_inventario(**kwargs):
+    """Invalida los datasets en memoria (se conecta a las señales de los modelos)"""
+    global _version_local
+    with _cache_lock:
+        _version_local += 1
+        _cache_datasets.clear()
+
+
+def version_datos_inventario():
+    """
+    Versión de los datos del reporte: contador local + último id/fecha de las
+    tablas que alimentan el reporte (detecta escrituras de otros procesos).
+    """
+    return (
+        _version_local,
+        MovimientoStock.objects.aggregate(v=Max('id'))['v'],
+        ItemVenta.objects.aggregate(v=Max('id'))['v'],
+        ConteoFisico.objects.aggregate(v=Max('fecha_conteo'))['v'],
+    )
+
+
+def obtener_dataset_inventario(producto_id=None, tipo_movimiento=None, fecha_desde=None, fecha_hasta=None):
+    """
+    Dataset del reporte de inventario desde la caché en memoria o recién calculado.
+    El resultado es compartido: quien lo use no debe modificarlo.
+    """
+    max_entradas = getattr(settings, 'REPORTE_INVENTARIO_CACHE_MAX', 4)
+    ttl = getattr(settings, 'REPORTE_INVENTARIO_CACHE_TTL', 300)
+    filtros = (
+        _producto_id_filtro(producto_id),
+        tipo_movimiento or None,
+        _fecha_filtro(fecha_desde),
+        _fecha_filtro(fecha_hasta),
+    )
+    if max_entradas <= 0:
+        return construir_dataset_inventario(producto_id, tipo_movimiento, fecha_desde, fecha_hasta)
+
+    clave = (filtros, version_datos_inventario())
+    ahora = time.monotonic()
+    with _cache_lock:
+        entrada = _cache_datasets.get(clave)
+        if entrada and ahora - entrada[0] <= ttl:
+            _cache_datasets.move_to_end(clave)
+            return entrada[1]
+
+    dataset = construir_dataset_inventario(producto_id, tipo_movimiento, fecha_desde, fecha_hasta)
+
+    with _cache_lock:
+        _cache_datasets[clave] = (ahora, dataset)
+        _cache_datasets.move_to_end(clave)
+        while len(_cache_datasets) > max_entradas:
+            _cache_datasets.popitem(last=False)
+    return dataset
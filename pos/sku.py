@@ -0,0 +1,56 @@
+"""
+Clave normalizada de producto (código + atributo).
+
+Productos, conteos físicos y reportes se cruzan por código y atributo. El
+atributo se normaliza igual en todos lados: sin espacios al inicio ni al
+final y '' cuando está vacío o es '-', 'None' o 'null'. La columna sku_key
+(Producto, ConteoFisico, ConteoFisicoActual) guarda "codigo|atributo" ya
+normalizado e indexado, así los cruces y agrupaciones se hacen en SQL.
+"""
+SEPARADOR_SKU = '|'
+ATRIBUTOS_VACIOS = ('-', 'None', 'null')
+
+
+def normalizar_atributo(atributo):
+    """Atributo normalizado: '' si está vacío, '-', 'None' o 'null'; sin espacios en los extremos"""
+    if not atributo:
+        return ''
+    atributo = atributo.strip()
+    if atributo in ATRIBUTOS_VACIOS:
+        return ''
+    return atributo
+
+
+def clave_sku(codigo, atributo=None):
+    """Clave (codigo, atributo) normalizada, la que usan los diccionarios de reportes"""
+    return ((codigo or '').strip(), normalizar_atributo(atributo))
+
+
+def sku_key(codigo, atributo=None):
+    """Valor de la columna sku_key para un código y atributo"""
+    return SEPARADOR_SKU.join(clave_sku(codigo, atributo))
+
+
+def reconstruir_sku_keys(modelo, tamano_lote=1000):
+    """
+    Recalcula sku_key de todas las filas de `modelo` (con campos codigo y
+    atributo) y guarda solo las que cambiaron, por lotes con bulk_update.
+
+    Returns:
+        cantidad de filas actualizadas
+    """
+    cambiadas = []
+    actualizadas = 0
+    for fila in modelo.objects.only('id', 'codigo', 'atributo', 'sku_key').order_by('id').iterator(chunk_size=tamano_lote):
+        clave = sku_key(fila.codigo, fila.atributo)
+        if fila.sku_key != clave:
+            fila.sku_key = clave
+            cambiadas.append(fila)
+        if len(cambiadas) >= tamano_lote:
+            modelo.objects.bulk_update(cambiadas, ['sku_key'])
+            actualizadas += len(cambiadas)
+            cambiadas = []
+    if cambiadas:
+        modelo.objects.bulk_update(cambiadas, ['sku_key'])
+        actualizadas += len(cambiadas)
+    return actualizadas
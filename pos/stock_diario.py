@@ -0,0 +1,161 @@
+"""
+Fotos diarias de stock (StockDiario): stock de un producto en un momento sin
+recorrer todo el historial de MovimientoStock.
+
+Cada fila guarda el stock de un producto al cierre de un día local. El stock
+en un momento T es la foto más reciente cerrada antes de T más el neto
+(ingresos - salidas + ajustes) de los movimientos entre el cierre de ese día
+y T, así que la consulta solo lee los movimientos posteriores a la foto.
+
+El comando generar_stock_diario registra cada noche la foto de ayer y también
+construye en bloque las de fechas pasadas. Un movimiento creado, editado o
+eliminado borra las fotos de su producto desde el día del movimiento (señal en
+models.py); mientras no se regeneren, stock_en() usa la foto anterior.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .fechas import rango_fechas_local
+from .models import MovimientoStock, Producto, StockDiario
+
+
+def cierre_dia(fecha):
+    """Momento aware del cierre del día local `fecha` (medianoche del día siguiente)"""
+    return rango_fechas_local(None, fecha)[1]
+
+
+def _netos(movimientos, *campos):
+    """
+    Neto de stock (ingresos - salidas + ajustes) de los movimientos agrupados
+    por producto_id y los campos adicionales indicados, en una sola consulta.
+
+    Returns:
+        dict {(producto_id, *campos): neto} o {producto_id: neto} sin campos adicionales
+    """
+    filas = movimientos.values('producto_id', *campos).annotate(
+        entradas=Sum('cantidad', filter=Q(tipo='ingreso')),
+        salidas=Sum('cantidad', filter=Q(tipo='salida')),
+        ajustes=Sum('cantidad', filter=Q(tipo='ajuste')),
+    ).order_by()
+
+    netos = {}
+    for fila in filas:
+        clave = (fila['producto_id'], *(fila[campo] for campo in campos)) if campos else fila['producto_id']
+        netos[clave] = int(fila['entradas'] or 0) - int(fila['salidas'] or 0) + int(fila['ajustes'] or 0)
+    return netos
+
+
+def stock_en(momento, producto_ids=None):
+    """
+    Stock de cada producto en `momento` (datetime aware).
+
+    Usa la foto StockDiario más reciente cerrada antes de `momento` más los
+    movimientos desde su cierre. Los productos sin foto anterior parten de la
+    primera foto posterior (o del stock actual si tampoco hay) y restan los
+    movimientos entre `momento` y esa referencia.
+
+    Args:
+        momento: datetime aware
+        producto_ids: iterable de ids para limitar el cálculo (None = todos)
+
+    Returns:
+        dict {producto_id: stock}
+    """
+    productos = Producto.objects.all()
+    fotos = StockDiario.objects.all()
+    movimientos = MovimientoStock.objects.all()
+    if producto_ids is not None:
+        producto_ids = list(producto_ids)
+        productos = productos.filter(id__in=producto_ids)
+        fotos = fotos.filter(producto_id__in=producto_ids)
+        movimientos = movimientos.filter(producto_id__in=producto_ids)
+
+    stock_actual = dict(productos.values_list('id', 'stock'))
+    dia = timezone.localdate(momento)
+    stock = {}
+
+    # Foto anterior + movimientos desde su cierre hasta el momento
+    fecha_anterior = fotos.filter(fecha__lt=dia).aggregate(fecha=Max('fecha'))['fecha']
+    if fecha_anterior:
+        netos = _netos(movimientos.filter(fecha__gte=cierre_dia(fecha_anterior), fecha__lt=momento))
+        for producto_id, stock_foto in fotos.filter(fecha=fecha_anterior).values_list('producto_id', 'stock'):
+            if producto_id in stock_actual:
+                stock[producto_id] = stock_foto + netos.get(producto_id, 0)
+
+    pendientes = [producto_id for producto_id in stock_actual if producto_id not in stock]
+    if not pendientes:
+        return stock
+
+    # Primera foto posterior - movimientos entre el momento y su cierre
+    fecha_posterior = fotos.filter(fecha__gte=dia).aggregate(fecha=Min('fecha'))['fecha']
+    if fecha_posterior:
+        fotos_posteriores = dict(fotos.filter(fecha=fecha_posterior).values_list('producto_id', 'stock'))
+        netos = _netos(movimientos.filter(fecha__gte=momento, fecha__lt=cierre_dia(fecha_posterior)))
+        for producto_id in pendientes:
+            if producto_id in fotos_posteriores:
+                stock[producto_id] = fotos_posteriores[producto_id] - netos.get(producto_id, 0)
+        pendientes = [producto_id for producto_id in pendientes if producto_id not in stock]
+
+    # Sin fotos: stock actual - movimientos desde el momento
+    if pendientes:
+        netos = _netos(movimientos.filter(fecha__gte=momento))
+        for producto_id in pendientes:
+            stock[producto_id] = stock_actual[producto_id] - netos.get(producto_id, 0)
+    return stock
+
+
+def generar_stock_diario(fecha_desde=None, fecha_hasta=None):
+    """
+    Registra las fotos de stock de todos los productos para cada día local
+    entre fecha_desde y fecha_hasta (por defecto solo ayer), reemplazando las
+    existentes. Parte del stock actual y retrocede día por día restando el
+    neto de cada día (una consulta agrupada por producto y día local).
+    No se generan fotos de hoy ni de días futuros: aún no cerraron, ni de los
+    días hasta el último cierre movido: sus movimientos ya no están en la tabla.
+
+    Returns:
+        cantidad de filas creadas
+    """
+    from .cierre_periodo import primer_dia_abierto
+
+    ayer = timezone.localdate() - timedelta(days=1)
+    fecha_hasta = min(fecha_hasta or ayer, ayer)
+    fecha_desde = primer_dia_abierto(fecha_desde or fecha_hasta)
+    if fecha_desde > fecha_hasta:
+        return 0
+
+    tz = timezone.get_current_timezone()
+    inicio, fin = rango_fechas_local(fecha_desde, fecha_hasta)
+
+    with transaction.atomic():
+        # Stock al cierre de fecha_hasta: stock actual menos lo movido después
+        stock = dict(Producto.objects.values_list('id', 'stock'))
+        for producto_id, neto in _netos(MovimientoStock.objects.filter(fecha__gte=fin)).items():
+            stock[producto_id] -= neto
+
+        netos_dia = defaultdict(dict)
+        movimientos_rango = MovimientoStock.objects.filter(fecha__gte=inicio, fecha__lt=fin).annotate(
+            dia=TruncDate('fecha', tzinfo=tz)
+        )
+        for (producto_id, dia), neto in _netos(movimientos_rango, 'dia').items():
+            netos_dia[dia][producto_id] = neto
+
+        StockDiario.objects.filter(fecha__gte=fecha_desde, fecha__lte=fecha_hasta).delete()
+        total = 0
+        dia = fecha_hasta
+        while dia >= fecha_desde:
+            StockDiario.objects.bulk_create(
+                [StockDiario(fecha=dia, producto_id=producto_id, stock=valor) for producto_id, valor in stock.items()],
+                batch_size=1000,
+            )
+            total += len(stock)
+            # Stock al cierre del día anterior: deshacer los movimientos de este día
+            for producto_id, neto in netos_dia.get(dia, {}).items():
+                stock[producto_id] -= neto
+            dia -= timedelta(days=1)
+    return total
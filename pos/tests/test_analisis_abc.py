@@ -0,0 +1,119 @@
+"""
+Tests para el análisis ABC y puntos de reorden (reportes?tipo=abc)
+"""
+import csv
+import io
+import math
+import statistics
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group, User
+from django.http import HttpResponse
+from django.test import Client, TestCase, signals
+from django.urls import reverse
+
+from pos.analisis_abc import COLUMNAS_ANALISIS_ABC, construir_analisis_abc, items_analisis_abc
+from pos.models import Producto, VentaProductoDiaria
+
+# Evitar problemas al copiar contextos instrumentados en tests
+signals.template_rendered.receivers = []
+
+
+class AnalisisAbcTestCase(TestCase):
+    """Clasificación ABC por valor vendido y punto de reorden con demanda diaria y su variabilidad"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin_test', password='testpass123', is_staff=True)
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user.groups.add(grupo_admin)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        self.desde = date(2025, 12, 1)
+        self.hasta = date(2025, 12, 10)
+        # Unidades diarias por producto (días sin ventas = 0) y precio unitario
+        self.ventas = {
+            'A1': ([10, 12, 8, 0, 15, 9, 11, 10, 13, 12], 1000, 20),
+            'A2': ([3, 0, 4, 5, 2, 0, 6, 3, 4, 3], 1000, 100),
+            'B1': ([0, 1, 0, 2, 0, 1, 0, 1, 0, 1], 2000, 1),
+            'C1': ([0, 0, 0, 0, 1, 0, 0, 0, 0, 0], 500, 0),
+        }
+        self.productos = {}
+        for codigo, (unidades, precio, stock) in self.ventas.items():
+            producto = Producto.objects.create(codigo=codigo, nombre=f'Producto {codigo}', precio=precio, stock=stock)
+            self.productos[codigo] = producto
+            VentaProductoDiaria.objects.bulk_create([
+                VentaProductoDiaria(
+                    fecha=self.desde + timedelta(days=i), producto=producto,
+                    cantidad=cantidad, valor=cantidad * precio, cantidad_ventas=1,
+                )
+                for i, cantidad in enumerate(unidades) if cantidad
+            ])
+        # Producto sin ventas y producto inactivo (no entra en el análisis)
+        Producto.objects.create(codigo='SIN', nombre='Sin ventas', precio=1000, stock=5)
+        inactivo = Producto.objects.create(codigo='OFF', nombre='Inactivo', precio=1000, stock=0, activo=False)
+        VentaProductoDiaria.objects.create(fecha=self.desde, producto=inactivo, cantidad=500, valor=500000)
+
+    def test_clases_y_reorden_coinciden_con_calculo_directo(self):
+        """Test: Clases por aporte acumulado y punto de reorden = demanda*L + z*desviación*sqrt(L)"""
+        analisis = construir_analisis_abc(self.desde, self.hasta, dias_reposicion=4, dias_cobertura=10, nivel_servicio=95)
+        items = {item['codigo']: item for item in items_analisis_abc(analisis)}
+
+        self.assertEqual(analisis['total_productos'], 5)
+        self.assertNotIn('OFF', items)
+        # Valores: A1=100000, A2=30000, B1=12000, C1=500 -> acumulados previos 0%, 70.2%, 91.2%, 99.6%
+        self.assertEqual({codigo: item['clase'] for codigo, item in items.items()},
+                         {'A1': 'A', 'A2': 'A', 'B1': 'B', 'C1': 'C', 'SIN': 'C'})
+        self.assertEqual([item['codigo'] for item in items_analisis_abc(analisis)][:2], ['A1', 'A2'])
+
+        z = statistics.NormalDist().inv_cdf(0.95)
+        for codigo, (unidades, _, stock) in self.ventas.items():
+            demanda = sum(unidades) / len(unidades)
+            desviacion = statistics.pstdev(unidades)
+            seguridad = math.ceil(z * desviacion * math.sqrt(4))
+            punto_reorden = math.ceil(demanda * 4) + seguridad
+            item = items[codigo]
+            self.assertAlmostEqual(item['demanda'], round(demanda, 2))
+            self.assertAlmostEqual(item['desviacion'], round(desviacion, 2))
+            self.assertEqual(item['stock_seguridad'], seguridad, codigo)
+            self.assertEqual(item['punto_reorden'], punto_reorden, codigo)
+            esperado = math.ceil(punto_reorden + demanda * 10 - stock) if stock <= punto_reorden else 0
+            self.assertEqual(item['cantidad_sugerida'], esperado, codigo)
+
+        self.assertEqual(items['SIN']['punto_reorden'], 0)
+        self.assertEqual(items['SIN']['cantidad_sugerida'], 0)
+        reponer = [item['codigo'] for item in items_analisis_abc(analisis, solo_reponer=True)]
+        self.assertEqual(reponer, ['A1', 'B1', 'C1'])
+        self.assertEqual(analisis['total_reponer'], 3)
+
+    def test_vista_y_exportacion_csv(self):
+        """Test: La pantalla muestra el resumen por clase y el CSV incluye todos los productos"""
+        params = {'tipo': 'abc', 'fecha_desde': '2025-12-01', 'fecha_hasta': '2025-12-10', 'dias_reposicion': '4'}
+        captured = {}
+
+        def _fake_render(request, template_name, context=None, *args, **kwargs):
+            captured['context'] = context or {}
+            return HttpResponse('OK')
+
+        with patch('pos.views.render', side_effect=_fake_render):
+            self.client.get(reverse('pos:reportes'), params)
+        context = captured['context']
+        self.assertEqual(context['tipo_reporte'], 'abc')
+        self.assertEqual(context['dias_reposicion'], 4)
+        self.assertEqual([c['productos'] for c in context['resumen_clases']], [2, 1, 2])
+        self.assertEqual(context['productos_top'][0]['codigo'], 'A1')
+
+        response = self.client.get(reverse('pos:reportes'), {**params, 'export': 'analisis_abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('analisis_abc_2025-12-01_a_2025-12-10.csv', response['Content-Disposition'])
+        filas = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(filas[0], COLUMNAS_ANALISIS_ABC)
+        self.assertEqual([fila[0] for fila in filas[1:]], ['A1', 'A2', 'B1', 'C1', 'SIN'])
+
+        response = self.client.get(reverse('pos:reportes'), {**params, 'export': 'analisis_abc', 'solo_reponer': '1'})
+        filas = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual([fila[0] for fila in filas[1:]], ['A1', 'B1', 'C1'])
+
+        # La pantalla real se renderiza sin errores
+        self.assertEqual(self.client.get(reverse('pos:reportes'), params).status_code, 200)
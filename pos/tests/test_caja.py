@@ -188,3 +188,103 @@ class CajaTestCase(TestCase):
         self.assertEqual(venta.metodo_pago, 'efectivo')
         self.assertEqual(venta.total, 20000)
 
+
+    def _crear_movimientos_caja(self, caja_usuario, cantidad_ventas):
+        """Crea ventas (algunas anuladas) y gastos/ingresos dentro del período de la caja"""
+        from datetime import timedelta
+        base = caja_usuario.fecha_apertura
+        for i in range(cantidad_ventas):
+            venta = Venta.objects.create(
+                usuario=self.user,
+                vendedor=self.user,
+                metodo_pago='efectivo' if i % 2 else 'tarjeta',
+                total=1000 + i,
+                completada=True,
+                caja=self.caja,
+                registradora_id=(i % 3) + 1,
+            )
+            Venta.objects.filter(id=venta.id).update(fecha=base + timedelta(minutes=i + 1))
+            if i % 7 == 0:
+                Venta.objects.filter(id=venta.id).update(
+                    anulada=True,
+                    fecha_anulacion=base + timedelta(minutes=i + 3),
+                    usuario_anulacion=self.user,
+                )
+            if i % 5 == 0:
+                gasto = GastoCaja.objects.create(
+                    tipo='gasto' if i % 10 else 'ingreso',
+                    monto=300,
+                    descripcion=f'Movimiento {i}',
+                    usuario=self.user,
+                    caja_usuario=caja_usuario,
+                )
+                GastoCaja.objects.filter(id=gasto.id).update(fecha=base + timedelta(minutes=i + 1))
+
+    def test_api_movimientos_caja_paginada(self):
+        """Test: La línea de tiempo paginada coincide con el cálculo completo de saldos"""
+        from datetime import timedelta
+        caja_usuario = CajaUsuario.objects.create(
+            usuario=self.user,
+            caja=self.caja,
+            monto_inicial=50000,
+        )
+        CajaUsuario.objects.filter(id=caja_usuario.id).update(
+            fecha_apertura=timezone.now() - timedelta(hours=3)
+        )
+        caja_usuario.refresh_from_db()
+        self._crear_movimientos_caja(caja_usuario, 40)
+
+        # Recorrer todas las páginas con el token
+        movimientos = []
+        token = None
+        while True:
+            params = {'limite': 7}
+            if token:
+                params['desde'] = token
+            data = self.client.get(reverse('pos:api_movimientos_caja'), params).json()
+            movimientos.extend(data['movimientos'])
+            token = data['siguiente_token']
+            if not token:
+                break
+
+        self.assertEqual(len(movimientos), data['total_movimientos'])
+        self.assertEqual(movimientos[-1]['tipo'], 'apertura')
+        self.assertEqual(movimientos[-1]['saldo_antes'], 0)
+        self.assertEqual(movimientos[-1]['saldo_despues'], 50000)
+
+        # Saldos encadenados: el saldo antes de un movimiento es el saldo después del anterior
+        for mas_reciente, anterior in zip(movimientos, movimientos[1:]):
+            self.assertEqual(mas_reciente['saldo_antes'], anterior['saldo_despues'])
+            self.assertGreaterEqual(mas_reciente['fecha'], anterior['fecha'])
+
+        # Las anulaciones sin gasto de devolución aparecen como movimiento negativo
+        devoluciones = [m for m in movimientos if m['tipo'] == 'devolucion']
+        self.assertEqual(len(devoluciones), Venta.objects.filter(anulada=True).count())
+        self.assertTrue(all(m['monto'] < 0 for m in devoluciones))
+
+    def test_caja_view_movimientos_costo_constante(self):
+        """Test: La cantidad de consultas de la página de caja no crece con los movimientos"""
+        from datetime import timedelta
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        caja_usuario = CajaUsuario.objects.create(
+            usuario=self.user,
+            caja=self.caja,
+            monto_inicial=50000,
+        )
+        CajaUsuario.objects.filter(id=caja_usuario.id).update(
+            fecha_apertura=timezone.now() - timedelta(hours=5)
+        )
+        caja_usuario.refresh_from_db()
+
+        self._crear_movimientos_caja(caja_usuario, 10)
+        with CaptureQueriesContext(connection) as pocas:
+            response = self.client.get(reverse('pos:caja'))
+        self.assertEqual(response.status_code, 200)
+
+        self._crear_movimientos_caja(caja_usuario, 120)
+        with CaptureQueriesContext(connection) as muchas:
+            response = self.client.get(reverse('pos:caja'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(pocas), len(muchas))
@@ -0,0 +1,213 @@
+"""
+Tests para el cierre de período (archivo JSON Lines y tablas resumen)
+"""
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import Client, TestCase, override_settings, signals
+from django.urls import reverse
+from django.utils import timezone
+
+from pos.cierre_periodo import (
+    cerrar_periodo, filas_archivadas, items_venta_archivados, movimientos_archivados, periodo_cierre,
+)
+from pos.conteos import actualizar_conteo_actual, aplicar_conteos, diferencias_conteo
+from pos.models import (
+    Caja, CajaUsuario, ConteoFisico, ConteoFisicoActual, GastoCaja, ItemVenta, MovimientoStock, Producto, ResumenGastoCierre, ResumenStockCierre, Venta, VentaDiaria,
+    StockDiario, VentaProductoDiaria,
+)
+from pos.reporte_caja import DESCRIPCION_RETIRO, construir_dataset_caja
+from pos.reporte_inventario import construir_dataset_inventario
+from pos.stock_diario import generar_stock_diario
+from pos.ventas_diarias import reconstruir_ventas_diarias, reconstruir_ventas_producto_diarias
+from pos.verificacion_stock import discrepancias_stock
+
+# Evitar problemas al copiar contextos instrumentados en tests
+signals.template_rendered.receivers = []
+
+
+class CierrePeriodoTestCase(TestCase):
+    """Un período cerrado y movido conserva sus totales y su detalle se lee desde el archivo"""
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(ARCHIVO_HISTORICO_DIR=Path(self.directorio))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.user = User.objects.create_user(username='admin_test', password='testpass123')
+        self.user.groups.add(Group.objects.get_or_create(name='Administradores')[0])
+        self.producto = Producto.objects.create(codigo='ARCH', nombre='Archivado', precio=1000, stock=5)
+
+        ahora = timezone.now()
+        self.corte = timezone.localdate(ahora - timedelta(days=5))
+        antes, despues = ahora - timedelta(days=10), ahora - timedelta(days=2)
+        self.venta_vieja = self._venta(antes, 3)
+        self.venta_nueva = self._venta(despues, 2)
+        self._movimiento(antes, 'ingreso', 10, 0, 10)
+        self._movimiento(antes + timedelta(minutes=5), 'salida', 3, 10, 7, venta=self.venta_vieja)
+        self._movimiento(despues, 'salida', 2, 7, 5, venta=self.venta_nueva)
+        GastoCaja.objects.create(tipo='gasto', monto=4000, descripcion='Viejo', fecha=antes, usuario=self.user)
+        GastoCaja.objects.create(tipo='gasto', monto=1500, descripcion='Nuevo', fecha=despues, usuario=self.user)
+
+    def _venta(self, fecha, cantidad):
+        venta = Venta.objects.create(usuario=self.user, fecha=fecha, total=1000 * cantidad, completada=True)
+        ItemVenta.objects.create(
+            venta=venta, producto=self.producto, cantidad=cantidad, precio_unitario=1000, subtotal=1000 * cantidad,
+        )
+        return venta
+
+    def _movimiento(self, fecha, tipo, cantidad, anterior, nuevo, **kwargs):
+        return MovimientoStock.objects.create(
+            producto=self.producto, tipo=tipo, cantidad=cantidad, stock_anterior=anterior, stock_nuevo=nuevo,
+            fecha=fecha, **kwargs
+        )
+
+    def test_cierre_movido_conserva_totales_y_detalle(self):
+        """Test: Las filas del período salen de las tablas, los resúmenes y el archivo conservan totales y detalle"""
+        ventas_diarias = VentaDiaria.objects.aggregate(total=Sum('total_ventas'))['total']
+        vendidas = VentaProductoDiaria.objects.aggregate(total=Sum('cantidad'))['total']
+
+        cierre = cerrar_periodo(self.corte, usuario=self.user, mover=True)
+
+        self.assertTrue(cierre.movido)
+        self.assertEqual(cierre.conteos, {'ventas': 1, 'items_venta': 1, 'movimientos_stock': 2, 'gastos_caja': 1})
+        self.assertEqual(list(Venta.objects.values_list('id', flat=True)), [self.venta_nueva.id])
+        self.assertEqual(ItemVenta.objects.count(), 1)
+        self.assertEqual(MovimientoStock.objects.count(), 1)
+        self.assertEqual(list(GastoCaja.objects.values_list('descripcion', flat=True)), ['Nuevo'])
+
+        # Las tablas diarias no se descuentan al mover (borrado sin señales)
+        self.assertEqual(VentaDiaria.objects.aggregate(total=Sum('total_ventas'))['total'], ventas_diarias)
+        self.assertEqual(VentaProductoDiaria.objects.aggregate(total=Sum('cantidad'))['total'], vendidas)
+        resumen = ResumenStockCierre.objects.get(cierre=cierre, producto=self.producto)
+        self.assertEqual(
+            (resumen.stock_inicial, resumen.ingresos, resumen.salidas_venta, resumen.salidas_inventario, resumen.cantidad_movimientos),
+            (0, 10, 3, 0, 2)
+        )
+        self.assertEqual(list(ResumenGastoCierre.objects.values_list('tipo', 'retiro', 'total', 'cantidad')), [('gasto', False, 4000, 1)])
+        self.assertEqual(list(discrepancias_stock()), [])
+
+        # Detalle bajo demanda desde el archivo
+        self.assertEqual([fila['id'] for fila in filas_archivadas('ventas')], [self.venta_vieja.id])
+        archivados = movimientos_archivados(self.producto.id)
+        self.assertEqual([(m.tipo, m.stock_anterior, m.stock_nuevo) for m in archivados], [('salida', 10, 7), ('ingreso', 0, 10)])
+        self.assertEqual(archivados[0].producto, self.producto)
+        items = items_venta_archivados(self.producto.id)
+        self.assertEqual([(item['venta_id'], item['cantidad']) for item in items], [(self.venta_vieja.id, 3)])
+
+        # reporte_producto suma el resumen y parte del stock inicial del período cerrado
+        salida = StringIO()
+        call_command('reporte_producto', 'ARCH', '--archivo', stdout=salida)
+        reporte = salida.getvalue()
+        self.assertIn('(incluye 2 movimientos de 1 períodos cerrados)', reporte)
+        self.assertIn('Movimientos archivados', reporte)
+        self.assertIn('= Stock Final Calculado:                        5', reporte)
+        self.assertIn('Diferencia:                                      0', reporte)
+
+        # El período ya está cerrado
+        with self.assertRaises(ValueError):
+            periodo_cierre(self.corte)
+
+    def test_reconstrucciones_no_tocan_periodos_movidos(self):
+        """Test: Reconstruir las tablas diarias después de mover conserva los días cerrados"""
+        cerrar_periodo(self.corte, mover=True)
+        ventas = sorted(VentaDiaria.objects.values_list('fecha', 'total_ventas'))
+        productos = sorted(VentaProductoDiaria.objects.values_list('fecha', 'cantidad'))
+        fotos = sorted(StockDiario.objects.filter(fecha__lte=self.corte).values_list('fecha', 'stock'))
+        self.assertEqual(len(ventas), 2)
+
+        reconstruir_ventas_diarias()
+        reconstruir_ventas_producto_diarias()
+        generar_stock_diario(self.corte - timedelta(days=10), self.corte)
+        self.assertEqual(sorted(VentaDiaria.objects.values_list('fecha', 'total_ventas')), ventas)
+        self.assertEqual(sorted(VentaProductoDiaria.objects.values_list('fecha', 'cantidad')), productos)
+        self.assertEqual(sorted(StockDiario.objects.filter(fecha__lte=self.corte).values_list('fecha', 'stock')), fotos)
+
+    def test_reportes_de_caja_e_inventario_sobre_periodo_movido(self):
+        """Test: Los reportes de caja e inventario dan lo mismo antes y después de mover el período"""
+        antes = timezone.now() - timedelta(days=10)
+        GastoCaja.objects.create(tipo='ingreso', monto=700, descripcion='Base', fecha=antes, usuario=self.user)
+        GastoCaja.objects.create(
+            tipo='gasto', monto=900, descripcion=f'{DESCRIPCION_RETIRO} - Usuario: admin_test', fecha=antes, usuario=self.user,
+        )
+        dia = timezone.localdate(antes)
+        rangos_caja = [(dia, dia), (dia - timedelta(days=1), timezone.localdate())]
+        rangos_inventario = [(dia.isoformat(), dia.isoformat()), (None, None)]
+
+        caja_antes = [construir_dataset_caja(*rango) for rango in rangos_caja]
+        inventario_antes = [construir_dataset_inventario(None, None, *rango)['resumen_productos'] for rango in rangos_inventario]
+        self.assertEqual(
+            (caja_antes[0]['total_gastos'], caja_antes[0]['total_ingresos'], caja_antes[0]['total_retiros']), (4000, 700, 900)
+        )
+        self.assertEqual(
+            [(p['total_entradas'], p['total_salidas'], p['stock_inicial'], p['stock_final']) for p in inventario_antes[0]],
+            [(10, 3, 0, 7)]
+        )
+
+        cerrar_periodo(self.corte, mover=True)
+        self.assertEqual(GastoCaja.objects.count(), 1)
+
+        self.assertEqual([construir_dataset_caja(*rango) for rango in rangos_caja], caja_antes)
+        self.assertEqual(
+            [construir_dataset_inventario(None, None, *rango)['resumen_productos'] for rango in rangos_inventario],
+            inventario_antes
+        )
+
+    def test_conteo_aplicado_antes_del_corte_no_se_reaplica(self):
+        """Test: Un conteo aplicado dentro del período movido no genera un nuevo ajuste al perder sus movimientos"""
+        antes = timezone.now() - timedelta(days=10)
+        conteo = ConteoFisico.objects.create(codigo='ARCH', cantidad_contada=7, fecha_conteo=antes + timedelta(minutes=1))
+        actualizar_conteo_actual(conteo)
+        # Al contar había 10; después salieron 3 y 2: el ajuste es -3 y deja 2
+        with mock.patch('django.utils.timezone.now', return_value=antes + timedelta(minutes=20)):
+            self.assertEqual([fila['ajuste'] for fila in aplicar_conteos()['filas']], [-3])
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 2)
+
+        cerrar_periodo(self.corte, mover=True)
+        self.assertEqual(diferencias_conteo()['filas'], [])
+        # Aunque no constara como aplicado, es anterior al último cierre movido
+        ConteoFisicoActual.objects.update(aplicado_en=None)
+        self.assertEqual(diferencias_conteo()['filas'], [])
+        aplicar_conteos()
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 2)
+
+    def test_no_mueve_con_caja_abierta_antes_del_corte(self):
+        """Test: Mover se rechaza mientras una caja abierta antes del corte siga sin cerrar"""
+        caja = Caja.objects.create(numero=1, nombre='Caja Principal')
+        abierta = CajaUsuario.objects.create(caja=caja, usuario=self.user, monto_inicial=0)
+        CajaUsuario.objects.filter(pk=abierta.pk).update(fecha_apertura=timezone.now() - timedelta(days=20))
+
+        with self.assertRaises(ValueError):
+            cerrar_periodo(self.corte, mover=True)
+        self.assertEqual(Venta.objects.count(), 2)
+
+        # Sin mover sí se puede archivar
+        self.assertFalse(cerrar_periodo(self.corte).movido)
+
+    def test_cierre_sin_mover_y_vista_de_movimientos_archivados(self):
+        """Test: Sin mover las filas siguen en las tablas; movidas, la trazabilidad las muestra desde el archivo"""
+        cierre = cerrar_periodo(self.corte - timedelta(days=10))
+        self.assertFalse(cierre.movido)
+        self.assertEqual(MovimientoStock.objects.count(), 3)
+        self.assertEqual(list(filas_archivadas('movimientos_stock')), [])
+
+        cerrar_periodo(self.corte, mover=True)
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('pos:movimientos_inventario')
+
+        response = client.get(url, {'producto': self.producto.id, 'archivado': '1'})
+        self.assertContains(response, 'Total: 2 movimientos archivados')
+        response = client.get(url, {'producto': self.producto.id})
+        self.assertContains(response, 'Total: 1 movimientos')
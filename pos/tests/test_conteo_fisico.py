@@ -130,6 +130,28 @@ class ConteoFisicoTestCase(TestCase):
         conteo.refresh_from_db()
         self.assertEqual(conteo.cantidad_contada, 50)
 
+    def test_actualizar_conteo_existente_por_clave_sku(self):
+        """Test: Un conteo guardado con atributo sin normalizar se actualiza por su sku_key"""
+        self.client.force_login(self.user_admin)
+        conteo = ConteoFisico.objects.create(
+            codigo='PROD002',
+            atributo=' Rojo ',
+            cantidad_contada=10,
+            usuario=self.user_admin,
+        )
+
+        response = self.client.post(reverse('pos:guardar_conteo_fisico'), {
+            'codigo': 'PROD002',
+            'atributo': 'Rojo',
+            'cantidad': '12',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['created'])
+        self.assertEqual(ConteoFisico.objects.filter(codigo='PROD002').count(), 1)
+        conteo.refresh_from_db()
+        self.assertEqual(conteo.cantidad_contada, 12)
+
     def test_guardar_conteo_sin_cantidad(self):
         """Test: Cantidad vacía ahora se interpreta como 0 (cambió el comportamiento)"""
         self.client.force_login(self.user_admin)
@@ -482,3 +504,209 @@ class ConteoFisicoTestCase(TestCase):
         self.assertIsInstance(data['cantidad'], int)
         self.assertEqual(data['cantidad'], 0)
 
+
+    def test_ultimos_conteos_por_clave_una_consulta(self):
+        """Test: El último conteo por código+atributo se obtiene en una consulta y coincide con la tabla vigente"""
+        from datetime import timedelta
+        from django.test import override_settings
+        from pos.conteos import ultimos_conteos_por_clave
+
+        self.client.force_login(self.user_admin)
+        url = reverse('pos:guardar_conteo_fisico')
+        self.client.post(url, {'codigo': 'PROD001', 'atributo': '', 'cantidad': '40'})
+        self.client.post(url, {'codigo': 'PROD002', 'atributo': 'Rojo', 'cantidad': '31'})
+        self.client.post(url, {'codigo': 'PROD002', 'atributo': 'Azul', 'cantidad': '19'})
+
+        # Conteo antiguo del mismo código+atributo: no debe ganar
+        antiguo = ConteoFisico.objects.create(codigo='PROD002', atributo='Rojo', cantidad_contada=99)
+        ConteoFisico.objects.filter(id=antiguo.id).update(fecha_conteo=timezone.now() - timedelta(days=3))
+
+        esperado = {
+            ('PROD001', ''): 40,
+            ('PROD002', 'Rojo'): 31,
+            ('PROD002', 'Azul'): 19,
+        }
+        for usar_tabla in (True, False):
+            with override_settings(CONTEO_FISICO_TABLA_ACTUAL=usar_tabla):
+                with self.assertNumQueries(1):
+                    ultimos = ultimos_conteos_por_clave()
+                self.assertEqual(
+                    {clave: c['cantidad_contada'] for clave, c in ultimos.items()},
+                    esperado
+                )
+
+        # Actualizar un conteo existente actualiza la tabla vigente
+        self.client.post(url, {'codigo': 'PROD001', 'atributo': '-', 'cantidad': '0'})
+        self.assertEqual(ultimos_conteos_por_clave(['PROD001'])[('PROD001', '')]['cantidad_contada'], 0)
+
+    def test_aplicar_conteos_en_bloque(self):
+        """Test: Vista previa sin escribir y aplicación en bloque relativa al stock que había al contar"""
+        from io import StringIO
+        from django.core.management import call_command
+        from pos.conteos import diferencias_conteo
+        from pos.verificacion_stock import discrepancias_stock
+
+        # Mismo código y atributo normalizado en dos productos activos: no se ajusta
+        Producto.objects.create(codigo='DUP', nombre='Duplicado A', precio=100, stock=3)
+        Producto.objects.create(codigo='DUP', nombre='Duplicado B', atributo='-', precio=100, stock=4)
+
+        self.client.force_login(self.user_admin)
+        url = reverse('pos:guardar_conteo_fisico')
+        self.client.post(url, {'codigo': 'PROD001', 'atributo': '', 'cantidad': '40'})
+        self.client.post(url, {'codigo': 'PROD002', 'atributo': 'Rojo', 'cantidad': '35'})
+        self.client.post(url, {'codigo': 'PROD002', 'atributo': 'Azul', 'cantidad': '20'})
+        self.client.post(url, {'codigo': 'DUP', 'atributo': '', 'cantidad': '9'})
+
+        # Venta posterior al conteo: el ajuste no la deshace
+        MovimientoStock.objects.create(
+            producto=self.producto1, tipo='salida', cantidad=2, stock_anterior=50, stock_nuevo=48,
+            fecha=timezone.now(),
+        )
+        Producto.objects.filter(id=self.producto1.id).update(stock=48)
+
+        # Una consulta para el último cierre movido y otra para las diferencias
+        with self.assertNumQueries(2):
+            diferencias = diferencias_conteo()
+        self.assertEqual(diferencias['ambiguos'], 2)
+        self.assertEqual(
+            [(fila['codigo'], fila['stock_conteo'], fila['ajuste']) for fila in diferencias['filas']],
+            [('PROD001', 50, -10), ('PROD002', 30, 5)]
+        )
+
+        # Vista previa y comando sin --aplicar no escriben
+        vista = reverse('pos:aplicar_conteo')
+        response = self.client.get(vista)
+        self.assertContains(response, 'Aplicar ajustes')
+        self.assertContains(response, '+5')
+        self.assertContains(response, '-10')
+        self.assertNotContains(response, 'Duplicado')
+        response = self.client.get(vista, {'format': 'csv'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8').strip().splitlines()), 3)
+        salida = StringIO()
+        call_command('aplicar_conteos', stdout=salida)
+        self.assertIn('Vista previa', salida.getvalue())
+        self.assertFalse(MovimientoStock.objects.filter(tipo='ajuste').exists())
+
+        response = self.client.post(vista)
+        self.assertRedirects(response, vista)
+        self.producto1.refresh_from_db()
+        self.producto2.refresh_from_db()
+        self.assertEqual((self.producto1.stock, self.producto2.stock), (38, 35))
+        ajustes = MovimientoStock.objects.filter(tipo='ajuste').order_by('producto_id')
+        self.assertEqual(
+            [(m.producto_id, m.cantidad, m.stock_anterior, m.stock_nuevo) for m in ajustes],
+            [(self.producto1.id, -10, 48, 38), (self.producto2.id, 5, 30, 35)]
+        )
+        self.assertTrue(all(m.conteo_id and m.usuario == self.user_admin for m in ajustes))
+        self.assertEqual(list(discrepancias_stock()), [])
+
+        # Un conteo aplicado no se vuelve a aplicar; recontar sí genera un nuevo ajuste
+        self.assertEqual(diferencias_conteo()['filas'], [])
+        self.client.post(url, {'codigo': 'PROD002', 'atributo': 'Rojo', 'cantidad': '33'})
+        call_command('aplicar_conteos', '--aplicar', stdout=StringIO())
+        self.producto2.refresh_from_db()
+        self.assertEqual(self.producto2.stock, 33)
+        self.assertEqual(MovimientoStock.objects.filter(tipo='ajuste').count(), 3)
+
+    def test_conteo_eliminado_no_se_vuelve_a_aplicar(self):
+        """Test: Borrar un conteo aplicado borra su conteo vigente y aplicar de nuevo no vuelve a ajustar"""
+        from pos.conteos import aplicar_conteos, diferencias_conteo
+        from pos.models import ConteoFisicoActual
+
+        Producto.objects.filter(id=self.producto1.id).update(stock=7)
+        self.client.force_login(self.user_admin)
+        self.client.post(reverse('pos:guardar_conteo_fisico'), {'codigo': 'PROD001', 'atributo': '', 'cantidad': '4'})
+        aplicar_conteos()
+        self.producto1.refresh_from_db()
+        self.assertEqual(self.producto1.stock, 4)
+
+        ConteoFisico.objects.filter(codigo='PROD001').delete()
+        self.assertFalse(ConteoFisicoActual.objects.filter(codigo='PROD001').exists())
+        self.assertEqual(diferencias_conteo()['filas'], [])
+        aplicar_conteos()
+        aplicar_conteos()
+        self.producto1.refresh_from_db()
+        self.assertEqual(self.producto1.stock, 4)
+        self.assertEqual(MovimientoStock.objects.filter(tipo='ajuste').count(), 1)
+
+    def test_conteo_actual_unico_por_clave_sku(self):
+        """Test: Los dos escritores de ConteoFisicoActual actualizan la fila de la clave aunque se guardó sin normalizar"""
+        from pos.conteos import actualizar_conteo_actual, registrar_conteos
+        from pos.models import ConteoFisicoActual
+
+        ConteoFisicoActual.objects.create(codigo='PROD002', atributo=' Rojo ', cantidad_contada=10, fecha_conteo=timezone.now())
+
+        registrar_conteos([{'codigo': 'PROD002', 'atributo': 'Rojo', 'cantidad': 3, 'mode': 'increment'}])
+        fila = ConteoFisicoActual.objects.get(sku_key='PROD002|Rojo')
+        self.assertEqual((fila.atributo, fila.cantidad_contada), ('Rojo', 13))
+
+        actualizar_conteo_actual(ConteoFisico.objects.create(codigo='PROD002', atributo='Rojo ', cantidad_contada=8))
+        self.assertEqual(list(ConteoFisicoActual.objects.values_list('sku_key', 'cantidad_contada')), [('PROD002|Rojo', 8)])
+
+    def test_guardar_conteos_en_lote(self):
+        """Test: Un lote de escaneos fija o suma por código+atributo con consultas que no dependen del tamaño"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from pos.conteos import ultimos_conteos_por_clave
+        from pos.models import ConteoFisicoActual
+
+        self.client.force_login(self.user_admin)
+        self.client.post(reverse('pos:guardar_conteo_fisico'), {'codigo': 'PROD001', 'atributo': '', 'cantidad': '10'})
+        url = reverse('pos:guardar_conteos_lote')
+
+        def enviar(entradas):
+            return self.client.post(url, json.dumps({'entradas': entradas}), content_type='application/json')
+
+        entradas = [
+            {'codigo': 'PROD001', 'atributo': '-', 'cantidad': 2, 'mode': 'increment'},
+            {'codigo': 'PROD002', 'atributo': 'Rojo', 'cantidad': '', 'mode': 'increment'},
+            {'codigo': 'PROD002', 'atributo': 'Rojo ', 'mode': 'increment'},
+            {'codigo': 'PROD002', 'atributo': 'Azul', 'cantidad': '7'},
+            {'codigo': 'PROD001', 'atributo': '', 'cantidad': 1, 'mode': 'increment'},
+        ]
+        response = enviar(entradas)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['conteos'], [
+            {'codigo': 'PROD001', 'atributo': '', 'cantidad': 13, 'created': False},
+            {'codigo': 'PROD002', 'atributo': 'Rojo', 'cantidad': 2, 'created': True},
+            {'codigo': 'PROD002', 'atributo': 'Azul', 'cantidad': 7, 'created': True},
+        ])
+        # Se actualiza el conteo existente y la tabla vigente coincide con el historial
+        self.assertEqual(ConteoFisico.objects.count(), 3)
+        self.assertEqual(ConteoFisicoActual.objects.count(), 3)
+        self.assertEqual(
+            {clave: c['cantidad_contada'] for clave, c in ultimos_conteos_por_clave().items()},
+            {('PROD001', ''): 13, ('PROD002', 'Rojo'): 2, ('PROD002', 'Azul'): 7}
+        )
+
+        # Mismo número de consultas para 3 y 100 códigos (100 caben en un INSERT de SQLite)
+        consultas = []
+        for cantidad in (3, 100):
+            lote = [{'codigo': f'LOTE{cantidad}-{i}', 'cantidad': i, 'mode': 'set'} for i in range(cantidad)]
+            with CaptureQueriesContext(connection) as capturadas:
+                self.assertEqual(enviar(lote).status_code, 200)
+            consultas.append(len(capturadas))
+        self.assertEqual(consultas[0], consultas[1])
+
+        # Una entrada inválida rechaza el lote completo
+        response = enviar([
+            {'codigo': 'PROD001', 'cantidad': 50},
+            {'codigo': 'PROD001', 'cantidad': 'abc'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Entrada 2', response.json()['error'])
+        self.assertEqual(response.json()['entrada'], 2)
+        self.assertEqual(ultimos_conteos_por_clave(['PROD001'])[('PROD001', '')]['cantidad_contada'], 13)
+
+        # Un lote reenviado (respuesta perdida) no vuelve a sumar
+        reenvio = {'lote': 'lote-prueba-1', 'entradas': [{'codigo': 'PROD001', 'cantidad': 5, 'mode': 'increment'}]}
+        primera = self.client.post(url, json.dumps(reenvio), content_type='application/json').json()
+        segunda = self.client.post(url, json.dumps(reenvio), content_type='application/json').json()
+        self.assertEqual(primera['conteos'][0]['cantidad'], 18)
+        self.assertEqual(segunda['conteos'], primera['conteos'])
+        self.assertEqual(ultimos_conteos_por_clave(['PROD001'])[('PROD001', '')]['cantidad_contada'], 18)
+        self.assertEqual(enviar([{'codigo': 'PROD001', 'mode': 'replace'}]).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        response = self.client.get(reverse('pos:escanear_conteo'))
+        self.assertContains(response, url)
@@ -0,0 +1,216 @@
+"""
+Tests para las exportaciones de reportes (CSV en streaming y XLSX write-only)
+"""
+import csv
+import io
+import tracemalloc
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import Group, User
+from django.http import StreamingHttpResponse
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from pos.conteos import actualizar_conteo_actual
+from pos.exportaciones import (
+    ENCABEZADOS_MOVIMIENTOS_CAJA, filas_movimientos_caja, respuesta_csv,
+)
+from pos.models import (
+    Caja, CajaUsuario, ConteoFisico, GastoCaja, ItemVenta, MovimientoStock, Producto, Venta,
+)
+from pos.reporte_inventario import invalidar_cache_inventario
+
+FILAS_SINTETICAS = 500_000
+
+# Pico de memoria admitido al exportar FILAS_SINTETICAS (el CSV completo ocupa ~55 MB)
+MEMORIA_MAXIMA_BYTES = 5 * 1024 * 1024
+
+
+class ExportacionCsvMemoriaTestCase(SimpleTestCase):
+    """La exportación CSV no acumula el archivo en memoria"""
+
+    def _movimientos_sinteticos(self, cantidad):
+        inicio = timezone.now()
+        saldo = 0
+        for i in range(cantidad):
+            delta = 1000 + (i % 50) * 100
+            yield {
+                'fecha_local': inicio + timedelta(seconds=i),
+                'tipo': 'Venta',
+                'descripcion': f'Venta #{i} - Registradora 1',
+                'delta': delta,
+                'saldo_antes': saldo,
+                'saldo_despues': saldo + delta,
+                'metodo_pago': 'Efectivo',
+                'usuario': 'cajero_sintetico',
+            }
+            saldo += delta
+
+    def test_exportar_500k_filas_memoria_acotada(self):
+        """Test: 500k filas se exportan con un pico de memoria fijo"""
+        response = respuesta_csv(
+            'movimientos.csv',
+            ENCABEZADOS_MOVIMIENTOS_CAJA,
+            filas_movimientos_caja(self._movimientos_sinteticos(FILAS_SINTETICAS)),
+        )
+        self.assertIsInstance(response, StreamingHttpResponse)
+
+        total_bytes = 0
+        lineas = 0
+        tracemalloc.start()
+        try:
+            for bloque in response.streaming_content:
+                total_bytes += len(bloque)
+                lineas += bloque.count(b'\n')
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(lineas, FILAS_SINTETICAS + 1)
+        self.assertGreater(total_bytes, MEMORIA_MAXIMA_BYTES)
+        self.assertLess(pico, MEMORIA_MAXIMA_BYTES)
+
+
+class ExportacionReportesStreamingTestCase(TestCase):
+    """Las exportaciones CSV de reportes responden en streaming"""
+
+    def setUp(self):
+        self.user_admin = User.objects.create_user(
+            username='admin_test',
+            password='testpass123',
+            is_staff=True,
+        )
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user_admin.groups.add(grupo_admin)
+
+        self.client = Client()
+        self.client.force_login(self.user_admin)
+
+    def test_export_movimientos_streaming_con_todas_las_filas(self):
+        """Test: export=movimientos recorre los gastos en lotes y los envía todos"""
+        tz = timezone.get_current_timezone()
+        inicio = timezone.make_aware(datetime(2025, 12, 14, 8, 0, 0), tz)
+        GastoCaja.objects.bulk_create([
+            GastoCaja(
+                tipo='gasto' if i % 2 else 'ingreso',
+                monto=100 + i,
+                descripcion=f'Movimiento {i}',
+                fecha=inicio + timedelta(seconds=i),
+                usuario=self.user_admin,
+            )
+            for i in range(2500)
+        ])
+
+        response = self.client.get(reverse('pos:reportes'), {
+            'tipo': 'caja',
+            'fecha_desde': '2025-12-14',
+            'fecha_hasta': '2025-12-14',
+            'export': 'movimientos',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('text/csv', response['Content-Type'])
+
+        filas = list(csv.reader(io.StringIO(response.getvalue().decode('utf-8'))))
+        self.assertEqual(filas[0][:3], ['Fecha', 'Tipo', 'Descripcion'])
+        self.assertEqual(len(filas), 2501)
+        self.assertEqual(filas[1][2], 'Movimiento 0')
+        self.assertEqual(filas[-1][2], 'Movimiento 2499')
+
+
+class ExportacionXlsxTestCase(TestCase):
+    """El XLSX write-only tiene el mismo contenido que el libro en memoria"""
+
+    def setUp(self):
+        self.user_admin = User.objects.create_user(
+            username='admin_test',
+            password='testpass123',
+            is_staff=True,
+        )
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user_admin.groups.add(grupo_admin)
+
+        self.client = Client()
+        self.client.force_login(self.user_admin)
+        invalidar_cache_inventario()
+
+        tz = timezone.get_current_timezone()
+        caja = Caja.objects.create(numero=1, nombre='Caja Principal', activa=True)
+        CajaUsuario.objects.create(
+            usuario=self.user_admin,
+            caja=caja,
+            monto_inicial=5000,
+            fecha_apertura=timezone.make_aware(datetime(2025, 12, 14, 9, 0, 0), tz),
+            fecha_cierre=timezone.make_aware(datetime(2025, 12, 14, 20, 0, 0), tz),
+        )
+        producto = Producto.objects.create(codigo='XL1', nombre='Producto XL', precio=1000, stock=10)
+        MovimientoStock.objects.create(
+            producto=producto, tipo='ingreso', cantidad=10, stock_anterior=0, stock_nuevo=10,
+            motivo='Test', usuario=self.user_admin,
+        )
+        for i in range(3):
+            venta = Venta.objects.create(
+                fecha=timezone.make_aware(datetime(2025, 12, 14, 10 + i, 0, 0), tz),
+                total=2000,
+                completada=True,
+                metodo_pago='efectivo',
+                usuario=self.user_admin,
+                caja=caja,
+            )
+            ItemVenta.objects.create(
+                venta=venta, producto=producto, cantidad=2, precio_unitario=1000, subtotal=2000
+            )
+        GastoCaja.objects.create(
+            tipo='gasto',
+            monto=300,
+            descripcion='Gasto operativo',
+            fecha=timezone.make_aware(datetime(2025, 12, 14, 11, 30, 0), tz),
+            usuario=self.user_admin,
+        )
+
+    def _exportar(self, params):
+        response = self.client.get(reverse('pos:reportes'), {'format': 'xlsx', **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('spreadsheetml', response['Content-Type'])
+        return load_workbook(filename=io.BytesIO(response.getvalue()))
+
+    def _valores(self, wb):
+        return {ws.title: [list(fila) for fila in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+
+    def test_xlsx_write_only_igual_a_libro_en_memoria(self):
+        """Test: Todos los tipos de exportación producen las mismas hojas y filas en ambos modos"""
+        exportaciones = [
+            {'tipo': 'caja', 'fecha_desde': '2025-12-14', 'fecha_hasta': '2025-12-14', 'export': export}
+            for export in ('ventas', 'movimientos', 'cajas', 'movimientos_caja')
+        ]
+        exportaciones.append({'tipo': 'inventario', 'export': 'resumen_inventario'})
+
+        for params in exportaciones:
+            with self.subTest(export=params['export']):
+                with override_settings(REPORTES_XLSX_WRITE_ONLY=True):
+                    write_only = self._valores(self._exportar(params))
+                with override_settings(REPORTES_XLSX_WRITE_ONLY=False):
+                    en_memoria = self._valores(self._exportar(params))
+                self.assertEqual(write_only, en_memoria)
+                for filas in write_only.values():
+                    self.assertGreaterEqual(len(filas), 2)
+
+        hojas_ventas = self._valores(self._exportar(exportaciones[0]))
+        self.assertEqual(len(hojas_ventas['Ventas']), 4)
+        self.assertEqual(hojas_ventas['Items'][0][:3], ['VentaID', 'Fecha', 'Producto'])
+        self.assertEqual(len(hojas_ventas['Items']), 4)
+
+    def test_xlsx_inventario_resalta_filas_que_coinciden(self):
+        """Test: En write-only se mantiene el encabezado en negrita y el resaltado verde"""
+        conteo = ConteoFisico.objects.create(codigo='XL1', cantidad_contada=10, usuario=self.user_admin)
+        actualizar_conteo_actual(conteo)
+        invalidar_cache_inventario()
+        wb = self._exportar({'tipo': 'inventario', 'export': 'resumen_inventario'})
+        ws = wb['Resumen Inventario']
+
+        self.assertTrue(ws['A1'].font.b)
+        self.assertEqual(ws['A2'].value, 'XL1')
+        self.assertEqual(ws['A2'].fill.start_color.rgb[-6:], 'C6EFCE')
+        self.assertEqual(ws.column_dimensions['B'].width, 35)
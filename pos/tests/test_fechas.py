@@ -0,0 +1,112 @@
+"""
+Tests para los filtros por rango de fechas locales (pos.fechas)
+"""
+import unittest
+from datetime import date, datetime
+
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from pos.fechas import filtro_dia_local, filtro_rango_fechas, rango_fechas_local
+from pos.models import GastoCaja, MovimientoStock, Producto, Venta
+
+
+def _plan(sql, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return ' | '.join(str(fila[-1]) for fila in cursor.fetchall())
+
+
+class RangoFechasLocalTestCase(TestCase):
+    """El rango semiabierto equivale a fecha__date y compara la columna directamente"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin_test', password='testpass123', is_staff=True)
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user.groups.add(grupo_admin)
+        self.producto = Producto.objects.create(codigo='PROD_A', nombre='Producto A', precio=1000, stock=0)
+        self.tz = timezone.get_current_timezone()
+
+        # Bogotá es UTC-5: 20:00 local del 14 ya es el 15 en UTC
+        for dia, hora in ((13, 23), (14, 0), (14, 20), (15, 0), (16, 9)):
+            MovimientoStock.objects.create(
+                producto=self.producto, tipo='ingreso', cantidad=1, stock_anterior=0, stock_nuevo=1,
+                fecha=timezone.make_aware(datetime(2025, 12, dia, hora, 30), self.tz),
+                usuario=self.user,
+            )
+
+    def _fechas(self, filtro):
+        return sorted(
+            timezone.localtime(f, self.tz).strftime('%d %H') for f in
+            MovimientoStock.objects.filter(filtro).values_list('fecha', flat=True)
+        )
+
+    def test_mismos_resultados_que_filtro_date(self):
+        """Test: Mismos registros que fecha__date__gte/lte en los bordes del día local"""
+        casos = [
+            (date(2025, 12, 14), date(2025, 12, 14)),
+            (date(2025, 12, 14), date(2025, 12, 15)),
+            (date(2025, 12, 14), None),
+            (None, date(2025, 12, 14)),
+            (None, None),
+        ]
+        for desde, hasta in casos:
+            filtro_date = {}
+            if desde:
+                filtro_date['fecha__date__gte'] = desde
+            if hasta:
+                filtro_date['fecha__date__lte'] = hasta
+            esperado = sorted(
+                timezone.localtime(f, self.tz).strftime('%d %H') for f in
+                MovimientoStock.objects.filter(**filtro_date).values_list('fecha', flat=True)
+            )
+            self.assertEqual(self._fechas(filtro_rango_fechas('fecha', desde, hasta)), esperado, (desde, hasta))
+
+        self.assertEqual(self._fechas(filtro_dia_local('fecha', date(2025, 12, 14))), ['14 00', '14 20'])
+
+    def test_rango_semiabierto(self):
+        """Test: fin es la medianoche local del día siguiente"""
+        inicio, fin = rango_fechas_local(date(2025, 12, 14), date(2025, 12, 14))
+        self.assertEqual(timezone.localtime(inicio, self.tz).replace(tzinfo=None), datetime(2025, 12, 14))
+        self.assertEqual(timezone.localtime(fin, self.tz).replace(tzinfo=None), datetime(2025, 12, 15))
+        self.assertEqual(rango_fechas_local(), (None, None))
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es de SQLite')
+    def test_plan_usa_indice_de_fecha(self):
+        """Test: El filtro por rango usa el índice de fecha; fecha__date obliga a recorrer la tabla"""
+        desde, hasta = date(2025, 12, 14), date(2025, 12, 15)
+        for modelo in (MovimientoStock, Venta, GastoCaja):
+            queryset = modelo.objects.filter(filtro_rango_fechas('fecha', desde, hasta)).values('id')
+            sql, params = queryset.query.sql_with_params()
+            plan = _plan(sql, params)
+            self.assertIn('USING', plan, (modelo.__name__, plan))
+            self.assertIn('fecha', plan, (modelo.__name__, plan))
+
+        sql, params = MovimientoStock.objects.filter(
+            fecha__date__gte=desde, fecha__date__lte=hasta
+        ).values('id').query.sql_with_params()
+        self.assertTrue(_plan(sql, params).startswith('SCAN'))
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es de SQLite')
+    def test_vista_movimientos_inventario_filtra_por_indice(self):
+        """Test: La consulta de movimientos_inventario_view con fechas busca por índice"""
+        client = Client()
+        client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse('pos:movimientos_inventario'), {
+                'fecha_desde': '2025-12-14', 'fecha_hasta': '2025-12-14',
+            })
+        self.assertEqual(response.status_code, 200)
+
+        consultas = [
+            q['sql'] for q in ctx.captured_queries
+            if 'FROM "pos_movimientostock"' in q['sql'] and '"fecha" >=' in q['sql']
+        ]
+        self.assertTrue(consultas)
+        for sql in consultas:
+            self.assertNotIn('django_datetime_cast_date', sql)
+            self.assertIn('USING', _plan(sql))
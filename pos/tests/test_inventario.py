@@ -6,8 +6,14 @@ from django.contrib.auth.models import User, Group
 from django.urls import reverse
 from pos.models import (
     Producto, IngresoMercancia, ItemIngresoMercancia,
-    SalidaMercancia, ItemSalidaMercancia, MovimientoStock
+    SalidaMercancia, ItemSalidaMercancia, MovimientoStock, Venta
 )
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pos.verificacion_stock import discrepancias_stock
+from importlib import import_module
+from unittest.mock import patch
 import json
 from django.test.client import store_rendered_templates
 
@@ -142,6 +148,50 @@ class InventarioTestCase(TestCase):
         self.assertIsNotNone(movimiento)
         self.assertEqual(movimiento.tipo, 'ingreso')
         self.assertEqual(movimiento.cantidad, 10)
+        self.assertEqual(movimiento.ingreso_id, ingreso.id)
+    
+    def test_completar_ingreso_en_bloque(self):
+        """Test: Completar un ingreso con varias líneas del mismo producto en consultas constantes y sin cortes en el historial"""
+        ingreso = IngresoMercancia.objects.create(proveedor='Proveedor Test', usuario=self.user)
+        productos = [self.producto1, self.producto2] + [
+            Producto.objects.create(codigo=f'BLQ{i}', nombre=f'Bloque {i}', precio=1000, stock=i) for i in range(30)
+        ]
+        lineas = [(producto, 2) for producto in productos] + [(self.producto1, 3), (self.producto1, 5)]
+        ItemIngresoMercancia.objects.bulk_create([
+            ItemIngresoMercancia(ingreso=ingreso, producto=producto, cantidad=cantidad, verificado=True)
+            for producto, cantidad in lineas
+        ])
+        pendiente = ItemIngresoMercancia.objects.create(ingreso=ingreso, producto=self.producto2, cantidad=7)
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(reverse('pos:detalle_ingreso', args=[ingreso.id]), {'completar': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(consultas), 25)
+
+        self.producto1.refresh_from_db()
+        self.producto2.refresh_from_db()
+        self.assertEqual(self.producto1.stock, 110)
+        self.assertEqual(self.producto2.stock, 52)
+        movimientos = MovimientoStock.objects.filter(producto=self.producto1).order_by('id')
+        self.assertEqual(
+            [(m.stock_anterior, m.stock_nuevo) for m in movimientos], [(100, 102), (102, 105), (105, 110)]
+        )
+        self.assertEqual(MovimientoStock.objects.filter(ingreso=ingreso).count(), len(lineas))
+        self.assertEqual(list(discrepancias_stock()), [])
+
+        ingreso.refresh_from_db()
+        self.assertFalse(ingreso.completado)
+        self.assertFalse(ingreso.items.filter(verificado=True, procesado=False).exists())
+
+        # Al verificar y procesar el último item el ingreso queda completado
+        pendiente.verificado = True
+        pendiente.save()
+        self.client.post(reverse('pos:detalle_ingreso', args=[ingreso.id]), {'completar': '1'})
+        ingreso.refresh_from_db()
+        self.producto2.refresh_from_db()
+        self.assertTrue(ingreso.completado)
+        self.assertEqual(self.producto2.stock, 59)
+        self.assertEqual(list(discrepancias_stock()), [])
     
     def test_crear_salida_mercancia(self):
         """Test: Crear una salida de mercancía"""
@@ -166,7 +216,48 @@ class InventarioTestCase(TestCase):
         self.assertEqual(salida.tipo, 'merma')
         self.assertEqual(salida.items.count(), 1)
         self.assertFalse(salida.completado)
-    
+
+    def test_crear_documentos_en_bloque(self):
+        """Test: Crear ingresos y salidas de 500 líneas con las mismas consultas que de 10, validando todo antes de escribir"""
+        productos = Producto.objects.bulk_create([
+            Producto(codigo=f'BLQ{i}', nombre=f'Bloque {i}', precio=1000, stock=10) for i in range(500)
+        ])
+
+        def crear(url, datos, lineas):
+            items = [
+                {'producto_id': producto.id, 'cantidad': 2, 'precio_compra': '150.0'} for producto in productos[:lineas]
+            ]
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.client.post(reverse(url), {**datos, 'items': json.dumps(items)})
+            self.assertEqual(response.status_code, 302)
+            self.assertLess(len(consultas), 15)
+            # Solo crece el número de INSERT de items (lotes limitados por los parámetros de SQLite)
+            return len([c for c in consultas if not c['sql'].startswith('INSERT INTO "pos_item')])
+
+        ingreso = {'proveedor': 'Proveedor Bloque'}
+        self.assertEqual(crear('pos:crear_ingreso', ingreso, 10), crear('pos:crear_ingreso', ingreso, 500))
+        ingreso = IngresoMercancia.objects.get(proveedor='Proveedor Bloque', total=500 * 300)
+        self.assertEqual(ingreso.items.count(), 500)
+        self.assertEqual(ingreso.items.filter(subtotal=300).count(), 500)
+
+        salida = {'tipo': 'merma', 'motivo': 'Bloque'}
+        self.assertEqual(crear('pos:crear_salida', salida, 10), crear('pos:crear_salida', salida, 500))
+        self.assertEqual(SalidaMercancia.objects.latest('id').items.count(), 500)
+
+        # Las líneas del mismo producto se suman para validar el stock y no se crea nada
+        salidas = SalidaMercancia.objects.count()
+        items = [{'producto_id': productos[0].id, 'cantidad': 6}, {'producto_id': productos[0].id, 'cantidad': 6}]
+        response = self.client.post(reverse('pos:crear_salida'), {**salida, 'items': json.dumps(items)})
+        self.assertRedirects(response, reverse('pos:crear_salida'), fetch_redirect_response=False)
+        self.assertEqual(SalidaMercancia.objects.count(), salidas)
+
+        # Un producto inexistente en la última línea tampoco deja un ingreso a medias
+        ingresos = IngresoMercancia.objects.count()
+        items = [{'producto_id': productos[0].id, 'cantidad': 1}, {'producto_id': 0, 'cantidad': 1}]
+        response = self.client.post(reverse('pos:crear_ingreso'), {'proveedor': 'X', 'items': json.dumps(items)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(IngresoMercancia.objects.count(), ingresos)
+
     def test_completar_salida_mercancia(self):
         """Test: Completar una salida de mercancía"""
         # Crear salida
@@ -205,7 +296,76 @@ class InventarioTestCase(TestCase):
         self.assertIsNotNone(movimiento)
         self.assertEqual(movimiento.tipo, 'salida')
         self.assertEqual(movimiento.cantidad, 5)
-    
+        self.assertEqual(movimiento.salida_id, salida.id)
+
+    def test_completar_salida_en_bloque(self):
+        """Test: Completar una salida es todo o nada y encadena los movimientos de líneas del mismo producto"""
+        salida = SalidaMercancia.objects.create(tipo='merma', motivo='Bloque', usuario=self.user)
+        ItemSalidaMercancia.objects.bulk_create([
+            ItemSalidaMercancia(salida=salida, producto=self.producto1, cantidad=30),
+            ItemSalidaMercancia(salida=salida, producto=self.producto2, cantidad=20),
+            ItemSalidaMercancia(salida=salida, producto=self.producto1, cantidad=40),
+        ])
+        # El stock bajó después de crear la salida: la última línea ya no alcanza (100 - 35 < 30 + 40)
+        Producto.objects.filter(pk=self.producto1.pk).update(stock=35)
+
+        response = self.client.post(reverse('pos:detalle_salida', args=[salida.id]), {'completar': '1'})
+        self.assertRedirects(response, reverse('pos:detalle_salida', args=[salida.id]), fetch_redirect_response=False)
+        salida.refresh_from_db()
+        self.producto2.refresh_from_db()
+        self.assertFalse(salida.completado)
+        self.assertEqual(self.producto2.stock, 50)
+        self.assertFalse(MovimientoStock.objects.filter(salida=salida).exists())
+
+        Producto.objects.filter(pk=self.producto1.pk).update(stock=100)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(reverse('pos:detalle_salida', args=[salida.id]), {'completar': '1'})
+        self.assertLess(len(consultas), 20)
+        salida.refresh_from_db()
+        self.producto1.refresh_from_db()
+        self.producto2.refresh_from_db()
+        self.assertTrue(salida.completado)
+        self.assertEqual((self.producto1.stock, self.producto2.stock), (30, 30))
+        self.assertEqual(
+            [(m.stock_anterior, m.stock_nuevo) for m in MovimientoStock.objects.filter(producto=self.producto1).order_by('id')],
+            [(100, 70), (70, 30)]
+        )
+
+        # Un segundo completado no vuelve a descontar
+        self.client.post(reverse('pos:detalle_salida', args=[salida.id]), {'completar': '1'})
+        self.producto1.refresh_from_db()
+        self.assertEqual(self.producto1.stock, 30)
+        self.assertEqual(MovimientoStock.objects.filter(salida=salida).count(), 3)
+
+    def test_completar_salida_con_stock_cambiante(self):
+        """Test: Si el descuento falla pero al releer el stock alcanza, se reintenta; si sigue fallando hay mensaje, no error 500"""
+        from pos import mercancia
+        from pos.movimientos_stock import StockNegativo
+
+        salida = SalidaMercancia.objects.create(tipo='merma', motivo='Concurrente', usuario=self.user)
+        ItemSalidaMercancia.objects.create(salida=salida, producto=self.producto1, cantidad=10)
+        incrementar = mercancia.incrementar_stock
+        llamadas = []
+
+        def _falla_una_vez(*args, **kwargs):
+            llamadas.append(1)
+            if len(llamadas) == 1:
+                raise StockNegativo()
+            return incrementar(*args, **kwargs)
+
+        with patch('pos.mercancia.incrementar_stock', side_effect=_falla_una_vez):
+            self.assertTrue(mercancia.completar_salida(salida, self.user))
+        self.producto1.refresh_from_db()
+        self.assertEqual(self.producto1.stock, 90)
+
+        otra = SalidaMercancia.objects.create(tipo='merma', motivo='Concurrente', usuario=self.user)
+        ItemSalidaMercancia.objects.create(salida=otra, producto=self.producto1, cantidad=10)
+        with patch('pos.mercancia.incrementar_stock', side_effect=StockNegativo()):
+            response = self.client.post(reverse('pos:detalle_salida', args=[otra.id]), {'completar': '1'})
+        self.assertRedirects(response, reverse('pos:detalle_salida', args=[otra.id]), fetch_redirect_response=False)
+        otra.refresh_from_db()
+        self.assertFalse(otra.completado)
+
     def test_salida_sin_stock_suficiente(self):
         """Test: Intentar salida con stock insuficiente"""
         # Crear salida con cantidad mayor al stock
@@ -230,3 +390,47 @@ class InventarioTestCase(TestCase):
         # Debe redirigir con error
         self.assertIn(response.status_code, [200, 302])
 
+    def test_eliminar_ingreso_borra_solo_sus_movimientos(self):
+        """Test: Al eliminar un ingreso se borran sus movimientos por la FK, no los de otro con prefijo similar"""
+        ingreso = IngresoMercancia.objects.create(proveedor='Proveedor Test', usuario=self.user)
+        otro = IngresoMercancia.objects.create(proveedor='Otro', usuario=self.user)
+        for documento in (ingreso, otro):
+            MovimientoStock.objects.create(
+                producto=self.producto1, tipo='ingreso', cantidad=1, stock_anterior=100, stock_nuevo=101,
+                motivo=f'Ingreso #{documento.id} - {documento.proveedor}', ingreso=documento,
+            )
+
+        ingreso.delete()
+
+        self.assertEqual(list(MovimientoStock.objects.values_list('ingreso_id', flat=True)), [otro.id])
+
+    def test_migracion_enlaza_movimientos_por_motivo(self):
+        """Test: La migración enlaza los movimientos existentes leyendo el motivo"""
+        migracion = import_module('pos.migrations.0032_movimientostock_documentos')
+        venta = Venta.objects.create(usuario=self.user, completada=True)
+        ingreso = IngresoMercancia.objects.create(proveedor='Proveedor Test', usuario=self.user)
+        salida = SalidaMercancia.objects.create(tipo='merma', motivo='Test', usuario=self.user)
+        motivos = {
+            f'Venta #{venta.id}': ('venta', venta.id),
+            f'Anulación venta #{venta.id}': ('venta', venta.id),
+            f'Ingreso #{ingreso.id} - Proveedor Test': ('ingreso', ingreso.id),
+            f'Salida #{salida.id} - Merma': ('salida', salida.id),
+            f'Ingreso #{ingreso.id + 100} - Eliminado': None,
+            'Ajuste manual': None,
+        }
+        for motivo in motivos:
+            MovimientoStock.objects.create(
+                producto=self.producto1, tipo='ajuste', cantidad=0, stock_anterior=100, stock_nuevo=100, motivo=motivo,
+            )
+
+        # Lotes pequeños para recorrer varios
+        with patch.object(migracion, 'TAMANO_LOTE', 2):
+            migracion.poblar_documentos_movimientos(apps, None)
+
+        for movimiento in MovimientoStock.objects.all():
+            enlaces = {
+                campo: getattr(movimiento, f'{campo}_id')
+                for campo in ('venta', 'ingreso', 'salida') if getattr(movimiento, f'{campo}_id')
+            }
+            esperado = motivos[movimiento.motivo]
+            self.assertEqual(enlaces, dict([esperado]) if esperado else {}, movimiento.motivo)
@@ -1,9 +1,16 @@
 """
 Tests para el módulo de Marketing
 """
+from datetime import datetime
+from unittest.mock import patch
+
 from django.test import TestCase, Client, signals
 from django.contrib.auth.models import User, Group
+from django.db import connection
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from pos.models import Venta, ItemVenta, Producto, Caja
 from django.test.client import store_rendered_templates
 
@@ -115,3 +122,110 @@ class MarketingTestCase(TestCase):
         response = self.client.get(reverse('pos:marketing'))
         self.assertIn(response.status_code, [200, 302])
 
+
+
+class RankingVendedoresTestCase(TestCase):
+    """Ranking de vendedores con una consulta agrupada y caché por rango"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin_test', password='testpass123', is_staff=True)
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user.groups.add(grupo_admin)
+        self.vendedores = [
+            User.objects.create_user(username=f'vendedor{i}', password='pass123', first_name='Vendedor', last_name=str(i))
+            for i in range(5)
+        ]
+        self.vendedores.append(User.objects.create_user(username='sin_nombre', password='pass123'))
+        self.caja = Caja.objects.create(numero=1, nombre='Caja Principal')
+        self.tz = timezone.get_current_timezone()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        for i, vendedor in enumerate(self.vendedores):
+            for j in range(i + 1):
+                self._venta(vendedor, 1000 * (i + 1))
+        self._venta(self.vendedores[0], 500, anulada=True)
+
+    def _venta(self, vendedor, total, dia=14, anulada=False):
+        return Venta.objects.create(
+            fecha=timezone.make_aware(datetime(2025, 12, dia, 10, 0, 0), self.tz),
+            usuario=self.user, vendedor=vendedor, metodo_pago='efectivo',
+            total=total, completada=True, anulada=anulada, caja=self.caja,
+        )
+
+    def _contexto(self, params=None):
+        def _fake_render(request, template_name, context):
+            response = HttpResponse('OK')
+            response._context = context
+            return response
+
+        with patch('pos.views.render', side_effect=_fake_render):
+            response = self.client.get(reverse('pos:marketing'), params or {
+                'fecha_desde': '2025-12-01', 'fecha_hasta': '2025-12-31',
+            })
+        return response._context
+
+    def test_ranking_una_consulta_sin_consultas_por_vendedor(self):
+        """Test: Totales por vendedor correctos y sin consultar cada usuario"""
+        with CaptureQueriesContext(connection) as ctx:
+            contexto = self._contexto({'fecha_desde': '2025-12-01', 'fecha_hasta': '2025-12-30'})
+        # Versión del rango + ranking agrupado (unido a auth_user)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'pos_ventadiaria' in q['sql']]), 2)
+
+        ranking = contexto['ranking_vendedores']
+        self.assertEqual(
+            [item['username'] for item in ranking],
+            ['sin_nombre', 'vendedor4', 'vendedor3', 'vendedor2', 'vendedor1', 'vendedor0']
+        )
+        self.assertEqual([item['posicion'] for item in ranking], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(ranking[0]['nombre_completo'], 'sin_nombre')
+        self.assertEqual(ranking[1]['nombre_completo'], 'Vendedor 4')
+        self.assertEqual(ranking[1]['total_ventas'], 25000)
+        self.assertEqual(ranking[1]['promedio_venta'], 5000)
+
+        ultimo = ranking[-1]
+        self.assertEqual((ultimo['total_ventas'], ultimo['cantidad_ventas']), (1000, 1))
+        self.assertEqual((ultimo['total_anuladas'], ultimo['cantidad_anuladas']), (500, 1))
+        self.assertEqual(ultimo['total_ventas_bruto'], 1500)
+
+        self.assertEqual(contexto['total_general'], sum(1000 * (i + 1) * (i + 1) for i in range(6)))
+        self.assertEqual(contexto['cantidad_general'], 21)
+        self.assertEqual(contexto['cantidad_anuladas_general'], 1)
+        self.assertEqual(contexto['top_vendedor']['username'], 'sin_nombre')
+
+        # Más vendedores no agregan consultas
+        for i in range(10):
+            self._venta(User.objects.create_user(username=f'extra{i}', password='pass123'), 100)
+        with CaptureQueriesContext(connection) as ctx_mas:
+            contexto = self._contexto({'fecha_desde': '2025-12-01', 'fecha_hasta': '2025-12-30'})
+        self.assertEqual(len(contexto['ranking_vendedores']), 16)
+        self.assertEqual(len(ctx_mas.captured_queries), len(ctx.captured_queries))
+
+    def test_cache_por_rango_se_invalida_con_ventas_del_rango(self):
+        """Test: El ranking se reutiliza hasta que cambia una venta dentro del rango"""
+        primero = self._contexto()
+
+        with CaptureQueriesContext(connection) as ctx:
+            cacheado = self._contexto()
+        self.assertIs(cacheado['ranking_vendedores'], primero['ranking_vendedores'])
+        self.assertEqual(len([q for q in ctx.captured_queries if 'pos_ventadiaria' in q['sql']]), 1)
+
+        # Venta fuera del rango: sigue en caché
+        Venta.objects.create(
+            fecha=timezone.make_aware(datetime(2026, 1, 5, 10, 0, 0), self.tz),
+            usuario=self.user, vendedor=self.vendedores[0], metodo_pago='efectivo',
+            total=99000, completada=True, caja=self.caja,
+        )
+        self.assertIs(self._contexto()['ranking_vendedores'], primero['ranking_vendedores'])
+
+        # Venta dentro del rango: se recalcula
+        venta = self._venta(self.vendedores[0], 99000)
+        recalculado = self._contexto()
+        self.assertEqual(recalculado['ranking_vendedores'][0]['username'], 'vendedor0')
+        self.assertEqual(recalculado['ranking_vendedores'][0]['total_ventas'], 100000)
+
+        # Reasignar el vendedor no cambia los totales del rango pero sí el ranking
+        venta.vendedor = self.vendedores[1]
+        venta.save()
+        reasignado = self._contexto()
+        self.assertEqual(reasignado['ranking_vendedores'][0]['username'], 'vendedor1')
@@ -0,0 +1,184 @@
+"""
+Tests para el pronóstico de agotamiento de stock (días de cobertura)
+"""
+import csv
+import io
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group, User
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings, signals
+from django.urls import reverse
+from django.utils import timezone
+
+from pos.models import ItemVenta, Producto, Venta, VentaProductoDiaria
+from pos.pronostico_stock import (
+    COLUMNAS_PRONOSTICO, calcular_velocidades, invalidar_cache_pronostico, pesos_suavizado, pronostico_stock,
+    velocidades_venta,
+)
+
+# Evitar problemas al copiar contextos instrumentados en tests
+signals.template_rendered.receivers = []
+
+
+@override_settings(PRONOSTICO_STOCK_VENTANA_DIAS=7, PRONOSTICO_STOCK_ALFA=None, PRONOSTICO_STOCK_DIAS_ENTREGA=5)
+class PronosticoStockTestCase(TestCase):
+    """Velocidad de venta diaria, días de cobertura y productos en riesgo"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin_test', password='testpass123', is_staff=True)
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user.groups.add(grupo_admin)
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.hoy = timezone.localdate()
+        invalidar_cache_pronostico()
+
+        # Unidades vendidas en los últimos 7 días completos (del más antiguo a ayer) y stock actual
+        self.ventas = {
+            'RAP': ([4, 6, 5, 5, 3, 7, 5], 10),   # 5/día -> 2 días
+            'MED': ([1, 2, 0, 1, 3, 0, 0], 12),   # 1/día -> 12 días
+            'LEN': ([0, 0, 0, 7, 0, 0, 0], 3),    # 1/día -> 3 días
+            'AGO': ([2, 2, 2, 2, 2, 2, 2], 0),    # sin stock -> 0 días
+            'SIN': ([], 50),                      # sin ventas -> sin límite
+        }
+        self.productos = {}
+        for codigo, (unidades, stock) in self.ventas.items():
+            producto = Producto.objects.create(codigo=codigo, nombre=f'Producto {codigo}', precio=1000, stock=stock)
+            self.productos[codigo] = producto
+            VentaProductoDiaria.objects.bulk_create([
+                VentaProductoDiaria(
+                    fecha=self.hoy - timedelta(days=7 - i), producto=producto,
+                    cantidad=cantidad, valor=cantidad * 1000, cantidad_ventas=1,
+                )
+                for i, cantidad in enumerate(unidades) if cantidad
+            ])
+        # Ventas de hoy (día incompleto) y de antes de la ventana no cuentan
+        VentaProductoDiaria.objects.create(fecha=self.hoy, producto=self.productos['MED'], cantidad=100, valor=1)
+        VentaProductoDiaria.objects.create(
+            fecha=self.hoy - timedelta(days=8), producto=self.productos['SIN'], cantidad=100, valor=1
+        )
+        # Inactivo: fuera del pronóstico
+        Producto.objects.create(codigo='OFF', nombre='Inactivo', precio=1000, stock=0, activo=False)
+
+    def _por_codigo(self, pronostico):
+        codigos = dict(Producto.objects.values_list('id', 'codigo'))
+        return {
+            codigos[producto_id]: (velocidad, dias, riesgo)
+            for producto_id, velocidad, dias, riesgo in zip(
+                pronostico['ids'].tolist(), pronostico['velocidad'].tolist(),
+                pronostico['dias_cobertura'].tolist(), pronostico['en_riesgo'].tolist(),
+            )
+        }
+
+    def test_suavizado_coincide_con_recurrencia(self):
+        """Test: Los pesos reproducen s_t = alfa*x_t + (1-alfa)*s_(t-1) y el promedio simple sin alfa"""
+        for alfa in (0.2, 0.5, 1.0):
+            serie = [4, 6, 5, 5, 3, 7, 5]
+            suavizado = serie[0]
+            for valor in serie[1:]:
+                suavizado = alfa * valor + (1 - alfa) * suavizado
+            self.assertAlmostEqual(float(pesos_suavizado(7, alfa) @ serie), suavizado)
+            self.assertAlmostEqual(float(pesos_suavizado(7, alfa).sum()), 1)
+        self.assertAlmostEqual(float(pesos_suavizado(7, None) @ [4, 6, 5, 5, 3, 7, 5]), 5)
+
+        ids, velocidades = calcular_velocidades(7, 0.5, self.hoy)
+        velocidad_med = velocidades[ids.tolist().index(self.productos['MED'].id)]
+        suavizado = 1
+        for valor in [2, 0, 1, 3, 0, 0]:
+            suavizado = 0.5 * valor + 0.5 * suavizado
+        self.assertAlmostEqual(float(velocidad_med), suavizado)
+
+    def test_dias_de_cobertura_y_riesgo(self):
+        """Test: Cobertura = stock / venta diaria; en riesgo si se agota antes de la entrega"""
+        resultado = self._por_codigo(pronostico_stock())
+        self.assertNotIn('OFF', resultado)
+        self.assertEqual(resultado['RAP'], (5, 2, True))
+        self.assertEqual(resultado['MED'], (1, 12, False))
+        self.assertEqual(resultado['LEN'], (1, 3, True))
+        self.assertEqual(resultado['AGO'], (2, 0, True))
+        self.assertEqual(resultado['SIN'], (0, float('inf'), False))
+
+        # Más días hasta la entrega: también MED queda en riesgo
+        self.assertTrue(self._por_codigo(pronostico_stock(dias_entrega=15))['MED'][2])
+
+    def test_cache_se_invalida_con_ventas_nuevas(self):
+        """Test: Las velocidades se reutilizan hasta que una venta actualiza VentaProductoDiaria"""
+        primera = velocidades_venta(7, None)
+        self.assertIs(velocidades_venta(7, None), primera)
+
+        # Venta de ayer: la señal recalcula desde ItemVenta la fila diaria existente de RAP (5 -> 12)
+        ayer = self.hoy - timedelta(days=1)
+        venta = Venta.objects.create(
+            fecha=timezone.make_aware(datetime.combine(ayer, datetime.min.time().replace(hour=12))),
+            completada=True, metodo_pago='efectivo', usuario=self.user,
+        )
+        ItemVenta.objects.create(
+            venta=venta, producto=self.productos['RAP'], cantidad=12, precio_unitario=1000, subtotal=12000,
+        )
+        self.assertEqual(self._por_codigo(pronostico_stock())['RAP'][0], 6)
+
+        # Filas escritas por otro proceso (sin señal): las detecta el último id
+        VentaProductoDiaria.objects.create(fecha=ayer, producto=self.productos['SIN'], cantidad=14, valor=1)
+        self.assertEqual(self._por_codigo(pronostico_stock())['SIN'][0], 2)
+
+        # Las ventas de hoy no entran en las velocidades: no invalidan la caché
+        calculadas = velocidades_venta(7, None)
+        venta_hoy = Venta.objects.create(completada=True, metodo_pago='efectivo', usuario=self.user)
+        ItemVenta.objects.create(
+            venta=venta_hoy, producto=self.productos['LEN'], cantidad=1, precio_unitario=1000, subtotal=1000,
+        )
+        VentaProductoDiaria.objects.create(fecha=self.hoy, producto=self.productos['AGO'], cantidad=1, valor=1)
+        self.assertIs(velocidades_venta(7, None), calculadas)
+
+    def test_dashboard_muestra_productos_en_riesgo(self):
+        """Test: El dashboard lista los productos en riesgo de menor a mayor cobertura"""
+        captured = {}
+
+        def _fake_render(request, template_name, context=None, *args, **kwargs):
+            if template_name == 'pos/home.html':
+                captured['context'] = context or {}
+            return HttpResponse('OK')
+
+        with patch('pos.views.render', side_effect=_fake_render):
+            self.client.get(reverse('pos:home'))
+        context = captured['context']
+        self.assertEqual(context['productos_bajo_stock'], 3)
+        self.assertEqual([fila['codigo'] for fila in context['productos_stock_bajo']], ['AGO', 'RAP', 'LEN'])
+        self.assertEqual(context['productos_stock_bajo'][1]['fecha_agotamiento'], self.hoy + timedelta(days=2))
+
+        self.assertEqual(self.client.get(reverse('pos:home')).status_code, 200)
+
+    def test_reporte_ordenable_y_csv(self):
+        """Test: El reporte ordena por columna, filtra en riesgo y exporta a CSV"""
+        captured = {}
+
+        def _fake_render(request, template_name, context=None, *args, **kwargs):
+            captured['context'] = context or {}
+            return HttpResponse('OK')
+
+        with patch('pos.views.render', side_effect=_fake_render):
+            self.client.get(reverse('pos:reportes'), {'tipo': 'cobertura'})
+            self.assertEqual(
+                [fila['codigo'] for fila in captured['context']['pronostico_filas']],
+                ['AGO', 'RAP', 'LEN', 'MED', 'SIN'],
+            )
+            self.assertEqual(captured['context']['total_en_riesgo'], 3)
+
+            self.client.get(reverse('pos:reportes'), {'tipo': 'cobertura', 'orden': 'velocidad', 'dir': 'desc'})
+            self.assertEqual(
+                [fila['codigo'] for fila in captured['context']['pronostico_filas']],
+                ['RAP', 'AGO', 'MED', 'LEN', 'SIN'],
+            )
+
+        response = self.client.get(reverse('pos:reportes'), {
+            'tipo': 'cobertura', 'solo_riesgo': '1', 'orden': 'stock', 'export': 'cobertura',
+        })
+        self.assertEqual(response.status_code, 200)
+        filas = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(filas[0], COLUMNAS_PRONOSTICO)
+        self.assertEqual([fila[0] for fila in filas[1:]], ['AGO', 'LEN', 'RAP'])
+
+        # La pantalla real se renderiza sin errores
+        self.assertEqual(self.client.get(reverse('pos:reportes'), {'tipo': 'cobertura', 'alfa': '0.3'}).status_code, 200)
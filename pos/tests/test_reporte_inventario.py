@@ -0,0 +1,200 @@
+"""
+Tests para el reporte de inventario (reportes?tipo=inventario)
+"""
+import csv
+import io
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings, signals
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from pos import reporte_inventario
+from pos.conteos import actualizar_conteo_actual
+from pos.models import ConteoFisico, MovimientoStock, Producto
+from pos.reporte_inventario import invalidar_cache_inventario
+
+# Evitar problemas al copiar contextos instrumentados en tests
+signals.template_rendered.receivers = []
+
+
+class ReporteInventarioTestCase(TestCase):
+    """Tests del resumen agrupado por código+atributo del reporte de inventario"""
+
+    def setUp(self):
+        self.user_admin = User.objects.create_user(
+            username='admin_test',
+            password='testpass123',
+            is_staff=True,
+        )
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user_admin.groups.add(grupo_admin)
+
+        self.client = Client()
+        self.client.force_login(self.user_admin)
+        invalidar_cache_inventario()
+
+    def _crear_productos(self, cantidad, prefijo='INV'):
+        """Crea productos con movimientos de ingreso, salida y ajuste"""
+        for i in range(cantidad):
+            producto = Producto.objects.create(
+                codigo=f'{prefijo}{i:04d}',
+                nombre=f'Producto {i}',
+                atributo='Rojo' if i % 2 else None,
+                precio=1000,
+                stock=20,
+                activo=True,
+            )
+            for tipo, cantidad_mov in (('ingreso', 10), ('salida', 3), ('ajuste', -1)):
+                MovimientoStock.objects.create(
+                    producto=producto,
+                    tipo=tipo,
+                    cantidad=cantidad_mov,
+                    stock_anterior=0,
+                    stock_nuevo=0,
+                    motivo='Test',
+                    usuario=self.user_admin,
+                )
+
+    def _contexto_inventario(self, params=None):
+        """Ejecuta el reporte de inventario y devuelve el contexto enviado al template"""
+        captured = {}
+
+        def _fake_render(request, template_name, context=None, *args, **kwargs):
+            captured['context'] = context or {}
+            return HttpResponse('OK')
+
+        datos = {'tipo': 'inventario'}
+        datos.update(params or {})
+        with patch('pos.views.render', side_effect=_fake_render):
+            response = self.client.get(reverse('pos:reportes'), datos)
+        self.assertEqual(response.status_code, 200)
+        return captured['context']
+
+    def test_resumen_stock_inicial_con_historico(self):
+        """Test: El stock inicial usa los totales históricos agrupados por código+atributo"""
+        self._crear_productos(2)
+        # Producto con atributo con espacios al final: debe agruparse con el normalizado
+        producto = Producto.objects.get(codigo='INV0001')
+        Producto.objects.filter(id=producto.id).update(atributo='Rojo ')
+
+        context = self._contexto_inventario()
+        resumen = {(item['codigo'], item['atributo'].strip()): item for item in context['resumen_productos']}
+
+        item = resumen[('INV0000', '-')]
+        self.assertEqual(item['total_entradas'], 10)
+        self.assertEqual(item['total_salidas'], 3)
+        self.assertEqual(item['ajustes'], -1)
+        # Stock inicial = stock actual - (entradas - salidas + ajustes)
+        self.assertEqual(item['stock_inicial'], 20 - (10 - 3 - 1))
+
+        item_rojo = resumen[('INV0001', 'Rojo')]
+        self.assertEqual(item_rojo['stock_inicial'], 20 - (10 - 3 - 1))
+
+        comparativa = {c['codigo']: c for c in context['comparativa_por_producto']}
+        self.assertEqual(comparativa['INV0000']['ingresos_cantidad'], 10)
+        self.assertEqual(comparativa['INV0000']['salidas_cantidad'], 3)
+        self.assertEqual(comparativa['INV0000']['balance_neto'], 7)
+
+    def test_sku_key_cruza_producto_y_conteo(self):
+        """Test: sku_key se mantiene al guardar y el reporte cruza producto y conteo por esa clave"""
+        producto = Producto.objects.create(codigo='SKU1', nombre='Sku', atributo='-', precio=1000, stock=5)
+        self.assertEqual(producto.sku_key, 'SKU1|')
+        producto.atributo = ' Azul '
+        producto.save(update_fields=['atributo'])
+        producto.refresh_from_db()
+        self.assertEqual(producto.sku_key, 'SKU1|Azul')
+
+        MovimientoStock.objects.create(producto=producto, tipo='ingreso', cantidad=5, stock_anterior=0, stock_nuevo=5)
+        conteo = ConteoFisico.objects.create(codigo='SKU1', atributo='Azul', cantidad_contada=4)
+        self.assertEqual(conteo.sku_key, producto.sku_key)
+        actualizar_conteo_actual(conteo)
+
+        context = self._contexto_inventario()
+        item = next(item for item in context['resumen_productos'] if item['codigo'] == 'SKU1')
+        self.assertEqual(
+            (item['atributo'], item['stock_actual'], item['cantidad_contada'], item['diferencia']),
+            ('Azul', 5, 4, -1)
+        )
+
+        # update() no pasa por save(): el comando de reconstrucción corrige la clave
+        Producto.objects.filter(id=producto.id).update(atributo='Verde')
+        call_command('reconstruir_sku_keys', stdout=io.StringIO())
+        producto.refresh_from_db()
+        self.assertEqual(producto.sku_key, 'SKU1|Verde')
+
+    def test_resumen_consultas_por_producto_constantes(self):
+        """Test: La cantidad de consultas del reporte no crece con la cantidad de productos"""
+        def _consultas_por_producto():
+            with CaptureQueriesContext(connection) as consultas:
+                self._contexto_inventario()
+            return len(consultas)
+
+        self._crear_productos(3, prefijo='A')
+        pocas = _consultas_por_producto()
+        self._crear_productos(15, prefijo='B')
+        for producto in Producto.objects.filter(codigo__startswith='B'):
+            conteo = ConteoFisico.objects.create(
+                codigo=producto.codigo,
+                atributo=producto.atributo,
+                cantidad_contada=18,
+            )
+            actualizar_conteo_actual(conteo)
+        muchas = _consultas_por_producto()
+        self.assertEqual(pocas, muchas)
+
+    def test_dataset_compartido_entre_pantalla_y_exportaciones(self):
+        """Test: Pantalla, CSV y XLSX del mismo filtro usan un único cálculo del dataset"""
+        self._crear_productos(4)
+        construir_original = reporte_inventario.construir_dataset_inventario
+
+        with patch.object(
+            reporte_inventario, 'construir_dataset_inventario', side_effect=construir_original
+        ) as construir:
+            context = self._contexto_inventario()
+            respuesta_csv = self.client.get(reverse('pos:reportes'), {
+                'tipo': 'inventario', 'export': 'resumen_inventario', 'format': 'csv',
+            })
+            respuesta_xlsx = self.client.get(reverse('pos:reportes'), {
+                'tipo': 'inventario', 'export': 'resumen_inventario', 'format': 'xlsx',
+            })
+        self.assertEqual(construir.call_count, 1)
+
+        self.assertIn('text/csv', respuesta_csv['Content-Type'])
+        self.assertIn('spreadsheetml', respuesta_xlsx['Content-Type'])
+        filas = list(csv.reader(io.StringIO(respuesta_csv.getvalue().decode('utf-8'))))
+        self.assertEqual(filas[0], reporte_inventario.COLUMNAS_RESUMEN_INVENTARIO)
+        self.assertEqual(
+            [fila[0] for fila in filas[1:]],
+            [item['codigo'] for item in context['resumen_productos']]
+        )
+
+    def test_dataset_se_invalida_con_nuevos_movimientos(self):
+        """Test: Un movimiento de stock nuevo invalida el dataset en caché"""
+        self._crear_productos(1)
+        context = self._contexto_inventario()
+        self.assertEqual(context['resumen_productos'][0]['total_entradas'], 10)
+
+        MovimientoStock.objects.create(
+            producto=Producto.objects.get(codigo='INV0000'),
+            tipo='ingreso',
+            cantidad=5,
+            stock_anterior=20,
+            stock_nuevo=25,
+            motivo='Test',
+            usuario=self.user_admin,
+        )
+        context = self._contexto_inventario()
+        self.assertEqual(context['resumen_productos'][0]['total_entradas'], 15)
+
+    @override_settings(REPORTE_INVENTARIO_CACHE_MAX=2)
+    def test_dataset_cache_acotada(self):
+        """Test: La caché conserva como máximo REPORTE_INVENTARIO_CACHE_MAX datasets"""
+        self._crear_productos(1)
+        for dia in ('2025-01-01', '2025-01-02', '2025-01-03'):
+            self._contexto_inventario({'fecha_desde': dia})
+        self.assertEqual(len(reporte_inventario._cache_datasets), 2)
@@ -238,7 +238,7 @@ class ReportesTestCase(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertIn('text/csv', resp.get('Content-Type', ''))
 
-        content = resp.content.decode('utf-8')
+        content = resp.getvalue().decode('utf-8')
         reader = csv.reader(io.StringIO(content))
         rows = list(reader)
 
@@ -269,7 +269,7 @@ class ReportesTestCase(TestCase):
             resp.get('Content-Type', ''),
         )
 
-        wb = load_workbook(filename=io.BytesIO(resp.content))
+        wb = load_workbook(filename=io.BytesIO(resp.getvalue()))
         self.assertIn('Ventas', wb.sheetnames)
         self.assertIn('Items', wb.sheetnames)
 
@@ -293,7 +293,7 @@ class ReportesTestCase(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertIn('text/csv', resp.get('Content-Type', ''))
 
-        content = resp.content.decode('utf-8')
+        content = resp.getvalue().decode('utf-8')
         reader = csv.reader(io.StringIO(content))
         rows = list(reader)
         self.assertGreaterEqual(len(rows), 2)
@@ -309,3 +309,42 @@ class ReportesTestCase(TestCase):
         self.assertEqual(int(first[5]), 5000)   # saldo después
 
 
+
+    def test_movimientos_caja_generador_mezclado_y_paginado(self):
+        """La línea de movimientos se genera perezosamente, en orden y con saldo continuo entre páginas."""
+        import inspect
+        from django.core.paginator import Paginator
+        from pos.reporte_caja import MovimientosCajaRango, movimientos_caja, rango_caja
+
+        # Gasto a la misma hora que v1: la venta va primero
+        GastoCaja.objects.create(
+            tipo='gasto', monto=200, descripcion='Gasto misma hora',
+            fecha=self.v1.fecha, usuario=self.user_admin, caja_usuario=self.caja_usuario,
+        )
+        inicio_dt, fin_dt = rango_caja(self.fecha_desde, self.fecha_hasta)
+
+        generador = movimientos_caja(inicio_dt, fin_dt)
+        self.assertTrue(inspect.isgenerator(generador))
+        filas = list(generador)
+        self.assertEqual(
+            [(m['tipo'], m['delta']) for m in filas],
+            [
+                ('Apertura', 5000), ('Venta', 10000), ('Gasto', -200), ('Gasto', -3000), ('Ingreso', 1000),
+                ('Venta', 20000), ('Venta Anulada', -5000), ('Retiro', -7000),
+            ]
+        )
+        saldo = 0
+        for m in filas:
+            self.assertEqual(m['saldo_antes'], saldo)
+            saldo += m['delta']
+            self.assertEqual(m['saldo_despues'], saldo)
+
+        paginator = Paginator(MovimientosCajaRango(inicio_dt, fin_dt), 3)
+        self.assertEqual(paginator.count, 8)
+        self.assertEqual(paginator.num_pages, 3)
+        paginas = []
+        for numero in paginator.page_range:
+            paginas.extend(
+                (m['clave'], m['saldo_antes'], m['saldo_despues']) for m in paginator.page(numero)
+            )
+        self.assertEqual(paginas, [(m['clave'], m['saldo_antes'], m['saldo_despues']) for m in filas])
@@ -0,0 +1,157 @@
+"""
+Tests para las fotos diarias de stock (StockDiario) y stock_en()
+"""
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, TestCase, signals
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from pos.models import MovimientoStock, Producto, StockDiario
+from pos.reporte_inventario import invalidar_cache_inventario
+from pos.stock_diario import cierre_dia, generar_stock_diario, stock_en
+
+# Evitar problemas al copiar contextos instrumentados en tests
+signals.template_rendered.receivers = []
+
+
+class StockDiarioTestCase(TestCase):
+    """El stock en un momento (foto + movimientos) coincide con recorrer todo el historial"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin_test', password='testpass123', is_staff=True)
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user.groups.add(grupo_admin)
+        self.tz = timezone.get_current_timezone()
+        self.hoy = timezone.localdate()
+        invalidar_cache_inventario()
+
+        self.producto = Producto.objects.create(codigo='SD001', nombre='Producto A', precio=1000, stock=0, activo=True)
+        self.otro = Producto.objects.create(codigo='SD002', nombre='Producto B', precio=1000, stock=0, activo=True)
+        # (días atrás, hora local, producto, tipo, cantidad)
+        for dias, hora, producto, tipo, cantidad in (
+            (10, 9, self.producto, 'ingreso', 50),
+            (8, 23, self.producto, 'salida', 5),
+            (8, 10, self.otro, 'ingreso', 30),
+            (5, 0, self.producto, 'ajuste', -2),
+            (3, 15, self.otro, 'salida', 4),
+            (1, 12, self.producto, 'salida', 7),
+            (0, 0, self.producto, 'ingreso', 10),
+        ):
+            self._movimiento(dias, hora, producto, tipo, cantidad)
+        Producto.objects.filter(id=self.producto.id).update(stock=50 - 5 - 2 - 7 + 10)
+        Producto.objects.filter(id=self.otro.id).update(stock=30 - 4)
+
+    def _momento(self, dias, hora):
+        dia = self.hoy - timedelta(days=dias)
+        return timezone.make_aware(datetime(dia.year, dia.month, dia.day, hora, 30), self.tz)
+
+    def _movimiento(self, dias, hora, producto, tipo, cantidad):
+        return MovimientoStock.objects.create(
+            producto=producto, tipo=tipo, cantidad=cantidad, stock_anterior=0, stock_nuevo=0,
+            fecha=self._momento(dias, hora), usuario=self.user,
+        )
+
+    def _stock_historial(self, momento):
+        """Stock actual - neto de todos los movimientos desde el momento (cálculo sin fotos)"""
+        stock = {}
+        for producto in Producto.objects.all():
+            neto = 0
+            for mov in MovimientoStock.objects.filter(producto=producto, fecha__gte=momento):
+                neto += {'ingreso': mov.cantidad, 'salida': -mov.cantidad, 'ajuste': mov.cantidad}[mov.tipo]
+            stock[producto.id] = producto.stock - neto
+        return stock
+
+    def _momentos(self):
+        return [self._momento(dias, hora) for dias in range(12) for hora in (0, 12, 23)]
+
+    def test_stock_en_coincide_con_historial(self):
+        """Test: Con fotos parciales, completas o sin fotos el resultado es el mismo"""
+        for momento in self._momentos():
+            self.assertEqual(stock_en(momento), self._stock_historial(momento), momento)
+
+        # Fotos de solo algunos días: se usa la anterior o, si no hay, la posterior
+        generar_stock_diario(self.hoy - timedelta(days=6), self.hoy - timedelta(days=4))
+        for momento in self._momentos():
+            self.assertEqual(stock_en(momento), self._stock_historial(momento), momento)
+            self.assertEqual(
+                stock_en(momento, [self.otro.id]), {self.otro.id: self._stock_historial(momento)[self.otro.id]}
+            )
+
+        generar_stock_diario(self.hoy - timedelta(days=12))
+        self.assertFalse(StockDiario.objects.filter(fecha__gte=self.hoy).exists())
+        for momento in self._momentos():
+            self.assertEqual(stock_en(momento), self._stock_historial(momento), momento)
+
+    def test_stock_en_solo_lee_movimientos_posteriores_a_la_foto(self):
+        """Test: La consulta de movimientos empieza en el cierre de la foto más reciente"""
+        generar_stock_diario(self.hoy - timedelta(days=12), self.hoy - timedelta(days=1))
+        momento = self._momento(0, 12)
+        with CaptureQueriesContext(connection) as ctx:
+            stock = stock_en(momento)
+        self.assertEqual(stock, {self.producto.id: 46, self.otro.id: 26})
+        consultas = [q['sql'] for q in ctx.captured_queries if 'pos_movimientostock' in q['sql']]
+        self.assertEqual(len(consultas), 1)
+        cierre = cierre_dia(self.hoy - timedelta(days=1)).astimezone(timezone.utc)
+        self.assertIn(cierre.strftime('%Y-%m-%d %H:%M:%S'), consultas[0])
+
+    def test_movimiento_con_fecha_pasada_invalida_fotos(self):
+        """Test: Un movimiento retroactivo borra las fotos de su producto desde ese día"""
+        generar_stock_diario(self.hoy - timedelta(days=12))
+        dias_fotos = StockDiario.objects.filter(producto=self.producto).count()
+
+        self._movimiento(4, 10, self.producto, 'ingreso', 3)
+        Producto.objects.filter(id=self.producto.id).update(stock=49)
+        self.assertEqual(
+            StockDiario.objects.filter(producto=self.producto).count(), dias_fotos - 4
+        )
+        self.assertEqual(StockDiario.objects.filter(producto=self.otro).count(), dias_fotos)
+        for momento in self._momentos():
+            self.assertEqual(stock_en(momento), self._stock_historial(momento), momento)
+
+    def test_comando_genera_historial(self):
+        """Test: --historial genera fotos desde el día anterior al primer movimiento hasta ayer"""
+        salida = StringIO()
+        call_command('generar_stock_diario', '--historial', stdout=salida)
+        self.assertIn('[OK] 22 fotos de stock registradas', salida.getvalue())
+        primera = StockDiario.objects.order_by('fecha').first()
+        self.assertEqual(primera.fecha, self.hoy - timedelta(days=11))
+        self.assertEqual(primera.stock, 0)
+        self.assertEqual(
+            StockDiario.objects.get(producto=self.producto, fecha=self.hoy - timedelta(days=1)).stock, 36
+        )
+
+        # Sin argumentos solo se reemplaza la foto de ayer
+        call_command('generar_stock_diario', stdout=StringIO())
+        self.assertEqual(StockDiario.objects.count(), 22)
+
+    def test_reporte_inventario_stock_inicial_y_final_del_periodo(self):
+        """Test: El reporte usa el stock al inicio de fecha_desde y al cierre de fecha_hasta"""
+        generar_stock_diario(self.hoy - timedelta(days=12))
+        client = Client()
+        client.force_login(self.user)
+        captured = {}
+
+        def _fake_render(request, template_name, context=None, *args, **kwargs):
+            captured['context'] = context or {}
+            return HttpResponse('OK')
+
+        desde, hasta = self.hoy - timedelta(days=8), self.hoy - timedelta(days=3)
+        with patch('pos.views.render', side_effect=_fake_render):
+            client.get(reverse('pos:reportes'), {
+                'tipo': 'inventario', 'fecha_desde': desde.isoformat(), 'fecha_hasta': hasta.isoformat(),
+            })
+        resumen = {item['codigo']: item for item in captured['context']['resumen_productos']}
+        self.assertEqual(resumen['SD001']['stock_inicial'], 50)
+        self.assertEqual(resumen['SD001']['stock_final'], 43)
+        self.assertEqual(resumen['SD001']['stock_actual'], 46)
+        self.assertEqual(resumen['SD002']['stock_inicial'], 0)
+        self.assertEqual(resumen['SD002']['stock_final'], 26)
+        self.assertEqual(captured['context']['analisis_datos']['total_stock_final'], 69)
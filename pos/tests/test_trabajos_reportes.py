@@ -0,0 +1,184 @@
+"""
+Tests para los trabajos de reportes en segundo plano
+"""
+import csv
+import io
+import json
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group, User
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings, signals
+from django.urls import reverse
+from django.utils import timezone
+
+from openpyxl import load_workbook
+
+from pos.models import Caja, ItemVenta, MovimientoStock, Producto, TrabajoReporte, Venta
+from pos.trabajos_reportes import solicitar_trabajo
+
+# Evitar problemas al copiar contextos instrumentados en tests
+signals.template_rendered.receivers = []
+
+
+class TrabajosReportesTestCase(TestCase):
+    """Los trabajos calculan el reporte, guardan sus archivos y se reutilizan mientras no cambien los datos"""
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        # En tests el trabajo se calcula en la misma petición: el hilo no vería la transacción del test
+        ajustes = override_settings(REPORTES_TRABAJOS_DIR=Path(self.directorio), REPORTES_TRABAJOS_SEGUNDO_PLANO=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.user = User.objects.create_user(username='admin_test', password='testpass123', is_staff=True)
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user.groups.add(grupo_admin)
+        self.caja = Caja.objects.create(numero=1, nombre='Caja Principal', activa=True)
+        self.producto = Producto.objects.create(
+            codigo='PROD_A', nombre='Producto A', precio=1000, stock=100, activo=True
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.tz = timezone.get_current_timezone()
+
+        self._venta(dia=14, total=3000, cantidad=3)
+
+    def _venta(self, dia, total, cantidad):
+        venta = Venta.objects.create(
+            fecha=timezone.make_aware(datetime(2025, 12, dia, 10, 0, 0), self.tz),
+            total=total,
+            completada=True,
+            metodo_pago='efectivo',
+            usuario=self.user,
+            vendedor=self.user,
+            caja=self.caja,
+        )
+        ItemVenta.objects.create(
+            venta=venta, producto=self.producto, cantidad=cantidad,
+            precio_unitario=1000, subtotal=total,
+        )
+        return venta
+
+    def _datos_caja(self):
+        return {'fecha_desde': '2025-12-14', 'fecha_hasta': '2025-12-14'}
+
+    def test_trabajo_caja_guarda_archivos_y_se_reutiliza(self):
+        """Test: El trabajo de caja termina con sus archivos y la misma solicitud lo reutiliza"""
+        trabajo, reutilizado = solicitar_trabajo('caja', self._datos_caja(), self.user)
+        self.assertFalse(reutilizado)
+        self.assertEqual(trabajo.estado, 'completado')
+        self.assertEqual(trabajo.progreso, 100)
+        self.assertEqual(trabajo.parametros['export'], 'movimientos_caja')
+
+        directorio = Path(self.directorio) / str(trabajo.id)
+        for nombre in ('parametros.json', 'contexto.json', 'reporte.csv', 'reporte.xlsx'):
+            self.assertTrue((directorio / nombre).is_file(), nombre)
+        with open(directorio / 'parametros.json', encoding='utf-8') as archivo:
+            self.assertEqual(json.load(archivo)['version_datos'], trabajo.version_datos)
+
+        mismo, reutilizado = solicitar_trabajo('caja', self._datos_caja(), self.user)
+        self.assertTrue(reutilizado)
+        self.assertEqual(mismo.id, trabajo.id)
+
+        # Una venta fuera del rango no cambia la versión de datos del reporte
+        self._venta(dia=20, total=1000, cantidad=1)
+        mismo, reutilizado = solicitar_trabajo('caja', self._datos_caja(), self.user)
+        self.assertTrue(reutilizado)
+
+        # Una venta dentro del rango sí
+        self._venta(dia=14, total=2000, cantidad=2)
+        nuevo, reutilizado = solicitar_trabajo('caja', self._datos_caja(), self.user)
+        self.assertFalse(reutilizado)
+        self.assertNotEqual(nuevo.id, trabajo.id)
+        self.assertNotEqual(nuevo.version_datos, trabajo.version_datos)
+
+    def test_trabajo_inventario_sin_archivos_se_recalcula(self):
+        """Test: Si los archivos del trabajo se borraron, la solicitud genera uno nuevo"""
+        MovimientoStock.objects.create(
+            producto=self.producto, tipo='ingreso', cantidad=100, stock_anterior=0, stock_nuevo=100,
+            usuario=self.user,
+        )
+        trabajo, _ = solicitar_trabajo('inventario', {'producto': str(self.producto.id)}, self.user)
+        self.assertEqual(trabajo.estado, 'completado')
+
+        shutil.rmtree(Path(self.directorio) / str(trabajo.id))
+        nuevo, reutilizado = solicitar_trabajo('inventario', {'producto': str(self.producto.id)}, self.user)
+        self.assertFalse(reutilizado)
+        self.assertNotEqual(nuevo.id, trabajo.id)
+
+        with open(Path(self.directorio) / str(nuevo.id) / 'reporte.csv', encoding='utf-8-sig') as archivo:
+            filas = list(csv.reader(archivo))
+        self.assertEqual(len(filas), 2)
+        self.assertIn('PROD_A', filas[1])
+
+    def test_trabajo_pendiente_o_abandonado_se_vuelve_a_procesar(self):
+        """Test: Un trabajo que quedó pendiente o colgado en proceso se procesa al pedirlo de nuevo"""
+        with override_settings(REPORTES_TRABAJOS_SEGUNDO_PLANO=True), patch('pos.trabajos_reportes.encolar_trabajo'):
+            trabajo, _ = solicitar_trabajo('caja', self._datos_caja(), self.user)
+        # El servidor se reinició antes de que el hilo lo tomara
+        self.assertEqual(trabajo.estado, 'pendiente')
+
+        mismo, reutilizado = solicitar_trabajo('caja', self._datos_caja(), self.user)
+        self.assertTrue(reutilizado)
+        self.assertEqual(mismo.id, trabajo.id)
+        self.assertEqual(mismo.estado, 'completado')
+
+        # En proceso reciente: se espera; en proceso antiguo: se da por abandonado
+        shutil.rmtree(Path(self.directorio) / str(trabajo.id))
+        TrabajoReporte.objects.filter(pk=trabajo.id).update(estado='en_proceso', fecha_inicio=timezone.now())
+        mismo, _ = solicitar_trabajo('caja', self._datos_caja(), self.user)
+        self.assertEqual(mismo.estado, 'en_proceso')
+
+        TrabajoReporte.objects.filter(pk=trabajo.id).update(fecha_inicio=timezone.now() - timedelta(hours=2))
+        mismo, reutilizado = solicitar_trabajo('caja', self._datos_caja(), self.user)
+        self.assertTrue(reutilizado)
+        self.assertEqual(mismo.id, trabajo.id)
+        self.assertEqual(mismo.estado, 'completado')
+        self.assertTrue((Path(self.directorio) / str(trabajo.id) / 'reporte.csv').is_file())
+
+    def test_vistas_crear_estado_resultado_y_descargas(self):
+        """Test: Flujo completo desde la pantalla: crear, consultar, ver y descargar"""
+        resp = self.client.post(reverse('pos:crear_trabajo_reporte'), {'tipo': 'caja', **self._datos_caja()})
+        self.assertEqual(resp.status_code, 200)
+        datos = resp.json()
+        self.assertTrue(datos['success'])
+        self.assertEqual(datos['estado'], 'completado')
+
+        estado = self.client.get(datos['url_estado']).json()
+        self.assertEqual(estado['progreso'], 100)
+        self.assertIn('url_xlsx', estado)
+
+        def _fake_render(request, template_name, context):
+            response = HttpResponse('OK')
+            response._reportes_context = context
+            return response
+
+        with patch('pos.views.render', side_effect=_fake_render):
+            resultado = self.client.get(datos['url_resultado'])
+        ctx = resultado._reportes_context
+        self.assertEqual(ctx['trabajo'].id, datos['id'])
+        self.assertEqual(ctx['total_ventas'], 3000)
+        self.assertEqual(ctx['resumen_diario'][0]['dia'], datetime(2025, 12, 14).date())
+
+        csv_resp = self.client.get(datos['url_csv'])
+        self.assertEqual(csv_resp.status_code, 200)
+        self.assertIn('reporte_movimientos_caja_2025-12-14_a_2025-12-14.csv', csv_resp['Content-Disposition'])
+        texto = b''.join(csv_resp.streaming_content).decode('utf-8-sig')
+        self.assertGreater(len(list(csv.reader(io.StringIO(texto)))), 1)
+
+        xlsx_resp = self.client.get(datos['url_xlsx'])
+        self.assertEqual(xlsx_resp.status_code, 200)
+        libro = load_workbook(io.BytesIO(b''.join(xlsx_resp.streaming_content)))
+        self.assertTrue(libro.sheetnames)
+
+        self.assertEqual(self.client.get(reverse('pos:descargar_trabajo_reporte', args=[datos['id'], 'pdf'])).status_code, 404)
+        self.assertEqual(
+            self.client.post(reverse('pos:crear_trabajo_reporte'), {'tipo': 'otro'}).status_code, 400
+        )
+        self.assertEqual(TrabajoReporte.objects.count(), 1)
@@ -215,3 +215,34 @@ class VentasTestCase(TestCase):
         self.assertIn(response.status_code, [200, 302])
         self.assertGreaterEqual(Venta.objects.count(), 5)
 
+
+    def test_item_venta_conserva_datos_del_producto(self):
+        """Test: El item guarda los datos del producto al vender; ticket y detalle no cambian si el producto se edita"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        venta = Venta.objects.create(
+            usuario=self.user, vendedor=self.user, metodo_pago='efectivo',
+            total=20000, completada=True
+        )
+        item = ItemVenta.objects.create(
+            venta=venta, producto=self.producto1, cantidad=2,
+            precio_unitario=10000, subtotal=20000
+        )
+        self.assertEqual(item.nombre, 'Producto Test 1')
+        self.assertEqual(item.codigo, 'PROD001')
+
+        self.producto1.nombre = 'Nombre Nuevo'
+        self.producto1.save()
+
+        for url in (reverse('pos:detalle_venta', args=[venta.id]), reverse('pos:imprimir_ticket', args=[venta.id])):
+            response = self.client.get(url)
+            self.assertContains(response, 'Producto Test 1')
+            self.assertNotContains(response, 'Nombre Nuevo')
+
+        # Items sin datos (cargas por bulk_create o anteriores a los campos) se completan con el comando
+        ItemVenta.objects.filter(id=item.id).update(codigo='', nombre='')
+        call_command('rellenar_datos_items_venta', stdout=StringIO())
+        item.refresh_from_db()
+        self.assertEqual(item.nombre, 'Nombre Nuevo')
+        self.assertEqual(item.codigo, 'PROD001')
@@ -0,0 +1,347 @@
+"""
+Tests para las tablas de ventas diarias (VentaDiaria y VentaProductoDiaria)
+"""
+import io
+from datetime import date, datetime
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import Client, TestCase, signals
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from pos.models import (
+    Caja, ItemVenta, MovimientoStock, Producto, Venta, VentaDiaria, VentaProductoDiaria
+)
+from pos import ventas_diarias
+from pos.ventas_diarias import (
+    recalculo_ventas_producto_agrupado, reconstruir_ventas_diarias, reconstruir_ventas_producto_diarias
+)
+
+# Evitar problemas al copiar contextos instrumentados en tests
+signals.template_rendered.receivers = []
+
+
+class VentaDiariaTestCase(TestCase):
+    """VentaDiaria se mantiene al vender, anular, editar y eliminar ventas"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin_test',
+            password='testpass123',
+            is_staff=True,
+        )
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user.groups.add(grupo_admin)
+        self.vendedor = User.objects.create_user(username='vendedor_test', password='testpass123')
+        self.caja = Caja.objects.create(numero=1, nombre='Caja Principal')
+
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.tz = timezone.get_current_timezone()
+
+    def _venta(self, hora=10, dia=14, **kwargs):
+        datos = {
+            'fecha': timezone.make_aware(datetime(2025, 12, dia, hora, 0, 0), self.tz),
+            'total': 10000,
+            'completada': True,
+            'metodo_pago': 'efectivo',
+            'usuario': self.user,
+            'vendedor': self.vendedor,
+            'caja': self.caja,
+            'registradora_id': 1,
+        }
+        datos.update(kwargs)
+        return Venta.objects.create(**datos)
+
+    def _tabla(self):
+        return sorted(
+            VentaDiaria.objects.exclude(
+                total_ventas=0, cantidad_ventas=0, total_anuladas=0, cantidad_anuladas=0
+            ).values_list(
+                'fecha', 'registradora_id', 'vendedor_id', 'usuario_id', 'metodo_pago',
+                'total_ventas', 'cantidad_ventas', 'total_anuladas', 'cantidad_anuladas',
+            ),
+            key=str,
+        )
+
+    def _assert_igual_a_reconstruccion(self):
+        incremental = self._tabla()
+        reconstruir_ventas_diarias()
+        self.assertEqual(incremental, self._tabla())
+
+    def test_alta_anulacion_edicion_y_borrado(self):
+        """Test: Cada cambio de venta se refleja por diferencia en la fila de su día"""
+        v1 = self._venta()
+        v2 = self._venta(hora=11, total=5000)
+        fila = VentaDiaria.objects.get(fecha=date(2025, 12, 14), metodo_pago='efectivo')
+        self.assertEqual((fila.total_ventas, fila.cantidad_ventas), (15000, 2))
+
+        # Anulación: pasa de ventas a anuladas
+        v2.anulada = True
+        v2.save()
+        fila.refresh_from_db()
+        self.assertEqual((fila.total_ventas, fila.cantidad_ventas), (10000, 1))
+        self.assertEqual((fila.total_anuladas, fila.cantidad_anuladas), (5000, 1))
+
+        # Edición: cambia total y método de pago (se mueve de fila)
+        v1.total = 12000
+        v1.metodo_pago = 'tarjeta'
+        v1.save()
+        fila_tarjeta = VentaDiaria.objects.get(fecha=date(2025, 12, 14), metodo_pago='tarjeta')
+        self.assertEqual((fila_tarjeta.total_ventas, fila_tarjeta.cantidad_ventas), (12000, 1))
+        fila.refresh_from_db()
+        self.assertEqual((fila.total_ventas, fila.cantidad_ventas), (0, 0))
+
+        # Venta no completada no aporta; al completarse sí
+        v3 = self._venta(hora=12, completada=False, total=700)
+        self.assertFalse(VentaDiaria.objects.filter(total_ventas=700).exists())
+        v3.completada = True
+        v3.save()
+        self._assert_igual_a_reconstruccion()
+
+        v1.delete()
+        self.assertFalse(VentaDiaria.objects.filter(metodo_pago='tarjeta', cantidad_ventas__gt=0).exists())
+        self._assert_igual_a_reconstruccion()
+
+    def test_fecha_local_de_la_venta(self):
+        """Test: Una venta a las 23:00 hora local cuenta en ese día aunque en UTC sea el siguiente"""
+        self._venta(hora=23)
+        self.assertTrue(VentaDiaria.objects.filter(fecha=date(2025, 12, 14)).exists())
+        self.assertFalse(VentaDiaria.objects.filter(fecha=date(2025, 12, 15)).exists())
+
+    def test_comando_reconstruir(self):
+        """Test: El comando reconstruye la tabla desde las ventas"""
+        self._venta()
+        self._venta(dia=15, metodo_pago='transferencia')
+        incremental = self._tabla()
+        VentaDiaria.objects.all().delete()
+
+        call_command('reconstruir_ventas_diarias', stdout=io.StringIO())
+        self.assertEqual(incremental, self._tabla())
+
+        # Reconstrucción parcial: solo toca el rango pedido
+        VentaDiaria.objects.filter(fecha=date(2025, 12, 14)).update(total_ventas=1)
+        call_command('reconstruir_ventas_diarias', desde='2025-12-15', hasta='2025-12-15', stdout=io.StringIO())
+        self.assertEqual(VentaDiaria.objects.get(fecha=date(2025, 12, 14)).total_ventas, 1)
+
+    def test_clave_unica_sin_vendedor_ni_registradora(self):
+        """Test: Las ventas sin vendedor ni registradora comparten una sola fila y la clave repetida se rechaza"""
+        self._venta(vendedor=None, registradora_id=None)
+        self._venta(hora=11, vendedor=None, registradora_id=None)
+        fila = VentaDiaria.objects.get(vendedor__isnull=True)
+        self.assertEqual(fila.cantidad_ventas, 2)
+        self.assertEqual(fila.clave, f'2025-12-14|0|0|{self.user.id}|efectivo')
+
+        # Un segundo insert con la misma clave (dos primeras ventas simultáneas) falla y cae al update
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            VentaDiaria.objects.create(
+                fecha=fila.fecha, usuario=self.user, metodo_pago='efectivo', clave=fila.clave
+            )
+
+    def _contexto(self, url, params=None):
+        captured = {}
+
+        def _fake_render(request, template_name, context=None, *args, **kwargs):
+            captured['context'] = context or {}
+            return HttpResponse('OK')
+
+        with patch('pos.views.render', side_effect=_fake_render):
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return captured['context']
+
+    def test_reportes_no_recorren_ventas(self):
+        """Test: Home, reporte de caja y marketing no agregan sobre Venta"""
+        hoy = timezone.localtime()
+        for i in range(5):
+            self._venta(fecha=hoy, total=1000 + i)
+        self._venta(fecha=hoy, total=999, anulada=True)
+
+        with CaptureQueriesContext(connection) as consultas:
+            ctx_home = self._contexto(reverse('pos:home'))
+            ctx_marketing = self._contexto(reverse('pos:marketing'))
+        self.assertEqual(ctx_home['ventas_hoy'], 5010)
+        self.assertEqual(ctx_home['total_ventas_hoy'], 5)
+        self.assertEqual(ctx_marketing['total_general'], 5010)
+        self.assertEqual(ctx_marketing['cantidad_anuladas_general'], 1)
+
+        agregados_venta = [
+            q['sql'] for q in consultas.captured_queries
+            if 'FROM "pos_venta"' in q['sql'] and ('SUM(' in q['sql'] or 'COUNT(' in q['sql'])
+        ]
+        self.assertEqual(agregados_venta, [])
+
+        ctx_caja = self._contexto(reverse('pos:reportes'), {
+            'tipo': 'caja',
+            'fecha_desde': hoy.date().isoformat(),
+            'fecha_hasta': hoy.date().isoformat(),
+        })
+        self.assertEqual(ctx_caja['total_ventas'], 5010)
+        self.assertEqual(ctx_caja['total_anuladas'], 999)
+        self.assertEqual(ctx_caja['resumen_diario'][0]['ventas_total'], 5010)
+
+
+class VentaProductoDiariaTestCase(TestCase):
+    """VentaProductoDiaria se mantiene al cambiar items y ventas, y alimenta los reportes de productos"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='admin_test',
+            password='testpass123',
+            is_staff=True,
+        )
+        grupo_admin, _ = Group.objects.get_or_create(name='Administradores')
+        self.user.groups.add(grupo_admin)
+        self.producto_a = Producto.objects.create(codigo='PA', nombre='Producto A', precio=1000, stock=100)
+        self.producto_b = Producto.objects.create(codigo='PB', nombre='Producto B', precio=500, stock=100)
+
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.tz = timezone.get_current_timezone()
+
+    def _venta(self, items, hora=10, dia=14, **kwargs):
+        datos = {
+            'fecha': timezone.make_aware(datetime(2025, 12, dia, hora, 0, 0), self.tz),
+            'completada': True,
+            'metodo_pago': 'efectivo',
+            'usuario': self.user,
+        }
+        datos.update(kwargs)
+        venta = Venta.objects.create(**datos)
+        for producto, cantidad in items:
+            ItemVenta.objects.create(
+                venta=venta, producto=producto, cantidad=cantidad,
+                precio_unitario=producto.precio, subtotal=producto.precio * cantidad,
+            )
+        return venta
+
+    def _fila(self, producto, dia=14):
+        return VentaProductoDiaria.objects.filter(
+            fecha=date(2025, 12, dia), producto=producto
+        ).values_list('cantidad', 'valor', 'cantidad_ventas').first()
+
+    def _tabla(self):
+        return sorted(VentaProductoDiaria.objects.values_list(
+            'fecha', 'producto_id', 'cantidad', 'valor', 'cantidad_ventas'
+        ))
+
+    def _assert_igual_a_reconstruccion(self):
+        incremental = self._tabla()
+        reconstruir_ventas_producto_diarias()
+        self.assertEqual(incremental, self._tabla())
+
+    def test_items_anulacion_edicion_y_borrado(self):
+        """Test: Cada cambio recalcula la fila (fecha, producto) con ventas distintas"""
+        v1 = self._venta([(self.producto_a, 2), (self.producto_a, 1), (self.producto_b, 4)])
+        v2 = self._venta([(self.producto_a, 5)], hora=23)
+        # Dos items del mismo producto en una venta cuentan como una sola venta
+        self.assertEqual(self._fila(self.producto_a), (8, 8000, 2))
+        self.assertEqual(self._fila(self.producto_b), (4, 2000, 1))
+
+        # Anulación: la venta deja de aportar
+        v2.anulada = True
+        v2.save()
+        self.assertEqual(self._fila(self.producto_a), (3, 3000, 1))
+
+        # Edición de un item: cambia cantidad y producto
+        item = v1.items.get(producto=self.producto_b)
+        item.producto = self.producto_a
+        item.cantidad = 1
+        item.subtotal = 1000
+        item.save()
+        self.assertEqual(self._fila(self.producto_a), (4, 4000, 1))
+        self.assertIsNone(self._fila(self.producto_b))
+
+        # Cambio de día de la venta: se mueve de fila
+        v1.fecha = timezone.make_aware(datetime(2025, 12, 15, 9, 0, 0), self.tz)
+        v1.save()
+        self.assertIsNone(self._fila(self.producto_a))
+        self.assertEqual(self._fila(self.producto_a, dia=15), (4, 4000, 1))
+        self._assert_igual_a_reconstruccion()
+
+        v2.anulada = False
+        v2.save()
+        v1.delete()
+        self.assertIsNone(self._fila(self.producto_a, dia=15))
+        self.assertEqual(self._fila(self.producto_a), (5, 5000, 1))
+        self._assert_igual_a_reconstruccion()
+
+    def test_recalculo_agrupado_de_una_venta(self):
+        """Test: Dentro de recalculo_ventas_producto_agrupado los items no recalculan uno por uno"""
+        productos = [
+            Producto.objects.create(codigo=f'PX{i}', nombre=f'Producto X{i}', precio=100, stock=10)
+            for i in range(30)
+        ]
+        with patch('pos.ventas_diarias.recalcular_ventas_producto',
+                   wraps=ventas_diarias.recalcular_ventas_producto) as recalcular:
+            with recalculo_ventas_producto_agrupado():
+                self._venta([(producto, 1) for producto in productos])
+                self.assertFalse(VentaProductoDiaria.objects.exists())
+        self.assertEqual(recalcular.call_count, 1)
+        self.assertEqual(VentaProductoDiaria.objects.count(), 30)
+        self._assert_igual_a_reconstruccion()
+
+    def test_comando_reconstruir(self):
+        """Test: El comando reconstruye la tabla desde los items"""
+        self._venta([(self.producto_a, 2)])
+        self._venta([(self.producto_b, 3)], dia=15)
+        incremental = self._tabla()
+        VentaProductoDiaria.objects.all().delete()
+
+        call_command('reconstruir_ventas_producto_diarias', stdout=io.StringIO())
+        self.assertEqual(incremental, self._tabla())
+
+        VentaProductoDiaria.objects.filter(fecha=date(2025, 12, 14)).update(cantidad=99)
+        call_command('reconstruir_ventas_producto_diarias', desde='2025-12-15', stdout=io.StringIO())
+        self.assertEqual(self._fila(self.producto_a)[0], 99)
+
+    def test_reportes_leen_la_tabla(self):
+        """Test: Inventario (top, rotación, precio promedio), caja y reporte_producto no agregan ItemVenta"""
+        from pos.reporte_inventario import construir_dataset_inventario
+
+        for producto in (self.producto_a, self.producto_b):
+            MovimientoStock.objects.create(
+                producto=producto, tipo='ingreso', cantidad=10,
+                stock_anterior=90, stock_nuevo=100, usuario=self.user,
+            )
+        self._venta([(self.producto_a, 2), (self.producto_b, 1)])
+        self._venta([(self.producto_a, 3)])
+
+        with CaptureQueriesContext(connection) as consultas:
+            dataset = construir_dataset_inventario()
+            salida = io.StringIO()
+            call_command('reporte_producto', 'PA', stdout=salida)
+
+        self.assertEqual(dataset['top_ventas'][0]['codigo'], 'PA')
+        self.assertEqual(dataset['top_ventas'][0]['total_ventas'], 5)
+        resumen_a = next(item for item in dataset['resumen_productos'] if item['codigo'] == 'PA')
+        self.assertEqual(resumen_a['precio_promedio_venta'], 1000)
+        self.assertEqual(dataset['top_rotacion'][0]['codigo'], 'PA')
+        self.assertIn('Total Ventas: 5 unidades', salida.getvalue())
+        self.assertIn('Ventas con el producto: 2', salida.getvalue())
+
+        # Las ventas por código+atributo y el total del comando ya no suman items
+        agregados_items = [
+            q['sql'] for q in consultas.captured_queries
+            if 'FROM "pos_itemventa"' in q['sql'] and 'SUM(' in q['sql'] and '"pos_producto"."codigo"' in q['sql']
+        ]
+        self.assertEqual(agregados_items, [])
+
+        ctx = {}
+
+        def _fake_render(request, template_name, context=None, *args, **kwargs):
+            ctx.update(context or {})
+            return HttpResponse('OK')
+
+        with patch('pos.views.render', side_effect=_fake_render):
+            self.client.get(reverse('pos:reportes'), {
+                'tipo': 'caja', 'fecha_desde': '2025-12-14', 'fecha_hasta': '2025-12-14',
+            })
+        top = list(ctx['top_productos'])
+        self.assertEqual(top[0]['producto__nombre'], 'Producto A')
+        self.assertEqual((top[0]['total_vendido'], top[0]['total_valor']), (5, 5000))
@@ -0,0 +1,100 @@
+"""
+Tests para la verificación de consistencia de stock (verificar_stock)
+"""
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from pos.models import ItemVenta, MovimientoStock, Producto, Venta
+from pos.verificacion_stock import discrepancias_stock
+
+
+class VerificacionStockTestCase(TestCase):
+    """Cada comprobación detecta su discrepancia y no marca historiales correctos"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin_test', password='testpass123')
+        self.inicio = timezone.now() - timedelta(days=1)
+        self.correcto = Producto.objects.create(codigo='OK', nombre='Correcto', precio=1000, stock=0)
+        self.roto = Producto.objects.create(codigo='ROTO', nombre='Roto', precio=1000, stock=0)
+        self.sin_movimientos = Producto.objects.create(codigo='SIN', nombre='Sin movimientos', precio=1000, stock=7)
+
+    def _movimiento(self, producto, minutos, tipo, cantidad, anterior, nuevo, **kwargs):
+        return MovimientoStock.objects.create(
+            producto=producto, tipo=tipo, cantidad=cantidad, stock_anterior=anterior, stock_nuevo=nuevo,
+            fecha=self.inicio + timedelta(minutes=minutos), **kwargs
+        )
+
+    def _venta(self, items, anulada=False):
+        venta = Venta.objects.create(usuario=self.user, completada=True, anulada=anulada)
+        for producto, cantidad in items:
+            ItemVenta.objects.create(
+                venta=venta, producto=producto, cantidad=cantidad,
+                precio_unitario=producto.precio, subtotal=producto.precio * cantidad,
+            )
+        return venta
+
+    def test_historial_correcto_sin_discrepancias(self):
+        """Test: Ingreso, venta, ajuste negativo y venta anulada con devolución no generan discrepancias"""
+        venta = self._venta([(self.correcto, 3)])
+        anulada = self._venta([(self.correcto, 2)], anulada=True)
+        self._movimiento(self.correcto, 0, 'ingreso', 10, 5, 15)
+        self._movimiento(self.correcto, 1, 'salida', 3, 15, 12, venta=venta)
+        self._movimiento(self.correcto, 2, 'ajuste', -2, 12, 10)
+        self._movimiento(self.correcto, 3, 'salida', 2, 10, 8, venta=anulada)
+        self._movimiento(self.correcto, 4, 'ingreso', 2, 8, 10, venta=anulada)
+        Producto.objects.filter(pk=self.correcto.pk).update(stock=10)
+
+        self.assertEqual(list(discrepancias_stock()), [])
+
+    def test_detecta_cada_tipo_de_discrepancia(self):
+        """Test: Movimiento mal calculado, cadena cortada, stock desviado y venta sin salida de stock"""
+        # stock_nuevo no cuadra con la cantidad (15 + 3 != 17)
+        inconsistente = self._movimiento(self.roto, 0, 'ingreso', 3, 15, 17)
+        # El siguiente no parte del stock_nuevo anterior (17 -> 20)
+        cortado = self._movimiento(self.roto, 1, 'salida', 5, 20, 15)
+        # Producto.stock 14: el historial dice 15 + 3 - 5 = 13
+        Producto.objects.filter(pk=self.roto.pk).update(stock=14)
+        # Venta de 4 unidades con salida de solo 1; venta sin ningún movimiento
+        venta = self._venta([(self.correcto, 4)])
+        sin_salida = self._venta([(self.correcto, 2)])
+        self._movimiento(self.correcto, 0, 'salida', 1, 1, 0, venta=venta)
+
+        discrepancias = [
+            (d['tipo'], d['producto_id'], d['movimiento_id'], d['venta_id'], d['esperado'], d['encontrado'])
+            for d in discrepancias_stock()
+        ]
+        self.assertEqual(discrepancias, [
+            ('movimiento_inconsistente', self.roto.id, inconsistente.id, None, 18, 17),
+            ('cadena_discontinua', self.roto.id, cortado.id, None, 17, 20),
+            ('stock_vs_historial', self.roto.id, None, None, 13, 14),
+            ('venta_sin_movimiento', self.correcto.id, None, venta.id, 4, 1),
+            ('venta_sin_movimiento', self.correcto.id, None, sin_salida.id, 2, 0),
+        ])
+        # Los productos sin movimientos no se comparan con el historial
+        self.assertNotIn(self.sin_movimientos.id, [d[1] for d in discrepancias])
+
+    def test_comando_escribe_jsonl_y_csv(self):
+        """Test: El comando escribe una discrepancia por línea y el resumen por tipo en stderr"""
+        self._movimiento(self.roto, 0, 'ingreso', 3, 0, 3)
+        salida, errores = StringIO(), StringIO()
+
+        call_command('verificar_stock', stdout=salida, stderr=errores)
+
+        lineas = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+        self.assertEqual(lineas, [{
+            'tipo': 'stock_vs_historial', 'producto_id': self.roto.id, 'movimiento_id': None, 'venta_id': None,
+            'esperado': 3, 'encontrado': 0, 'diferencia': -3,
+        }])
+        self.assertIn('stock_vs_historial: 1', errores.getvalue())
+
+        salida = StringIO()
+        call_command('verificar_stock', '--formato', 'csv', '--tipo', 'cadena_discontinua', stdout=salida, stderr=StringIO())
+        self.assertEqual(salida.getvalue().splitlines(), [
+            'tipo,producto_id,movimiento_id,venta_id,esperado,encontrado,diferencia',
+        ])
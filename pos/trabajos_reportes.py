@@ -0,0 +1,453 @@
+"""
+Trabajos de reportes en segundo plano (reportes de inventario y de caja).
+
+Los reportes sobre temporadas completas pueden tardar más que el timeout de
+la petición. En modo trabajo la vista solo registra un TrabajoReporte con los
+filtros normalizados y un hilo trabajador del mismo proceso lo calcula (no se
+necesita broker externo); la pantalla consulta el progreso hasta que termina.
+
+Cada trabajo completado deja en disco, en REPORTES_TRABAJOS_DIR/<id>/:
+
+    parametros.json  tipo, filtros y versión de datos
+    contexto.json    secciones agregadas de la pantalla
+    reporte.csv      exportación principal del reporte
+    reporte.xlsx     la misma exportación en Excel
+
+La versión de datos es una huella (conteos, máximos y sumas) de las tablas que
+alimentan el reporte, calculada en la base de datos para que sea la misma en
+todos los procesos. Mientras no cambie, una solicitud con los mismos filtros
+reutiliza el trabajo terminado (o el que está en curso).
+
+Configuración opcional en settings:
+
+    REPORTES_TRABAJOS_DIR = BASE_DIR / 'reportes_trabajos'
+    REPORTES_TRABAJOS_SEGUNDO_PLANO = True   # False: se calcula en la misma petición
+    REPORTES_TRABAJOS_MINUTOS_EN_PROCESO = 30  # luego un trabajo en proceso se da por abandonado
+
+Los trabajos que quedaron pendientes (por ejemplo tras reiniciar el servidor)
+vuelven a la cola cuando alguien pide el mismo reporte, o se procesan con el
+comando procesar_trabajos_reportes.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .models import (
+    CajaUsuario, ConteoFisico, GastoCaja, IngresoMercancia, MovimientoStock, Producto,
+    SalidaMercancia, TrabajoReporte, Venta, VentaDiaria, VentaProductoDiaria
+)
+
+logger = logging.getLogger(__name__)
+
+TIPOS_MOVIMIENTO = ('ingreso', 'salida', 'ajuste')
+
+# Exportación guardada por defecto en los trabajos de caja
+EXPORTACION_CAJA_DEFECTO = 'movimientos_caja'
+
+ARCHIVO_PARAMETROS = 'parametros.json'
+ARCHIVO_CONTEXTO = 'contexto.json'
+ARCHIVOS_DESCARGA = {
+    'csv': 'reporte.csv',
+    'xlsx': 'reporte.xlsx',
+}
+
+
+def directorio_trabajos():
+    return Path(getattr(settings, 'REPORTES_TRABAJOS_DIR', Path(settings.BASE_DIR) / 'reportes_trabajos'))
+
+
+def directorio_trabajo(trabajo):
+    return directorio_trabajos() / str(trabajo.id)
+
+
+def artefactos_disponibles(trabajo):
+    """Indica si los archivos del trabajo siguen en disco"""
+    directorio = directorio_trabajo(trabajo)
+    return all(
+        (directorio / nombre).is_file()
+        for nombre in (ARCHIVO_PARAMETROS, ARCHIVO_CONTEXTO, *ARCHIVOS_DESCARGA.values())
+    )
+
+
+# ============================================
+# PARÁMETROS Y VERSIÓN DE DATOS
+# ============================================
+
+def _fecha_iso(valor):
+    """'YYYY-MM-DD' validada o None"""
+    if not valor or str(valor).lower() in ('none', 'null'):
+        return None
+    try:
+        return datetime.strptime(str(valor), '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return None
+
+
+def normalizar_parametros(tipo, datos):
+    """
+    Filtros del reporte en forma canónica (misma solicitud => mismo dict).
+
+    Args:
+        tipo: 'inventario' o 'caja'
+        datos: dict-like con los filtros del formulario (request.POST/GET)
+
+    Raises:
+        ValueError: si el tipo de reporte no existe
+    """
+    if tipo == 'inventario':
+        try:
+            producto_id = int(datos.get('producto') or 0) or None
+        except (TypeError, ValueError):
+            producto_id = None
+        tipo_movimiento = datos.get('tipo_mov') or None
+        return {
+            'producto': producto_id,
+            'tipo_mov': tipo_movimiento if tipo_movimiento in TIPOS_MOVIMIENTO else None,
+            'fecha_desde': _fecha_iso(datos.get('fecha_desde')),
+            'fecha_hasta': _fecha_iso(datos.get('fecha_hasta')),
+        }
+    if tipo == 'caja':
+        from .exportaciones import EXPORTACIONES_CAJA
+        from .reporte_caja import fechas_reporte_caja
+
+        fecha_desde, fecha_hasta = fechas_reporte_caja(datos.get('fecha_desde'), datos.get('fecha_hasta'))
+        export = datos.get('export') or EXPORTACION_CAJA_DEFECTO
+        return {
+            'fecha_desde': fecha_desde.isoformat(),
+            'fecha_hasta': fecha_hasta.isoformat(),
+            'export': export if export in EXPORTACIONES_CAJA else EXPORTACION_CAJA_DEFECTO,
+        }
+    raise ValueError(f'Tipo de reporte inválido: {tipo}')
+
+
+def _huella_inventario():
+    """El reporte de inventario usa el stock actual: la huella cubre todas las tablas"""
+    return [
+        MovimientoStock.objects.aggregate(n=Count('id'), ultimo=Max('id'), suma=Sum('cantidad')),
+        ConteoFisico.objects.aggregate(n=Count('id'), ultimo=Max('fecha_conteo')),
+        Producto.objects.aggregate(
+            n=Count('id'), ultimo=Max('id'), stock=Sum('stock'), activos=Count('id', filter=Q(activo=True))
+        ),
+        VentaProductoDiaria.objects.aggregate(n=Count('id'), cantidad=Sum('cantidad'), valor=Sum('valor')),
+        IngresoMercancia.objects.aggregate(n=Count('id', filter=Q(completado=True)), ultimo=Max('id')),
+        SalidaMercancia.objects.aggregate(n=Count('id', filter=Q(completado=True)), ultimo=Max('id')),
+    ]
+
+
+def _huella_caja(parametros):
+    """El reporte de caja solo depende del rango: cambios fuera de él no invalidan el resultado"""
+    from .reporte_caja import rango_caja
+
+    fecha_desde = date.fromisoformat(parametros['fecha_desde'])
+    fecha_hasta = date.fromisoformat(parametros['fecha_hasta'])
+    inicio_dt, fin_dt = rango_caja(fecha_desde, fecha_hasta)
+    return [
+        VentaDiaria.objects.filter(fecha__gte=fecha_desde, fecha__lte=fecha_hasta).aggregate(
+            total=Sum('total_ventas'), cantidad=Sum('cantidad_ventas'),
+            anuladas=Sum('total_anuladas'), cantidad_anuladas=Sum('cantidad_anuladas'),
+        ),
+        VentaProductoDiaria.objects.filter(fecha__gte=fecha_desde, fecha__lte=fecha_hasta).aggregate(
+            cantidad=Sum('cantidad'), valor=Sum('valor'),
+        ),
+        Venta.objects.filter(fecha__gte=inicio_dt, fecha__lt=fin_dt).aggregate(n=Count('id'), ultimo=Max('id')),
+        GastoCaja.objects.filter(fecha__gte=inicio_dt, fecha__lt=fin_dt).aggregate(
+            n=Count('id'), ultimo=Max('id'), suma=Sum('monto'),
+        ),
+        CajaUsuario.objects.filter(fecha_apertura__lt=fin_dt).filter(
+            Q(fecha_cierre__gte=inicio_dt) | Q(fecha_cierre__isnull=True)
+        ).aggregate(
+            n=Count('id'), ultimo=Max('id'), cerradas=Count('fecha_cierre'),
+            inicial=Sum('monto_inicial'), final=Sum('monto_final'),
+        ),
+        Producto.objects.filter(activo=True).count(),
+    ]
+
+
+def _hash(valor):
+    return hashlib.sha256(json.dumps(valor, cls=DjangoJSONEncoder, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def version_datos(tipo, parametros):
+    """Hash de la huella de datos del reporte"""
+    huella = _huella_inventario() if tipo == 'inventario' else _huella_caja(parametros)
+    return _hash(huella)
+
+
+def clave_trabajo(tipo, parametros, version):
+    return _hash([tipo, parametros, version])
+
+
+# ============================================
+# SOLICITUD Y EJECUCIÓN
+# ============================================
+
+def solicitar_trabajo(tipo, datos, usuario=None):
+    """
+    Registra (o reutiliza) el trabajo del reporte con esos filtros.
+
+    Returns:
+        (trabajo, reutilizado)
+
+    Raises:
+        ValueError: si el tipo de reporte no existe
+    """
+    parametros = normalizar_parametros(tipo, datos)
+    version = version_datos(tipo, parametros)
+    clave = clave_trabajo(tipo, parametros, version)
+
+    existentes = TrabajoReporte.objects.filter(
+        clave=clave, estado__in=('pendiente', 'en_proceso', 'completado')
+    ).order_by('-id')
+    for existente in existentes:
+        if existente.estado == 'completado':
+            if artefactos_disponibles(existente):
+                return existente, True
+            continue
+        if existente.estado == 'en_proceso':
+            if not _en_proceso_abandonado(existente):
+                return existente, True
+            # El hilo que lo tomó murió o se colgó: vuelve a pendiente (una sola solicitud lo logra)
+            TrabajoReporte.objects.filter(
+                pk=existente.pk, estado='en_proceso', fecha_inicio=existente.fecha_inicio
+            ).update(estado='pendiente', progreso=0, mensaje='En cola')
+        # Un pendiente puede no estar en ninguna cola (servidor reiniciado): se encola de nuevo.
+        # procesar_trabajo lo toma con una actualización condicional, así que no se calcula dos veces
+        _programar_trabajo(existente.id)
+        existente.refresh_from_db()
+        return existente, True
+
+    trabajo = TrabajoReporte.objects.create(
+        tipo=tipo,
+        parametros=parametros,
+        version_datos=version,
+        clave=clave,
+        usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+        mensaje='En cola',
+    )
+    _programar_trabajo(trabajo.id)
+    trabajo.refresh_from_db()
+    return trabajo, False
+
+
+def _programar_trabajo(trabajo_id):
+    """Encola el trabajo al confirmar la transacción o lo calcula ya (sin segundo plano)"""
+    if getattr(settings, 'REPORTES_TRABAJOS_SEGUNDO_PLANO', True):
+        transaction.on_commit(lambda: encolar_trabajo(trabajo_id))
+    else:
+        procesar_trabajo(trabajo_id)
+
+
+def _en_proceso_abandonado(trabajo):
+    """Un trabajo en proceso desde hace más de REPORTES_TRABAJOS_MINUTOS_EN_PROCESO se da por abandonado"""
+    minutos = getattr(settings, 'REPORTES_TRABAJOS_MINUTOS_EN_PROCESO', 30)
+    return trabajo.fecha_inicio is None or trabajo.fecha_inicio < timezone.now() - timedelta(minutes=minutos)
+
+
+_cola = queue.Queue()
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def encolar_trabajo(trabajo_id):
+    """Agrega el trabajo a la cola del hilo trabajador (lo inicia si no está vivo)"""
+    global _hilo
+    _cola.put(trabajo_id)
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_trabajador, name='trabajos-reportes', daemon=True)
+            _hilo.start()
+
+
+def _trabajador():
+    while True:
+        trabajo_id = _cola.get()
+        try:
+            procesar_trabajo(trabajo_id)
+        except Exception:
+            logger.exception('Error inesperado procesando el trabajo de reporte #%s', trabajo_id)
+        finally:
+            # El hilo tiene su propia conexión: no dejarla abierta entre trabajos
+            connection.close()
+            _cola.task_done()
+
+
+def _avance(trabajo_id, progreso, mensaje):
+    TrabajoReporte.objects.filter(pk=trabajo_id).update(progreso=progreso, mensaje=mensaje)
+
+
+def procesar_trabajo(trabajo_id):
+    """
+    Calcula un trabajo pendiente y guarda sus archivos.
+    Solo lo procesa quien logra pasarlo de pendiente a en_proceso.
+
+    Returns:
+        True si este llamado procesó el trabajo
+    """
+    tomado = TrabajoReporte.objects.filter(pk=trabajo_id, estado='pendiente').update(
+        estado='en_proceso', fecha_inicio=timezone.now(), progreso=5, mensaje='Iniciando'
+    )
+    if not tomado:
+        return False
+
+    trabajo = TrabajoReporte.objects.get(pk=trabajo_id)
+    destino = directorio_trabajo(trabajo)
+    temporal = destino.with_name(f'{destino.name}.tmp')
+    try:
+        shutil.rmtree(temporal, ignore_errors=True)
+        temporal.mkdir(parents=True)
+        if trabajo.tipo == 'inventario':
+            _generar_inventario(trabajo, temporal)
+        else:
+            _generar_caja(trabajo, temporal)
+        with open(temporal / ARCHIVO_PARAMETROS, 'w', encoding='utf-8') as archivo:
+            json.dump({
+                'id': trabajo.id,
+                'tipo': trabajo.tipo,
+                'parametros': trabajo.parametros,
+                'version_datos': trabajo.version_datos,
+                'generado': timezone.now(),
+            }, archivo, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2)
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(temporal, destino)
+    except Exception as e:
+        logger.exception('Error generando el trabajo de reporte #%s', trabajo_id)
+        shutil.rmtree(temporal, ignore_errors=True)
+        TrabajoReporte.objects.filter(pk=trabajo_id).update(
+            estado='error', error=str(e), mensaje='Error al generar el reporte', fecha_fin=timezone.now()
+        )
+        return True
+
+    TrabajoReporte.objects.filter(pk=trabajo_id).update(
+        estado='completado', progreso=100, mensaje='Completado', fecha_fin=timezone.now()
+    )
+    return True
+
+
+def _guardar_contexto(directorio, contexto):
+    with open(directorio / ARCHIVO_CONTEXTO, 'w', encoding='utf-8') as archivo:
+        json.dump(contexto, archivo, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def _generar_inventario(trabajo, directorio):
+    from .exportaciones import escribir_csv, escribir_xlsx, filas_resumen_inventario_xlsx
+    from .reporte_inventario import (
+        ANCHOS_RESUMEN_INVENTARIO, CLAVES_CONTEXTO_INVENTARIO, COLUMNAS_RESUMEN_INVENTARIO,
+        construir_dataset_inventario, fila_resumen_inventario,
+    )
+
+    parametros = trabajo.parametros
+    _avance(trabajo.id, 10, 'Calculando resumen de inventario')
+    dataset = construir_dataset_inventario(
+        parametros['producto'], parametros['tipo_mov'], parametros['fecha_desde'], parametros['fecha_hasta']
+    )
+    resumen_productos = dataset['resumen_productos']
+
+    _avance(trabajo.id, 60, 'Guardando resultado')
+    _guardar_contexto(directorio, {clave: dataset[clave] for clave in CLAVES_CONTEXTO_INVENTARIO})
+
+    _avance(trabajo.id, 70, 'Generando CSV')
+    escribir_csv(
+        directorio / ARCHIVOS_DESCARGA['csv'],
+        COLUMNAS_RESUMEN_INVENTARIO,
+        (fila_resumen_inventario(item) for item in resumen_productos),
+    )
+
+    _avance(trabajo.id, 85, 'Generando Excel')
+    escribir_xlsx(
+        directorio / ARCHIVOS_DESCARGA['xlsx'],
+        [('Resumen Inventario', COLUMNAS_RESUMEN_INVENTARIO, ANCHOS_RESUMEN_INVENTARIO)],
+        filas_resumen_inventario_xlsx(resumen_productos),
+    )
+
+
+def _generar_caja(trabajo, directorio):
+    from .exportaciones import escribir_csv, escribir_xlsx, exportacion_caja_csv, exportacion_caja_xlsx
+    from .reporte_caja import construir_dataset_caja, rango_caja
+
+    parametros = trabajo.parametros
+    fecha_desde = date.fromisoformat(parametros['fecha_desde'])
+    fecha_hasta = date.fromisoformat(parametros['fecha_hasta'])
+    inicio_dt, fin_dt = rango_caja(fecha_desde, fecha_hasta)
+    tz = timezone.get_current_timezone()
+
+    _avance(trabajo.id, 10, 'Calculando totales de caja')
+    _guardar_contexto(directorio, construir_dataset_caja(fecha_desde, fecha_hasta))
+
+    _avance(trabajo.id, 40, 'Generando CSV')
+    escribir_csv(directorio / ARCHIVOS_DESCARGA['csv'], *exportacion_caja_csv(
+        parametros['export'], inicio_dt, fin_dt, tz
+    ))
+
+    _avance(trabajo.id, 70, 'Generando Excel')
+    escribir_xlsx(directorio / ARCHIVOS_DESCARGA['xlsx'], *exportacion_caja_xlsx(
+        parametros['export'], inicio_dt, fin_dt, tz
+    ))
+
+
+# ============================================
+# RESULTADOS
+# ============================================
+
+def cargar_contexto(trabajo):
+    """Contexto guardado del trabajo, con las fechas del resumen diario como date"""
+    with open(directorio_trabajo(trabajo) / ARCHIVO_CONTEXTO, encoding='utf-8') as archivo:
+        contexto = json.load(archivo)
+    for dia in contexto.get('resumen_diario', []):
+        if dia.get('dia'):
+            dia['dia'] = date.fromisoformat(dia['dia'])
+    return contexto
+
+
+def ruta_descarga(trabajo, formato):
+    """Ruta del archivo csv/xlsx del trabajo (None si el formato no existe)"""
+    nombre = ARCHIVOS_DESCARGA.get(formato)
+    return directorio_trabajo(trabajo) / nombre if nombre else None
+
+
+def nombre_descarga(trabajo, formato):
+    """Nombre de archivo para la descarga, igual al de la exportación directa"""
+    parametros = trabajo.parametros
+    if trabajo.tipo == 'inventario':
+        fecha_desde, fecha_hasta = parametros.get('fecha_desde'), parametros.get('fecha_hasta')
+        fecha_str = ''
+        if fecha_desde and fecha_hasta:
+            fecha_str = f"_{fecha_desde}_a_{fecha_hasta}"
+        elif fecha_desde:
+            fecha_str = f"_desde_{fecha_desde}"
+        elif fecha_hasta:
+            fecha_str = f"_hasta_{fecha_hasta}"
+        return f"resumen_inventario{fecha_str}.{formato}"
+    return f"reporte_{parametros['export']}_{parametros['fecha_desde']}_a_{parametros['fecha_hasta']}.{formato}"
+
+
+def reiniciar_trabajos_en_proceso():
+    """Devuelve a pendiente los trabajos que quedaron en proceso (p. ej. el servidor se reinició)"""
+    return TrabajoReporte.objects.filter(estado='en_proceso').update(
+        estado='pendiente', progreso=0, mensaje='En cola'
+    )
+
+
+def eliminar_trabajos_antiguos(antes_de):
+    """
+    Borra los trabajos creados antes de `antes_de` y sus archivos.
+
+    Returns:
+        cantidad de trabajos eliminados
+    """
+    trabajos = list(TrabajoReporte.objects.filter(fecha_creacion__lt=antes_de).exclude(estado='en_proceso'))
+    for trabajo in trabajos:
+        shutil.rmtree(directorio_trabajo(trabajo), ignore_errors=True)
+    TrabajoReporte.objects.filter(pk__in=[trabajo.id for trabajo in trabajos]).delete()
+    return len(trabajos)
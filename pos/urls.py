@@ -41,13 +41,21 @@ urlpatterns = [
     path('caja/cerrar/', views.cerrar_caja_view, name='cerrar_caja'),
     path('caja/registrar-gasto/', views.registrar_gasto_view, name='registrar_gasto'),
     path('caja/registrar-ingreso/', views.registrar_ingreso_view, name='registrar_ingreso'),
+    path('caja/movimientos/', views.api_movimientos_caja_view, name='api_movimientos_caja'),
     
     # Reportes
     path('reportes/', views.reportes_view, name='reportes'),
     path('reportes/guardar-conteo-fisico/', views.guardar_conteo_fisico_view, name='guardar_conteo_fisico'),
+    path('reportes/guardar-conteos-lote/', views.guardar_conteos_lote_view, name='guardar_conteos_lote'),
+    path('reportes/aplicar-conteo/', views.aplicar_conteo_view, name='aplicar_conteo'),
+    path('reportes/trabajos/', views.crear_trabajo_reporte_view, name='crear_trabajo_reporte'),
+    path('reportes/trabajos/<int:trabajo_id>/', views.resultado_trabajo_reporte_view, name='resultado_trabajo_reporte'),
+    path('reportes/trabajos/<int:trabajo_id>/estado/', views.estado_trabajo_reporte_view, name='estado_trabajo_reporte'),
+    path('reportes/trabajos/<int:trabajo_id>/descargar/<str:formato>/', views.descargar_trabajo_reporte_view, name='descargar_trabajo_reporte'),
     
     # Inventario (Ingreso/Salida Mercancía unificado)
     path('inventario/', views.inventario_view, name='inventario'),
+    path('inventario/escanear-conteo/', views.escanear_conteo_view, name='escanear_conteo'),
     path('movimientos-inventario/', views.movimientos_inventario_view, name='movimientos_inventario'),
     path('ingreso-mercancia/', views.ingreso_mercancia_view, name='ingreso_mercancia'),
     path('ingreso-mercancia/nuevo/', views.crear_ingreso_view, name='crear_ingreso'),
@@ -0,0 +1,152 @@
+"""
+Verificación de consistencia entre el stock de los productos, el historial de
+MovimientoStock y las ventas, para todo el catálogo con pocas consultas
+agrupadas (sin recorrer producto por producto).
+
+Comprobaciones; cada discrepancia es un dict con 'tipo' y los ids y valores
+necesarios para revisarla:
+
+- 'movimiento_inconsistente': stock_nuevo - stock_anterior no coincide con la
+  cantidad del movimiento (ingreso suma, salida resta, ajuste con signo).
+- 'cadena_discontinua': el stock_anterior de un movimiento no es el stock_nuevo
+  del movimiento anterior del mismo producto (LAG por fecha e id).
+- 'stock_vs_historial': Producto.stock distinto del saldo del historial
+  (stock_anterior del primer movimiento + neto de todos los movimientos).
+- 'venta_sin_movimiento': las unidades vendidas de un producto en una venta
+  completada y no anulada no coinciden con sus salidas de stock netas
+  (salidas - ingresos de anulación) enlazadas a esa venta.
+"""
+from django.db.models import Case, F, IntegerField, Q, Sum, When, Window
+from django.db.models.functions import Lag, RowNumber
+
+from .models import ItemVenta, MovimientoStock
+
+TIPOS_DISCREPANCIA = ('movimiento_inconsistente', 'cadena_discontinua', 'stock_vs_historial', 'venta_sin_movimiento')
+
+COLUMNAS_DISCREPANCIA = ['tipo', 'producto_id', 'movimiento_id', 'venta_id', 'esperado', 'encontrado', 'diferencia']
+
+# Orden del historial de cada producto (mismo criterio que el reporte de inventario, con id para empates)
+ORDEN_HISTORIAL = [F('fecha').asc(), F('id').asc()]
+
+TAMANO_LOTE = 5000
+
+
+def variacion_stock():
+    """Variación de stock del movimiento: ingreso +cantidad, salida -cantidad, ajuste con su signo"""
+    return Case(
+        When(tipo='ingreso', then=F('cantidad')),
+        When(tipo='salida', then=-F('cantidad')),
+        default=F('cantidad'),
+        output_field=IntegerField(),
+    )
+
+
+def _discrepancia(tipo, esperado, encontrado, producto_id=None, movimiento_id=None, venta_id=None):
+    return {
+        'tipo': tipo,
+        'producto_id': producto_id,
+        'movimiento_id': movimiento_id,
+        'venta_id': venta_id,
+        'esperado': esperado,
+        'encontrado': encontrado,
+        'diferencia': encontrado - esperado,
+    }
+
+
+def movimientos_inconsistentes():
+    """Movimientos cuyo stock_nuevo no es stock_anterior + la variación del movimiento (una consulta)"""
+    filas = MovimientoStock.objects.annotate(variacion=variacion_stock()).exclude(
+        stock_nuevo=F('stock_anterior') + F('variacion')
+    ).order_by('id').values_list('id', 'producto_id', 'stock_anterior', 'variacion', 'stock_nuevo')
+    for movimiento_id, producto_id, stock_anterior, variacion, stock_nuevo in filas.iterator(chunk_size=TAMANO_LOTE):
+        yield _discrepancia(
+            'movimiento_inconsistente', stock_anterior + variacion, stock_nuevo,
+            producto_id=producto_id, movimiento_id=movimiento_id,
+        )
+
+
+def cadenas_discontinuas():
+    """
+    Movimientos cuyo stock_anterior difiere del stock_nuevo del movimiento
+    anterior del mismo producto: una consulta con LAG particionado por producto.
+    """
+    filas = MovimientoStock.objects.annotate(
+        nuevo_previo=Window(Lag('stock_nuevo'), partition_by=[F('producto_id')], order_by=ORDEN_HISTORIAL),
+    ).filter(nuevo_previo__isnull=False).exclude(
+        stock_anterior=F('nuevo_previo')
+    ).order_by('producto_id', 'fecha', 'id').values_list('id', 'producto_id', 'nuevo_previo', 'stock_anterior')
+    for movimiento_id, producto_id, nuevo_previo, stock_anterior in filas.iterator(chunk_size=TAMANO_LOTE):
+        yield _discrepancia(
+            'cadena_discontinua', nuevo_previo, stock_anterior, producto_id=producto_id, movimiento_id=movimiento_id,
+        )
+
+
+def stock_vs_historial():
+    """
+    Productos con movimientos cuyo stock actual no coincide con el saldo del
+    historial: una consulta con el primer movimiento (ROW_NUMBER) y el neto
+    (SUM de ventana) por producto.
+    """
+    filas = MovimientoStock.objects.annotate(
+        posicion=Window(RowNumber(), partition_by=[F('producto_id')], order_by=ORDEN_HISTORIAL),
+        neto=Window(Sum(variacion_stock()), partition_by=[F('producto_id')]),
+    ).filter(posicion=1).order_by('producto_id').values_list(
+        'producto_id', 'stock_anterior', 'neto', 'producto__stock'
+    )
+    for producto_id, stock_inicial, neto, stock in filas.iterator(chunk_size=TAMANO_LOTE):
+        if stock_inicial + neto != stock:
+            yield _discrepancia('stock_vs_historial', stock_inicial + neto, stock, producto_id=producto_id)
+
+
+def ventas_sin_movimiento():
+    """
+    Por venta completada y no anulada y producto: unidades de sus items contra
+    salidas netas enlazadas a la venta (dos consultas agrupadas).
+    """
+    ventas_validas = Q(venta__completada=True, venta__anulada=False)
+    vendidas = {
+        (venta_id, producto_id): int(cantidad or 0)
+        for venta_id, producto_id, cantidad in ItemVenta.objects.filter(ventas_validas).values(
+            'venta_id', 'producto_id'
+        ).annotate(suma_cantidad=Sum('cantidad')).order_by().values_list(
+            'venta_id', 'producto_id', 'suma_cantidad'
+        ).iterator(chunk_size=TAMANO_LOTE)
+    }
+    movidas = {
+        (venta_id, producto_id): -int(variacion or 0)
+        for venta_id, producto_id, variacion in MovimientoStock.objects.filter(ventas_validas).values(
+            'venta_id', 'producto_id'
+        ).annotate(suma_variacion=Sum(variacion_stock())).order_by().values_list(
+            'venta_id', 'producto_id', 'suma_variacion'
+        ).iterator(chunk_size=TAMANO_LOTE)
+    }
+    for venta_id, producto_id in sorted(vendidas.keys() | movidas.keys()):
+        esperado = vendidas.get((venta_id, producto_id), 0)
+        encontrado = movidas.get((venta_id, producto_id), 0)
+        if esperado != encontrado:
+            yield _discrepancia(
+                'venta_sin_movimiento', esperado, encontrado, producto_id=producto_id, venta_id=venta_id,
+            )
+
+
+COMPROBACIONES = {
+    'movimiento_inconsistente': movimientos_inconsistentes,
+    'cadena_discontinua': cadenas_discontinuas,
+    'stock_vs_historial': stock_vs_historial,
+    'venta_sin_movimiento': ventas_sin_movimiento,
+}
+
+
+def discrepancias_stock(tipos=None):
+    """
+    Discrepancias de las comprobaciones indicadas (todas por defecto), en el
+    orden de TIPOS_DISCREPANCIA. Es un generador: las filas se leen por lotes.
+    """
+    for tipo in TIPOS_DISCREPANCIA:
+        if not tipos or tipo in tipos:
+            yield from COMPROBACIONES[tipo]()
+
+
+def fila_discrepancia(discrepancia):
+    """Fila CSV de una discrepancia (columnas de COLUMNAS_DISCREPANCIA)"""
+    return ['' if discrepancia[columna] is None else discrepancia[columna] for columna in COLUMNAS_DISCREPANCIA]
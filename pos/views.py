@@ -3,7 +3,7 @@ from django.http import JsonResponse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Q, Avg
+from django.db.models import Sum, Q
 from django.utils import timezone
 from datetime import datetime
 from functools import wraps
@@ -20,6 +20,7 @@ from .models import (
     SalidaMercancia, ItemSalidaMercancia,
     CampanaMarketing, ClientePotencial
 )
+from .ventas_diarias import recalculo_ventas_producto_agrupado
 
 
 # ============================================
@@ -352,32 +353,23 @@ def cerrar_registradora_view(request):
 @login_required
 def home_view(request):
     """Vista principal del dashboard"""
-    hoy = timezone.now().date()
-    
-    # Ventas de hoy
-    ventas_hoy = Venta.objects.filter(
-        fecha__date=hoy,
-        completada=True,
-        anulada=False
-    ).aggregate(
-        total=Sum('total'),
-        cantidad=Count('id')
-    )
+    from .pronostico_stock import productos_en_riesgo
+    from .ventas_diarias import totales_ventas, ventas_diarias_rango
+    hoy = timezone.localdate()
+    
+    # Ventas de hoy (tabla de totales diarios)
+    ventas_hoy = totales_ventas(ventas_diarias_rango(hoy, hoy))
     
     # Productos
     productos_count = Producto.objects.filter(activo=True).count()
-    productos_bajo_stock = Producto.objects.filter(activo=True, stock__lt=10).count()
     
     # Últimas ventas
     ultimas_ventas = Venta.objects.filter(
         completada=True
     ).order_by('-fecha')[:10]
     
-    # Productos con stock bajo
-    productos_stock_bajo = Producto.objects.filter(
-        activo=True,
-        stock__lt=10
-    ).order_by('stock')[:10]
+    # Productos que se agotan antes de la próxima entrega (días de cobertura)
+    productos_bajo_stock, productos_stock_bajo, pronostico = productos_en_riesgo(10)
     
     # Caja abierta (caja única global)
     caja_principal = Caja.objects.filter(numero=1).first()
@@ -411,27 +403,22 @@ def home_view(request):
         })
     
     # Calcular ventas totales del mes actual para la meta
-    from datetime import datetime
-    inicio_mes = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    ventas_mes = Venta.objects.filter(
-        fecha__gte=inicio_mes,
-        completada=True,
-        anulada=False
-    ).aggregate(total=Sum('total'))
-    
-    ventas_totales_mes = float(ventas_mes['total'] or 0)
+    ventas_mes = totales_ventas(ventas_diarias_rango(hoy.replace(day=1)))
+    
+    ventas_totales_mes = float(ventas_mes['total_ventas'])
     meta_ventas = 100000000  # 100 millones
     porcentaje_meta = (ventas_totales_mes / meta_ventas * 100) if meta_ventas > 0 else 0
     porcentaje_meta = float(min(porcentaje_meta, 100))  # Limitar al 100% y convertir a float
     faltan_para_meta = max(0, meta_ventas - ventas_totales_mes)  # No mostrar negativo
     
     context = {
-        'ventas_hoy': ventas_hoy['total'] or 0,
-        'total_ventas_hoy': ventas_hoy['cantidad'] or 0,
+        'ventas_hoy': ventas_hoy['total_ventas'],
+        'total_ventas_hoy': ventas_hoy['cantidad_ventas'],
         'productos_count': productos_count,
         'productos_bajo_stock': productos_bajo_stock,
         'ultimas_ventas': ultimas_ventas,
         'productos_stock_bajo': productos_stock_bajo,
+        'dias_entrega': pronostico['dias_entrega'],
         'caja_abierta': caja_abierta,
         'registradora_seleccionada': registradora_seleccionada,
         'registradoras': registradoras,
@@ -559,6 +546,7 @@ def vender_view(request):
 
 
 @login_required
+@recalculo_ventas_producto_agrupado()
 def procesar_venta(request):
     """Procesar una venta (AJAX)"""
     if request.method == 'POST':
@@ -650,7 +638,8 @@ def procesar_venta(request):
                     stock_anterior=producto.stock + cantidad,
                     stock_nuevo=producto.stock,
                     motivo=f'Venta #{venta.id}',
-                    usuario=request.user
+                    usuario=request.user,
+                    venta=venta
                 )
                 
                 total += subtotal
@@ -772,6 +761,7 @@ def detalle_venta_view(request, venta_id):
 
 
 @login_required
+@recalculo_ventas_producto_agrupado()
 def editar_venta_view(request, venta_id):
     """Editar una venta"""
     # Solo administradores y cajeros pueden editar ventas
@@ -903,8 +893,11 @@ def editar_venta_view(request, venta_id):
                         # Devolver stock anterior
                         item.producto.stock += item.cantidad
                         item.producto.save()
-                        # Actualizar item
+                        # Actualizar item (si cambia el producto se copian los datos del nuevo)
+                        producto_anterior_id = item.producto_id
                         item.producto = Producto.objects.get(id=producto_id)
+                        if item.producto_id != producto_anterior_id:
+                            item.copiar_datos_producto()
                         item.cantidad = cantidad
                         item.precio_unitario = precio
                         item.subtotal = precio * cantidad
@@ -1165,7 +1158,8 @@ def anular_venta_view(request, venta_id):
                     stock_anterior=producto.stock - item.cantidad,
                     stock_nuevo=producto.stock,
                     motivo=f'Anulación venta #{venta.id}',
-                    usuario=request.user
+                    usuario=request.user,
+                    venta=venta
                 )
             
             # Manejar el dinero recibido si la venta fue en efectivo
@@ -1212,6 +1206,9 @@ def anular_venta_view(request, venta_id):
     return redirect('pos:detalle_venta', venta_id=venta_id)
 
 
+MOVIMIENTOS_CAJA_POR_PAGINA = 100
+
+
 @login_required
 @requiere_rol('Administradores', 'Cajeros')
 def caja_view(request):
@@ -1354,6 +1351,8 @@ def caja_view(request):
     ventas_caja = []
     gastos_caja = []
     movimientos_unificados = []
+    movimientos_total = 0
+    movimientos_siguiente_token = None
     total_gastos = 0
     total_ingresos = 0
     saldo_caja = 0
@@ -1468,19 +1467,21 @@ def caja_view(request):
         )
         # Filtrar solo los gastos de devolución que corresponden a ventas en efectivo
         gastos_devolucion_efectivo_total = 0
+        import re
+        gastos_devolucion_por_venta = []
         for gasto in gastos_devolucion_efectivo:
             # Extraer ID de venta de la descripción
-            import re
             match = re.search(r'venta #(\d+)', gasto.descripcion, re.IGNORECASE)
             if match:
-                venta_id_devolucion = int(match.group(1))
-                # Verificar si la venta era en efectivo
-                try:
-                    venta_devolucion = Venta.objects.get(id=venta_id_devolucion)
-                    if venta_devolucion.metodo_pago == 'efectivo':
-                        gastos_devolucion_efectivo_total += gasto.monto
-                except Venta.DoesNotExist:
-                    pass
+                gastos_devolucion_por_venta.append((int(match.group(1)), gasto.monto))
+        # Verificar en una sola consulta cuáles ventas eran en efectivo
+        ventas_devolucion = Venta.objects.in_bulk(
+            [venta_id for venta_id, _ in gastos_devolucion_por_venta]
+        )
+        for venta_id_devolucion, monto_devolucion in gastos_devolucion_por_venta:
+            venta_devolucion = ventas_devolucion.get(venta_id_devolucion)
+            if venta_devolucion and venta_devolucion.metodo_pago == 'efectivo':
+                gastos_devolucion_efectivo_total += monto_devolucion
         
         if gastos_devolucion_efectivo_total > 0:
             # Si hay gastos de devolución en efectivo, significa que el dinero de las ventas anuladas SÍ entró a la caja
@@ -1519,148 +1520,19 @@ def caja_view(request):
         # Para mostrar en la tabla, incluir solo los gastos del período de la caja
         gastos_caja = gastos_periodo.order_by('-fecha')
         
-        # Crear lista unificada de movimientos (apertura, ventas, gastos, ingresos)
-        movimientos_unificados = []
-        
-        # Agregar apertura de caja como primer movimiento
-        # (monto_inicial ya está definido arriba)
-        movimientos_unificados.append({
-            'tipo': 'apertura',
-            'fecha': caja_mostrar.fecha_apertura,
-            'monto': monto_inicial,
-            'descripcion': 'Apertura de Caja',
-            'usuario': caja_mostrar.usuario,
-            'metodo_pago': None,
-            'vendedor': None,
-            'venta_id': None,
-        })
-        
-        # Verificar si hay gastos de devolución por anulación para evitar duplicación
-        # Si existe un GastoCaja de devolución, no agregar el movimiento adicional de anulación
-        gastos_devolucion_ids = set()
-        for gasto in gastos_periodo:
-            if 'Devolución por anulación de venta #' in gasto.descripcion:
-                # Extraer el ID de la venta de la descripción
-                import re
-                match = re.search(r'venta #(\d+)', gasto.descripcion, re.IGNORECASE)
-                if match:
-                    venta_id_devolucion = int(match.group(1))
-                    gastos_devolucion_ids.add(venta_id_devolucion)
-        
-        # Agregar TODAS las ventas como movimientos (incluyendo anuladas)
-        # Las ventas aparecen normalmente, y si están anuladas, se agrega un movimiento adicional de anulación
-        # EXCEPTO si ya existe un GastoCaja de devolución (para evitar duplicación)
-        ventas_lista_todas = list(ventas_caja_todas.order_by('fecha'))
-        for venta in ventas_lista_todas:
-            # Obtener nombre de la registradora si existe
-            registradora_nombre = None
-            if venta.registradora_id:
-                registradoras = {
-                    1: 'Registradora 1',
-                    2: 'Registradora 2',
-                    3: 'Registradora 3',
-                }
-                registradora_nombre = registradoras.get(venta.registradora_id, f'Registradora {venta.registradora_id}')
-            
-            # Agregar la venta normalmente (incluso si está anulada)
-            movimientos_unificados.append({
-                'tipo': 'venta',
-                'fecha': venta.fecha,
-                'monto': venta.total,
-                'descripcion': f'Venta #{venta.id}' + (' (Anulada)' if venta.anulada else ''),
-                'usuario': venta.usuario,
-                'metodo_pago': venta.get_metodo_pago_display(),
-                'vendedor': venta.vendedor,
-                'venta_id': venta.id,
-                'registradora_id': venta.registradora_id,
-                'registradora_nombre': registradora_nombre,
-                'anulada': venta.anulada,
-            })
-            
-            # Si la venta está anulada, agregar un movimiento adicional de anulación que reste
-            # SOLO si NO existe un GastoCaja de devolución (para evitar duplicación)
-            if venta.anulada and venta.id not in gastos_devolucion_ids:
-                movimientos_unificados.append({
-                    'tipo': 'devolucion',  # Tipo especial para devoluciones/anulaciones
-                    'fecha': venta.fecha_anulacion if venta.fecha_anulacion else venta.fecha,
-                    'monto': -venta.total,  # Monto negativo para restar
-                    'descripcion': f'Anulación - Venta #{venta.id}',
-                    'usuario': venta.usuario_anulacion if venta.usuario_anulacion else venta.usuario,
-                    'metodo_pago': venta.get_metodo_pago_display(),
-                    'vendedor': venta.vendedor,
-                    'venta_id': venta.id,
-                    'registradora_id': venta.registradora_id,
-                    'registradora_nombre': registradora_nombre,
-                    'anulada': True,
-                })
-        
-        # Agregar gastos e ingresos como movimientos
-        # Usar gastos_periodo que ya está filtrado por fecha
-        # Convertir a lista para asegurar que se incluyan todos los gastos del período
-        gastos_lista = list(gastos_periodo.order_by('fecha'))
-        
-        # Log para trazabilidad
-        logger.debug(f"Caja #{caja_mostrar.id}: Agregando {len(gastos_lista)} gastos/ingresos a movimientos (filtrados por fecha)")
-        
-        for movimiento in gastos_lista:
-            # Identificar si es un retiro por la descripción
-            es_retiro = 'Retiro de dinero al cerrar caja' in movimiento.descripcion
-            tipo_movimiento = 'retiro' if es_retiro else movimiento.tipo
-            
-            # Log para trazabilidad de devoluciones
-            if 'Devolución por anulación' in movimiento.descripcion:
-                logger.debug(f"Movimiento de devolución detectado: ID={movimiento.id}, Monto=${movimiento.monto:,}, Caja={caja_mostrar.id}")
-            
-            movimientos_unificados.append({
-                'tipo': tipo_movimiento,
-                'fecha': movimiento.fecha,
-                'monto': movimiento.monto,
-                'descripcion': movimiento.descripcion,
-                'usuario': movimiento.usuario,
-                'metodo_pago': None,
-                'vendedor': None,
-                'venta_id': None,
-                'gasto_id': movimiento.id,  # Agregar ID del gasto para trazabilidad
-            })
-        
-        # Ordenar todos los movimientos por fecha ascendente para calcular saldos
-        movimientos_unificados.sort(key=lambda x: x['fecha'])
-        
-        # Calcular saldo antes y después de cada movimiento
-        # IMPORTANTE: El saldo inicial es 0 antes de cualquier movimiento
-        # La apertura establece el monto inicial, y luego se calculan los saldos secuencialmente
-        saldo_actual = 0
-        
-        for movimiento in movimientos_unificados:
-            saldo_antes = saldo_actual
-            monto = int(movimiento['monto'])
-            
-            # Calcular saldo después según el tipo de movimiento
-            if movimiento['tipo'] == 'apertura':
-                # La apertura agrega el monto inicial
-                saldo_despues = saldo_antes + monto
-            elif movimiento['tipo'] == 'venta' or movimiento['tipo'] == 'ingreso':
-                # Ventas e ingresos suman al saldo
-                saldo_despues = saldo_antes + monto
-            elif movimiento['tipo'] == 'devolucion':
-                # Devoluciones restan del saldo (el monto ya es negativo)
-                saldo_despues = saldo_antes + monto  # Sumar porque monto es negativo
-            elif movimiento['tipo'] == 'retiro' or movimiento['tipo'] == 'gasto':
-                # Retiros y gastos restan del saldo
-                saldo_despues = saldo_antes - monto
-            else:
-                # Por defecto, no afecta el saldo
-                saldo_despues = saldo_antes
-            
-            # Agregar saldo antes y después al movimiento
-            movimiento['saldo_antes'] = saldo_antes
-            movimiento['saldo_despues'] = saldo_despues
-            
-            # Actualizar saldo actual para el siguiente movimiento
-            saldo_actual = saldo_despues
-        
-        # Ordenar por fecha descendente para mostrar (más recientes primero)
-        movimientos_unificados.sort(key=lambda x: x['fecha'], reverse=True)
+        # Línea de tiempo de movimientos (apertura, ventas, anulaciones, gastos, ingresos)
+        # paginada por cursor: solo se cargan las filas de la página solicitada y el
+        # saldo antes/después se calcula hacia atrás desde el saldo final (agregados)
+        from .movimientos_caja import pagina_movimientos_caja
+        pagina_movimientos = pagina_movimientos_caja(
+            caja_mostrar,
+            caja_principal,
+            limite=MOVIMIENTOS_CAJA_POR_PAGINA,
+            token=request.GET.get('mov_desde')
+        )
+        movimientos_unificados = pagina_movimientos['movimientos']
+        movimientos_total = pagina_movimientos['total_movimientos']
+        movimientos_siguiente_token = pagina_movimientos['siguiente_token']
         
         # Calcular saldo en caja: Monto Inicial + Ventas Válidas + Ventas Anuladas (que ingresaron dinero) + Ingresos - Gastos
         # IMPORTANTE sobre ventas anuladas:
@@ -1694,6 +1566,9 @@ def caja_view(request):
         'ventas_caja': ventas_caja,
         'gastos_caja': gastos_caja,
         'movimientos_unificados': movimientos_unificados,
+        'movimientos_total': movimientos_total,
+        'movimientos_siguiente_token': movimientos_siguiente_token,
+        'movimientos_desde': request.GET.get('mov_desde', ''),
         'total_gastos': total_gastos,
         'total_ingresos': total_ingresos,
         'saldo_caja': saldo_caja,
@@ -1716,6 +1591,65 @@ def caja_view(request):
     return render(request, 'pos/caja.html', context)
 
 
+@login_required
+@requiere_rol('Administradores', 'Cajeros')
+def api_movimientos_caja_view(request):
+    """
+    API paginada de la línea de tiempo de movimientos de la caja.
+    Parámetros GET: limite (1-500, por defecto 100) y desde (token de la página anterior).
+    """
+    from datetime import date
+    from .movimientos_caja import pagina_movimientos_caja
+
+    caja_principal = Caja.objects.filter(numero=1).first()
+    caja_mostrar = obtener_caja_mostrar(None, date.today())
+    if not caja_principal or not caja_mostrar:
+        return JsonResponse({'movimientos': [], 'siguiente_token': None, 'total_movimientos': 0})
+
+    try:
+        limite = int(request.GET.get('limite', MOVIMIENTOS_CAJA_POR_PAGINA))
+    except (TypeError, ValueError):
+        limite = MOVIMIENTOS_CAJA_POR_PAGINA
+    limite = max(1, min(limite, 500))
+
+    pagina = pagina_movimientos_caja(
+        caja_mostrar,
+        caja_principal,
+        limite=limite,
+        token=request.GET.get('desde')
+    )
+
+    def _nombre(usuario):
+        if not usuario:
+            return None
+        return usuario.get_full_name() or usuario.username
+
+    movimientos_data = []
+    for movimiento in pagina['movimientos']:
+        movimientos_data.append({
+            'tipo': movimiento['tipo'],
+            'fecha': timezone.localtime(movimiento['fecha']).isoformat(),
+            'monto': int(movimiento['monto']),
+            'descripcion': movimiento['descripcion'],
+            'usuario': _nombre(movimiento['usuario']),
+            'vendedor': _nombre(movimiento.get('vendedor')),
+            'metodo_pago': movimiento.get('metodo_pago'),
+            'venta_id': movimiento.get('venta_id'),
+            'gasto_id': movimiento.get('gasto_id'),
+            'registradora': movimiento.get('registradora_nombre'),
+            'anulada': movimiento.get('anulada', False),
+            'saldo_antes': movimiento['saldo_antes'],
+            'saldo_despues': movimiento['saldo_despues'],
+        })
+
+    return JsonResponse({
+        'caja_id': caja_mostrar.id,
+        'movimientos': movimientos_data,
+        'siguiente_token': pagina['siguiente_token'],
+        'total_movimientos': pagina['total_movimientos'],
+    })
+
+
 @login_required
 @requiere_rol('Administradores', 'Cajeros')
 def abrir_caja_view(request):
@@ -2157,13 +2091,94 @@ def registrar_ingreso_view(request):
     return redirect('pos:caja')
 
 
+def _contexto_reporte_inventario(producto_id, tipo_movimiento, fecha_desde, fecha_hasta, dataset):
+    """Contexto de la pantalla del reporte de inventario a partir del dataset (o de un trabajo guardado)"""
+    from .reporte_inventario import CLAVES_CONTEXTO_INVENTARIO
+
+    context = {
+        'tipo_reporte': 'inventario',
+        # Lista de productos para el filtro
+        'productos': Producto.objects.filter(activo=True).order_by('nombre'),
+        'producto_id': producto_id,
+        'tipo_movimiento': tipo_movimiento,
+        'fecha_desde': fecha_desde,
+        'fecha_hasta': fecha_hasta,
+    }
+    context.update({clave: dataset[clave] for clave in CLAVES_CONTEXTO_INVENTARIO})
+    return context
+
+
+def _contexto_reporte_caja(request, fecha_desde, fecha_hasta, datos):
+    """
+    Contexto de la pantalla del reporte de caja: las secciones agregadas vienen
+    en `datos` (construir_dataset_caja o un trabajo en segundo plano) y los
+    detalles se paginan aquí según los parámetros page_* del request.
+    """
+    from django.core.paginator import Paginator
+    from .reporte_caja import MovimientosCajaRango, rango_caja
+
+    inicio_dt, fin_dt = rango_caja(fecha_desde, fecha_hasta)
+
+    # Ventas (incluye anuladas; se desglosa)
+    ventas_qs = Venta.objects.filter(
+        fecha__gte=inicio_dt,
+        fecha__lt=fin_dt,
+        completada=True
+    )
+
+    # Caja: cajas que se solapan con el rango
+    cajas_qs = CajaUsuario.objects.filter(
+        fecha_apertura__lt=fin_dt
+    ).filter(
+        Q(fecha_cierre__gte=inicio_dt) | Q(fecha_cierre__isnull=True)
+    ).select_related('usuario', 'caja').order_by('-fecha_apertura')
+
+    # Movimientos (gastos/ingresos/retiros) por rango (no depende de una caja específica)
+    movimientos_qs = GastoCaja.objects.filter(fecha__gte=inicio_dt, fecha__lt=fin_dt).select_related('usuario', 'caja_usuario').order_by('-fecha')
+
+    # Paginación (ventas y movimientos)
+    ventas_page = request.GET.get('page_ventas', 1)
+    movs_page = request.GET.get('page_movs', 1)
+    cajas_page = request.GET.get('page_cajas', 1)
+    movs_caja_page = request.GET.get('page_movs_caja', 1)
+
+    ventas_paginated = Paginator(
+        ventas_qs.select_related('usuario', 'vendedor').prefetch_related('items').order_by('-fecha'), 50
+    ).get_page(ventas_page)
+    movs_paginated = Paginator(movimientos_qs, 50).get_page(movs_page)
+    cajas_paginated = Paginator(cajas_qs, 25).get_page(cajas_page)
+    # Línea de movimientos con saldo: perezosa, la página solo recorre hasta su última fila
+    movs_caja_paginated = Paginator(MovimientosCajaRango(inicio_dt, fin_dt), 100).get_page(movs_caja_page)
+
+    context = {
+        'tipo_reporte': 'caja',
+        'modo_simple': True,
+        'fecha_desde': fecha_desde,
+        'fecha_hasta': fecha_hasta,
+        'inicio_dt': inicio_dt,
+        'fin_dt': fin_dt,
+        'usar_corte_dia': False,
+        'corte_dia': '',
+        'ocultar_cajas_sin_mov': False,
+
+        # Detalles paginados
+        'ventas_detalle': ventas_paginated,
+        'cajas_detalle': cajas_paginated,
+        'movimientos_detalle': movs_paginated,
+        'movimientos_caja_detalle': movs_caja_paginated,
+
+        # En modo web simplificado: siempre todas las cajas del rango (sin forzar CajaUsuario)
+        'caja_usuario_id': '',
+        'caja_usuario_sel': None,
+    }
+    context.update(datos)
+    return context
+
+
 @login_required
 @requiere_rol('Administradores')
 def reportes_view(request):
     """Vista de reportes"""
-    # Asegurar que Sum esté disponible en el scope local
-    from django.db.models import Sum as SumAgg, Count, Q
-    
     if not puede_ver_reportes(request.user):
         messages.error(request, 'No tienes permisos para ver reportes')
         return redirect('pos:home')
@@ -2171,6 +2186,10 @@ def reportes_view(request):
     # Obtener tipo de reporte
     tipo_reporte = request.GET.get('tipo', '')
     
+    # Enlaces anteriores a la página de selección (fechas/export sin tipo) son del reporte de caja
+    if not tipo_reporte and any(request.GET.get(k) for k in ('export', 'fecha_desde', 'fecha_hasta')):
+        tipo_reporte = 'caja'
+    
     # Si no hay tipo seleccionado, mostrar página de selección
     if not tipo_reporte:
         return render(request, 'pos/reportes.html', {
@@ -2179,9 +2198,6 @@ def reportes_view(request):
     
     # Si es inventario, usar la vista de movimientos de inventario
     if tipo_reporte == 'inventario':
-        from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-        from .models import MovimientoStock, Producto
-        
         # Filtros
         producto_id = request.GET.get('producto')
         tipo_movimiento = request.GET.get('tipo_mov')
@@ -2198,685 +2214,21 @@ def reportes_view(request):
         if fecha_hasta and fecha_hasta.lower() in ('none', 'null', ''):
             fecha_hasta = None
         
-        # Base query para movimientos
-        movimientos_qs = MovimientoStock.objects.select_related('producto')
+        # Todos los datos del reporte (resumen, análisis, tops y comparativa) se calculan una sola vez
+        # por filtro y versión de datos; la pantalla y las exportaciones comparten el mismo dataset
+        from .reporte_inventario import obtener_dataset_inventario
+        dataset = obtener_dataset_inventario(producto_id, tipo_movimiento, fecha_desde, fecha_hasta)
+        resumen_productos = dataset['resumen_productos']
         
-        if producto_id:
-            try:
-                producto_id_int = int(producto_id)
-                movimientos_qs = movimientos_qs.filter(producto_id=producto_id_int)
-            except (ValueError, TypeError):
-                pass  # Ignorar si no es un número válido
-        
-        if tipo_movimiento:
-            movimientos_qs = movimientos_qs.filter(tipo=tipo_movimiento)
-        
-        if fecha_desde:
-            try:
-                fecha_desde_obj = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-                movimientos_qs = movimientos_qs.filter(fecha__date__gte=fecha_desde_obj)
-            except ValueError:
-                pass
-        
-        if fecha_hasta:
-            try:
-                fecha_hasta_obj = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-                movimientos_qs = movimientos_qs.filter(fecha__date__lte=fecha_hasta_obj)
-            except ValueError:
-                pass
-        
-        # Optimización: Agrupar directamente por código + atributo usando annotate
-        # Esto hace todo en una sola consulta SQL en lugar de múltiples consultas
-        from django.db.models import Min
-        
-        # Agrupar movimientos por producto__codigo y producto__atributo
-        # Usar Min para obtener el primer nombre (todos los productos con mismo código+atributo tienen el mismo nombre)
-        resumen_agrupado = movimientos_qs.values(
-            'producto__codigo',
-            'producto__atributo'
-        ).annotate(
-            producto__nombre=Min('producto__nombre'),  # Obtener nombre del primer producto
-            total_entradas=SumAgg('cantidad', filter=Q(tipo='ingreso')),
-            total_salidas=SumAgg('cantidad', filter=Q(tipo='salida')),
-            total_ajustes=SumAgg('cantidad', filter=Q(tipo='ajuste'))
-        ).order_by('producto__codigo', 'producto__atributo')
-        
-        # Obtener stock actual de productos agrupados por código+atributo
-        # Pre-cargar todos los productos activos para evitar consultas N+1
-        productos_activos = Producto.objects.filter(activo=True).values(
-            'codigo', 'atributo', 'stock', 'nombre', 'precio'
-        )
-        
-        # Crear un diccionario para lookup rápido de stock por (codigo, atributo)
-        # Nota: Normalizar atributo para que coincida con cómo se busca después
-        stock_map = {}
-        for p in productos_activos:
-            codigo = p['codigo']
-            # Normalizar atributo: quitar espacios al final para que coincida con la búsqueda
-            atributo = (p['atributo'] or '').strip() if p['atributo'] else ''
-            clave = (codigo, atributo)
-            if clave not in stock_map:
-                stock_map[clave] = {'stock': 0, 'nombre': p['nombre'], 'precio': p['precio']}
-            stock_map[clave]['stock'] += p['stock']
-            # Si hay múltiples productos con mismo código+atributo, usar el precio del primero encontrado
-            # (generalmente todos tienen el mismo precio)
-        
-        # Construir la lista de resultados con análisis de negativos
-        resumen_productos = []
-        for item in resumen_agrupado:
-            codigo = item['producto__codigo']
-            # Normalizar atributo: quitar espacios y convertir vacío a string vacío
-            atributo = (item['producto__atributo'] or '').strip() if item['producto__atributo'] else ''
-            clave = (codigo, atributo)
-            
-            total_entradas = int(item['total_entradas'] or 0)
-            total_salidas = int(item['total_salidas'] or 0)
-            ajustes = int(item['total_ajustes'] or 0)
-            neto = total_entradas - total_salidas + ajustes
-            
-            # Obtener stock actual del mapa
-            stock_info = stock_map.get(clave, {'stock': 0, 'nombre': item.get('producto__nombre', ''), 'precio': 0})
-            stock_actual = stock_info['stock']
-            nombre = stock_info['nombre'] or item.get('producto__nombre', '')
-            precio_venta = stock_info.get('precio', 0)
-            
-            # Calcular stock inicial usando TODOS los movimientos históricos (sin filtro de fecha)
-            # Buscar el producto para obtener todos sus movimientos
-            # Nota: El atributo en la BD puede tener espacios al final, así que normalizamos
-            productos_con_codigo = Producto.objects.filter(codigo=codigo, activo=True)
-            
-            # Filtrar productos por atributo normalizado (comparar sin espacios al final)
-            productos_filtrados = []
-            for prod in productos_con_codigo:
-                prod_atributo = (prod.atributo or '').strip() if prod.atributo else ''
-                if atributo:
-                    # Si buscamos un atributo específico, comparar normalizados
-                    if prod_atributo == atributo:
-                        productos_filtrados.append(prod)
-                else:
-                    # Si no hay atributo, buscar productos sin atributo
-                    if not prod_atributo:
-                        productos_filtrados.append(prod)
-            
-            # Obtener todos los movimientos históricos de estos productos
-            if productos_filtrados:
-                movimientos_historicos = MovimientoStock.objects.filter(producto__in=productos_filtrados)
-            else:
-                # Si no se encontraron productos, crear un queryset vacío
-                movimientos_historicos = MovimientoStock.objects.none()
-            total_entradas_historico = movimientos_historicos.filter(tipo='ingreso').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            total_salidas_historico = movimientos_historicos.filter(tipo='salida').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            total_ajustes_historico = movimientos_historicos.filter(tipo='ajuste').aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            neto_historico = total_entradas_historico - total_salidas_historico + total_ajustes_historico
-            
-            # Stock inicial = Stock actual - Neto histórico total
-            stock_inicial_calculado = stock_actual - neto_historico
-            
-            # Analizar causas de negativos
-            causas_negativos = []
-            alertas = []
-            diferencia_salidas_entradas = 0
-            
-            # Análisis de Neto negativo
-            if neto < 0:
-                if total_salidas > (total_entradas + ajustes):
-                    diferencia = total_salidas - (total_entradas + ajustes)
-                    causas_negativos.append(f"Salidas ({total_salidas}) superan entradas+ajustes ({total_entradas + ajustes}) por {diferencia} unidades")
-                if ajustes < 0:
-                    causas_negativos.append(f"Ajustes negativos ({ajustes}) reducen el stock en {abs(ajustes)} unidades")
-            
-            # Calcular diferencia entre salidas y entradas para el template
-            if total_salidas > total_entradas:
-                diferencia_salidas_entradas = total_salidas - total_entradas
-            
-            # Análisis de Stock Actual negativo
-            if stock_actual < 0:
-                alertas.append(f"⚠️ Stock actual negativo: {stock_actual}. Posible inconsistencia en el inventario.")
-                # Calcular stock esperado basado en movimientos
-                stock_esperado = total_entradas - total_salidas + ajustes
-                if stock_esperado != stock_actual:
-                    diferencia_stock = stock_actual - stock_esperado
-                    causas_negativos.append(f"Inconsistencia: Stock actual ({stock_actual}) difiere del esperado ({stock_esperado}) por {diferencia_stock} unidades")
-            
-            # Análisis de Stock Actual cero con movimientos
-            if stock_actual == 0 and (total_entradas > 0 or total_salidas > 0):
-                if total_salidas > total_entradas:
-                    alertas.append("⚠️ Stock agotado: Se vendió más de lo que ingresó")
-            
-            # Análisis de ajustes significativos
-            if abs(ajustes) > (total_entradas + total_salidas) * 0.5 and (total_entradas + total_salidas) > 0:
-                alertas.append(f"⚠️ Ajustes significativos ({ajustes}) comparado con movimientos normales")
-            
-            resumen_productos.append({
-                'codigo': codigo,
-                'nombre': nombre,
-                'atributo': atributo if atributo else '-',
-                'total_entradas': total_entradas,
-                'total_salidas': total_salidas,
-                'ajustes': ajustes,
-                'ajustes_abs': abs(ajustes),  # Valor absoluto para el template
-                'neto': neto,
-                'stock_inicial': stock_inicial_calculado,
-                'stock_actual': stock_actual,
-                'precio_venta': precio_venta,
-                'causas_negativos': causas_negativos,
-                'alertas': alertas,
-                'tiene_problemas': len(causas_negativos) > 0 or len(alertas) > 0 or neto < 0 or stock_actual < 0,
-                'diferencia_salidas_entradas': diferencia_salidas_entradas,
-            })
-        
-        # Ordenar por código y atributo
-        resumen_productos.sort(key=lambda x: (x['codigo'], x['atributo']))
-        
-        # Calcular ventas por producto (usando ItemVenta) para agregar a cada item
-        from .models import ItemVenta, Venta
-        fecha_desde_ventas = None
-        fecha_hasta_ventas = None
-        if fecha_desde:
-            try:
-                fecha_desde_ventas = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        if fecha_hasta:
-            try:
-                fecha_hasta_ventas = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        
-        ventas_qs = Venta.objects.filter(completada=True, anulada=False)
-        if fecha_desde_ventas:
-            ventas_qs = ventas_qs.filter(fecha__date__gte=fecha_desde_ventas)
-        if fecha_hasta_ventas:
-            ventas_qs = ventas_qs.filter(fecha__date__lte=fecha_hasta_ventas)
-        
-        # Calcular ventas por código+atributo y precio promedio
-        ventas_por_producto = {}
-        items_venta = ItemVenta.objects.filter(venta__in=ventas_qs).select_related('producto')
-        for item_venta in items_venta:
-            codigo = item_venta.producto.codigo
-            atributo = (item_venta.producto.atributo or '').strip() if item_venta.producto.atributo else ''
-            clave = (codigo, atributo)
-            if clave not in ventas_por_producto:
-                ventas_por_producto[clave] = {
-                    'cantidad_total': 0,
-                    'valor_total': 0  # Suma de precio_unitario * cantidad
-                }
-            ventas_por_producto[clave]['cantidad_total'] += item_venta.cantidad
-            ventas_por_producto[clave]['valor_total'] += item_venta.precio_unitario * item_venta.cantidad
-        
-        # Calcular ingresos y salidas de mercancía por producto
-        from .models import ItemIngresoMercancia, ItemSalidaMercancia, IngresoMercancia, SalidaMercancia
-        
-        # Filtrar ingresos y salidas de mercancía por fecha si hay filtros
-        ingresos_mercancia_qs = IngresoMercancia.objects.filter(completado=True)
-        salidas_mercancia_qs = SalidaMercancia.objects.filter(completado=True)
-        
-        if fecha_desde_ventas:
-            ingresos_mercancia_qs = ingresos_mercancia_qs.filter(fecha__date__gte=fecha_desde_ventas)
-            salidas_mercancia_qs = salidas_mercancia_qs.filter(fecha__date__gte=fecha_desde_ventas)
-        if fecha_hasta_ventas:
-            ingresos_mercancia_qs = ingresos_mercancia_qs.filter(fecha__date__lte=fecha_hasta_ventas)
-            salidas_mercancia_qs = salidas_mercancia_qs.filter(fecha__date__lte=fecha_hasta_ventas)
-        
-        # Calcular ingresos de mercancía por código+atributo
-        ingresos_mercancia_por_producto = {}
-        items_ingreso = ItemIngresoMercancia.objects.filter(ingreso__in=ingresos_mercancia_qs).select_related('producto')
-        for item_ingreso in items_ingreso:
-            codigo = item_ingreso.producto.codigo
-            atributo = (item_ingreso.producto.atributo or '').strip() if item_ingreso.producto.atributo else ''
-            clave = (codigo, atributo)
-            if clave not in ingresos_mercancia_por_producto:
-                ingresos_mercancia_por_producto[clave] = 0
-            ingresos_mercancia_por_producto[clave] += item_ingreso.cantidad
-        
-        # Calcular salidas de mercancía por código+atributo
-        salidas_mercancia_por_producto = {}
-        items_salida = ItemSalidaMercancia.objects.filter(salida__in=salidas_mercancia_qs).select_related('producto')
-        for item_salida in items_salida:
-            codigo = item_salida.producto.codigo
-            atributo = (item_salida.producto.atributo or '').strip() if item_salida.producto.atributo else ''
-            clave = (codigo, atributo)
-            if clave not in salidas_mercancia_por_producto:
-                salidas_mercancia_por_producto[clave] = 0
-            salidas_mercancia_por_producto[clave] += item_salida.cantidad
-        
-        # Agregar ventas, precio promedio e ingresos netos de mercancía a cada item del resumen
-        for item in resumen_productos:
-            codigo = item['codigo']
-            atributo_raw = item['atributo']
-            atributo = (atributo_raw.strip() if atributo_raw and atributo_raw != '-' else '')
-            clave = (codigo, atributo)
-            
-            # Ventas y precio promedio
-            venta_info = ventas_por_producto.get(clave, {'cantidad_total': 0, 'valor_total': 0})
-            item['total_ventas'] = venta_info['cantidad_total']
-            # Calcular precio promedio: valor_total / cantidad_total (si hay ventas)
-            if venta_info['cantidad_total'] > 0:
-                item['precio_promedio_venta'] = round(venta_info['valor_total'] / venta_info['cantidad_total'])
-            else:
-                item['precio_promedio_venta'] = None
-            
-            # Ingresos netos de mercancía (Ingresos - Salidas)
-            ingresos_merc = ingresos_mercancia_por_producto.get(clave, 0)
-            salidas_merc = salidas_mercancia_por_producto.get(clave, 0)
-            item['total_ingresos_mercancia'] = ingresos_merc - salidas_merc
-        
-        # Obtener conteos físicos existentes (último conteo por código+atributo)
-        from .models import ConteoFisico
-        conteos_fisicos = {}
-        for item in resumen_productos:
-            codigo = item['codigo']
-            # Normalizar atributo: convertir '-' a None y hacer strip para coincidir con cómo se guarda
-            atributo_raw = item['atributo']
-            if atributo_raw == '-' or not atributo_raw:
-                atributo = None
-            else:
-                atributo = atributo_raw.strip() if atributo_raw else None
-            # Buscar último conteo para este código+atributo
-            conteo = ConteoFisico.objects.filter(
-                codigo=codigo,
-                atributo=atributo
-            ).order_by('-fecha_conteo').first()
-            if conteo:
-                conteos_fisicos[(codigo, atributo)] = conteo.cantidad_contada
-        
-        # Agregar conteos físicos a los items y calcular diferencias
-        productos_con_diferencias = []
-        for item in resumen_productos:
-            codigo = item['codigo']
-            # Normalizar atributo de la misma manera que arriba
-            atributo_raw = item['atributo']
-            if atributo_raw == '-' or not atributo_raw:
-                atributo = None
-            else:
-                atributo = atributo_raw.strip() if atributo_raw else None
-            cantidad_contada = conteos_fisicos.get((codigo, atributo), None)
-            item['cantidad_contada'] = cantidad_contada
-            
-            # Calcular diferencia entre stock_actual y cantidad_contada
-            stock_actual = item.get('stock_actual', 0)
-            if cantidad_contada is not None:
-                diferencia = cantidad_contada - stock_actual
-                item['diferencia'] = diferencia
-                item['coincide'] = (diferencia == 0)
-                # Si hay diferencia, agregar a la lista de productos con diferencias
-                if diferencia != 0:
-                    productos_con_diferencias.append({
-                        'codigo': codigo,
-                        'nombre': item.get('nombre', ''),
-                        'atributo': item.get('atributo', '-'),
-                        'stock_actual': stock_actual,
-                        'cantidad_contada': cantidad_contada,
-                        'diferencia': diferencia,
-                    })
-            else:
-                item['diferencia'] = None
-                item['coincide'] = False
-        
-        # Obtener lista de productos para el filtro
-        productos = Producto.objects.filter(activo=True).order_by('nombre')
-        
-        # ===== ANÁLISIS DE DATOS DEL RESUMEN =====
-        # Nota: total_salidas en resumen_productos son salidas de inventario (MovimientoStock tipo='salida')
-        # Las ventas se calculan por separado en la comparativa
-        analisis_datos = {
-            'total_productos': len(resumen_productos),
-            'total_entradas': sum(item.get('total_entradas', 0) for item in resumen_productos),
-            'total_salidas_inventario': sum(item.get('total_salidas', 0) for item in resumen_productos),
-            'total_ajustes': sum(item.get('ajustes', 0) for item in resumen_productos),
-            'total_neto': sum(item.get('neto', 0) for item in resumen_productos),
-            'total_stock_inicial': sum(item.get('stock_inicial', 0) for item in resumen_productos),
-            'total_stock_actual': sum(item.get('stock_actual', 0) for item in resumen_productos),
-            'productos_con_movimientos': len([item for item in resumen_productos if item.get('total_entradas', 0) > 0 or item.get('total_salidas', 0) > 0]),
-            'productos_sin_movimientos': len([item for item in resumen_productos if item.get('total_entradas', 0) == 0 and item.get('total_salidas', 0) == 0]),
-            'productos_stock_cero': len([item for item in resumen_productos if item.get('stock_actual', 0) == 0]),
-            'productos_stock_negativo': len([item for item in resumen_productos if item.get('stock_actual', 0) < 0]),
-            'productos_con_problemas': len([item for item in resumen_productos if item.get('tiene_problemas', False)]),
-            'productos_con_conteo': len([item for item in resumen_productos if item.get('cantidad_contada') is not None]),
-            'productos_coinciden': len([item for item in resumen_productos if item.get('coincide', False)]),
-        }
-        
-        # Top productos por entradas
-        top_entradas = sorted(
-            [item for item in resumen_productos if item.get('total_entradas', 0) > 0],
-            key=lambda x: x.get('total_entradas', 0),
-            reverse=True
-        )[:10]
-        
-        # Top productos por ventas (calcular desde ItemVenta)
-        # Primero necesitamos obtener las ventas por producto antes de la comparativa
-        from .models import ItemVenta, Venta
-        fecha_desde_ventas = None
-        fecha_hasta_ventas = None
-        if fecha_desde:
-            try:
-                fecha_desde_ventas = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        if fecha_hasta:
-            try:
-                fecha_hasta_ventas = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        
-        ventas_qs_temp = Venta.objects.filter(completada=True, anulada=False)
-        if fecha_desde_ventas:
-            ventas_qs_temp = ventas_qs_temp.filter(fecha__date__gte=fecha_desde_ventas)
-        if fecha_hasta_ventas:
-            ventas_qs_temp = ventas_qs_temp.filter(fecha__date__lte=fecha_hasta_ventas)
-        
-        # Calcular ventas por código+atributo
-        ventas_por_producto = {}
-        items_venta_temp = ItemVenta.objects.filter(venta__in=ventas_qs_temp).select_related('producto')
-        for item_venta in items_venta_temp:
-            codigo = item_venta.producto.codigo
-            atributo = (item_venta.producto.atributo or '').strip() if item_venta.producto.atributo else ''
-            clave = (codigo, atributo)
-            if clave not in ventas_por_producto:
-                ventas_por_producto[clave] = {
-                    'codigo': codigo,
-                    'nombre': item_venta.producto.nombre,
-                    'atributo': atributo if atributo else '-',
-                    'total_ventas': 0
-                }
-            ventas_por_producto[clave]['total_ventas'] += item_venta.cantidad
-        
-        # Crear lista de productos con ventas para el top
-        productos_con_ventas = list(ventas_por_producto.values())
-        top_ventas = sorted(
-            productos_con_ventas,
-            key=lambda x: x.get('total_ventas', 0),
-            reverse=True
-        )[:10]
-        
-        # Productos con mayor rotación (ventas / stock_inicial si stock_inicial > 0)
-        productos_rotacion = []
-        for item in resumen_productos:
-            stock_inicial = item.get('stock_inicial', 0)
-            codigo = item.get('codigo')
-            atributo_raw = item.get('atributo', '-')
-            atributo = (atributo_raw.strip() if atributo_raw and atributo_raw != '-' else '')
-            clave = (codigo, atributo)
-            ventas_producto = ventas_por_producto.get(clave, {}).get('total_ventas', 0)
-            if stock_inicial > 0 and ventas_producto > 0:
-                rotacion = (ventas_producto / stock_inicial) * 100
-                productos_rotacion.append({
-                    **item,
-                    'total_ventas': ventas_producto,
-                    'rotacion_porcentaje': round(rotacion, 2)
-                })
-        top_rotacion = sorted(productos_rotacion, key=lambda x: x.get('rotacion_porcentaje', 0), reverse=True)[:10]
-        
-        # Productos con mayor diferencia absoluta entre conteo y stock
-        productos_diferencias_abs = sorted(
-            [item for item in resumen_productos if item.get('diferencia') is not None],
-            key=lambda x: abs(x.get('diferencia', 0)),
-            reverse=True
-        )[:10]
-        
-        # Análisis de variación de stock
-        variaciones_stock = []
-        for item in resumen_productos:
-            stock_inicial = item.get('stock_inicial', 0)
-            stock_actual = item.get('stock_actual', 0)
-            if stock_inicial != 0:
-                variacion = ((stock_actual - stock_inicial) / abs(stock_inicial)) * 100
-            else:
-                variacion = 100 if stock_actual > 0 else 0
-            variaciones_stock.append({
-                **item,
-                'variacion_porcentaje': round(variacion, 2)
-            })
-        
-        # Productos con mayor aumento de stock
-        top_aumento_stock = sorted(
-            [v for v in variaciones_stock if v.get('variacion_porcentaje', 0) > 0],
-            key=lambda x: x.get('variacion_porcentaje', 0),
-            reverse=True
-        )[:10]
-        
-        # Productos con mayor disminución de stock
-        top_disminucion_stock = sorted(
-            [v for v in variaciones_stock if v.get('variacion_porcentaje', 0) < 0],
-            key=lambda x: x.get('variacion_porcentaje', 0)
-        )[:10]
-        
-        # ===== COMPARATIVA: Ingresos vs Salidas (Ventas) vs Salidas de Mercancía =====
-        from .models import ItemVenta, Venta
-        # Sum ya está importado al inicio del archivo, no es necesario importarlo de nuevo
-        
-        # Filtros de fecha para la comparativa
-        fecha_desde_comparativa = None
-        fecha_hasta_comparativa = None
-        if fecha_desde:
-            try:
-                fecha_desde_comparativa = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        if fecha_hasta:
-            try:
-                fecha_hasta_comparativa = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        
-        # 1. INGRESOS DE MERCANCÍA (MovimientoStock tipo='ingreso')
-        ingresos_qs = MovimientoStock.objects.filter(tipo='ingreso')
-        if fecha_desde_comparativa:
-            ingresos_qs = ingresos_qs.filter(fecha__date__gte=fecha_desde_comparativa)
-        if fecha_hasta_comparativa:
-            ingresos_qs = ingresos_qs.filter(fecha__date__lte=fecha_hasta_comparativa)
-        if producto_id:
-            try:
-                producto_id_int = int(producto_id)
-                ingresos_qs = ingresos_qs.filter(producto_id=producto_id_int)
-            except (ValueError, TypeError):
-                pass
-        
-        total_ingresos_cantidad = ingresos_qs.aggregate(total=Sum('cantidad'))['total'] or 0
-        total_ingresos_registros = ingresos_qs.count()
-        
-        # 2. SALIDAS POR VENTAS (ItemVenta de ventas completadas y no anuladas)
-        ventas_qs = Venta.objects.filter(completada=True, anulada=False)
-        if fecha_desde_comparativa:
-            ventas_qs = ventas_qs.filter(fecha__date__gte=fecha_desde_comparativa)
-        if fecha_hasta_comparativa:
-            ventas_qs = ventas_qs.filter(fecha__date__lte=fecha_hasta_comparativa)
-        
-        items_venta_qs = ItemVenta.objects.filter(venta__in=ventas_qs)
-        if producto_id:
-            try:
-                producto_id_int = int(producto_id)
-                items_venta_qs = items_venta_qs.filter(producto_id=producto_id_int)
-            except (ValueError, TypeError):
-                pass
-        
-        total_ventas_cantidad = items_venta_qs.aggregate(total=Sum('cantidad'))['total'] or 0
-        total_ventas_registros = items_venta_qs.count()
-        total_ventas_valor = items_venta_qs.aggregate(total=Sum('subtotal'))['total'] or 0
-        
-        # 3. SALIDAS DE MERCANCÍA (MovimientoStock tipo='salida')
-        salidas_qs = MovimientoStock.objects.filter(tipo='salida')
-        if fecha_desde_comparativa:
-            salidas_qs = salidas_qs.filter(fecha__date__gte=fecha_desde_comparativa)
-        if fecha_hasta_comparativa:
-            salidas_qs = salidas_qs.filter(fecha__date__lte=fecha_hasta_comparativa)
-        if producto_id:
-            try:
-                producto_id_int = int(producto_id)
-                salidas_qs = salidas_qs.filter(producto_id=producto_id_int)
-            except (ValueError, TypeError):
-                pass
-        
-        total_salidas_cantidad = salidas_qs.aggregate(total=Sum('cantidad'))['total'] or 0
-        total_salidas_registros = salidas_qs.count()
-        
-        # Calcular balance neto
-        balance_neto_cantidad = total_ingresos_cantidad - total_ventas_cantidad - total_salidas_cantidad
-        
-        # Comparativa por producto (si no hay filtro de producto específico)
-        comparativa_por_producto = []
-        if not producto_id:
-            # Agrupar por producto
-            productos_comparativa = Producto.objects.filter(activo=True).values('id', 'codigo', 'nombre', 'atributo')
-            
-            for prod in productos_comparativa:
-                prod_id = prod['id']
-                
-                # Ingresos del producto
-                ingresos_prod = MovimientoStock.objects.filter(
-                    tipo='ingreso',
-                    producto_id=prod_id
-                )
-                if fecha_desde_comparativa:
-                    ingresos_prod = ingresos_prod.filter(fecha__date__gte=fecha_desde_comparativa)
-                if fecha_hasta_comparativa:
-                    ingresos_prod = ingresos_prod.filter(fecha__date__lte=fecha_hasta_comparativa)
-                cant_ingresos = ingresos_prod.aggregate(total=Sum('cantidad'))['total'] or 0
-                
-                # Ventas del producto
-                items_venta_prod = ItemVenta.objects.filter(
-                    producto_id=prod_id,
-                    venta__in=ventas_qs
-                )
-                cant_ventas = items_venta_prod.aggregate(total=Sum('cantidad'))['total'] or 0
-                valor_ventas = items_venta_prod.aggregate(total=Sum('subtotal'))['total'] or 0
-                
-                # Salidas de mercancía del producto
-                salidas_prod = MovimientoStock.objects.filter(
-                    tipo='salida',
-                    producto_id=prod_id
-                )
-                if fecha_desde_comparativa:
-                    salidas_prod = salidas_prod.filter(fecha__date__gte=fecha_desde_comparativa)
-                if fecha_hasta_comparativa:
-                    salidas_prod = salidas_prod.filter(fecha__date__lte=fecha_hasta_comparativa)
-                cant_salidas = salidas_prod.aggregate(total=Sum('cantidad'))['total'] or 0
-                
-                # Solo agregar si hay algún movimiento
-                if cant_ingresos > 0 or cant_ventas > 0 or cant_salidas > 0:
-                    comparativa_por_producto.append({
-                        'codigo': prod['codigo'],
-                        'nombre': prod['nombre'],
-                        'atributo': prod['atributo'] or '-',
-                        'ingresos_cantidad': cant_ingresos,
-                        'ventas_cantidad': cant_ventas,
-                        'ventas_valor': valor_ventas,
-                        'salidas_cantidad': cant_salidas,
-                        'balance_neto': cant_ingresos - cant_ventas - cant_salidas,
-                    })
-        
-        # Ordenar por código
-        comparativa_por_producto.sort(key=lambda x: x['codigo'])
-        
-        # Obtener conteos físicos existentes (último conteo por código+atributo)
-        from .models import ConteoFisico
-        conteos_fisicos = {}
-        for item in resumen_productos:
-            codigo = item['codigo']
-            atributo = item['atributo'] if item['atributo'] != '-' else None
-            # Buscar último conteo para este código+atributo
-            conteo = ConteoFisico.objects.filter(
-                codigo=codigo,
-                atributo=atributo
-            ).order_by('-fecha_conteo').first()
-            if conteo:
-                conteos_fisicos[(codigo, atributo)] = conteo.cantidad_contada
-        
-        # Agregar conteos físicos a los items
-        for item in resumen_productos:
-            codigo = item['codigo']
-            atributo = item['atributo'] if item['atributo'] != '-' else None
-            item['cantidad_contada'] = conteos_fisicos.get((codigo, atributo), None)
-        
-        # Verificar si se solicita exportación (después de obtener conteos físicos)
+        # Verificar si se solicita exportación
         export_tipo = request.GET.get('export')
-        export_format = (request.GET.get('format') or 'csv').strip().lower()
+        # El enlace histórico descarga Excel: CSV solo si se pide explícitamente
+        export_format = (request.GET.get('format') or 'xlsx').strip().lower()
         
         if export_tipo == 'resumen_inventario':
-            from django.http import HttpResponse
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, PatternFill
-            
-            wb = Workbook()
-            ws = wb.active
-            ws.title = 'Resumen Inventario'
-            
-            # Estilo para headers
-            header_font = Font(bold=True)
-            header_alignment = Alignment(horizontal='center', vertical='center')
-            
-            # Estilo para filas donde stock_actual == cantidad_contada
-            fill_coincide = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')  # Verde claro
-            
-            # Headers
-            headers = [
-                'Código', 'Producto', 'Atributo', 'Total de Ingresos', 'Ventas', 'Stock Actual',
-                'Cantidad Física Contada', 'Diferencia', 'Precio Venta', 'Precio Promedio'
-            ]
-            ws.append(headers)
-            
-            # Aplicar estilo a headers
-            for cell in ws[1]:
-                cell.font = header_font
-                cell.alignment = header_alignment
-            
-            # Agregar datos
-            for item in resumen_productos:
-                # Obtener cantidad_contada - puede ser None, 0, o un número positivo
-                cantidad_contada = item.get('cantidad_contada')
-                stock_actual = item.get('stock_actual', 0)
-                total_ventas = item.get('total_ventas', 0)
-                precio_promedio = item.get('precio_promedio_venta')
-                
-                if cantidad_contada is None:
-                    cantidad_contada_excel = ''
-                    diferencia_excel = ''
-                else:
-                    cantidad_contada_excel = cantidad_contada  # Incluye 0
-                    diferencia_excel = cantidad_contada - stock_actual
-                
-                ws.append([
-                    item['codigo'],
-                    item['nombre'],
-                    item.get('atributo', '-'),
-                    item.get('total_ingresos_mercancia', 0),
-                    total_ventas,
-                    stock_actual,
-                    cantidad_contada_excel,
-                    diferencia_excel,
-                    item.get('precio_venta', 0),
-                    precio_promedio if precio_promedio else '',
-                ])
-                
-                # Si stock_actual coincide con cantidad_contada, resaltar la fila
-                if cantidad_contada is not None and stock_actual == cantidad_contada:
-                    row_num = ws.max_row
-                    # Aplicar fondo verde a toda la fila
-                    for col in range(1, len(headers) + 1):
-                        cell = ws.cell(row=row_num, column=col)
-                        cell.fill = fill_coincide
-            
-            # Ajustar ancho de columnas
-            column_widths = {
-                'A': 15,  # Código
-                'B': 35,  # Producto
-                'C': 20,  # Atributo
-                'D': 18,  # Total de Ingresos
-                'E': 12,  # Ventas
-                'F': 15,  # Stock Actual
-                'G': 20,  # Cantidad Física Contada
-                'H': 12,  # Diferencia
-                'I': 15,  # Precio Venta
-                'J': 15,  # Precio Promedio
-            }
-            for col, width in column_widths.items():
-                ws.column_dimensions[col].width = width
-            
-            # Preparar respuesta
-            from io import BytesIO
-            output = BytesIO()
-            wb.save(output)
-            output.seek(0)
+            from .reporte_inventario import (
+                ANCHOS_RESUMEN_INVENTARIO, COLUMNAS_RESUMEN_INVENTARIO, fila_resumen_inventario
+            )
             
             # Generar nombre de archivo
             fecha_str = ''
@@ -2887,673 +2239,241 @@ def reportes_view(request):
             elif fecha_hasta:
                 fecha_str = f"_hasta_{fecha_hasta}"
             
-            filename = f"resumen_inventario{fecha_str}.xlsx"
+            if export_format == 'csv':
+                from .exportaciones import respuesta_csv
+                return respuesta_csv(
+                    f"resumen_inventario{fecha_str}.csv",
+                    COLUMNAS_RESUMEN_INVENTARIO,
+                    (fila_resumen_inventario(item) for item in resumen_productos),
+                )
             
-            response = HttpResponse(
-                output.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            from .exportaciones import filas_resumen_inventario_xlsx, respuesta_xlsx
+            
+            # Las filas donde stock_actual == cantidad_contada se resaltan en verde
+            return respuesta_xlsx(
+                f"resumen_inventario{fecha_str}.xlsx",
+                [('Resumen Inventario', COLUMNAS_RESUMEN_INVENTARIO, ANCHOS_RESUMEN_INVENTARIO)],
+                filas_resumen_inventario_xlsx(resumen_productos),
             )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
         
+        return render(request, 'pos/reportes.html', _contexto_reporte_inventario(
+            producto_id, tipo_movimiento, fecha_desde, fecha_hasta, dataset
+        ))
+
+    # Análisis ABC y puntos de reorden (cálculo vectorizado con NumPy)
+    if tipo_reporte == 'abc':
+        from itertools import islice
+        from .analisis_abc import (
+            COLUMNAS_ANALISIS_ABC, LIMITE_PANTALLA_ABC, construir_analisis_abc, fila_analisis_abc,
+            items_analisis_abc, parametros_analisis_abc,
+        )
+
+        parametros = parametros_analisis_abc(request.GET)
+        analisis = construir_analisis_abc(**parametros)
+        solo_reponer = request.GET.get('solo_reponer') == '1'
+
+        if request.GET.get('export') == 'analisis_abc':
+            from .exportaciones import respuesta_csv
+            sufijo = '_reponer' if solo_reponer else ''
+            return respuesta_csv(
+                f"analisis_abc{sufijo}_{parametros['fecha_desde'].isoformat()}_a_{parametros['fecha_hasta'].isoformat()}.csv",
+                COLUMNAS_ANALISIS_ABC,
+                (fila_analisis_abc(item) for item in items_analisis_abc(analisis, solo_reponer)),
+            )
+
         context = {
-            'tipo_reporte': 'inventario',
-            'resumen_productos': resumen_productos,
-            'productos_con_diferencias': productos_con_diferencias,
-            'productos': productos,
-            'producto_id': producto_id,
-            'tipo_movimiento': tipo_movimiento,
-            'fecha_desde': fecha_desde,
-            'fecha_hasta': fecha_hasta,
-            # Análisis de datos
-            'analisis_datos': analisis_datos,
-            'top_entradas': top_entradas,
-            'top_ventas': top_ventas,
-            'top_rotacion': top_rotacion,
-            'productos_diferencias_abs': productos_diferencias_abs,
-            'top_aumento_stock': top_aumento_stock,
-            'top_disminucion_stock': top_disminucion_stock,
-            # Comparativa
-            'total_ingresos_cantidad': total_ingresos_cantidad,
-            'total_ingresos_registros': total_ingresos_registros,
-            'total_ventas_cantidad': total_ventas_cantidad,
-            'total_ventas_registros': total_ventas_registros,
-            'total_ventas_valor': total_ventas_valor,
-            'total_salidas_cantidad': total_salidas_cantidad,
-            'total_salidas_registros': total_salidas_registros,
-            'balance_neto_cantidad': balance_neto_cantidad,
-            'comparativa_por_producto': comparativa_por_producto,
+            'tipo_reporte': 'abc',
+            'analisis': analisis,
+            'resumen_clases': analisis['resumen_clases'],
+            # En pantalla solo las primeras filas; la lista completa va en el CSV
+            'productos_reponer': list(islice(items_analisis_abc(analisis, solo_reponer=True), LIMITE_PANTALLA_ABC)),
+            'productos_top': list(islice(items_analisis_abc(analisis), LIMITE_PANTALLA_ABC)),
+            'limite_pantalla': LIMITE_PANTALLA_ABC,
         }
+        context.update(parametros)
         return render(request, 'pos/reportes.html', context)
-    
-    # Si es caja, continuar con el código existente
-    elif tipo_reporte == 'caja':
-        # Obtener fechas del filtro
-        fecha_desde = request.GET.get('fecha_desde')
-        fecha_hasta = request.GET.get('fecha_hasta')
-        
-        # Ventas del mes actual por defecto
-        try:
-            if not fecha_desde:
-                fecha_desde = timezone.now().replace(day=1).date()
-            else:
-                fecha_desde = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-        except Exception:
-            fecha_desde = timezone.now().replace(day=1).date()
-        
-        try:
-            if not fecha_hasta:
-                fecha_hasta = timezone.now().date()
-            else:
-                fecha_hasta = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-        except Exception:
-            fecha_hasta = timezone.now().date()
 
-        if fecha_hasta < fecha_desde:
-            fecha_desde, fecha_hasta = fecha_hasta, fecha_desde
+    if tipo_reporte == 'cobertura':
+        from django.core.paginator import Paginator
+        from .pronostico_stock import (
+            COLUMNAS_PRONOSTICO, FilasPronostico, fila_pronostico, orden_pronostico, parametros_reporte_pronostico,
+            pronostico_stock,
+        )
 
-        # Rango datetime (timezone-aware): por fecha calendario
-        from datetime import time, timedelta
-        tz = timezone.get_current_timezone()
-        inicio_dt = timezone.make_aware(datetime.combine(fecha_desde, time.min), tz)
-        fin_dt = timezone.make_aware(datetime.combine(fecha_hasta, time.max), tz)
+        parametros = parametros_reporte_pronostico(request.GET)
+        pronostico = pronostico_stock(parametros['ventana_dias'], parametros['alfa'], parametros['dias_entrega'])
+        posiciones = orden_pronostico(
+            pronostico, parametros['orden'], parametros['descendente'], parametros['solo_riesgo'],
+        )
+        filas = FilasPronostico(pronostico, posiciones)
+
+        if request.GET.get('export') == 'cobertura':
+            from .exportaciones import respuesta_csv
+            sufijo = '_en_riesgo' if parametros['solo_riesgo'] else ''
+            return respuesta_csv(
+                f"dias_cobertura{sufijo}_{pronostico['hoy'].isoformat()}.csv",
+                COLUMNAS_PRONOSTICO,
+                (fila_pronostico(fila) for fila in filas),
+            )
 
-        # En modo web simplificado: siempre todas las cajas del rango (sin forzar CajaUsuario)
-        caja_usuario_id = ''
-        caja_usuario_sel = None
-
-        def _display_user(u):
-            if not u:
-                return ''
-            return (u.get_full_name() or u.username)
-
-        def _build_movimientos_caja():
-            """
-            Reporte estilo "Todos los Movimientos" (Caja):
-            Apertura + Ventas + Gastos/Ingresos/Retiros con saldo antes/después.
-            """
-            items = []
-
-            # Apertura(s)
-            aperturas_qs = CajaUsuario.objects.none()
-            aperturas_qs = CajaUsuario.objects.filter(
-                fecha_apertura__gte=inicio_dt,
-                fecha_apertura__lte=fin_dt
-            ).select_related('usuario', 'caja')
-
-            for cu in aperturas_qs:
-                items.append({
-                    'fecha': cu.fecha_apertura,
-                    'tipo': 'Apertura',
-                    'descripcion': f'Apertura de Caja (CajaUsuario #{cu.id})',
-                    'delta': int(cu.monto_inicial or 0),
-                    'monto_abs': int(cu.monto_inicial or 0),
-                    'metodo_pago': '-',
-                    'usuario': _display_user(cu.usuario),
-                    'venta_id': None,
-                })
+        context = {
+            'tipo_reporte': 'cobertura',
+            'pronostico_filas': Paginator(filas, 100).get_page(request.GET.get('page')),
+            'total_productos': len(pronostico['ids']),
+            'total_en_riesgo': int(pronostico['en_riesgo'].sum()),
+            'alfa': parametros['alfa'] or '',
+            'columnas_orden': [
+                ('stock', 'Stock Actual'), ('velocidad', 'Venta Diaria'), ('dias_cobertura', 'Días de Cobertura'),
+            ],
+        }
+        context.update({k: v for k, v in parametros.items() if k != 'alfa'})
+        return render(request, 'pos/reportes.html', context)
 
-            # Ventas
-            for v in Venta.objects.filter(
-                fecha__gte=inicio_dt,
-                fecha__lte=fin_dt,
-                completada=True
-            ).select_related('usuario', 'vendedor').order_by('fecha'):
-                vendedor = v.vendedor if v.vendedor else v.usuario
-                desc = f'Venta #{v.id}'
-                if v.registradora_id:
-                    desc = f'{desc} - Registradora {v.registradora_id}'
-                delta = int(v.total or 0)
-                tipo = 'Venta'
-                if v.anulada:
-                    tipo = 'Venta Anulada'
-                    delta = -delta
-                items.append({
-                    'fecha': v.fecha,
-                    'tipo': tipo,
-                    'descripcion': desc,
-                    'delta': delta,
-                    'monto_abs': int(v.total or 0),
-                    'metodo_pago': v.get_metodo_pago_display(),
-                    'usuario': _display_user(vendedor),
-                    'venta_id': v.id,
-                })
+    # Caja (cualquier otro tipo también muestra el reporte de caja)
+    else:
+        from .exportaciones import (
+            EXPORTACIONES_CAJA, exportacion_caja_csv, exportacion_caja_xlsx, respuesta_csv, respuesta_xlsx,
+        )
+        from .reporte_caja import construir_dataset_caja, fechas_reporte_caja, rango_caja
 
-            # Gastos / Ingresos (y retiros)
-            gastos_qs = GastoCaja.objects.filter(fecha__gte=inicio_dt, fecha__lte=fin_dt).select_related('usuario', 'caja_usuario')
-
-            for g in gastos_qs.order_by('fecha'):
-                es_retiro = bool(g.descripcion and 'Retiro de dinero al cerrar caja' in g.descripcion)
-                tipo = 'Retiro' if es_retiro else ('Gasto' if g.tipo == 'gasto' else 'Ingreso')
-                delta = int(g.monto or 0)
-                if g.tipo == 'gasto':
-                    delta = -delta
-                items.append({
-                    'fecha': g.fecha,
-                    'tipo': tipo,
-                    'descripcion': g.descripcion,
-                    'delta': delta,
-                    'monto_abs': int(g.monto or 0),
-                    'metodo_pago': '-',
-                    'usuario': _display_user(g.usuario),
-                    'venta_id': None,
-                })
+        # Ventas del mes actual por defecto
+        fecha_desde, fecha_hasta = fechas_reporte_caja(request.GET.get('fecha_desde'), request.GET.get('fecha_hasta'))
 
-            def _orden_tipo(t):
-                if t == 'Apertura':
-                    return 0
-                if t.startswith('Venta'):
-                    return 1
-                return 2
-
-            items.sort(key=lambda x: (x['fecha'], _orden_tipo(x['tipo'])))
-
-            saldo = 0
-            out = []
-            for it in items:
-                saldo_antes = saldo
-                saldo_despues = saldo + int(it['delta'])
-                saldo = saldo_despues
-                out.append({
-                    **it,
-                    'saldo_antes': saldo_antes,
-                    'saldo_despues': saldo_despues,
-                    'fecha_local': timezone.localtime(it['fecha'], tz),
-                })
-            return out
+        # Rango datetime (timezone-aware): por fecha calendario
+        tz = timezone.get_current_timezone()
+        inicio_dt, fin_dt = rango_caja(fecha_desde, fecha_hasta)
 
         # Export (mismo endpoint): CSV / Excel
         export_tipo = request.GET.get('export')
         export_format = (request.GET.get('format') or 'csv').strip().lower()
-        if export_tipo in ('ventas', 'movimientos', 'cajas', 'movimientos_caja'):
-            from django.http import HttpResponse
-
-            if export_format in ('xlsx', 'excel'):
-                from openpyxl import Workbook
-
-                wb = Workbook()
-
-                def _set_headers(ws, headers):
-                    ws.append(headers)
-                    for cell in ws[1]:
-                        cell.font = cell.font.copy(bold=True)
-
-                if export_tipo == 'ventas':
-                    ws = wb.active
-                    ws.title = 'Ventas'
-                    _set_headers(ws, [
-                        'ID', 'Fecha', 'Total', 'Metodo Pago', 'Anulada',
-                        'Usuario', 'Vendedor', 'Registradora',
-                        'Items Cantidad', 'Items Detalle'
-                    ])
-
-                    qs = Venta.objects.filter(
-                        fecha__gte=inicio_dt, fecha__lte=fin_dt, completada=True
-                    ).select_related('usuario', 'vendedor').prefetch_related('items__producto').order_by('fecha')
-
-                    ws_items = wb.create_sheet('Items')
-                    _set_headers(ws_items, [
-                        'VentaID', 'Fecha', 'Producto', 'Cantidad', 'Precio Unitario', 'Subtotal'
-                    ])
-
-                    for v in qs:
-                        items = list(v.items.all())
-                        items_cant = sum((it.cantidad or 0) for it in items)
-                        items_detalle = ' | '.join([
-                            f"{it.producto.nombre} x{it.cantidad} (${it.subtotal})" for it in items
-                        ])
-                        fecha_local = timezone.localtime(v.fecha, tz).strftime('%Y-%m-%d %H:%M:%S')
-                        ws.append([
-                            v.id,
-                            fecha_local,
-                            v.total,
-                            v.metodo_pago,
-                            int(v.anulada),
-                            (v.usuario.username if v.usuario else ''),
-                            (v.vendedor.username if v.vendedor else ''),
-                            (v.registradora_id or ''),
-                            items_cant,
-                            items_detalle,
-                        ])
-                        for it in items:
-                            ws_items.append([
-                                v.id,
-                                fecha_local,
-                                it.producto.nombre,
-                                it.cantidad,
-                                it.precio_unitario,
-                                it.subtotal,
-                            ])
-
-            elif export_tipo == 'movimientos':
-                ws = wb.active
-                ws.title = 'Movimientos'
-                _set_headers(ws, [
-                    'Fecha', 'Tipo', 'Descripcion', 'Monto', 'Metodo', 'Usuario', 'CajaUsuarioID'
-                ])
-
-                # Ventas
-                for v in Venta.objects.filter(
-                    fecha__gte=inicio_dt, fecha__lte=fin_dt, completada=True
-                ).select_related('usuario').order_by('fecha'):
-                    tipo = 'venta_anulada' if v.anulada else 'venta'
-                    fecha_local = timezone.localtime(v.fecha, tz).strftime('%Y-%m-%d %H:%M:%S')
-                    ws.append([
-                        fecha_local,
-                        tipo,
-                        f'Venta #{v.id}',
-                        v.total,
-                        v.metodo_pago,
-                        (v.usuario.username if v.usuario else ''),
-                        '',
-                    ])
-
-                # Gastos/Ingresos
-                for g in GastoCaja.objects.filter(
-                    fecha__gte=inicio_dt, fecha__lte=fin_dt
-                ).select_related('usuario', 'caja_usuario').order_by('fecha'):
-                    fecha_local = timezone.localtime(g.fecha, tz).strftime('%Y-%m-%d %H:%M:%S')
-                    ws.append([
-                        fecha_local,
-                        g.tipo,
-                        g.descripcion,
-                        g.monto,
-                        '',
-                        (g.usuario.username if g.usuario else ''),
-                        (g.caja_usuario_id or ''),
-                    ])
-
-            elif export_tipo == 'cajas':
-                ws = wb.active
-                ws.title = 'Cajas'
-                _set_headers(ws, [
-                    'CajaUsuarioID', 'Caja', 'Apertura', 'Cierre', 'Monto Inicial', 'Monto Final', 'Usuario'
-                ])
-                for cu in CajaUsuario.objects.filter(
-                    fecha_apertura__lte=fin_dt
-                ).filter(
-                    Q(fecha_cierre__gte=inicio_dt) | Q(fecha_cierre__isnull=True)
-                ).select_related('usuario', 'caja').order_by('fecha_apertura'):
-                    apertura_local = timezone.localtime(cu.fecha_apertura, tz).strftime('%Y-%m-%d %H:%M:%S')
-                    cierre_local = timezone.localtime(cu.fecha_cierre, tz).strftime('%Y-%m-%d %H:%M:%S') if cu.fecha_cierre else ''
-                    ws.append([
-                        cu.id,
-                        (cu.caja.nombre if cu.caja else ''),
-                        apertura_local,
-                        cierre_local,
-                        cu.monto_inicial,
-                        (cu.monto_final if cu.monto_final is not None else ''),
-                        (cu.usuario.username if cu.usuario else ''),
-                    ])
-            else:  # movimientos_caja
-                ws = wb.active
-                ws.title = 'MovimientosCaja'
-                _set_headers(ws, [
-                    'Fecha/Hora', 'Tipo', 'Descripcion', 'Monto', 'Saldo Antes', 'Saldo Despues', 'Metodo de Pago', 'Usuario'
-                ])
-                for m in _build_movimientos_caja():
-                    ws.append([
-                        m['fecha_local'].strftime('%Y-%m-%d %H:%M:%S'),
-                        m['tipo'],
-                        m['descripcion'],
-                        m['delta'],
-                        m['saldo_antes'],
-                        m['saldo_despues'],
-                        m['metodo_pago'] or '-',
-                        m['usuario'] or '',
-                    ])
-
-            from io import BytesIO
-            output = BytesIO()
-            wb.save(output)
-            output.seek(0)
-
-            filename = f"reporte_{export_tipo}_{fecha_desde.isoformat()}_a_{fecha_hasta.isoformat()}.xlsx"
-            response = HttpResponse(
-                output.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
-
-            # CSV (por defecto)
-            import csv
-            filename = f"reporte_{export_tipo}_{fecha_desde.isoformat()}_a_{fecha_hasta.isoformat()}.csv"
-            response = HttpResponse(content_type='text/csv; charset=utf-8')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            writer = csv.writer(response)
-
-            if export_tipo == 'ventas':
-                writer.writerow([
-                    'ID', 'Fecha', 'Total', 'Metodo Pago', 'Completada', 'Anulada',
-                    'Usuario', 'Vendedor', 'Registradora',
-                    'Items Cantidad', 'Items Detalle'
-                ])
-                for v in Venta.objects.filter(
-                    fecha__gte=inicio_dt, fecha__lte=fin_dt, completada=True
-                ).select_related('usuario', 'vendedor').prefetch_related('items__producto'):
-                    items = list(v.items.all())
-                    items_cant = sum((it.cantidad or 0) for it in items)
-                    items_detalle = ' | '.join([
-                        f"{it.producto.nombre} x{it.cantidad} (${it.subtotal})" for it in items
-                    ])
-                    fecha_local = timezone.localtime(v.fecha, tz).strftime('%Y-%m-%d %H:%M:%S')
-                    writer.writerow([
-                        v.id,
-                        fecha_local,
-                        v.total,
-                        v.metodo_pago,
-                        int(v.completada),
-                        int(v.anulada),
-                        (v.usuario.username if v.usuario else ''),
-                        (v.vendedor.username if v.vendedor else ''),
-                        (v.registradora_id or ''),
-                        items_cant,
-                        items_detalle,
-                    ])
-                return response
-
-            elif export_tipo == 'movimientos':
-                writer.writerow([
-                    'Fecha', 'Tipo', 'Descripcion', 'Monto', 'Metodo', 'Usuario', 'CajaUsuarioID'
-                ])
-                # Ventas
-                for v in Venta.objects.filter(
-                    fecha__gte=inicio_dt, fecha__lte=fin_dt, completada=True
-                ).select_related('usuario'):
-                    tipo = 'venta_anulada' if v.anulada else 'venta'
-                    fecha_local = timezone.localtime(v.fecha, tz).strftime('%Y-%m-%d %H:%M:%S')
-                    writer.writerow([
-                        fecha_local,
-                        tipo,
-                        f'Venta #{v.id}',
-                        v.total,
-                        v.metodo_pago,
-                        (v.usuario.username if v.usuario else ''),
-                        '',
-                    ])
-                # Gastos/Ingresos
-                for g in GastoCaja.objects.filter(fecha__gte=inicio_dt, fecha__lte=fin_dt).select_related('usuario', 'caja_usuario'):
-                    fecha_local = timezone.localtime(g.fecha, tz).strftime('%Y-%m-%d %H:%M:%S')
-                    writer.writerow([
-                        fecha_local,
-                        g.tipo,
-                        g.descripcion,
-                        g.monto,
-                        '',
-                        (g.usuario.username if g.usuario else ''),
-                        (g.caja_usuario_id or ''),
-                    ])
-                return response
-
-            elif export_tipo == 'cajas':
-                writer.writerow([
-                    'CajaUsuarioID', 'Apertura', 'Cierre', 'Monto Inicial', 'Monto Final', 'Usuario'
-                ])
-                for cu in CajaUsuario.objects.filter(
-                    fecha_apertura__lte=fin_dt
-                ).filter(
-                    Q(fecha_cierre__gte=inicio_dt) | Q(fecha_cierre__isnull=True)
-                ).select_related('usuario', 'caja').order_by('-fecha_apertura'):
-                    apertura_local = timezone.localtime(cu.fecha_apertura, tz).strftime('%Y-%m-%d %H:%M:%S')
-                    cierre_local = timezone.localtime(cu.fecha_cierre, tz).strftime('%Y-%m-%d %H:%M:%S') if cu.fecha_cierre else ''
-                    writer.writerow([
-                        cu.id,
-                        apertura_local,
-                        cierre_local,
-                        cu.monto_inicial,
-                        (cu.monto_final if cu.monto_final is not None else ''),
-                        (cu.usuario.username if cu.usuario else ''),
-                    ])
-                return response
-
-            elif export_tipo == 'movimientos_caja':
-                writer.writerow([
-                    'Fecha/Hora', 'Tipo', 'Descripcion', 'Monto', 'Saldo Antes', 'Saldo Despues', 'Metodo de Pago', 'Usuario'
-                ])
-                for m in _build_movimientos_caja():
-                    writer.writerow([
-                        m['fecha_local'].strftime('%Y-%m-%d %H:%M:%S'),
-                        m['tipo'],
-                        m['descripcion'],
-                        m['delta'],
-                        m['saldo_antes'],
-                        m['saldo_despues'],
-                        m['metodo_pago'] or '-',
-                        m['usuario'] or '',
-                    ])
-                return response
-
-        # Ventas (incluye anuladas; se desglosa)
-        ventas_qs = Venta.objects.filter(
-        fecha__gte=inicio_dt,
-        fecha__lte=fin_dt,
-        completada=True
-    )
-    ventas_validas = ventas_qs.filter(anulada=False)
-    ventas_anuladas = ventas_qs.filter(anulada=True)
-
-    total_ventas = int(ventas_validas.aggregate(total=SumAgg('total'))['total'] or 0)
-    total_anuladas = int(ventas_anuladas.aggregate(total=SumAgg('total'))['total'] or 0)
-    cantidad_ventas = ventas_validas.count()
-    cantidad_anuladas = ventas_anuladas.count()
-    promedio_venta = int(total_ventas / cantidad_ventas) if cantidad_ventas > 0 else 0
-
-    # Top productos (solo ventas válidas)
-    top_productos = ItemVenta.objects.filter(
-        venta__in=ventas_validas
-    ).values('producto__nombre').annotate(
-        total_vendido=SumAgg('cantidad'),
-        total_valor=SumAgg('subtotal')
-    ).order_by('-total_vendido')[:15]
-
-    # Ventas por método de pago (válidas)
-    ventas_por_metodo = ventas_validas.values('metodo_pago').annotate(
-        cantidad=Count('id'),
-        total=SumAgg('total')
-    ).order_by('-total')
-
-    # Resumen por usuario / vendedor (solo válidas)
-    resumen_por_usuario = ventas_validas.values('usuario__username').annotate(
-        cantidad=Count('id'),
-        total=SumAgg('total')
-    ).order_by('-total')
-
-    resumen_por_vendedor = ventas_validas.values('vendedor__username').annotate(
-        cantidad=Count('id'),
-        total=SumAgg('total')
-    ).order_by('-total')
-
-    # Totales por método (válidas)
-    ventas_efectivo = int(ventas_validas.filter(metodo_pago='efectivo').aggregate(total=SumAgg('total'))['total'] or 0)
-    ventas_tarjeta = int(ventas_validas.filter(metodo_pago='tarjeta').aggregate(total=SumAgg('total'))['total'] or 0)
-    ventas_transferencia = int(ventas_validas.filter(metodo_pago='transferencia').aggregate(total=SumAgg('total'))['total'] or 0)
-    dinero_bancos = ventas_tarjeta + ventas_transferencia
+        if export_tipo in EXPORTACIONES_CAJA:
+            filename = f"reporte_{export_tipo}_{fecha_desde.isoformat()}_a_{fecha_hasta.isoformat()}"
+            # CSV (por defecto): se envía en streaming mientras se recorren los datos
+            if export_format not in ('xlsx', 'excel'):
+                encabezados, filas = exportacion_caja_csv(export_tipo, inicio_dt, fin_dt, tz)
+                return respuesta_csv(f"{filename}.csv", encabezados, filas)
 
-    # Caja: cajas que se solapan con el rango
-    cajas_qs = CajaUsuario.objects.filter(
-        fecha_apertura__lte=fin_dt
-    ).filter(
-        Q(fecha_cierre__gte=inicio_dt) | Q(fecha_cierre__isnull=True)
-    ).select_related('usuario', 'caja').order_by('-fecha_apertura')
+            # Excel: libro write-only escrito fila a fila en un archivo temporal
+            hojas, filas = exportacion_caja_xlsx(export_tipo, inicio_dt, fin_dt, tz)
+            return respuesta_xlsx(f"{filename}.xlsx", hojas, filas)
 
-    # Movimientos (gastos/ingresos/retiros) por rango (no depende de una caja específica)
-    movimientos_qs = GastoCaja.objects.filter(fecha__gte=inicio_dt, fecha__lte=fin_dt).select_related('usuario', 'caja_usuario').order_by('-fecha')
-    total_gastos = int(movimientos_qs.filter(tipo='gasto').exclude(descripcion__icontains='Retiro de dinero al cerrar caja').aggregate(total=SumAgg('monto'))['total'] or 0)
-    total_ingresos = int(movimientos_qs.filter(tipo='ingreso').aggregate(total=SumAgg('monto'))['total'] or 0)
-    total_retiros = int(movimientos_qs.filter(tipo='gasto', descripcion__icontains='Retiro de dinero al cerrar caja').aggregate(total=SumAgg('monto'))['total'] or 0)
-
-    # Resumen diario (por fecha local)
-    from django.db.models.functions import TruncDate
-    dia_expr = TruncDate('fecha', tzinfo=tz)
-
-    # Saldo inicial por dia: suma de montos iniciales de cajas abiertas ese dia (segun corte)
-    dia_apertura_expr = TruncDate('fecha_apertura', tzinfo=tz)
-
-    saldo_inicial_map = {
-        r['dia']: int(r['saldo_inicial'] or 0)
-        for r in CajaUsuario.objects.filter(
-            fecha_apertura__gte=inicio_dt,
-            fecha_apertura__lte=fin_dt
-        ).annotate(
-            dia=dia_apertura_expr
-        ).values('dia').annotate(
-            saldo_inicial=SumAgg('monto_inicial')
-        )
-    }
+        datos = construir_dataset_caja(fecha_desde, fecha_hasta)
+        return render(request, 'pos/reportes.html', _contexto_reporte_caja(request, fecha_desde, fecha_hasta, datos))
 
-    ventas_diarias_qs = ventas_qs.annotate(dia=dia_expr)
-    ventas_validas_diarias = ventas_diarias_qs.filter(anulada=False)
-    ventas_anuladas_diarias = ventas_diarias_qs.filter(anulada=True)
-
-    ventas_ok_map = {
-        r['dia']: r for r in ventas_validas_diarias.values('dia').annotate(
-            total_ventas=SumAgg('total'),
-            cantidad_ventas=Count('id'),
-            ventas_efectivo=SumAgg('total', filter=Q(metodo_pago='efectivo')),
-            ventas_tarjeta=SumAgg('total', filter=Q(metodo_pago='tarjeta')),
-            ventas_transferencia=SumAgg('total', filter=Q(metodo_pago='transferencia')),
-        )
-    }
-    ventas_an_map = {
-        r['dia']: r for r in ventas_anuladas_diarias.values('dia').annotate(
-            total_anuladas=SumAgg('total'),
-            cantidad_anuladas=Count('id'),
-        )
-    }
 
-    movs_diarias_qs = GastoCaja.objects.filter(
-        fecha__gte=inicio_dt, fecha__lte=fin_dt
-    ).annotate(dia=dia_expr)
+def _estado_trabajo_reporte(trabajo):
+    """Estado del trabajo para el sondeo desde la pantalla de reportes"""
+    from django.urls import reverse
 
-    movs_g_map = {
-        r['dia']: r for r in movs_diarias_qs.filter(tipo='gasto').exclude(
-            descripcion__icontains='Retiro de dinero al cerrar caja'
-        ).values('dia').annotate(total_gastos=SumAgg('monto'), cantidad_gastos=Count('id'))
-    }
-    movs_i_map = {
-        r['dia']: r for r in movs_diarias_qs.filter(tipo='ingreso').values('dia').annotate(
-            total_ingresos=SumAgg('monto'),
-            cantidad_ingresos=Count('id')
-        )
+    datos = {
+        'id': trabajo.id,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'progreso': trabajo.progreso,
+        'mensaje': trabajo.mensaje,
+        'error': trabajo.error,
+        'url_estado': reverse('pos:estado_trabajo_reporte', args=[trabajo.id]),
     }
-    movs_r_map = {
-        r['dia']: r for r in movs_diarias_qs.filter(
-            tipo='gasto', descripcion__icontains='Retiro de dinero al cerrar caja'
-        ).values('dia').annotate(total_retiros=SumAgg('monto'), cantidad_retiros=Count('id'))
-    }
-
-    dias = sorted(set(
-        list(ventas_ok_map.keys())
-        + list(ventas_an_map.keys())
-        + list(movs_g_map.keys())
-        + list(movs_i_map.keys())
-        + list(movs_r_map.keys())
-    ))
-
-    def _n(v):
-        return int(v or 0)
-
-    resumen_diario = []
-    for dia in dias:
-        vo = ventas_ok_map.get(dia, {})
-        va = ventas_an_map.get(dia, {})
-        mg = movs_g_map.get(dia, {})
-        mi = movs_i_map.get(dia, {})
-        mr = movs_r_map.get(dia, {})
-
-        saldo_inicial = int(saldo_inicial_map.get(dia, 0) or 0)
-        ventas_ef = _n(vo.get('ventas_efectivo'))
-        ventas_tj = _n(vo.get('ventas_tarjeta'))
-        ventas_tf = _n(vo.get('ventas_transferencia'))
-        gastos_sr = _n(mg.get('total_gastos'))
-        ingresos = _n(mi.get('total_ingresos'))
-        retiros = _n(mr.get('total_retiros'))
-
-        # Neto operativo (sin retiros): efectivo + ingresos - gastos.
-        # Los retiros se muestran separados y no afectan este neto.
-        neto_operativo = ventas_ef + ingresos - gastos_sr
-
-        resumen_diario.append({
-            'dia': dia,
-            'saldo_inicial': saldo_inicial,
-            'ventas_total': _n(vo.get('total_ventas')),
-            'ventas_cantidad': _n(vo.get('cantidad_ventas')),
-            'anuladas_total': _n(va.get('total_anuladas')),
-            'anuladas_cantidad': _n(va.get('cantidad_anuladas')),
-            'ventas_efectivo': ventas_ef,
-            'ventas_tarjeta': ventas_tj,
-            'ventas_transferencia': ventas_tf,
-            'gastos_sin_retiro_total': gastos_sr,
-            'gastos_sin_retiro_cantidad': _n(mg.get('cantidad_gastos')),
-            'ingresos_total': ingresos,
-            'ingresos_cantidad': _n(mi.get('cantidad_ingresos')),
-            'retiros_total': retiros,
-            'retiros_cantidad': _n(mr.get('cantidad_retiros')),
-            'neto_operativo': int(neto_operativo),
+    if trabajo.estado == 'completado':
+        datos.update({
+            'url_resultado': reverse('pos:resultado_trabajo_reporte', args=[trabajo.id]),
+            'url_csv': reverse('pos:descargar_trabajo_reporte', args=[trabajo.id, 'csv']),
+            'url_xlsx': reverse('pos:descargar_trabajo_reporte', args=[trabajo.id, 'xlsx']),
         })
+    return datos
 
-    # Paginación (ventas y movimientos)
-    from django.core.paginator import Paginator
-    ventas_page = request.GET.get('page_ventas', 1)
-    movs_page = request.GET.get('page_movs', 1)
-    cajas_page = request.GET.get('page_cajas', 1)
-    movs_caja_page = request.GET.get('page_movs_caja', 1)
 
-    ventas_paginated = Paginator(
-        ventas_qs.select_related('usuario', 'vendedor').prefetch_related('items__producto').order_by('-fecha'), 50
-    ).get_page(ventas_page)
-    movs_paginated = Paginator(movimientos_qs, 50).get_page(movs_page)
-    cajas_paginated = Paginator(cajas_qs, 25).get_page(cajas_page)
-    movs_caja_list = _build_movimientos_caja()
-    movs_caja_paginated = Paginator(movs_caja_list, 100).get_page(movs_caja_page)
+@login_required
+@requiere_rol('Administradores')
+def crear_trabajo_reporte_view(request):
+    """Registra un reporte para calcularlo en segundo plano (o reutiliza uno idéntico)"""
+    from .trabajos_reportes import solicitar_trabajo
 
-    total_productos = Producto.objects.filter(activo=True).count()
+    if request.method != 'POST':
+        return JsonResponse({
+            'success': False,
+            'error': 'Método no permitido. Solo se acepta POST.'
+        }, status=405)
 
-    context = {
-        'tipo_reporte': 'caja',
-        'modo_simple': True,
-        'fecha_desde': fecha_desde,
-        'fecha_hasta': fecha_hasta,
-        'inicio_dt': inicio_dt,
-        'fin_dt': fin_dt,
-        'usar_corte_dia': False,
-        'corte_dia': '',
-        'ocultar_cajas_sin_mov': False,
+    if not puede_ver_reportes(request.user):
+        return JsonResponse({'success': False, 'error': 'No tienes permisos para ver reportes'}, status=403)
 
-        # Ventas
-        'total_ventas': total_ventas,
-        'cantidad_ventas': cantidad_ventas,
-        'promedio_venta': promedio_venta,
-        'total_anuladas': total_anuladas,
-        'cantidad_anuladas': cantidad_anuladas,
-        'ventas_efectivo': ventas_efectivo,
-        'ventas_tarjeta': ventas_tarjeta,
-        'ventas_transferencia': ventas_transferencia,
-        'dinero_bancos': dinero_bancos,
-        'ventas_por_metodo': ventas_por_metodo,
-        'resumen_por_usuario': resumen_por_usuario,
-        'resumen_por_vendedor': resumen_por_vendedor,
-        'top_productos': top_productos,
-        'ventas_detalle': ventas_paginated,
+    try:
+        trabajo, reutilizado = solicitar_trabajo(request.POST.get('tipo', ''), request.POST, request.user)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
-        # Caja / movimientos
-        'cajas_detalle': cajas_paginated,
-        'movimientos_detalle': movs_paginated,
-        'movimientos_caja_detalle': movs_caja_paginated,
-        'total_gastos': total_gastos,
-        'total_ingresos': total_ingresos,
-        'total_retiros': total_retiros,
-        'resumen_diario': resumen_diario,
-        'caja_usuario_id': caja_usuario_id,
-        'caja_usuario_sel': caja_usuario_sel,
+    return JsonResponse({
+        'success': True,
+        'reutilizado': reutilizado,
+        **_estado_trabajo_reporte(trabajo),
+    })
 
-        'total_productos': total_productos,
-    }
 
+@login_required
+@requiere_rol('Administradores')
+def estado_trabajo_reporte_view(request, trabajo_id):
+    """Progreso de un trabajo de reporte (JSON)"""
+    from .models import TrabajoReporte
+
+    trabajo = get_object_or_404(TrabajoReporte, id=trabajo_id)
+    return JsonResponse({'success': True, **_estado_trabajo_reporte(trabajo)})
+
+
+@login_required
+@requiere_rol('Administradores')
+def resultado_trabajo_reporte_view(request, trabajo_id):
+    """Pantalla del reporte con las secciones agregadas guardadas por el trabajo"""
+    from django.urls import reverse
+    from .models import TrabajoReporte
+    from .trabajos_reportes import artefactos_disponibles, cargar_contexto
+
+    trabajo = get_object_or_404(TrabajoReporte, id=trabajo_id)
+    if trabajo.estado != 'completado' or not artefactos_disponibles(trabajo):
+        messages.error(request, 'El reporte en segundo plano no está disponible')
+        return redirect(f"{reverse('pos:reportes')}?tipo={trabajo.tipo}")
+
+    datos = cargar_contexto(trabajo)
+    parametros = trabajo.parametros
+    if trabajo.tipo == 'inventario':
+        context = _contexto_reporte_inventario(
+            str(parametros['producto']) if parametros['producto'] else None,
+            parametros['tipo_mov'], parametros['fecha_desde'], parametros['fecha_hasta'], datos
+        )
+    else:
+        context = _contexto_reporte_caja(
+            request,
+            datetime.strptime(parametros['fecha_desde'], '%Y-%m-%d').date(),
+            datetime.strptime(parametros['fecha_hasta'], '%Y-%m-%d').date(),
+            datos
+        )
+    context['trabajo'] = trabajo
+    context['trabajo_estado'] = _estado_trabajo_reporte(trabajo)
     return render(request, 'pos/reportes.html', context)
 
 
+@login_required
+@requiere_rol('Administradores')
+def descargar_trabajo_reporte_view(request, trabajo_id, formato):
+    """Descarga el CSV o XLSX generado por un trabajo de reporte"""
+    from django.http import FileResponse, Http404
+    from .exportaciones import CONTENT_TYPE_XLSX
+    from .models import TrabajoReporte
+    from .trabajos_reportes import nombre_descarga, ruta_descarga
+
+    trabajo = get_object_or_404(TrabajoReporte, id=trabajo_id, estado='completado')
+    ruta = ruta_descarga(trabajo, formato)
+    if ruta is None or not ruta.is_file():
+        raise Http404('Archivo no disponible')
+
+    return FileResponse(
+        open(ruta, 'rb'),
+        as_attachment=True,
+        filename=nombre_descarga(trabajo, formato),
+        content_type=CONTENT_TYPE_XLSX if formato == 'xlsx' else 'text/csv; charset=utf-8',
+    )
+
+
 @login_required
 @requiere_rol('Administradores', 'Inventario')
 def movimientos_inventario_view(request):
@@ -3575,22 +2495,33 @@ def movimientos_inventario_view(request):
     if tipo_movimiento:
         movimientos_list = movimientos_list.filter(tipo=tipo_movimiento)
     
+    # Rango sobre la columna fecha (usa el índice), no sobre fecha__date
+    from .fechas import filtro_rango_fechas
+    fecha_desde_obj = fecha_hasta_obj = None
     if fecha_desde:
         try:
-            from datetime import datetime
             fecha_desde_obj = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-            movimientos_list = movimientos_list.filter(fecha__date__gte=fecha_desde_obj)
         except ValueError:
             pass
     
     if fecha_hasta:
         try:
-            from datetime import datetime
             fecha_hasta_obj = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-            movimientos_list = movimientos_list.filter(fecha__date__lte=fecha_hasta_obj)
         except ValueError:
             pass
     
+    movimientos_list = movimientos_list.filter(filtro_rango_fechas('fecha', fecha_desde_obj, fecha_hasta_obj))
+    
+    # Movimientos de períodos cerrados y movidos: se leen del archivo (solo de un producto)
+    from .models import CierrePeriodo
+    hay_archivo = CierrePeriodo.objects.filter(movido=True).exists()
+    archivado = hay_archivo and request.GET.get('archivado') == '1' and bool(producto_id)
+    if archivado:
+        from .cierre_periodo import movimientos_archivados
+        from .fechas import rango_fechas_local
+        inicio, fin = rango_fechas_local(fecha_desde_obj, fecha_hasta_obj)
+        movimientos_list = movimientos_archivados(producto_id, tipo_movimiento or None, inicio, fin)
+    
     # Paginación: 50 movimientos por página
     paginator = Paginator(movimientos_list, 50)
     page = request.GET.get('page', 1)
@@ -3612,6 +2543,8 @@ def movimientos_inventario_view(request):
         'tipo_movimiento': tipo_movimiento,
         'fecha_desde': fecha_desde,
         'fecha_hasta': fecha_hasta,
+        'hay_archivo': hay_archivo,
+        'archivado': archivado,
     }
     
     return render(request, 'pos/movimientos_inventario.html', context)
@@ -3677,7 +2610,6 @@ def salida_mercancia_view(request):
 @requiere_rol('Administradores')
 def marketing_view(request):
     """Vista de ranking de ventas por vendedor"""
-    from django.contrib.auth.models import User
     from datetime import timedelta
     
     # Obtener rango de fechas (últimos 30 días por defecto)
@@ -3685,108 +2617,29 @@ def marketing_view(request):
     fecha_hasta = request.GET.get('fecha_hasta')
     
     if not fecha_desde:
-        fecha_desde = (timezone.now() - timedelta(days=30)).date()
+        fecha_desde = timezone.localdate() - timedelta(days=30)
     else:
         fecha_desde = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
     
     if not fecha_hasta:
-        fecha_hasta = timezone.now().date()
+        fecha_hasta = timezone.localdate()
     else:
         fecha_hasta = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
     
-    # Obtener TODAS las ventas (incluyendo anuladas) para calcular total bruto
-    ventas_todas = Venta.objects.filter(
-        fecha__date__gte=fecha_desde,
-        fecha__date__lte=fecha_hasta,
-        completada=True,
-        vendedor__isnull=False
-    )
-    
-    # Obtener ventas NO anuladas para cantidad y promedio
-    ventas = ventas_todas.filter(anulada=False)
-    
-    # Obtener ventas anuladas para restar
-    ventas_anuladas = ventas_todas.filter(anulada=True)
-    
-    # Calcular ranking por vendedor (TODAS LAS VENTAS, incluyendo anuladas)
-    # Esto nos da el total bruto de cada vendedor
-    ranking_vendedores_bruto = ventas_todas.values('vendedor').annotate(
-        total_ventas_bruto=Sum('total'),  # Total bruto (incluye anuladas)
-        cantidad_ventas_total=Count('id')
-    )
-    
-    # Calcular estadísticas de anulaciones por vendedor
-    anulaciones_por_vendedor = ventas_anuladas.values('vendedor').annotate(
-        total_anuladas=Sum('total'),
-        cantidad_anuladas=Count('id')
-    )
-    
-    # Calcular estadísticas de ventas válidas por vendedor (para cantidad y promedio)
-    ventas_validas_por_vendedor = ventas.values('vendedor').annotate(
-        cantidad_ventas=Count('id'),
-        promedio_venta=Avg('total')
-    )
-    
-    # Crear diccionarios para fácil acceso
-    anulaciones_dict = {item['vendedor']: item for item in anulaciones_por_vendedor}
-    ventas_validas_dict = {item['vendedor']: item for item in ventas_validas_por_vendedor}
-    
-    # Enriquecer con información del usuario y estadísticas de anulaciones
-    ranking_completo = []
-    for item in ranking_vendedores_bruto:
-        try:
-            vendedor = User.objects.get(id=item['vendedor'])
-            # Obtener estadísticas de anulaciones para este vendedor
-            anulaciones_vendedor = anulaciones_dict.get(item['vendedor'], {})
-            total_anuladas = anulaciones_vendedor.get('total_anuladas', 0) or 0
-            cantidad_anuladas = anulaciones_vendedor.get('cantidad_anuladas', 0) or 0
-            
-            # Obtener estadísticas de ventas válidas
-            ventas_validas_vendedor = ventas_validas_dict.get(item['vendedor'], {})
-            cantidad_ventas = ventas_validas_vendedor.get('cantidad_ventas', 0) or 0
-            promedio_venta = ventas_validas_vendedor.get('promedio_venta', 0) or 0
-            
-            # Calcular total neto (ventas brutas - anulaciones)
-            total_ventas_bruto = float(item['total_ventas_bruto'] or 0)
-            total_anuladas_decimal = float(total_anuladas or 0)
-            total_ventas_neto = round(total_ventas_bruto - total_anuladas_decimal, 2)
-            
-            ranking_completo.append({
-                'vendedor': vendedor,
-                'nombre_completo': vendedor.get_full_name() or vendedor.username,
-                'username': vendedor.username,
-                'total_ventas': total_ventas_neto,  # Total neto después de restar anulaciones
-                'total_ventas_bruto': round(total_ventas_bruto, 2),  # Total bruto (sin restar anulaciones)
-                'cantidad_ventas': cantidad_ventas,
-                'promedio_venta': round(float(promedio_venta or 0), 2),
-                'total_anuladas': round(total_anuladas_decimal, 2),
-                'cantidad_anuladas': cantidad_anuladas,
-            })
-        except User.DoesNotExist:
-            continue
-    
-    # Estadísticas generales
-    # Total bruto (todas las ventas, incluyendo anuladas)
-    total_general_bruto = ventas_todas.aggregate(total=Sum('total'))['total'] or 0
-    # Cantidad de ventas válidas (no anuladas)
-    cantidad_general = ventas.count()
-    
-    # Estadísticas de anulaciones generales
-    total_anuladas_general = ventas_anuladas.aggregate(total=Sum('total'))['total'] or 0
-    cantidad_anuladas_general = ventas_anuladas.count()
-    
-    # Calcular total neto general (ventas brutas - anulaciones)
-    total_anuladas_general_decimal = float(total_anuladas_general or 0)
-    total_general = round(float(total_general_bruto or 0) - total_anuladas_general_decimal, 2)
+    # Ranking por vendedor: una consulta agrupada sobre la tabla de totales diarios,
+    # cacheada por rango mientras no cambie ninguna venta de esos días
+    from .ventas_diarias import ranking_vendedores
+    datos_ranking = ranking_vendedores(fecha_desde, fecha_hasta)
+    ranking_completo = datos_ranking['ranking']
+    totales = datos_ranking['totales']
+    
+    # Estadísticas generales (ventas válidas; las anuladas van por separado)
+    cantidad_general = totales['cantidad_ventas']
+    total_anuladas_general_decimal = float(totales['total_anuladas'])
+    cantidad_anuladas_general = totales['cantidad_anuladas']
+    total_general = round(float(totales['total_ventas']), 2)
     promedio_general = round(total_general / cantidad_general, 2) if cantidad_general > 0 else 0
     
-    # Reordenar ranking por total_ventas neto (después de restar anulaciones)
-    ranking_completo = sorted(ranking_completo, key=lambda x: x['total_ventas'], reverse=True)
-    
-    # Actualizar posiciones después de reordenar
-    for i, item in enumerate(ranking_completo, 1):
-        item['posicion'] = i
-    
     # Top vendedor
     top_vendedor = ranking_completo[0] if ranking_completo else None
     
@@ -4136,6 +2989,7 @@ def limpiar_carrito_view(request):
 
 
 @login_required
+@recalculo_ventas_producto_agrupado()
 def procesar_venta_completa_view(request):
     """Procesar venta completa desde el carrito de sesión"""
     if request.method == 'POST':
@@ -4258,7 +3112,8 @@ def procesar_venta_completa_view(request):
                     stock_anterior=producto.stock + cantidad,
                     stock_nuevo=producto.stock,
                     motivo=f'Venta #{venta.id}',
-                    usuario=request.user
+                    usuario=request.user,
+                    venta=venta
                 )
             
             # Actualizar total de la venta
@@ -4408,44 +3263,17 @@ def editar_producto_view(request, producto_id):
 def crear_ingreso_view(request):
     """Vista para crear un nuevo ingreso de mercancía"""
     if request.method == 'POST':
+        from .mercancia import crear_ingreso
         try:
-            proveedor = request.POST.get('proveedor')
-            numero_factura = request.POST.get('numero_factura') or None
-            observaciones = request.POST.get('observaciones') or None
-            
-            ingreso = IngresoMercancia.objects.create(
-                proveedor=proveedor,
-                numero_factura=numero_factura,
-                observaciones=observaciones,
-                usuario=request.user,
-                completado=False
+            # Productos leídos en una consulta; encabezado e items en una transacción
+            ingreso = crear_ingreso(
+                request.user,
+                request.POST.get('proveedor'),
+                json.loads(request.POST.get('items', '[]')),
+                numero_factura=request.POST.get('numero_factura') or None,
+                observaciones=request.POST.get('observaciones') or None,
             )
             
-            # Procesar items
-            items_data = json.loads(request.POST.get('items', '[]'))
-            total = 0
-            
-            for item_data in items_data:
-                producto_id = int(item_data['producto_id'])
-                cantidad = int(item_data['cantidad'])
-                precio_compra = int(float(item_data.get('precio_compra', 0)))
-                
-                producto = Producto.objects.get(id=producto_id)
-                subtotal = cantidad * precio_compra
-                
-                ItemIngresoMercancia.objects.create(
-                    ingreso=ingreso,
-                    producto=producto,
-                    cantidad=cantidad,
-                    precio_compra=precio_compra,
-                    subtotal=subtotal
-                )
-                
-                total += subtotal
-            
-            ingreso.total = total
-            ingreso.save()
-            
             messages.success(request, f'Ingreso #{ingreso.id} creado exitosamente')
             return redirect('pos:detalle_ingreso', ingreso_id=ingreso.id)
         except Exception as e:
@@ -4478,68 +3306,37 @@ def detalle_ingreso_view(request, ingreso_id):
         
         # Manejar completar ingreso (parcial o completo)
         elif 'completar' in request.POST:
-            # Buscar items verificados que aún no han sido procesados
-            items_a_procesar = ingreso.items.filter(verificado=True, procesado=False)
-            
-            if items_a_procesar.count() == 0:
-                # Verificar si hay items verificados pero ya procesados
-                items_verificados_no_procesados = ingreso.items.filter(verificado=True, procesado=False).count()
-                if items_verificados_no_procesados == 0:
-                    # Verificar si todos están procesados
-                    total_items = ingreso.items.count()
-                    items_procesados_total = ingreso.items.filter(procesado=True).count()
-                    if items_procesados_total == total_items:
-                        messages.info(request, 'Todos los items ya han sido procesados')
-                    else:
-                        messages.error(request, 'Debes verificar al menos un item antes de completar el ingreso')
-                return redirect('pos:detalle_ingreso', ingreso_id=ingreso_id)
+            from .mercancia import completar_ingreso
             
-            # Procesar solo los items verificados que no han sido procesados
-            items_procesados = 0
-            for item in items_a_procesar:
-                stock_anterior = item.producto.stock
-                item.producto.stock += item.cantidad
-                item.producto.save()
-                
-                # Registrar movimiento de stock
-                MovimientoStock.objects.create(
-                    producto=item.producto,
-                    tipo='ingreso',
-                    cantidad=item.cantidad,
-                    stock_anterior=stock_anterior,
-                    stock_nuevo=item.producto.stock,
-                    motivo=f'Ingreso #{ingreso.id} - {ingreso.proveedor}',
-                    usuario=request.user
-                )
-                
-                # Marcar item como procesado
-                item.procesado = True
-                item.save()
-                items_procesados += 1
+            # Procesar en una transacción solo los items verificados que no han sido procesados
+            items_procesados, estado = completar_ingreso(ingreso, request.user)
             
-            # Verificar si todos los items están procesados para marcar el ingreso como completado
-            total_items = ingreso.items.count()
-            items_procesados_total = ingreso.items.filter(procesado=True).count()
-            items_pendientes = ingreso.items.filter(verificado=False).count()
+            if items_procesados == 0:
+                if estado['total'] and estado['procesados'] == estado['total']:
+                    messages.info(request, 'Todos los items ya han sido procesados')
+                else:
+                    messages.error(request, 'Debes verificar al menos un item antes de completar el ingreso')
+                return redirect('pos:detalle_ingreso', ingreso_id=ingreso_id)
             
-            if items_procesados_total == total_items:
+            if estado['procesados'] == estado['total']:
                 # Todos los items están procesados
-                ingreso.completado = True
-                ingreso.save()
-                messages.success(request, f'Ingreso completado totalmente. {items_procesados} items procesados en esta operación. Total: {items_procesados_total} items.')
+                messages.success(request, f'Ingreso completado totalmente. {items_procesados} items procesados en esta operación. Total: {estado["procesados"]} items.')
             else:
                 # Ingreso parcial - aún hay items pendientes
-                items_no_verificados = ingreso.items.filter(verificado=False).count()
-                items_verificados_no_procesados = ingreso.items.filter(verificado=True, procesado=False).count()
-                
                 mensaje = f'Ingreso parcial completado. {items_procesados} items procesados en esta operación.'
-                if items_verificados_no_procesados > 0:
-                    mensaje += f' {items_verificados_no_procesados} items verificados pendientes de procesar.'
-                if items_no_verificados > 0:
-                    mensaje += f' {items_no_verificados} items aún no verificados.'
+                if estado['verificados_pendientes'] > 0:
+                    mensaje += f' {estado["verificados_pendientes"]} items verificados pendientes de procesar.'
+                if estado['no_verificados'] > 0:
+                    mensaje += f' {estado["no_verificados"]} items aún no verificados.'
                 
                 messages.warning(request, mensaje)
     
+    # Items con su producto en una consulta (la página los recorre en la tabla y en las tarjetas)
+    from django.db.models import Prefetch
+    ingreso = IngresoMercancia.objects.select_related('usuario').prefetch_related(
+        Prefetch('items', queryset=ItemIngresoMercancia.objects.select_related('producto'))
+    ).get(pk=ingreso.pk)
+    
     context = {'ingreso': ingreso}
     return render(request, 'pos/detalle_ingreso.html', context)
 
@@ -4553,41 +3350,22 @@ def detalle_ingreso_view(request, ingreso_id):
 def crear_salida_view(request):
     """Vista para crear una nueva salida de mercancía"""
     if request.method == 'POST':
+        from .mercancia import StockInsuficiente, crear_salida
         try:
-            tipo = request.POST.get('tipo')
-            destino = request.POST.get('destino') or None
-            motivo = request.POST.get('motivo')
-            
-            salida = SalidaMercancia.objects.create(
-                tipo=tipo,
-                destino=destino,
-                motivo=motivo,
-                usuario=request.user,
-                completado=False
+            # Todo se valida (incluido el stock) antes de crear la salida
+            salida = crear_salida(
+                request.user,
+                request.POST.get('tipo'),
+                json.loads(request.POST.get('items', '[]')),
+                destino=request.POST.get('destino') or None,
+                motivo=request.POST.get('motivo'),
             )
             
-            # Procesar items
-            items_data = json.loads(request.POST.get('items', '[]'))
-            
-            for item_data in items_data:
-                producto_id = int(item_data['producto_id'])
-                cantidad = int(item_data['cantidad'])
-                
-                producto = Producto.objects.get(id=producto_id)
-                
-                if producto.stock < cantidad:
-                    salida.delete()
-                    messages.error(request, f'Stock insuficiente para {producto.nombre}')
-                    return redirect('pos:crear_salida')
-                
-                ItemSalidaMercancia.objects.create(
-                    salida=salida,
-                    producto=producto,
-                    cantidad=cantidad
-                )
-            
             messages.success(request, f'Salida #{salida.id} creada exitosamente')
             return redirect('pos:detalle_salida', salida_id=salida.id)
+        except StockInsuficiente as e:
+            messages.error(request, str(e))
+            return redirect('pos:crear_salida')
         except Exception as e:
             messages.error(request, f'Error al crear salida: {str(e)}')
     
@@ -4603,33 +3381,24 @@ def detalle_salida_view(request, salida_id):
     salida = get_object_or_404(SalidaMercancia, id=salida_id)
     
     if request.method == 'POST' and 'completar' in request.POST:
-        if not salida.completado:
-            # Actualizar stock de productos
-            for item in salida.items.all():
-                if item.producto.stock < item.cantidad:
-                    messages.error(request, f'Stock insuficiente para {item.producto.nombre}')
-                    return redirect('pos:detalle_salida', salida_id=salida_id)
-                
-                item.producto.stock -= item.cantidad
-                item.producto.save()
-                
-                # Registrar movimiento de stock
-                MovimientoStock.objects.create(
-                    producto=item.producto,
-                    tipo='salida',
-                    cantidad=item.cantidad,
-                    stock_anterior=item.producto.stock + item.cantidad,
-                    stock_nuevo=item.producto.stock,
-                    motivo=f'Salida #{salida.id} - {salida.get_tipo_display()}',
-                    usuario=request.user
-                )
-            
-            salida.completado = True
-            salida.save()
+        from .mercancia import StockInsuficiente, completar_salida
+        try:
+            # Todos los items en una transacción: si falta stock no se descuenta ninguno
+            completada = completar_salida(salida, request.user)
+        except StockInsuficiente as e:
+            messages.error(request, str(e))
+            return redirect('pos:detalle_salida', salida_id=salida_id)
+        if completada:
             messages.success(request, 'Salida completada y stock actualizado')
         else:
             messages.warning(request, 'Esta salida ya está completada')
     
+    # Items con su producto en una consulta
+    from django.db.models import Prefetch
+    salida = SalidaMercancia.objects.select_related('usuario').prefetch_related(
+        Prefetch('items', queryset=ItemSalidaMercancia.objects.select_related('producto'))
+    ).get(pk=salida.pk)
+    
     context = {'salida': salida}
     return render(request, 'pos/detalle_salida.html', context)
 
@@ -4791,6 +3560,7 @@ def gestionar_cliente_view(request, cliente_id):
 def guardar_conteo_fisico_view(request):
     """Vista para guardar conteos físicos de inventario"""
     from .models import ConteoFisico
+    from .sku import sku_key
     
     if request.method != 'POST':
         return JsonResponse({
@@ -4804,7 +3574,7 @@ def guardar_conteo_fisico_view(request):
         cantidad_str = request.POST.get('cantidad', '').strip()
         
         # Log para debugging
-        logger.info(f'Guardar conteo físico - codigo: {codigo}, atributo: {atributo}, cantidad_str: "{cantidad_str}"')
+        logger.debug(f'Guardar conteo físico - codigo: {codigo}, atributo: {atributo}, cantidad_str: "{cantidad_str}"')
         
         # Validar código
         if not codigo:
@@ -4834,13 +3604,12 @@ def guardar_conteo_fisico_view(request):
                 }, status=400)
         
         # Log la cantidad final
-        logger.info(f'Cantidad procesada: {cantidad} (tipo: {type(cantidad).__name__})')
+        logger.debug(f'Cantidad procesada: {cantidad} (tipo: {type(cantidad).__name__})')
         
-        # Buscar si ya existe un conteo para este código+atributo
+        # Buscar si ya existe un conteo para este código+atributo (clave normalizada)
         # Usamos el último conteo por fecha
         conteo_existente = ConteoFisico.objects.filter(
-            codigo=codigo,
-            atributo=atributo
+            sku_key=sku_key(codigo, atributo)
         ).order_by('-fecha_conteo').first()
         
         if conteo_existente:
@@ -4860,6 +3629,10 @@ def guardar_conteo_fisico_view(request):
             )
             created = True
         
+        # Mantener actualizada la tabla de conteos vigentes usada por los reportes
+        from .conteos import actualizar_conteo_actual
+        actualizar_conteo_actual(conteo_existente)
+        
         return JsonResponse({
             'success': True,
             'cantidad': cantidad,
@@ -4874,3 +3647,106 @@ def guardar_conteo_fisico_view(request):
             'success': False,
             'error': f'Error al guardar conteo: {str(e)}'
         }, status=500)
+
+
+@login_required
+@requiere_rol('Administradores', 'Inventario')
+def guardar_conteos_lote_view(request):
+    """
+    Guarda en bloque los conteos de una sesión de escaneo. Recibe JSON
+    {"lote": "<id>", "entradas": [{"codigo", "atributo", "cantidad", "mode": "set"|"increment"}, ...]}
+    y devuelve los totales resultantes por código+atributo. Un lote ya aplicado
+    devuelve los mismos totales sin volver a sumar; si una entrada es inválida
+    responde 400 con su posición en "entrada" (desde 1) y no aplica ninguna.
+    """
+    from .conteos import EntradaCapturaInvalida, registrar_conteos
+
+    if request.method != 'POST':
+        return JsonResponse({
+            'success': False,
+            'error': 'Método no permitido. Solo se acepta POST.'
+        }, status=405)
+
+    try:
+        datos = json.loads(request.body or b'{}')
+        entradas = datos.get('entradas')
+        lote = str(datos.get('lote') or '').strip()[:64] or None
+    except (ValueError, AttributeError):
+        entradas = None
+    if not isinstance(entradas, list):
+        return JsonResponse({'success': False, 'error': 'Se espera {"entradas": [...]}'}, status=400)
+
+    try:
+        conteos = registrar_conteos(entradas, usuario=request.user, lote=lote)
+    except EntradaCapturaInvalida as e:
+        return JsonResponse({'success': False, 'error': str(e), 'entrada': e.numero}, status=400)
+    except Exception as e:
+        logger.error(f'Error al guardar conteos en lote: {str(e)}', exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'error': f'Error al guardar conteos: {str(e)}'
+        }, status=500)
+
+    logger.info(f'Conteos en lote: {len(entradas)} entradas, {len(conteos)} códigos ({request.user.username})')
+    return JsonResponse({'success': True, 'conteos': conteos})
+
+
+@login_required
+@requiere_rol('Administradores', 'Inventario')
+def escanear_conteo_view(request):
+    """Página móvil de conteo por escaneo: acumula lecturas y las envía en lotes"""
+    return render(request, 'pos/escanear_conteo.html')
+
+
+@login_required
+@requiere_rol('Administradores')
+def aplicar_conteo_view(request):
+    """
+    Vista previa (GET) y aplicación (POST) de los conteos físicos vigentes como
+    ajustes de stock: todas las diferencias se calculan y aplican en bloque.
+    """
+    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+    from .conteos import (
+        COLUMNAS_APLICAR_CONTEO, aplicar_conteos, diferencias_conteo, fila_aplicar_conteo, resumen_diferencias,
+    )
+
+    if request.method == 'POST':
+        try:
+            resumen = resumen_diferencias(aplicar_conteos(usuario=request.user))
+        except Exception as e:
+            logger.error(f'Error al aplicar conteos físicos: {str(e)}', exc_info=True)
+            messages.error(request, f'Error al aplicar conteos: {str(e)}')
+            return redirect('pos:aplicar_conteo')
+        if resumen['productos']:
+            messages.success(
+                request,
+                f"Conteos aplicados: {resumen['productos']} productos ajustados "
+                f"(+{resumen['unidades_suben']} / -{resumen['unidades_bajan']} unidades)"
+            )
+        else:
+            messages.info(request, 'No hay diferencias pendientes de aplicar')
+        return redirect('pos:aplicar_conteo')
+
+    diferencias = diferencias_conteo()
+    if request.GET.get('format', '').strip().lower() == 'csv':
+        from .exportaciones import respuesta_csv
+        return respuesta_csv(
+            f"ajustes_conteo_{timezone.localdate():%Y%m%d}.csv",
+            COLUMNAS_APLICAR_CONTEO,
+            (fila_aplicar_conteo(fila) for fila in diferencias['filas']),
+        )
+
+    paginator = Paginator(diferencias['filas'], 100)
+    page = request.GET.get('page', 1)
+    try:
+        filas = paginator.page(page)
+    except PageNotAnInteger:
+        filas = paginator.page(1)
+    except EmptyPage:
+        filas = paginator.page(paginator.num_pages)
+
+    context = {
+        'filas': filas,
+        'resumen': resumen_diferencias(diferencias),
+    }
+    return render(request, 'pos/aplicar_conteo.html', context)
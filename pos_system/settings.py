@@ -136,3 +136,22 @@ EMAIL_USE_SSL = False  # No usar SSL si se usa TLS
 EMAIL_TIMEOUT = 10
 DEFAULT_FROM_EMAIL = 'Ventas Bazar 2025 <noreply@tersacosmeticos.com>'
 
+
+# Conteo físico: los reportes leen el último conteo por código+atributo desde la
+# tabla ConteoFisicoActual (se actualiza al guardar conteos). En False se calcula
+# desde el historial de ConteoFisico con una consulta de ventana.
+CONTEO_FISICO_TABLA_ACTUAL = True
+
+# Exportaciones Excel de reportes: libro write-only de openpyxl (memoria constante).
+# En False se usa el Workbook normal en memoria (mismo contenido y estilos).
+REPORTES_XLSX_WRITE_ONLY = True
+
+# Trabajos de reportes en segundo plano: un hilo del mismo proceso calcula el
+# reporte y guarda contexto JSON, CSV y XLSX en este directorio (sin broker externo).
+# En False el trabajo se calcula dentro de la misma petición.
+REPORTES_TRABAJOS_DIR = BASE_DIR / 'reportes_trabajos'
+REPORTES_TRABAJOS_SEGUNDO_PLANO = True
+
+# Cierre de período (comando cerrar_periodo): archivos JSON Lines comprimidos con
+# el detalle de ventas, items, movimientos de stock y gastos de caja archivados.
+ARCHIVO_HISTORICO_DIR = BASE_DIR / 'archivo_historico'
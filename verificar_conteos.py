@@ -7,6 +7,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pos_system.settings')
 django.setup()
 
 from pos.models import ConteoFisico, Producto
+from pos.conteos import ultimo_conteo, ultimos_conteos_por_clave
 
 # Buscar producto
 producto = Producto.objects.filter(codigo__iexact='SALO0659').first()
@@ -25,21 +26,13 @@ if producto:
         print(f"  ID: {c.id}, Codigo: [{c.codigo}], Atributo: [{c.atributo}], Tipo: {type(c.atributo)}, Cantidad: {c.cantidad_contada}, Fecha: {c.fecha_conteo}")
     print()
     
-    # Buscar con atributo del producto
-    atributo_producto = producto.atributo
-    if atributo_producto in ('', '-', 'None', 'null') or not atributo_producto:
-        atributo_buscar = None
+    # Último conteo vigente para el código+atributo del producto (misma lógica que el reporte)
+    print(f"Buscando último conteo con atributo: [{producto.atributo}]")
+    conteo = ultimo_conteo(producto.codigo, producto.atributo)
+    if conteo:
+        print(f"  ID: {conteo['id']}, Cantidad: {conteo['cantidad_contada']}, Fecha: {conteo['fecha_conteo']}")
     else:
-        atributo_buscar = atributo_producto
-    
-    print(f"Buscando con atributo: [{atributo_buscar}] (tipo: {type(atributo_buscar)})")
-    conteos_filtrados = ConteoFisico.objects.filter(
-        codigo__iexact='SALO0659',
-        atributo=atributo_buscar
-    )
-    print(f"Conteos encontrados con filtro: {conteos_filtrados.count()}")
-    for c in conteos_filtrados:
-        print(f"  ID: {c.id}, Cantidad: {c.cantidad_contada}, Fecha: {c.fecha_conteo}")
+        print("  Sin conteo registrado")
 else:
     print("Producto no encontrado")
     
@@ -50,3 +43,10 @@ conteos_todos = ConteoFisico.objects.all().order_by('-fecha_conteo')[:10]
 for c in conteos_todos:
     print(f"  Codigo: [{c.codigo}], Atributo: [{c.atributo}], Cantidad: {c.cantidad_contada}, Fecha: {c.fecha_conteo}")
 
+# Conteos vigentes (último por código+atributo), una sola consulta
+print("\n" + "="*80)
+ultimos = ultimos_conteos_por_clave()
+print(f"Conteos vigentes por código+atributo: {len(ultimos)}")
+for (codigo, atributo), c in sorted(ultimos.items())[:10]:
+    print(f"  Codigo: [{codigo}], Atributo: [{atributo or '-'}], Cantidad: {c['cantidad_contada']}, Fecha: {c['fecha_conteo']}")
+